@@ -0,0 +1,397 @@
+# Audience Index - MID -> 用户群 的持久化倒排索引
+# 回滚或状态变更前需要知道这些 MID 还属于哪些用户群（影响扇出）。索引目录（DATA_SYNC_AUDIENCE_INDEX）包含：
+#   - 若干段：每段为 CSR 形式的三个 .npy（升序去重的 uint64 MID、每个 MID 的条目偏移、uint32 用户群序号），
+#     查询时内存映射，每段只需一次二分查找，只读取命中的页
+#   - manifest.json：用户群ID -> 序号与其最新快照所在的段，以及段列表
+# 同步某个用户群的全量快照时只为它写一个新段并更新 manifest，它在旧段中的条目随之失效（查询时按序号过滤），
+# 不需要重写整个索引。段数超过 COMPACT_SEGMENTS 时按大小分层合并：通常只合并基础段之后的小段，
+# 小段累计达到基础段的 1/4 或基础段中失效条目超过 1/4 时才连同基础段整体合并
+import os
+import json
+import time
+import shutil
+import argparse
+from datetime import datetime
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from file_lock import file_lock
+
+INDEX_DIR_ENV = "DATA_SYNC_AUDIENCE_INDEX"
+
+MANIFEST_NAME = "manifest.json"
+LOCK_NAME = "index.lock"
+MANIFEST_VERSION = 1
+MANIFEST_KEYS = ("audiences", "segments", "next_segment", "next_ordinal")
+
+# 段数超过该值时合并
+COMPACT_SEGMENTS = 4
+
+# 扇出报告中列出的用户群数上限
+FANOUT_LIMIT = 50
+
+class AudienceIndexError(ValueError):
+    """索引目录无法读取或内容不正确"""
+
+def index_dir() -> str:
+    return os.environ.get(INDEX_DIR_ENV, "").strip()
+
+def _sorted_unique(mids) -> np.ndarray:
+    """升序去重的 uint64 MID；比 np.unique 快得多（后者对 uint64 走哈希路径，十几万个 MID 就要几十毫秒）"""
+    mids = np.sort(np.asarray(mids, dtype=np.uint64))
+    if len(mids) < 2:
+        return mids
+    return mids[np.concatenate(([True], mids[1:] != mids[:-1]))]
+
+class Segment:
+    """
+    一段倒排条目（CSR）：mids 升序去重，MID mids[i] 的用户群序号为 ordinals[offsets[i]:offsets[i + 1]]
+    三个数组都内存映射读取
+    """
+
+    NAMES = ("mids", "offsets", "ordinals")
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        try:
+            self.mids, self.offsets, self.ordinals = (
+                np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r") for name in self.NAMES)
+        except (OSError, ValueError) as e:
+            raise AudienceIndexError(f"无法读取索引段 {directory}: {e}")
+        if self.mids.ndim != 1 or len(self.offsets) != len(self.mids) + 1:
+            raise AudienceIndexError(f"索引段 {directory} 的内容不完整")
+
+    def __len__(self) -> int:
+        """条目数（MID 与用户群的对数）"""
+        return len(self.ordinals)
+
+    @property
+    def nbytes(self) -> int:
+        return self.mids.nbytes + self.offsets.nbytes + self.ordinals.nbytes
+
+    @classmethod
+    def write(cls, directory: str, mids: np.ndarray, ordinals: np.ndarray):
+        """
+        写入新段；mids 须已升序（同一 MID 的多个条目相邻）
+        先写入临时目录再整体改名。调用方随后才写 manifest，所以同名的已有目录只可能是上次中断留下的孤儿段，直接清除
+        """
+        mids = np.asarray(mids, dtype=np.uint64)
+        starts = np.flatnonzero(np.concatenate(([True], mids[1:] != mids[:-1]))) if len(mids) else np.zeros(0, dtype=np.int64)
+        offsets = np.append(starts, len(mids))
+        offsets = offsets.astype(np.uint32 if len(mids) < 1 << 32 else np.int64)
+        temp_dir = directory + ".tmp"
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        os.makedirs(temp_dir)
+        for name, array in zip(cls.NAMES, (mids[starts], offsets, np.asarray(ordinals, dtype=np.uint32))):
+            np.save(os.path.join(temp_dir, f"{name}.npy"), np.ascontiguousarray(array))
+        shutil.rmtree(directory, ignore_errors=True)
+        os.replace(temp_dir, directory)
+
+    def lookup(self, mids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """查询 MID -> (命中条目对应的查询下标, 命中条目的用户群序号)"""
+        if not len(self.mids) or not len(mids):
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.uint32)
+        slots = np.minimum(np.searchsorted(self.mids, mids), len(self.mids) - 1)
+        hit = np.flatnonzero(self.mids[slots] == mids)
+        slots = slots[hit]
+        starts = self.offsets[slots].astype(np.int64)
+        lengths = self.offsets[slots + 1].astype(np.int64) - starts
+        # 每个命中 MID 的区间 [start, start + length) 拼接成一个下标数组
+        positions = np.arange(lengths.sum(), dtype=np.int64) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.repeat(hit, lengths), np.asarray(self.ordinals[positions])
+
+    def live_entries(self, live: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """仍然有效（序号在 live 中为 True）的全部条目，按 MID 升序"""
+        ordinals = np.asarray(self.ordinals)
+        mids = np.repeat(np.asarray(self.mids), np.diff(np.asarray(self.offsets).astype(np.int64)))
+        keep = live[ordinals]
+        return mids[keep], ordinals[keep]
+
+class AudienceIndex:
+    """
+    MID -> 用户群 的倒排索引
+    manifest["audiences"][用户群ID] = {"ordinal", "segment", "count", "updated_at"}，
+    segment 为该用户群最新快照所在的段（None 表示已删除）
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._cache_key = None
+        self._manifest = None
+        self._segments: Dict[str, Segment] = {}
+
+    # -----------------------------------------------------------------------
+    # manifest
+    # -----------------------------------------------------------------------
+
+    @property
+    def manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_NAME)
+
+    def _read_manifest(self) -> Dict:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except FileNotFoundError:
+            return {"version": MANIFEST_VERSION, "audiences": {}, "segments": [], "next_segment": 1, "next_ordinal": 0}
+        except (OSError, ValueError) as e:
+            raise AudienceIndexError(f"无法读取索引 {self.manifest_path}: {e}")
+        if not isinstance(manifest, dict) or manifest.get("version") != MANIFEST_VERSION:
+            version = manifest.get("version") if isinstance(manifest, dict) else None
+            raise AudienceIndexError(f"索引版本不支持: {version}")
+        missing = [key for key in MANIFEST_KEYS if key not in manifest]
+        if missing:
+            raise AudienceIndexError(f"索引 {self.manifest_path} 缺少字段: {', '.join(missing)}")
+        return manifest
+
+    def _write_manifest(self, manifest: Dict):
+        temp_path = self.manifest_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(manifest, f, ensure_ascii=False)
+        os.replace(temp_path, self.manifest_path)
+
+    def _load(self) -> Tuple[Dict, List[Segment]]:
+        """读取 manifest 与段；manifest 未变化时复用已打开的内存映射"""
+        try:
+            stat = os.stat(self.manifest_path)
+            cache_key = (stat.st_mtime_ns, stat.st_size)
+        except FileNotFoundError:
+            cache_key = None
+        if cache_key is None or cache_key != self._cache_key:
+            manifest = self._read_manifest()
+            segments = {}
+            for name in manifest["segments"]:
+                segments[name] = self._segments.get(name) or Segment(os.path.join(self.directory, name))
+            self._manifest, self._segments, self._cache_key = manifest, segments, cache_key
+        return self._manifest, [self._segments[name] for name in self._manifest["segments"]]
+
+    def _live(self, manifest: Dict, segment_name: str) -> np.ndarray:
+        """该段中哪些用户群序号的条目仍然有效"""
+        live = np.zeros(manifest["next_ordinal"] + 1, dtype=bool)
+        for info in manifest["audiences"].values():
+            if info["segment"] == segment_name:
+                live[info["ordinal"]] = True
+        return live
+
+    # -----------------------------------------------------------------------
+    # 写入
+    # -----------------------------------------------------------------------
+
+    def _lock(self):
+        os.makedirs(self.directory, exist_ok=True)
+        return file_lock(os.path.join(self.directory, LOCK_NAME))
+
+    def ingest(self, audience_id: str, mids) -> Dict:
+        """用某个用户群的全量快照替换它在索引中的成员（写一个新段），返回该用户群的记录"""
+        mids = _sorted_unique(mids)
+        with self._lock():
+            manifest = self._read_manifest()
+            info = manifest["audiences"].get(audience_id)
+            if info is None:
+                info = {"ordinal": manifest["next_ordinal"]}
+                manifest["next_ordinal"] += 1
+            name = f"seg_{manifest['next_segment']:06d}"
+            manifest["next_segment"] += 1
+            Segment.write(os.path.join(self.directory, name), mids, np.full(len(mids), info["ordinal"], dtype=np.uint32))
+            info.update(segment=name, count=len(mids), updated_at=datetime.now().isoformat(timespec="seconds"))
+            manifest["audiences"][audience_id] = info
+            manifest["segments"].append(name)
+            self._write_manifest(manifest)
+            if len(manifest["segments"]) > COMPACT_SEGMENTS:
+                self._compact_tiered(manifest)
+        return info
+
+    def remove(self, audience_id: str) -> bool:
+        """从索引中删除用户群（条目在下次合并时清除）"""
+        with self._lock():
+            manifest = self._read_manifest()
+            info = manifest["audiences"].get(audience_id)
+            if info is None or info["segment"] is None:
+                return False
+            info.update(segment=None, count=0, updated_at=datetime.now().isoformat(timespec="seconds"))
+            self._write_manifest(manifest)
+            return True
+
+    def compact(self):
+        """把所有段合并为一个"""
+        with self._lock():
+            manifest = self._read_manifest()
+            self._merge(manifest, list(manifest["segments"]))
+
+    def _compact_tiered(self, manifest: Dict):
+        """
+        按大小分层合并（调用方持有锁）：小段累计达到基础段的 1/4、或基础段中失效条目超过 1/4 时整体合并，
+        否则只合并基础段之后的小段
+        """
+        base, rest = manifest["segments"][0], manifest["segments"][1:]
+        sizes = {name: len(Segment(os.path.join(self.directory, name))) for name in manifest["segments"]}
+        base_live = sum(info["count"] for info in manifest["audiences"].values() if info["segment"] == base)
+        if sum(sizes[name] for name in rest) * 4 >= sizes[base] or base_live * 4 < sizes[base] * 3:
+            self._merge(manifest, list(manifest["segments"]))
+        else:
+            self._merge(manifest, rest)
+
+    def _merge(self, manifest: Dict, names: List[str]):
+        """把 names 中各段的有效条目合并为一个新段，替换这些段并删除旧文件（调用方持有锁）"""
+        mids_parts, ordinal_parts = [], []
+        for name in names:
+            segment = Segment(os.path.join(self.directory, name))
+            mids, ordinals = segment.live_entries(self._live(manifest, name))
+            mids_parts.append(mids)
+            ordinal_parts.append(ordinals)
+        mids = np.concatenate(mids_parts) if mids_parts else np.zeros(0, dtype=np.uint64)
+        ordinals = np.concatenate(ordinal_parts) if ordinal_parts else np.zeros(0, dtype=np.uint32)
+        # 各段本身有序，稳定排序（timsort）按已有的有序片段归并
+        order = np.argsort(mids, kind="stable")
+        merged = f"seg_{manifest['next_segment']:06d}"
+        manifest["next_segment"] += 1
+        Segment.write(os.path.join(self.directory, merged), mids[order], ordinals[order])
+        for info in manifest["audiences"].values():
+            if info["segment"] in names:
+                info["segment"] = merged
+        position = manifest["segments"].index(names[0])
+        manifest["segments"] = [name for name in manifest["segments"] if name not in names]
+        manifest["segments"].insert(position, merged)
+        self._write_manifest(manifest)
+        # 已打开的内存映射在 POSIX 上仍可读取被删除的文件
+        for name in names:
+            shutil.rmtree(os.path.join(self.directory, name), ignore_errors=True)
+
+    # -----------------------------------------------------------------------
+    # 查询
+    # -----------------------------------------------------------------------
+
+    def lookup(self, mids) -> Tuple[np.ndarray, np.ndarray, List[str]]:
+        """
+        批量查询：返回 (升序去重的查询 MID 中命中条目的下标, 命中条目的用户群序号, 序号 -> 用户群ID)
+        """
+        manifest, segments = self._load()
+        mids = _sorted_unique(mids)
+        names = [""] * (manifest["next_ordinal"] + 1)
+        for audience_id, info in manifest["audiences"].items():
+            names[info["ordinal"]] = audience_id
+        hit_parts, ordinal_parts = [], []
+        for name, segment in zip(manifest["segments"], segments):
+            hits, ordinals = segment.lookup(mids)
+            keep = self._live(manifest, name)[ordinals]
+            hit_parts.append(hits[keep])
+            ordinal_parts.append(ordinals[keep])
+        hits = np.concatenate(hit_parts) if hit_parts else np.zeros(0, dtype=np.int64)
+        ordinals = np.concatenate(ordinal_parts) if ordinal_parts else np.zeros(0, dtype=np.uint32)
+        return hits, ordinals, names
+
+    def audiences_of(self, mids: Sequence[int]) -> Dict[int, List[str]]:
+        """每个 MID 所属的用户群ID（只列出至少属于一个用户群的 MID）"""
+        unique = _sorted_unique(mids)
+        hits, ordinals, names = self.lookup(unique)
+        result: Dict[int, List[str]] = {}
+        for hit, ordinal in zip(hits.tolist(), ordinals.tolist()):
+            result.setdefault(int(unique[hit]), []).append(names[ordinal])
+        return result
+
+    def fanout(self, mids, current_audience: Optional[str] = None, limit: int = FANOUT_LIMIT) -> Dict:
+        """
+        影响扇出：这些 MID 分别属于哪些用户群。返回命中 MID 数、各用户群包含的 MID 数（current_audience 单独给出，
+        不计入其他用户群），以及同时属于其他用户群的 MID 数
+        """
+        started = time.perf_counter()
+        mids = _sorted_unique(mids)
+        hits, ordinals, names = self.lookup(mids)
+        counts = np.bincount(ordinals, minlength=len(names)) if len(ordinals) else np.zeros(len(names), dtype=np.int64)
+        current_ordinal = None
+        info = self._manifest["audiences"].get(current_audience) if current_audience else None
+        if info is not None and info["segment"] is not None:
+            current_ordinal = info["ordinal"]
+        other = ordinals != current_ordinal if current_ordinal is not None else np.ones(len(ordinals), dtype=bool)
+        ranked = [ordinal for ordinal in np.argsort(-counts, kind="stable").tolist()
+                  if counts[ordinal] and ordinal != current_ordinal]
+        queried = len(mids)
+        return {
+            "queried": queried,
+            "indexed": int(np.count_nonzero(np.bincount(hits, minlength=queried))),
+            "in_other_audiences": int(np.count_nonzero(np.bincount(hits[other], minlength=queried))),
+            "current_audience": current_audience,
+            "current_audience_hits": int(counts[current_ordinal]) if current_ordinal is not None else None,
+            "other_audiences": len(ranked),
+            "audiences": [{"audience_id": names[ordinal], "mids": int(counts[ordinal]),
+                           "ratio": round(int(counts[ordinal]) / queried, 6)} for ordinal in ranked[:limit]],
+            "indexed_audiences": sum(1 for item in self._manifest["audiences"].values() if item["segment"] is not None),
+            "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+
+    def stats(self) -> Dict:
+        manifest, segments = self._load()
+        live = {name: self._live(manifest, name) for name in manifest["segments"]}
+        return {
+            "audiences": sum(1 for info in manifest["audiences"].values() if info["segment"] is not None),
+            "segments": len(segments),
+            "entries": sum(len(segment) for segment in segments),
+            "live_entries": sum(info["count"] for info in manifest["audiences"].values()),
+            "bytes": sum(segment.nbytes for segment in segments),
+            "stale_segments": sum(1 for name in manifest["segments"] if not live[name].any()),
+        }
+
+_default_index: Optional[AudienceIndex] = None
+
+def default_index() -> Optional[AudienceIndex]:
+    """DATA_SYNC_AUDIENCE_INDEX 指向的索引；未设置或尚未建立时返回 None"""
+    global _default_index
+    directory = index_dir()
+    if not directory or not os.path.exists(os.path.join(directory, MANIFEST_NAME)):
+        return None
+    if _default_index is None or _default_index.directory != directory:
+        _default_index = AudienceIndex(directory)
+    return _default_index
+
+def read_snapshot_mids(source: str) -> np.ndarray:
+    """
+    同步快照中的 MID：consistency_tree 快照（MID,Status 的 .csv / .bin / .snap），
+    或 mid_bitmap 支持的来源（bitmap: / .rbm / delta: / u64: / file: / 文本）
+    """
+    import consistency_tree
+    import mid_bitmap
+
+    if source.endswith(consistency_tree.BINARY_EXTENSIONS):
+        return np.asarray(consistency_tree.read_binary(source)[0])
+    if source.endswith(".csv"):
+        return consistency_tree.read_csv(source)[0]
+    return mid_bitmap.load_source(source).to_array()
+
+def main():
+    parser = argparse.ArgumentParser(description="MID -> 用户群 倒排索引")
+    parser.add_argument("--index", default=index_dir(), help=f"索引目录（默认取 {INDEX_DIR_ENV}）")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ingest_parser = subparsers.add_parser("ingest", help="用用户群的全量快照替换其成员")
+    ingest_parser.add_argument("audience_id")
+    ingest_parser.add_argument("source", help="MID,Status 快照（.csv / .bin / .snap）或 MID 来源（bitmap: / file: / delta: / u64:）")
+
+    remove_parser = subparsers.add_parser("remove", help="从索引中删除用户群")
+    remove_parser.add_argument("audience_id")
+
+    query_parser = subparsers.add_parser("query", help="查询 MID 的影响扇出")
+    query_parser.add_argument("source", help="MID 来源（与 ingest 相同）")
+    query_parser.add_argument("--current", help="当前操作的用户群ID")
+
+    subparsers.add_parser("compact", help="合并所有段")
+    subparsers.add_parser("stats", help="索引统计")
+
+    args = parser.parse_args()
+    if not args.index:
+        parser.error(f"需要 --index 或 {INDEX_DIR_ENV}")
+    index = AudienceIndex(args.index)
+    if args.command == "ingest":
+        print(index.ingest(args.audience_id, read_snapshot_mids(args.source)))
+    elif args.command == "remove":
+        print("已删除" if index.remove(args.audience_id) else "索引中没有该用户群")
+    elif args.command == "query":
+        print(json.dumps(index.fanout(read_snapshot_mids(args.source), args.current), ensure_ascii=False, indent=2))
+    elif args.command == "compact":
+        index.compact()
+        print(index.stats())
+    else:
+        print(index.stats())
+
+if __name__ == "__main__":
+    main()
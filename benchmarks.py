@@ -0,0 +1,1020 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+性能基准测试
+用法: python benchmarks.py <benchmark> [参数]
+"""
+
+import os
+import sys
+import time
+import asyncio
+import argparse
+import tempfile
+
+# ---------------------------------------------------------------------------
+# 并发确认：N 个工具调用同时等待 UI 时，总耗时应接近最长单次，而不是求和
+# ---------------------------------------------------------------------------
+
+# 模拟 UI 的子进程：等待指定秒数（代替人工思考时间）后按帧协议回传结果
+# argv: <秒数> <仓库目录> [图片字节数] --output-stdout
+STUB_UI_SCRIPT = """
+import sys, time
+sys.path.insert(0, sys.argv[2])
+import ui_protocol
+time.sleep(float(sys.argv[1]))
+image_size = int(sys.argv[3]) if len(sys.argv) > 4 else 0
+images = [bytes(image_size)] if image_size else []
+with open(sys.stdout.fileno(), "wb", closefd=False) as out:
+    ui_protocol.write_result(out, {"interactive_feedback": "ok", "images": images})
+"""
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def _write_stub_ui() -> str:
+    with tempfile.NamedTemporaryFile("w", suffix=".py", delete=False) as f:
+        f.write(STUB_UI_SCRIPT)
+        return f.name
+
+def bench_concurrency(args):
+    import ui_launcher
+
+    stub_path = _write_stub_ui()
+
+    # 每个调用的 "UI 时间" 不同，便于区分 max 与 sum
+    delays = [args.delay * (i + 1) / args.n for i in range(args.n)]
+
+    async def one_call(delay):
+        start = time.perf_counter()
+        await ui_launcher.run_ui_process(stub_path, [str(delay), REPO_DIR])
+        return time.perf_counter() - start
+
+    async def run_all():
+        start = time.perf_counter()
+        durations = await asyncio.gather(*(one_call(d) for d in delays))
+        return durations, time.perf_counter() - start
+
+    try:
+        durations, wall = asyncio.run(run_all())
+    finally:
+        os.unlink(stub_path)
+
+    print(f"{'call':>6} {'ui_time_s':>10} {'elapsed_s':>10}")
+    for i, (delay, elapsed) in enumerate(zip(delays, durations)):
+        print(f"{i:>6} {delay:>10.2f} {elapsed:>10.2f}")
+    print(f"sum of UI times : {sum(durations):.2f} s")
+    print(f"max of UI times : {max(durations):.2f} s")
+    print(f"total wall time : {wall:.2f} s")
+
+# ---------------------------------------------------------------------------
+# 结果回传：临时文件 JSON+Base64 对比 stdout 帧协议
+# ---------------------------------------------------------------------------
+
+def bench_result_transport(args):
+    import base64
+    import json
+    import ui_launcher
+
+    image_size = int(args.image_mb * 1024 * 1024)
+    image = os.urandom(image_size)
+
+    # 旧方式：UI 端 Base64 + json.dump 到临时文件，服务端读取、解析、解码、删除
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
+            output_file = tmp.name
+        with open(output_file, "w", encoding="utf-8") as f:
+            json.dump({"interactive_feedback": "ok", "images": [base64.b64encode(image).decode("utf-8")]}, f, ensure_ascii=False, indent=2)
+        with open(output_file, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        os.unlink(output_file)
+        decoded = [base64.b64decode(b64) for b64 in result["images"]]
+        assert decoded[0] == image
+    file_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+    # 新方式：子进程通过 stdout 以帧回传原始字节（包含进程启动开销）
+    stub_path = _write_stub_ui()
+    try:
+        async def run_frames(size):
+            result = await ui_launcher.run_ui_process(stub_path, ["0", REPO_DIR, str(size)])
+            # 只返回大小：asyncio.run 结束时会 repr 任务结果，大字节串会扭曲计时
+            return sum(len(img) for img in result["images"])
+
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            assert asyncio.run(run_frames(image_size)) == image_size
+        frames_ms = (time.perf_counter() - start) * 1000 / args.repeat
+
+        # 仅进程启动开销（无图片），用于扣除
+        start = time.perf_counter()
+        for _ in range(args.repeat):
+            asyncio.run(run_frames(0))
+        spawn_ms = (time.perf_counter() - start) * 1000 / args.repeat
+    finally:
+        os.unlink(stub_path)
+
+    print(f"image size               : {args.image_mb:.1f} MB")
+    print(f"temp file + JSON/Base64  : {file_ms:8.1f} ms")
+    print(f"stdout frames (incl. spawn): {frames_ms:8.1f} ms")
+    print(f"stdout frames (transfer) : {frames_ms - spawn_ms:8.1f} ms")
+
+# ---------------------------------------------------------------------------
+# 规则文件查找：原逐关键词正则扫描 对比 进程内索引
+# ---------------------------------------------------------------------------
+
+RULES_WORDS_ZH = ["数据库", "用户群", "同步", "配置", "分支", "缓存", "状态", "回滚", "验证", "部署",
+                  "接口", "日志", "权限", "任务", "版本", "测试", "环境", "队列", "索引", "备份"]
+RULES_WORDS_EN = ["mysql", "redis", "kafka", "audience", "dmp", "task", "python", "docker",
+                  "staging", "prod", "branch", "schema", "cron", "batch", "retry", "timeout"]
+
+def _generate_rules_file(path: str, target_bytes: int, seed: int = 42) -> int:
+    """生成指定大小的规则文件，返回问答条目数"""
+    import random
+    rng = random.Random(seed)
+    sections = ["项目配置", "工作流程规则", "确认信息", "数据同步", "部署规则"]
+    count = 0
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# 用户规则文件\n\n")
+        written = 0
+        while written < target_bytes:
+            section = sections[count // 2000 % len(sections)]
+            if count % 2000 == 0:
+                f.write(f"\n## {section}\n")
+            question = "".join(rng.choice(RULES_WORDS_ZH) for _ in range(3)) + " " + " ".join(rng.choice(RULES_WORDS_EN) for _ in range(2)) + f" #{count}?"
+            answer = rng.choice(RULES_WORDS_ZH) + " " + rng.choice(RULES_WORDS_EN) + f" v{count}"
+            entry = f"\n### 2024-01-01 00:00:{count % 60:02d}\n**问题：** {question}\n**用户回答：** {answer}\n"
+            f.write(entry)
+            written += len(entry.encode("utf-8"))
+            count += 1
+    return count
+
+def _legacy_search_in_rules(keywords, file_path):
+    """原 server.search_in_rules + extract_answer_from_rules 的实现（用于对比）"""
+    import re
+    with open(file_path, "r", encoding="utf-8") as f:
+        content = f.read()
+    results = {}
+    for keyword in keywords:
+        pattern = re.compile(keyword, re.IGNORECASE)
+        matches = pattern.findall(content)
+        if matches:
+            lines = content.split("\n")
+            context_lines = []
+            for i, line in enumerate(lines):
+                if pattern.search(line):
+                    start = max(0, i - 3)
+                    end = min(len(lines), i + 4)
+                    context_lines.extend(lines[start:end])
+            if context_lines:
+                results[keyword] = "\n".join(context_lines)
+    for keyword, context in results.items():
+        match = re.compile(r"\*\*用户回答[：:]\*\*\s*(.+)", re.IGNORECASE | re.MULTILINE).search(context)
+        if match and match.group(1).strip():
+            return match.group(1).strip()
+    return None
+
+def bench_rules_lookup(args):
+    import statistics
+    import rules_index
+
+    # 精确命中单个条目的关键词 + 高频词 + 不存在的关键词
+    queries = [["v{}".format(i * 7919 % 1000)] for i in range(args.queries)]
+    queries += [["redis"], ["数据库 mysql"], ["同步配置"], ["不存在的关键词"]]
+
+    print(f"{'size':>6} {'entries':>8} {'build_ms':>9} {'lookup_p50_ms':>14} {'lookup_max_ms':>14} {'legacy_ms':>10}")
+    for size_mb in args.sizes:
+        with tempfile.NamedTemporaryFile(suffix=".md", delete=False) as tmp:
+            path = tmp.name
+        try:
+            count = _generate_rules_file(path, int(size_mb * 1024 * 1024))
+            index = rules_index.RulesIndex(path)
+
+            start = time.perf_counter()
+            index.refresh()
+            build_ms = (time.perf_counter() - start) * 1000
+
+            timings = []
+            for keywords in queries:
+                start = time.perf_counter()
+                index.latest_answer(keywords)
+                timings.append((time.perf_counter() - start) * 1000)
+
+            legacy = "-"
+            if size_mb <= args.legacy_max_mb:
+                start = time.perf_counter()
+                _legacy_search_in_rules(queries[0], path)
+                legacy = f"{(time.perf_counter() - start) * 1000:.1f}"
+
+            print(f"{size_mb:>5g}M {count:>8} {build_ms:>9.1f} {statistics.median(timings):>14.3f} {max(timings):>14.3f} {legacy:>10}")
+        finally:
+            os.unlink(path)
+
+def bench_keyword_match(args):
+    with tempfile.NamedTemporaryFile(suffix=".md", delete=False) as tmp:
+        path = tmp.name
+    try:
+        _run_keyword_match(args, path)
+    finally:
+        os.unlink(path)
+
+def _run_keyword_match(args, path):
+    import re
+    import random
+    import rules_index
+    from keyword_matcher import KeywordMatcher
+
+    _generate_rules_file(path, int(args.size_mb * 1024 * 1024))
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read()
+    index = rules_index.RulesIndex(path)
+    index.refresh()
+
+    rng = random.Random(7)
+    pool = RULES_WORDS_ZH + RULES_WORDS_EN + [f"v{i}" for i in range(0, 5000, 37)] + ["不存在", "no such thing", "c++", "a.b?"]
+    norm_texts = [entry.norm_text for entry in index.entries]
+
+    print(f"{'keywords':>8} {'per_kw_file_ms':>15} {'per_kw_entries_ms':>18} {'single_pass_ms':>15} {'indexed_ms':>11}")
+    for n in args.counts:
+        keywords = rng.sample(pool, n)
+
+        # 原实现的循环：每个关键词一次全文 findall + 逐行扫描（关键词已转义，否则 c++ 会直接报错）
+        start = time.perf_counter()
+        lines = content.split("\n")
+        for keyword in keywords:
+            pattern = re.compile(re.escape(keyword), re.IGNORECASE)
+            if pattern.findall(content):
+                [line for line in lines if pattern.search(line)]
+        per_kw_file_ms = (time.perf_counter() - start) * 1000
+
+        # 每个关键词一次遍历全部条目
+        start = time.perf_counter()
+        for keyword in keywords:
+            phrase = keyword.casefold()
+            [text for text in norm_texts if phrase in text]
+        per_kw_entries_ms = (time.perf_counter() - start) * 1000
+
+        # 多关键词匹配器：全部条目只遍历一次
+        start = time.perf_counter()
+        matcher = KeywordMatcher(keywords)
+        for text in norm_texts:
+            matcher.find_all(text)
+        single_pass_ms = (time.perf_counter() - start) * 1000
+
+        # 倒排表取候选 + 多关键词匹配器
+        start = time.perf_counter()
+        index.search(keywords)
+        indexed_ms = (time.perf_counter() - start) * 1000
+
+        print(f"{n:>8} {per_kw_file_ms:>15.1f} {per_kw_entries_ms:>18.1f} {single_pass_ms:>15.1f} {indexed_ms:>11.1f}")
+
+def bench_rules_store(args):
+    import statistics
+    import rules_store
+
+    queries = [["v{}".format(i * 7919 % 1000)] for i in range(args.queries)]
+    queries += [["redis"], ["数据库 mysql"], ["同步配置"], ["不存在的关键词"], ["redis", "部署", "v42"]]
+
+    print(f"{'size':>6} {'entries':>8} {'import_s':>9} {'db_mb':>7} {'lookup_p50_ms':>14} {'lookup_p95_ms':>14} {'lookup_max_ms':>14}")
+    for size_mb in args.sizes:
+        tmpdir = tempfile.mkdtemp()
+        md_path = os.path.join(tmpdir, "rules.md")
+        db_path = os.path.join(tmpdir, "rules.db")
+        try:
+            _generate_rules_file(md_path, int(size_mb * 1024 * 1024))
+            store = rules_store.SqliteRulesStore(db_path)
+
+            start = time.perf_counter()
+            count = store.import_markdown(md_path)
+            import_s = time.perf_counter() - start
+
+            timings = []
+            for _ in range(args.repeat):
+                for keywords in queries:
+                    start = time.perf_counter()
+                    store.latest_answer(keywords)
+                    timings.append((time.perf_counter() - start) * 1000)
+            timings.sort()
+            store.close()
+
+            db_mb = os.path.getsize(db_path) / 1024 / 1024
+            p95 = timings[int(len(timings) * 0.95)]
+            print(f"{size_mb:>5g}M {count:>8} {import_s:>9.1f} {db_mb:>7.1f} {statistics.median(timings):>14.3f} {p95:>14.3f} {timings[-1]:>14.3f}")
+        finally:
+            import shutil
+            shutil.rmtree(tmpdir)
+
+def bench_similarity(args):
+    import random
+    import statistics
+    import rules_similarity
+
+    rng = random.Random(42)
+
+    def question(i):
+        return "".join(rng.choice(RULES_WORDS_ZH) for _ in range(3)) + " " + " ".join(rng.choice(RULES_WORDS_EN) for _ in range(3)) + f" #{i}?"
+
+    print(f"{'questions':>10} {'add_s':>7} {'first_query_ms':>15} {'query_p50_ms':>13} {'query_max_ms':>13}")
+    for count in args.counts:
+        index = rules_similarity.SimilarityIndex()
+        stored = [question(i) for i in range(count)]
+        start = time.perf_counter()
+        for i, q in enumerate(stored):
+            index.add(q, f"answer {i}")
+        add_s = time.perf_counter() - start
+
+        # 第一次查询包含 IDF/归一化的重算
+        start = time.perf_counter()
+        index.query(stored[0])
+        first_ms = (time.perf_counter() - start) * 1000
+
+        timings = []
+        for _ in range(args.queries):
+            # 打乱词序模拟换一种说法
+            words = rng.choice(stored).split(" ")
+            rng.shuffle(words)
+            start = time.perf_counter()
+            index.query(" ".join(words))
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f"{count:>10} {add_s:>7.2f} {first_ms:>15.1f} {statistics.median(timings):>13.2f} {max(timings):>13.2f}")
+
+# ---------------------------------------------------------------------------
+# 粘贴图片：GUI 线程在每次粘贴上的停顿（同步编码 vs 线程池编码）
+# ---------------------------------------------------------------------------
+
+def _qt_app():
+    """无窗口环境下创建（或复用）QApplication"""
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PySide6.QtWidgets import QApplication
+    return QApplication.instance() or QApplication(sys.argv[:1])
+
+def _screenshot_image(width: int, height: int, seed: int = 0):
+    """生成一张类似截图的 QImage：浅色背景上的文字行和色块"""
+    import random
+    from PySide6.QtGui import QImage, QPainter, QColor, QFont
+
+    rng = random.Random(seed)
+    image = QImage(width, height, QImage.Format_ARGB32)
+    image.fill(QColor(250, 250, 250))
+    painter = QPainter(image)
+    painter.setFont(QFont("Sans", 24))
+    for _ in range(height // 8):
+        painter.setPen(QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        painter.drawText(rng.randrange(width), rng.randrange(height), " ".join(rng.choice(RULES_WORDS_EN) for _ in range(6)))
+    for _ in range(height // 16):
+        painter.fillRect(rng.randrange(width), rng.randrange(height), 160, 60,
+                         QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    painter.end()
+    return image
+
+def bench_image_paste(args):
+    import statistics
+    from PySide6.QtCore import QMimeData, Qt
+    from PySide6.QtGui import QPixmap
+
+    app = _qt_app()
+    import image_pipeline
+    import feedback_ui
+
+    images = [_screenshot_image(args.width, args.height, seed) for seed in range(args.count)]
+    options = image_pipeline.ImageOptions.from_env()
+    dpr = args.dpr
+
+    # 原实现：GUI 线程上同步编码，预览按逻辑尺寸和物理尺寸各平滑缩放一次
+    legacy = []
+    for image in images:
+        start = time.perf_counter()
+        image_pipeline.encode_image(image, options)
+        pixmap = QPixmap.fromImage(image)
+        width = int(pixmap.width() * (80 / pixmap.height()))
+        pixmap.scaled(width, 80, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        pixmap.scaled(int(width * dpr), int(80 * dpr), Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        legacy.append((time.perf_counter() - start) * 1000)
+
+    # 现实现：粘贴只生成占位缩略图，编码在线程池中完成；提交时等待未完成的编码
+    window = feedback_ui.FeedbackUI("benchmark")
+    window.feedback_text.device_pixel_ratio = dpr
+    stalls = []
+    for image in images:
+        mime = QMimeData()
+        mime.setImageData(image)
+        start = time.perf_counter()
+        window.feedback_text.insertFromMimeData(mime)
+        stalls.append((time.perf_counter() - start) * 1000)
+        app.processEvents()
+    start = time.perf_counter()
+    window.feedback_text.wait_for_pending_images()
+    wait_ms = (time.perf_counter() - start) * 1000
+    encoded = len(window.feedback_text.image_registry.payload())
+
+    print(f"{args.count} x {args.width}x{args.height} 截图, DPR {dpr:g}")
+    print(f"{'mode':>10} {'stall_p50_ms':>13} {'stall_max_ms':>13} {'stall_total_ms':>15}")
+    for name, timings in (("sync", legacy), ("threaded", stalls)):
+        print(f"{name:>10} {statistics.median(timings):>13.1f} {max(timings):>13.1f} {sum(timings):>15.1f}")
+    print(f"提交时等待剩余编码: {wait_ms:.1f} ms（已编码 {encoded}/{args.count}）")
+    window.feedback_result = {"interactive_feedback": "", "images": []}
+    window.close()
+
+def _peak_rss_mb() -> float:
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 为单位，macOS 以字节为单位
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+def _image_memory_run(args):
+    """在独立进程中运行一种模式，最后一行输出 基线/峰值 RSS（MB）与结果帧大小"""
+    import io
+    from PySide6.QtCore import QMimeData
+    from PySide6.QtGui import QPixmap
+
+    app = _qt_app()
+    import image_pipeline
+    import feedback_ui
+    import ui_protocol
+
+    window = feedback_ui.FeedbackUI("benchmark")
+    app.processEvents()
+    baseline = _peak_rss_mb()
+
+    if args.mode == "legacy":
+        # 原实现：每张图片保存 Base64 字符串，预览持有完整的 QPixmap，提交时再解码
+        import base64
+        image_data, pixmaps = [], []
+        for seed in range(args.count):
+            image = _screenshot_image(args.width, args.height, seed)
+            encoded = image_pipeline.encode_image(image, window.feedback_text.image_options)
+            image_data.append({'data': base64.b64encode(encoded.data).decode('utf-8')})
+            pixmaps.append(QPixmap.fromImage(image))
+            del image, encoded
+        images = [base64.b64decode(img['data']) for img in image_data]
+    else:
+        for seed in range(args.count):
+            mime = QMimeData()
+            mime.setImageData(_screenshot_image(args.width, args.height, seed))
+            window.feedback_text.insertFromMimeData(mime)
+            del mime
+            # 两次粘贴之间通常有几秒间隔，后台编码早已完成
+            window.feedback_text.wait_for_pending_images()
+        images = window.feedback_text.get_image_payload()
+
+    out = io.BytesIO()
+    ui_protocol.write_result(out, {"interactive_feedback": "", "images": images})
+    print(f"{baseline:.1f} {_peak_rss_mb():.1f} {len(out.getvalue())}")
+    sys.stdout.flush()
+    os._exit(0)
+
+def bench_image_memory(args):
+    import subprocess
+
+    if args.mode:
+        _image_memory_run(args)
+        return
+
+    print(f"{args.count} x {args.width}x{args.height} 截图")
+    print(f"{'mode':>10} {'baseline_mb':>12} {'peak_rss_mb':>12} {'payload_kb':>11}")
+    for mode in ("legacy", "registry"):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "image-memory", "--mode", mode,
+             "--count", str(args.count), "--width", str(args.width), "--height", str(args.height)],
+            capture_output=True, text=True, check=True,
+        ).stdout.splitlines()[-1].split()
+        baseline, peak, payload = float(output[0]), float(output[1]), int(output[2])
+        print(f"{mode:>10} {baseline:>12.1f} {peak:>12.1f} {payload / 1024:>11.0f}")
+
+# ---------------------------------------------------------------------------
+# 描述区域渲染：原实现（预处理两次、逐行逐模式检测、每次切换行高全量重算）vs prompt_render
+# ---------------------------------------------------------------------------
+
+_LEGACY_MARKDOWN_PATTERNS = [
+    r'^#{1,6}\s+.+', r'\*\*.+?\*\*', r'\*.+?\*', r'_.+?_', r'`[^`]+`', r'^\s*```', r'^\s*>',
+    r'^\s*[-*+]\s+', r'^\s*\d+\.\s+', r'\[.+?\]\(.+?\)', r'!\[.+?\]\(.+?\)', r'\|.+\|.+\|', r'^-{3,}$', r'^={3,}$',
+]
+_LEGACY_STRONG_PATTERNS = [r'^#{1,6}\s+.+', r'^\s*```', r'^\s*>', r'^\s*[-*+]\s+', r'^\s*\d+\.\s+', r'\|.+\|.+\|', r'^-{3,}$', r'^={3,}$']
+
+def _legacy_render_prompt(prompt: str, line_height: float, log) -> str:
+    """原 FeedbackUI._update_description_text 的调用链（调试输出写到 log）"""
+    import re
+    import prompt_render
+
+    def preprocess(text):
+        print(f"原始文本: {repr(text)}", file=log)
+        text = prompt_render.preprocess(text)
+        print(f"预处理后文本: {repr(text)}", file=log)
+        return text
+
+    def is_markdown(text):
+        if not text or text.strip() == "":
+            return False
+        text = preprocess(text)
+        lines = text.split('\n')
+        count = 0
+        for line in lines:
+            for pattern in _LEGACY_MARKDOWN_PATTERNS:
+                if re.search(pattern, line, re.MULTILINE):
+                    count += 1
+                    if pattern in _LEGACY_STRONG_PATTERNS:
+                        return True
+        return count >= 2 or (count > 0 and count / len(lines) > 0.1)
+
+    if is_markdown(prompt):
+        body = prompt_render.markdown_to_html(preprocess(prompt))
+        return f"<style>{prompt_render.markdown_style(line_height)}</style><div class=\"md-content\">{body}</div>"
+    body = prompt_render.text_to_html(preprocess(prompt))
+    return f"<div style=\"{prompt_render.text_style(line_height)}\">{body}</div>"
+
+def _generate_prompt(target_bytes: int, markdown: bool, seed: int = 0) -> str:
+    """生成指定大小的提示文本：Markdown（标题、列表、代码块、表格）或纯日志"""
+    import random
+    rng = random.Random(seed)
+    parts, size = [], 0
+    i = 0
+    while size < target_bytes:
+        words = " ".join(rng.choice(RULES_WORDS_EN) for _ in range(12))
+        if markdown:
+            kind = i % 5
+            if kind == 0:
+                chunk = f"## 步骤 {i} {words[:30]}\n\n{words} {rng.choice(RULES_WORDS_ZH)}。\n"
+            elif kind == 1:
+                chunk = "".join(f"- **{rng.choice(RULES_WORDS_EN)}**: `{rng.randrange(10**6)}` {words[:40]}\n" for _ in range(4))
+            elif kind == 2:
+                chunk = "```python\n" + "".join(f"value_{j} = compute({j}, '{rng.choice(RULES_WORDS_EN)}')\n" for j in range(5)) + "```\n"
+            elif kind == 3:
+                chunk = "| mid | status | audience |\n|---|---|---|\n" + "".join(f"| {rng.randrange(10**9)} | ok | {rng.randrange(10**4)} |\n" for _ in range(4))
+            else:
+                chunk = f"{words}。{rng.choice(RULES_WORDS_ZH)} [文档](https://example.com/{i})\n\n"
+        else:
+            chunk = f"2024-01-01 12:00:{i % 60:02d} INFO task={rng.randrange(10**6)} {words}\n"
+        parts.append(chunk)
+        size += len(chunk.encode("utf-8"))
+        i += 1
+    return "".join(parts)
+
+def bench_prompt_render(args):
+    import prompt_render
+
+    with open(os.devnull, "w") as log:
+        print(f"{'size':>6} {'kind':>8} {'legacy_ms':>10} {'first_ms':>9} {'restyle_ms':>11} {'legacy_toggle_ms':>17}")
+        for size_kb in args.sizes_kb:
+            for kind in ("markdown", "text"):
+                prompt = _generate_prompt(int(size_kb * 1024), kind == "markdown")
+                # 每次换一个前缀，避免命中上一轮的缓存
+                prompt = f"{kind} {size_kb}\n" + prompt
+
+                start = time.perf_counter()
+                _legacy_render_prompt(prompt, 1.3, log)
+                legacy_ms = (time.perf_counter() - start) * 1000
+
+                # 原实现切换行高 = 再走一遍完整流程
+                start = time.perf_counter()
+                _legacy_render_prompt(prompt, 1.4, log)
+                legacy_toggle_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                prompt_render.render_html(prompt, 1.3)
+                first_ms = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                prompt_render.render_html(prompt, 1.4)
+                restyle_ms = (time.perf_counter() - start) * 1000
+
+                print(f"{size_kb:>5g}K {kind:>8} {legacy_ms:>10.1f} {first_ms:>9.1f} {restyle_ms:>11.2f} {legacy_toggle_ms:>17.1f}")
+
+def bench_prompt_first_paint(args):
+    """FeedbackUI 从构造到首次绘制的耗时：整体 setHtml vs 渐进渲染"""
+    app = _qt_app()
+    import prompt_render
+    import feedback_ui
+
+    # 预热 markdown 实例与窗口相关的一次性初始化
+    prompt_render.markdown_to_html("warm up")
+    warm = feedback_ui.FeedbackUI("warm up")
+    warm.feedback_result = {"interactive_feedback": "", "images": []}
+    warm.close()
+
+    progressive_threshold = prompt_render.PROGRESSIVE_THRESHOLD
+    print(f"{'size':>6} {'kind':>8} {'full_ms':>9} {'progressive_ms':>15} {'stream_to_cap_s':>16}")
+    for size_kb in args.sizes_kb:
+        for kind in ("markdown", "text"):
+            prompt = _generate_prompt(int(size_kb * 1024), kind == "markdown")
+            results = {}
+            for mode in ("full", "progressive"):
+                if mode == "full" and kind == "markdown" and size_kb > args.full_max_kb:
+                    results[mode] = None
+                    continue
+                prompt_render.PROGRESSIVE_THRESHOLD = float("inf") if mode == "full" else progressive_threshold
+                # 每轮换一个前缀，避免命中转换缓存
+                text = f"{mode} {kind} {size_kb}\n" + prompt
+                start = time.perf_counter()
+                window = feedback_ui.FeedbackUI(text)
+                window.show()
+                app.processEvents()
+                results[mode] = (time.perf_counter() - start) * 1000
+                if mode == "progressive":
+                    start = time.perf_counter()
+                    while window._prompt_render_timer.isActive():
+                        app.processEvents()
+                    results["stream"] = time.perf_counter() - start
+                window.feedback_result = {"interactive_feedback": "", "images": []}
+                window.close()
+            prompt_render.PROGRESSIVE_THRESHOLD = progressive_threshold
+            full = f"{results['full']:.0f}" if results["full"] is not None else "skipped"
+            print(f"{size_kb:>5g}K {kind:>8} {full:>9} {results['progressive']:>15.0f} {results['stream']:>16.2f}")
+
+def bench_data_sync_first_paint(args):
+    """DataSyncUI 从构造到首次绘制的耗时：全部标签页立即构建 vs 延迟构建"""
+    import statistics
+    app = _qt_app()
+    import data_sync_ui
+
+    data_sync_ui.prepare_application()
+    options = ["确认执行", "需要修改", "取消操作"]
+    result = {"interactive_feedback": "", "images": []}
+
+    def open_window(operation_type):
+        context = {"operation_type": operation_type, "audience_id": "aud_001", "task_id": "task_001", "timestamp": "2024-01-01 00:00:00"}
+        return data_sync_ui.DataSyncUI(context, options)
+
+    # 预热窗口相关的一次性初始化（字体、样式、平台插件）
+    warm = open_window("sync")
+    warm.show()
+    app.processEvents()
+    warm.feedback_result = result
+    warm.close()
+
+    timings = {"eager": [], "lazy": [], "idle": []}
+    operation_types = ["sync", "verify", "update", "rollback"]
+    for i in range(args.repeat):
+        for mode in ("eager", "lazy"):
+            start = time.perf_counter()
+            window = open_window(operation_types[i % len(operation_types)])
+            if mode == "eager":
+                # 与原实现一致：显示前构建全部标签页
+                while window._pending_tabs:
+                    window._materialize_tab(next(iter(window._pending_tabs)))
+            window.show()
+            app.processEvents()
+            timings[mode].append((time.perf_counter() - start) * 1000)
+            if mode == "lazy":
+                start = time.perf_counter()
+                while window._pending_tabs:
+                    app.processEvents()
+                timings["idle"].append((time.perf_counter() - start) * 1000)
+            window.feedback_result = result
+            window.close()
+            app.processEvents()
+
+    print(f"{'mode':>6} {'p50_ms':>8} {'mean_ms':>8}")
+    for mode in ("eager", "lazy"):
+        print(f"{mode:>6} {statistics.median(timings[mode]):>8.1f} {statistics.mean(timings[mode]):>8.1f}")
+    print(f"剩余标签页在空闲时构建完成: p50 {statistics.median(timings['idle']):.1f} ms")
+
+# ---------------------------------------------------------------------------
+# DMP 自动验证：大响应的解析（行数组 / 列对象）与向量化校验耗时
+# ---------------------------------------------------------------------------
+
+def _dmp_response_columns(rows: int, bad_ratio: float, seed: int = 0):
+    """生成 DMP 响应的各列，约 bad_ratio 比例的行有问题（RawDMP 为 0、非法状态或重复 MID）"""
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    mids = np.arange(5_000_000_000, 5_000_000_000 + rows, dtype=np.uint64)
+    raw = rng.choice([8, 16, 32], size=rows)
+    status = np.full(rows, 20)
+    bad = np.flatnonzero(rng.random(rows) < bad_ratio)
+    kinds = rng.integers(0, 3, size=len(bad))
+    raw[bad[kinds == 0]] = 0
+    status[bad[kinds == 1]] = 7
+    duplicated = bad[kinds == 2]
+    mids[duplicated] = mids[(duplicated + 1) % rows]
+    return [str(m) for m in mids.tolist()], raw.tolist(), status.tolist()
+
+def bench_dmp_verify(args):
+    import json
+    import statistics
+    import dmp_verification
+
+    print(f"{'rows':>9} {'format':>8} {'MB':>6} {'parse_ms':>9} {'verify_p50_ms':>14} {'failed':>8}")
+    for rows in args.rows:
+        mids, raw, status = _dmp_response_columns(rows, args.bad_ratio)
+        payloads = {
+            "rows": json.dumps([{"MID": m, "RawDMP": r, "Status": s} for m, r, s in zip(mids, raw, status)]),
+            "columns": json.dumps({"MID": mids, "RawDMP": raw, "Status": status}),
+        }
+        for fmt, payload in payloads.items():
+            start = time.perf_counter()
+            parsed = dmp_verification.parse_dmp_response(payload)
+            parse_ms = (time.perf_counter() - start) * 1000
+            timings = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                report = dmp_verification.verify(parsed, "all")
+                report.summary()
+                report.failing_rows()
+                timings.append((time.perf_counter() - start) * 1000)
+            failed = report.summary()["failed_rows"]
+            print(f"{rows:>9} {fmt:>8} {len(payload) / 1e6:>6.1f} {parse_ms:>9.0f} {statistics.median(timings):>14.1f} {failed:>8}")
+
+# ---------------------------------------------------------------------------
+# 受影响 MID：各种编码的参数大小、解码耗时与峰值内存（tracemalloc 计入 NumPy 分配）
+# ---------------------------------------------------------------------------
+
+def bench_affected_mids(args):
+    import tracemalloc
+    import numpy as np
+    import mid_set
+
+    rng = np.random.default_rng(0)
+    print(f"{'mids':>10} {'encoding':>9} {'arg_MB':>7} {'decode_s':>9} {'peak_MB':>8} {'array_MB':>9}")
+    for count in args.counts:
+        # 有序、间隔 1~8 的 MID，与用户群导出的顺序一致
+        mids = (5_000_000_000 + np.cumsum(rng.integers(1, 9, size=count))).astype(np.uint64)
+        tmpdir = tempfile.mkdtemp()
+        delta_path = os.path.join(tmpdir, "mids.delta")
+        with open(delta_path, "wb") as f:
+            f.write(mid_set.encode_delta(mids))
+        cases = {
+            "delta": mid_set.encode_mids(mids, "delta"),
+            "u64": mid_set.encode_mids(mids, "u64"),
+            "file": "file:" + delta_path,
+        }
+        if count <= args.list_max:
+            cases["list"] = [str(m) for m in mids.tolist()]
+        del mids
+        for encoding, value in cases.items():
+            arg_mb = len(value) / 1e6 if isinstance(value, str) else sum(len(m) + 49 for m in value) / 1e6
+            tracemalloc.start()
+            start = time.perf_counter()
+            array = mid_set.decode_mids(value)
+            payload = array.ui_payload()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            os.unlink(payload["path"])
+            print(f"{count:>10} {encoding:>9} {arg_mb:>7.1f} {elapsed:>9.2f} {peak / 1e6:>8.1f} {array.nbytes / 1e6:>9.1f}")
+            del array
+        import shutil
+        shutil.rmtree(tmpdir)
+    print("arg_MB：参数本身的大小（list 为 Python 字符串对象的近似大小）；peak_MB：解码、摘要与写出 .npy 的峰值内存")
+
+def bench_consistency_tree(args):
+    import shutil
+    import numpy as np
+    import consistency_tree
+
+    def full_scan(dmp_path, local_path):
+        """对照：读入两侧全表，按 MID 排序后逐个比较"""
+        dmp_mids, dmp_statuses = consistency_tree.read_binary(dmp_path)
+        local_mids, local_statuses = consistency_tree.read_binary(local_path)
+        common, dmp_index, local_index = np.intersect1d(dmp_mids, local_mids, return_indices=True)
+        return (len(dmp_mids) - len(common)) + (len(local_mids) - len(common)) + int(
+            (dmp_statuses[dmp_index] != local_statuses[local_index]).sum())
+
+    rng = np.random.default_rng(0)
+    print(f"{'mids':>10} {'diffs':>6} {'build_s':>8} {'scan_ms':>9} {'tree_ms':>8} {'buckets':>8} {'found':>6}")
+    for count in args.counts:
+        mids = (5_000_000_000 + np.cumsum(rng.integers(1, 9, size=count))).astype(np.uint64)
+        statuses = rng.choice(np.array([1, 20]), size=count)
+        tmpdir = tempfile.mkdtemp()
+        dmp_path = os.path.join(tmpdir, "dmp.bin")
+        consistency_tree.write_snapshot(dmp_path, mids, statuses)
+        for diffs in args.diffs:
+            # 一半改状态，一半从本地删除
+            changed = rng.choice(count, size=diffs, replace=False)
+            local_statuses = statuses.copy()
+            local_statuses[changed[: diffs // 2]] = 7
+            keep = np.ones(count, dtype=bool)
+            keep[changed[diffs // 2:]] = False
+            local_path = os.path.join(tmpdir, f"local_{diffs}.bin")
+            consistency_tree.write_snapshot(local_path, mids[keep], local_statuses[keep])
+
+            start = time.perf_counter()
+            consistency_tree.load_snapshot(dmp_path, rebuild=True)
+            consistency_tree.load_snapshot(local_path, rebuild=True)
+            build = time.perf_counter() - start
+
+            scan_times, tree_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                expected = full_scan(dmp_path, local_path)
+                scan_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                report = consistency_tree.check(dmp_path, local_path)
+                tree_times.append(time.perf_counter() - start)
+            assert report.divergent_count == expected == diffs
+            print(f"{count:>10} {diffs:>6} {build:>8.2f} {min(scan_times) * 1000:>9.1f} {min(tree_times) * 1000:>8.1f} "
+                  f"{report.stats['buckets_compared']:>8} {report.divergent_count:>6}")
+        del mids, statuses
+        shutil.rmtree(tmpdir)
+    print("build_s：两侧首次构建并缓存哈希树；scan_ms：读入全表逐个比较；tree_ms：复用缓存的哈希树比对（含打开快照）")
+
+def bench_audience_bitmap(args):
+    import gc
+    import operator
+    import psutil
+    import numpy as np
+    import mid_bitmap
+
+    # 操作数作为参数传入，不在闭包中引用循环末尾会被 del 的变量
+    def timed(func, *operands):
+        start = time.perf_counter()
+        result = func(*operands)
+        return result, (time.perf_counter() - start) * 1000
+
+    process = psutil.Process()
+    rng = np.random.default_rng(0)
+    print(f"{'mids':>10} {'impl':>7} {'build_s':>8} {'MB':>8} {'and_ms':>9} {'or_ms':>9} {'andnot_ms':>10} {'and_card_ms':>12} {'ser_MB':>7}")
+    for count in args.counts:
+        # 两个用户群：有序、间隔 1~8 的 MID，第二个与第一个约一半重叠
+        first = (5_000_000_000 + np.cumsum(rng.integers(1, 9, size=count))).astype(np.uint64)
+        second = np.concatenate([first[count // 2:], first[-1] + np.cumsum(rng.integers(1, 9, size=count - count // 2)).astype(np.uint64)])
+
+        (a, b), build = timed(lambda x, y: (mid_bitmap.MidBitmap.from_mids(x), mid_bitmap.MidBitmap.from_mids(y)), first, second)
+        intersection, and_ms = timed(operator.and_, a, b)
+        union, or_ms = timed(operator.or_, a, b)
+        _, andnot_ms = timed(operator.sub, a, b)
+        shared, and_card_ms = timed(a.intersection_cardinality, b)
+        assert len(intersection) == shared == count - count // 2 and len(union) == count + count - count // 2
+        serialized = len(a.to_bytes()) + len(b.to_bytes())
+        print(f"{count:>10} {'bitmap':>7} {build / 1000:>8.2f} {(a.nbytes + b.nbytes) / 1e6:>8.1f} {and_ms:>9.1f} {or_ms:>9.1f} "
+              f"{andnot_ms:>10.1f} {and_card_ms:>12.1f} {serialized / 1e6:>7.1f}")
+        del a, b, intersection, union
+
+        # Python 集合每个元素约 100 字节（int 对象 + 哈希表槽位），内存不足时跳过
+        estimated = count * 2 * 100
+        available = psutil.virtual_memory().available
+        if count > args.set_max or estimated > available * 0.7:
+            print(f"{count:>10} {'set':>7} 跳过（预计需要 {estimated / 1e9:.1f} GB，可用 {available / 1e9:.1f} GB）")
+        else:
+            gc.collect()
+            rss = process.memory_info().rss
+            (a, b), build = timed(lambda x, y: (set(x.tolist()), set(y.tolist())), first, second)
+            built_mb = (process.memory_info().rss - rss) / 1e6
+            _, and_ms = timed(operator.and_, a, b)
+            _, or_ms = timed(operator.or_, a, b)
+            _, andnot_ms = timed(operator.sub, a, b)
+            _, and_card_ms = timed(lambda x, y: len(x & y), a, b)
+            print(f"{count:>10} {'set':>7} {build / 1000:>8.2f} {built_mb:>8.1f} {and_ms:>9.1f} {or_ms:>9.1f} "
+                  f"{andnot_ms:>10.1f} {and_card_ms:>12.1f} {'-':>7}")
+            del a, b
+        del first, second
+        gc.collect()
+    print("MB：两个用户群的内存（bitmap 为容器大小，set 为 RSS 增量，不含 MID 字符串）；ser_MB：两个位图序列化后的大小")
+
+def bench_audience_index(args):
+    import shutil
+    import numpy as np
+    import audience_index
+
+    def scan(paths, queries):
+        """对照：逐个读入用户群快照，统计查询 MID 落在各用户群中的个数"""
+        counts = []
+        for path in paths:
+            members = np.load(path)
+            positions = np.minimum(np.searchsorted(members, queries), len(members) - 1)
+            counts.append(int(np.count_nonzero(members[positions] == queries)))
+        return counts
+
+    rng = np.random.default_rng(0)
+    tmpdir = tempfile.mkdtemp()
+    index = audience_index.AudienceIndex(os.path.join(tmpdir, "index"))
+    snapshots = [np.unique(rng.integers(0, args.universe, size=args.size).astype(np.uint64)) for _ in range(args.audiences + 1)]
+    paths = []
+    start = time.perf_counter()
+    for number in range(args.audiences):
+        index.ingest(f"audience_{number}", snapshots[number])
+    ingest = time.perf_counter() - start
+    start = time.perf_counter()
+    index.compact()
+    compact = time.perf_counter() - start
+    # 替换一个用户群的快照：只写一个新段，旧条目留在基础段中等下次合并
+    start = time.perf_counter()
+    index.ingest("audience_0", snapshots[-1])
+    reingest = time.perf_counter() - start
+    snapshots[0] = snapshots.pop()
+    for number, members in enumerate(snapshots):
+        paths.append(os.path.join(tmpdir, f"audience_{number}.npy"))
+        np.save(paths[-1], members)
+    stats = index.stats()
+    print(f"{args.audiences} 个用户群 × {args.size:,} MID：逐个写入 {ingest:.2f} s，合并为一段 {compact:.2f} s，"
+          f"替换一个用户群 {reingest * 1000:.0f} ms；{stats['segments']} 段 {stats['entries']:,} 条目 {stats['bytes'] / 1e6:.0f} MB")
+
+    for compacted in (False, True):
+        if compacted:
+            index.compact()
+        print(f"{'queries':>10} {'segments':>9} {'scan_ms':>9} {'index_ms':>9} {'in_others':>10} {'audiences':>10}")
+        for count in args.queries:
+            queries = audience_index._sorted_unique(rng.integers(0, args.universe, size=count))
+            expected = scan(paths, queries)
+            scan_times, index_times = [], []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                scan(paths, queries)
+                scan_times.append(time.perf_counter() - start)
+                start = time.perf_counter()
+                fanout = index.fanout(queries, "audience_0", limit=args.audiences)
+                index_times.append(time.perf_counter() - start)
+            got = {item["audience_id"]: item["mids"] for item in fanout["audiences"]}
+            assert [got.get(f"audience_{number}", 0) for number in range(1, args.audiences)] == expected[1:]
+            assert fanout["current_audience_hits"] == expected[0]
+            print(f"{len(queries):>10} {index.stats()['segments']:>9} {min(scan_times) * 1000:>9.1f} {min(index_times) * 1000:>9.1f} "
+                  f"{fanout['in_other_audiences']:>10} {fanout['other_audiences']:>10}")
+    shutil.rmtree(tmpdir)
+    print("scan_ms：逐个读入用户群快照（.npy）求交；index_ms：AudienceIndex.fanout（内存映射的倒排段）")
+
+BENCHMARKS = {
+    "concurrency": bench_concurrency,
+    "result-transport": bench_result_transport,
+    "rules-lookup": bench_rules_lookup,
+    "keyword-match": bench_keyword_match,
+    "rules-store": bench_rules_store,
+    "similarity": bench_similarity,
+    "image-paste": bench_image_paste,
+    "image-memory": bench_image_memory,
+    "prompt-render": bench_prompt_render,
+    "prompt-first-paint": bench_prompt_first_paint,
+    "data-sync-first-paint": bench_data_sync_first_paint,
+    "dmp-verify": bench_dmp_verify,
+    "affected-mids": bench_affected_mids,
+    "consistency-tree": bench_consistency_tree,
+    "audience-bitmap": bench_audience_bitmap,
+    "audience-index": bench_audience_index,
+}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="性能基准测试")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+
+    p = subparsers.add_parser("concurrency", help="并发 UI 调用的总耗时")
+    p.add_argument("--n", type=int, default=5, help="并发调用数")
+    p.add_argument("--delay", type=float, default=2.0, help="最长的单次 UI 时间（秒）")
+
+    p = subparsers.add_parser("result-transport", help="UI 结果回传方式对比")
+    p.add_argument("--image-mb", type=float, default=10.0, help="图片大小（MB）")
+    p.add_argument("--repeat", type=int, default=5, help="重复次数")
+
+    p = subparsers.add_parser("rules-lookup", help="规则文件查找延迟（索引 vs 原实现）")
+    p.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 100], help="规则文件大小（MB）")
+    p.add_argument("--queries", type=int, default=50, help="查询次数")
+    p.add_argument("--legacy-max-mb", type=float, default=100, help="超过该大小不再运行原实现")
+
+    p = subparsers.add_parser("keyword-match", help="多关键词匹配：逐关键词循环 vs 一次扫描")
+    p.add_argument("--size-mb", type=float, default=1.0, help="规则文件大小（MB）")
+    p.add_argument("--counts", type=int, nargs="+", default=[1, 5, 10, 20, 50], help="关键词个数")
+
+    p = subparsers.add_parser("rules-store", help="SQLite FTS5 规则存储的查找延迟")
+    p.add_argument("--sizes", type=float, nargs="+", default=[1, 10, 100], help="导入的规则文件大小（MB）")
+    p.add_argument("--queries", type=int, default=50, help="精确命中查询个数")
+    p.add_argument("--repeat", type=int, default=5, help="重复次数")
+
+    p = subparsers.add_parser("similarity", help="相似问题索引的构建与查询延迟")
+    p.add_argument("--counts", type=int, nargs="+", default=[1000, 10000, 100000], help="已保存问题数")
+    p.add_argument("--queries", type=int, default=50, help="查询次数")
+
+    p = subparsers.add_parser("image-paste", help="粘贴图片时 GUI 线程的停顿")
+    p.add_argument("--count", type=int, default=5, help="粘贴的图片张数")
+    p.add_argument("--width", type=int, default=3840, help="截图宽度")
+    p.add_argument("--height", type=int, default=2160, help="截图高度")
+    p.add_argument("--dpr", type=float, default=2.0, help="模拟的设备像素比")
+
+    p = subparsers.add_parser("image-memory", help="粘贴多张截图时的峰值 RSS")
+    p.add_argument("--count", type=int, default=10, help="粘贴的图片张数")
+    p.add_argument("--width", type=int, default=3840, help="截图宽度")
+    p.add_argument("--height", type=int, default=2160, help="截图高度")
+    p.add_argument("--mode", choices=["legacy", "registry"], help=argparse.SUPPRESS)
+
+    p = subparsers.add_parser("prompt-render", help="描述区域渲染耗时（原实现 vs 单次预处理 + 缓存）")
+    p.add_argument("--sizes-kb", type=float, nargs="+", default=[1, 10, 100, 1024], help="提示文本大小（KB）")
+
+    p = subparsers.add_parser("prompt-first-paint", help="大提示文本的首次绘制耗时（整体渲染 vs 渐进渲染）")
+    p.add_argument("--sizes-kb", type=float, nargs="+", default=[100, 1024, 5120], help="提示文本大小（KB）")
+    p.add_argument("--full-max-kb", type=float, default=1024, help="Markdown 超过该大小不再运行整体渲染")
+
+    p = subparsers.add_parser("data-sync-first-paint", help="DataSyncUI 的首次绘制耗时（立即构建 vs 延迟构建标签页）")
+    p.add_argument("--repeat", type=int, default=20, help="重复次数")
+
+    p = subparsers.add_parser("dmp-verify", help="DMP 响应的解析与向量化校验耗时")
+    p.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000], help="响应行数")
+    p.add_argument("--bad-ratio", type=float, default=0.001, help="有问题的行所占比例")
+    p.add_argument("--repeat", type=int, default=5, help="校验重复次数")
+
+    p = subparsers.add_parser("affected-mids", help="受影响 MID 的编码大小、解码耗时与峰值内存")
+    p.add_argument("--counts", type=int, nargs="+", default=[1000000, 10000000], help="MID 个数")
+    p.add_argument("--list-max", type=int, default=1000000, help="超过该数量不再测试字符串列表")
+
+    p = subparsers.add_parser("consistency-tree", help="哈希树一致性比对 vs 全表逐个比较")
+    p.add_argument("--counts", type=int, nargs="+", default=[1000000, 10000000], help="用户群 MID 个数")
+    p.add_argument("--diffs", type=int, nargs="+", default=[10, 1000, 100000], help="两侧不一致的 MID 个数")
+    p.add_argument("--repeat", type=int, default=3)
+
+    p = subparsers.add_parser("audience-bitmap", help="用户群位图 vs Python 集合的集合运算")
+    p.add_argument("--counts", type=int, nargs="+", default=[1000000, 50000000], help="每个用户群的 MID 个数")
+    p.add_argument("--set-max", type=int, default=50000000, help="超过该数量不再测试 Python 集合")
+
+    p = subparsers.add_parser("audience-index", help="MID -> 用户群 倒排索引的写入与影响扇出查询延迟")
+    p.add_argument("--audiences", type=int, default=40, help="用户群个数")
+    p.add_argument("--size", type=int, default=500000, help="每个用户群的 MID 个数")
+    p.add_argument("--universe", type=int, default=50000000, help="MID 取值范围")
+    p.add_argument("--queries", type=int, nargs="+", default=[100000, 1000000], help="查询的 MID 个数")
+    p.add_argument("--repeat", type=int, default=3)
+
+    args = parser.parse_args()
+    BENCHMARKS[args.benchmark](args)
+    sys.exit(0)
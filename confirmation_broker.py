@@ -0,0 +1,287 @@
+# Confirmation Broker - 常驻 UI 进程中的确认请求队列
+# 两个 MCP 服务端的弹窗请求都进入同一个队列，按严重程度排序（critical 的回滚/一致性检查优先），
+# 同一时间只显示一个窗口，窗口顶部的队列栏可以在待确认请求之间切换；
+# 短时间内连续到达的请求合并为一次摘要提示，而不是每个请求各弹一个置顶窗口抢焦点
+import os
+import time
+import threading
+from typing import Callable, Dict, List, Optional
+
+from PySide6.QtCore import Qt, QObject, QTimer
+from PySide6.QtWidgets import QApplication, QComboBox, QLabel, QPushButton, QToolBar
+
+# 合并窗口（毫秒）：该时间内到达的请求一起入队，只提示一次
+COALESCE_ENV = "INTERACTIVE_FEEDBACK_COALESCE_MS"
+DEFAULT_COALESCE_MS = 300
+
+# 严重程度从高到低
+SEVERITY_RANK = {"critical": 0, "high": 1, "medium": 2, "low": 3}
+
+# 未显式给出严重程度时，按数据同步操作类型推断
+OPERATION_SEVERITY = {
+    "rollback": "critical",
+    "consistency": "high",
+    "update": "medium",
+    "sync": "medium",
+    "verify": "low",
+}
+
+# 同一严重程度内，回滚与一致性检查排在前面
+OPERATION_RANK = {"rollback": 0, "consistency": 1}
+
+def coalesce_ms() -> int:
+    """合并窗口（毫秒），环境变量无效时使用默认值"""
+    try:
+        return max(0, int(os.environ.get(COALESCE_ENV, DEFAULT_COALESCE_MS)))
+    except ValueError:
+        return DEFAULT_COALESCE_MS
+
+def request_severity(kind: str, payload: Dict) -> str:
+    """请求的严重程度：payload 中显式给出的优先，其次按操作类型推断，默认 medium"""
+    severity = str(payload.get("severity") or "").strip().lower()
+    if severity in SEVERITY_RANK:
+        return severity
+    if kind == "data_sync":
+        context = payload.get("context") or {}
+        items = context.get("items")
+        if items:
+            # 批量确认取各条目中的最高风险
+            levels = [str(item.get("risk_level", "")).lower() for item in items]
+            return min((level for level in levels if level in SEVERITY_RANK), key=SEVERITY_RANK.get, default="medium")
+        return OPERATION_SEVERITY.get(context.get("operation_type"), "medium")
+    return "medium"
+
+def request_title(kind: str, payload: Dict) -> str:
+    """队列中显示的简短标题"""
+    if kind == "data_sync":
+        context = payload.get("context") or {}
+        if context.get("items"):
+            return f"batch_sync {len(context['items'])} 个用户群"
+        return f"{context.get('operation_type', '')} {context.get('audience_id', '')}".strip()
+    prompt = " ".join(str(payload.get("prompt", "")).split())
+    return prompt[:40] + ("…" if len(prompt) > 40 else "")
+
+class PendingConfirmation:
+    """队列中的一个确认请求"""
+
+    def __init__(self, seq: int, kind: str, payload: Dict, window, on_finished: Callable[["PendingConfirmation", Dict], None],
+                 prepare: Optional[Callable[[], object]] = None):
+        self.seq = seq
+        self.kind = kind
+        self.severity = request_severity(kind, payload)
+        self.title = request_title(kind, payload)
+        self.operation = (payload.get("context") or {}).get("operation_type", "") if kind == "data_sync" else ""
+        self.window = window
+        self.on_finished = on_finished
+        self.prepare = prepare
+        self.arrived_at = time.monotonic()
+        # 首次显示的时间（monotonic），None 表示仍在排队
+        self.shown_at: Optional[float] = None
+        self.toolbar: Optional[QToolBar] = None
+
+    def sort_key(self):
+        return (SEVERITY_RANK[self.severity], OPERATION_RANK.get(self.operation, len(OPERATION_RANK)), self.seq)
+
+    def wait_seconds(self, now: Optional[float] = None) -> float:
+        """排队等待时间：已显示的按首次显示时刻计，否则计到现在"""
+        end = self.shown_at if self.shown_at is not None else (now or time.monotonic())
+        return end - self.arrived_at
+
+    def status(self, now: float) -> Dict:
+        return {
+            "id": self.seq,
+            "kind": self.kind,
+            "severity": self.severity,
+            "title": self.title,
+            "age_s": round(now - self.arrived_at, 1),
+            "wait_s": round(self.wait_seconds(now), 1),
+            "shown": self.shown_at is not None,
+        }
+
+class ConfirmationBroker(QObject):
+    """
+    确认请求队列（只在 GUI 线程中调用 add；status 可在任意线程调用）
+    窗口由调用方创建，队列负责决定显示哪一个；窗口关闭（提交或取消）后自动显示下一个最高优先级的请求
+    """
+
+    def __init__(self, coalesce_interval_ms: Optional[int] = None, parent=None):
+        super().__init__(parent)
+        self._queue: List[PendingConfirmation] = []
+        self._incoming: List[PendingConfirmation] = []
+        self._current: Optional[PendingConfirmation] = None
+        self._seq = 0
+        self._last_flush_count = 0
+        self._lock = threading.Lock()
+
+        self._coalesce_timer = QTimer(self)
+        self._coalesce_timer.setSingleShot(True)
+        self._coalesce_timer.setInterval(coalesce_ms() if coalesce_interval_ms is None else coalesce_interval_ms)
+        self._coalesce_timer.timeout.connect(self._flush)
+
+        # 队列中有多个请求时定期刷新等待时间
+        self._refresh_timer = QTimer(self)
+        self._refresh_timer.setInterval(1000)
+        self._refresh_timer.timeout.connect(self._refresh_toolbar)
+
+    def add(self, kind: str, payload: Dict, window, on_finished: Callable[[PendingConfirmation, Dict], None],
+            prepare: Optional[Callable[[], object]] = None) -> PendingConfirmation:
+        """
+        加入一个已创建（未显示）的窗口；合并窗口结束后统一入队
+        每次显示该窗口前调用 prepare（如应用界面主题），窗口关闭时以 (请求, 结果) 调用 on_finished
+        """
+        with self._lock:
+            self._seq += 1
+            pending = PendingConfirmation(self._seq, kind, payload, window, on_finished, prepare)
+            self._incoming.append(pending)
+        window.finished.connect(lambda result: self._on_finished(pending, result))
+        # 第一个请求开始计时，合并窗口内后续到达的请求不延长等待
+        if not self._coalesce_timer.isActive():
+            self._coalesce_timer.start()
+        return pending
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._queue) + len(self._incoming)
+
+    def status(self) -> Dict:
+        """队列深度与每个请求的等待时间（按显示顺序）"""
+        now = time.monotonic()
+        with self._lock:
+            queue = sorted(self._queue, key=PendingConfirmation.sort_key) + self._incoming
+            return {
+                "queue_depth": len(queue),
+                "current": self._current.seq if self._current else None,
+                "requests": [pending.status(now) for pending in queue],
+            }
+
+    def _ordered(self) -> List[PendingConfirmation]:
+        return sorted(self._queue, key=PendingConfirmation.sort_key)
+
+    def _flush(self):
+        """合并窗口结束：新请求入队，没有正在显示的窗口时显示最高优先级的请求"""
+        with self._lock:
+            arrived, self._incoming = self._incoming, []
+            self._queue.extend(arrived)
+        self._last_flush_count = len(arrived)
+        if not arrived:
+            return
+        if self._current is None:
+            self._show(self._ordered()[0])
+        else:
+            # 不打断正在处理的请求，只更新摘要并提示一次
+            self._refresh_toolbar()
+            QApplication.alert(self._current.window)
+
+    def _show(self, pending: PendingConfirmation):
+        """显示指定请求的窗口，隐藏当前窗口（保留其输入内容）"""
+        previous = self._current
+        self._current = pending
+        if pending.shown_at is None:
+            pending.shown_at = time.monotonic()
+        if previous is not None and previous is not pending:
+            # 在同一位置显示，看起来是同一个窗口在切换内容
+            pending.window.move(previous.window.pos())
+            previous.window.hide()
+        self._refresh_toolbar()
+        if pending.prepare is not None:
+            pending.prepare()
+        pending.window.show()
+        pending.window.raise_()
+        pending.window.activateWindow()
+
+    def _step(self, offset: int):
+        """在队列中前后切换"""
+        ordered = self._ordered()
+        if self._current in ordered and len(ordered) > 1:
+            index = (ordered.index(self._current) + offset) % len(ordered)
+            self._show(ordered[index])
+
+    def _select(self, seq):
+        for pending in self._queue:
+            if pending.seq == seq and pending is not self._current:
+                self._show(pending)
+                return
+
+    def _on_finished(self, pending: PendingConfirmation, result: Dict):
+        """窗口提交或取消：移出队列，回传结果并显示下一个请求"""
+        with self._lock:
+            if pending in self._queue:
+                self._queue.remove(pending)
+            elif pending in self._incoming:
+                self._incoming.remove(pending)
+        pending.on_finished(pending, result)
+        if self._current is pending:
+            self._current = None
+            self._last_flush_count = 0
+            if self._queue:
+                self._show(self._ordered()[0])
+        if len(self._queue) <= 1:
+            self._refresh_timer.stop()
+
+    def _digest_text(self, ordered: List[PendingConfirmation]) -> str:
+        counts: Dict[str, int] = {}
+        for pending in ordered:
+            counts[pending.severity] = counts.get(pending.severity, 0) + 1
+        parts = [f"{severity.upper()} {counts[severity]}" for severity in SEVERITY_RANK if severity in counts]
+        text = f"待确认 {len(ordered)} 个：" + " · ".join(parts)
+        if self._last_flush_count > 1:
+            text = f"新到 {self._last_flush_count} 个请求 · " + text
+        return text
+
+    def _ensure_toolbar(self, pending: PendingConfirmation) -> QToolBar:
+        """给窗口加上队列栏（摘要、请求列表、上一个/下一个）"""
+        if pending.toolbar is not None:
+            return pending.toolbar
+        toolbar = QToolBar("确认队列", pending.window)
+        toolbar.setObjectName("confirmation_queue")
+        toolbar.setMovable(False)
+        toolbar.digest_label = QLabel()
+        toolbar.addWidget(toolbar.digest_label)
+        toolbar.addSeparator()
+        previous_button = QPushButton("◀ 上一个")
+        previous_button.clicked.connect(lambda: self._step(-1))
+        toolbar.addWidget(previous_button)
+        toolbar.selector = QComboBox()
+        toolbar.selector.setMinimumContentsLength(30)
+        toolbar.selector.activated.connect(lambda index: self._select(toolbar.selector.itemData(index)))
+        toolbar.addWidget(toolbar.selector)
+        next_button = QPushButton("下一个 ▶")
+        next_button.clicked.connect(lambda: self._step(1))
+        toolbar.addWidget(next_button)
+        pending.window.addToolBar(Qt.TopToolBarArea, toolbar)
+        pending.toolbar = toolbar
+        return toolbar
+
+    def _refresh_toolbar(self):
+        """刷新当前窗口的队列栏；队列中只有一个请求时隐藏"""
+        current = self._current
+        if current is None:
+            return
+        ordered = self._ordered()
+        if len(ordered) <= 1:
+            if current.toolbar is not None:
+                current.toolbar.hide()
+            self._refresh_timer.stop()
+            return
+        toolbar = self._ensure_toolbar(current)
+        toolbar.digest_label.setText(self._digest_text(ordered))
+        now = time.monotonic()
+        selector = toolbar.selector
+        seqs = [pending.seq for pending in ordered]
+        # 队列未变化时只更新文本，不重建列表（避免关闭已展开的下拉框）
+        rebuild = seqs != [selector.itemData(i) for i in range(selector.count())]
+        selector.blockSignals(True)
+        if rebuild:
+            selector.clear()
+        for position, pending in enumerate(ordered, 1):
+            waited = "处理中" if pending is current else f"等待 {now - pending.arrived_at:.0f}s"
+            text = f"{position}. [{pending.severity.upper()}] {pending.title} · {waited}"
+            if rebuild:
+                selector.addItem(text, pending.seq)
+            else:
+                selector.setItemText(position - 1, text)
+        selector.setCurrentIndex(ordered.index(current))
+        selector.blockSignals(False)
+        toolbar.show()
+        if not self._refresh_timer.isActive():
+            self._refresh_timer.start()
@@ -0,0 +1,134 @@
+# Confirmation Tickets - 异步确认凭据
+# 工具以 ticket 模式调用时立即返回凭据，弹窗在后台任务中保持打开；
+# 调用方用 get_confirmation_result(ticket) 短时间长轮询结果，轮询窗口之后才到达的回答保留在内存中，
+# 凭据数量有上限，超过有效期的凭据被清除（仍在等待的窗口随之关闭）
+import os
+import json
+import time
+import uuid
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Optional
+
+logger = logging.getLogger(__name__)
+
+# 凭据有效期（秒）：弹窗最多等待这么久，回答在此之后仍保留同样时长
+TICKET_TTL_ENV = "INTERACTIVE_FEEDBACK_TICKET_TTL"
+DEFAULT_TICKET_TTL = 3600
+# 同时保存的凭据上限
+TICKET_MAX_ENV = "INTERACTIVE_FEEDBACK_TICKET_MAX"
+DEFAULT_TICKET_MAX = 256
+
+# 单次长轮询的默认与最长等待（秒），低于常见的工具调用超时
+DEFAULT_POLL_SECONDS = 25
+MAX_POLL_SECONDS = 55
+
+def _env_number(name: str, default):
+    try:
+        value = type(default)(os.environ.get(name, default))
+    except ValueError:
+        return default
+    return value if value > 0 else default
+
+class Ticket:
+    """一个确认凭据：后台任务产出的工具结果"""
+
+    def __init__(self, ticket_id: str, task: asyncio.Task):
+        self.id = ticket_id
+        self.task = task
+        self.created_at = time.monotonic()
+        self.finished_at: Optional[float] = None
+        task.add_done_callback(self._on_done)
+
+    def _on_done(self, task: asyncio.Task):
+        self.finished_at = time.monotonic()
+
+    @property
+    def done(self) -> bool:
+        return self.task.done()
+
+    def expired(self, now: float, ttl: float) -> bool:
+        """等待超过有效期，或回答到达后超过有效期"""
+        return now - (self.finished_at if self.finished_at is not None else self.created_at) > ttl
+
+class TicketStore:
+    """
+    进程内的凭据表（按创建顺序），只在 MCP 服务端的事件循环中使用
+    超过上限时先淘汰最早完成的凭据，全部仍在等待时淘汰最早创建的（取消其后台任务）
+    """
+
+    def __init__(self, ttl: Optional[float] = None, max_tickets: Optional[int] = None):
+        self.ttl = float(ttl if ttl is not None else _env_number(TICKET_TTL_ENV, DEFAULT_TICKET_TTL))
+        self.max_tickets = max_tickets if max_tickets is not None else _env_number(TICKET_MAX_ENV, DEFAULT_TICKET_MAX)
+        self._tickets: "OrderedDict[str, Ticket]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def issue(self, work: Awaitable[Any]) -> str:
+        """在后台运行 work（弹窗并整理结果），返回凭据 ID"""
+        self.purge()
+        while len(self._tickets) >= self.max_tickets:
+            victim = next((t for t in self._tickets.values() if t.done), None) or next(iter(self._tickets.values()))
+            self._drop(victim)
+        ticket_id = uuid.uuid4().hex[:12]
+        self._tickets[ticket_id] = Ticket(ticket_id, asyncio.ensure_future(work))
+        return ticket_id
+
+    def _drop(self, ticket: Ticket):
+        self._tickets.pop(ticket.id, None)
+        if not ticket.done:
+            logger.info(f"Confirmation ticket {ticket.id} dropped before it was answered")
+            ticket.task.cancel()
+        elif not ticket.task.cancelled():
+            # 取走异常，避免 "exception was never retrieved" 警告
+            ticket.task.exception()
+
+    def purge(self):
+        """清除过期的凭据"""
+        now = time.monotonic()
+        for ticket in [t for t in self._tickets.values() if t.expired(now, self.ttl)]:
+            self._drop(ticket)
+
+    async def wait(self, ticket_id: str, timeout: float) -> Optional[Ticket]:
+        """
+        最多等待 timeout 秒；返回凭据（可能仍未完成），凭据不存在或已过期时返回 None
+        等待超时不会取消后台任务，之后到达的回答仍会保存
+        """
+        self.purge()
+        ticket = self._tickets.get(ticket_id)
+        if ticket is None:
+            return None
+        if not ticket.done and timeout > 0:
+            await asyncio.wait({ticket.task}, timeout=timeout)
+        return ticket
+
+    async def poll(self, ticket_id: str, wait_seconds: Optional[float] = None):
+        """
+        get_confirmation_result 的实现：已有回答时返回工具结果本身（可重复获取，直到过期），
+        否则返回描述状态的 JSON 文本（pending / expired / error）
+        """
+        timeout = DEFAULT_POLL_SECONDS if wait_seconds is None else min(max(wait_seconds, 0), MAX_POLL_SECONDS)
+        started = time.monotonic()
+        ticket = await self.wait(ticket_id, timeout)
+        if ticket is None:
+            return status_text(ticket_id, "expired", message="凭据不存在或已过期")
+        if not ticket.done:
+            return status_text(ticket_id, "pending", waited_s=round(time.monotonic() - started, 1),
+                               age_s=round(time.monotonic() - ticket.created_at, 1))
+        if ticket.task.cancelled():
+            return status_text(ticket_id, "error", message="确认已被取消")
+        error = ticket.task.exception()
+        if error is not None:
+            return status_text(ticket_id, "error", message=str(error))
+        return ticket.task.result()
+
+def status_text(ticket_id: str, status: str, **fields) -> str:
+    """凭据状态的 JSON 文本"""
+    return json.dumps({"ticket": ticket_id, "status": status, **fields}, ensure_ascii=False)
+
+def issued_text(store: TicketStore, ticket_id: str) -> str:
+    """ticket 模式下工具立即返回的内容"""
+    return status_text(ticket_id, "pending", expires_in_s=int(store.ttl),
+                       next="get_confirmation_result(ticket) 获取回答")
@@ -0,0 +1,618 @@
+# Consistency Tree - DMP 与本地用户群的哈希树一致性比对
+# 两侧都把 MID→状态 按 MID 的哈希分到 2^depth 个桶：桶哈希为桶内 (MID, 状态) 元素哈希之和（与顺序无关，可增量更新），
+# 上层节点为两个子节点哈希的混合，逐层直到根。比对时先比根，只沿不一致的节点向下，最后只在不一致的桶里逐个比较，
+# 得到仅 DMP 有、仅本地有、状态不同的 MID。
+# 快照构建的树缓存在快照旁（<快照>.merkle/，按需内存映射读取），本地替身库在每次写入时增量维护桶哈希，
+# 因此比对只读取根到不一致桶的路径和这些桶本身，开销与差异数量成正比，而不是用户群大小
+# 数据源：
+#   - CSV：MID,Status 两列（可有表头，多余的列忽略）
+#   - .bin / .snap：小端 (uint64 MID, int64 Status) 记录，每条 16 字节
+#   - store:<路径>：本地替身库（SQLite）
+import os
+import json
+import time
+import sqlite3
+import argparse
+import warnings
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
+
+import numpy as np
+
+# 默认树深度：2^16 个桶，1000 万个 MID 时每桶约 150 个
+DEFAULT_DEPTH = 16
+MAX_DEPTH = 24
+
+# 报告中列出的不一致行数上限（全部不一致 MID 另以数组给出）
+DIFF_ROWS_LIMIT = 500
+
+# CSV 每次读取的字节数
+CSV_BLOCK_SIZE = 1 << 24
+
+# SQLite IN 查询每批的参数个数
+SQL_BATCH = 500
+
+STORE_PREFIX = "store:"
+CACHE_SUFFIX = ".merkle"
+CACHE_VERSION = 1
+RECORD_DTYPE = np.dtype([("mid", "<u8"), ("status", "<i8")])
+BINARY_EXTENSIONS = (".bin", ".snap")
+
+_MIX1 = np.uint64(0xBF58476D1CE4E5B9)
+_MIX2 = np.uint64(0x94D049BB133111EB)
+_BUCKET_SEED = np.uint64(0x9E3779B97F4A7C15)
+_STATUS_SEED = np.uint64(0xD6E8FEB86659FD93)
+_INT64_MAX = np.iinfo(np.int64).max
+
+class SnapshotError(ValueError):
+    """快照或本地库无法读取、格式不正确"""
+
+# ---------------------------------------------------------------------------
+# 哈希
+# ---------------------------------------------------------------------------
+
+def _mix(x: np.ndarray) -> np.ndarray:
+    """splitmix64 的混合函数（向量化，uint64 乘法按 2^64 回绕）"""
+    x = x ^ (x >> np.uint64(30))
+    x = x * _MIX1
+    x = x ^ (x >> np.uint64(27))
+    x = x * _MIX2
+    return x ^ (x >> np.uint64(31))
+
+def bucket_of(mids: np.ndarray, depth: int) -> np.ndarray:
+    """MID 所在的桶（两侧必须使用相同的 depth）"""
+    return (_mix(mids ^ _BUCKET_SEED) >> np.uint64(64 - depth)).astype(np.int64)
+
+def entry_hash(mids: np.ndarray, statuses: np.ndarray) -> np.ndarray:
+    """(MID, 状态) 元素哈希"""
+    statuses = np.ascontiguousarray(statuses, dtype=np.int64).view(np.uint64)
+    return _mix(mids ^ _mix(statuses ^ _STATUS_SEED))
+
+def _combine(left: np.ndarray, right: np.ndarray) -> np.ndarray:
+    return _mix(left + _mix(right ^ _BUCKET_SEED))
+
+class MerkleTree:
+    """按层保存的哈希树：levels[0] 为 2^depth 个桶哈希，levels[-1] 为根"""
+
+    def __init__(self, leaves: np.ndarray):
+        self.levels = [np.asarray(leaves, dtype=np.uint64)]
+        while len(self.levels[-1]) > 1:
+            level = self.levels[-1]
+            self.levels.append(_combine(level[0::2], level[1::2]))
+
+    @property
+    def depth(self) -> int:
+        return len(self.levels) - 1
+
+    @property
+    def root(self) -> int:
+        return int(self.levels[-1][0])
+
+    def diff_buckets(self, other: "MerkleTree") -> Tuple[np.ndarray, int]:
+        """从根开始只沿不一致的节点向下，返回 (不一致的桶, 比较过的节点数)"""
+        if self.depth != other.depth:
+            raise SnapshotError(f"两侧哈希树深度不同（{self.depth} / {other.depth}），请用相同的 depth 重建")
+        candidates = np.zeros(1 if self.root != other.root else 0, dtype=np.int64)
+        visited = 1
+        for level in range(self.depth - 1, -1, -1):
+            if not len(candidates):
+                break
+            children = np.stack([candidates * 2, candidates * 2 + 1], axis=1).ravel()
+            visited += len(children)
+            candidates = children[self.levels[level][children] != other.levels[level][children]]
+        return candidates, visited
+
+def _leaves(mids: np.ndarray, statuses: np.ndarray, offsets: np.ndarray) -> np.ndarray:
+    """按桶排好序的条目 -> 桶哈希（空桶为 0）"""
+    leaves = np.zeros(len(offsets) - 1, dtype=np.uint64)
+    nonempty = np.flatnonzero(np.diff(offsets))
+    if len(nonempty):
+        leaves[nonempty] = np.add.reduceat(entry_hash(mids, statuses), offsets[nonempty])
+    return leaves
+
+# ---------------------------------------------------------------------------
+# 快照
+# ---------------------------------------------------------------------------
+
+class Snapshot:
+    """
+    按 (桶, MID) 排序的快照：mids / statuses 连续存放，offsets[b]:offsets[b+1] 为第 b 个桶的条目
+    """
+
+    def __init__(self, mids: np.ndarray, statuses: np.ndarray, offsets: np.ndarray, leaves: np.ndarray):
+        self.mids = mids
+        self.statuses = statuses
+        self.offsets = offsets
+        self.tree = MerkleTree(leaves)
+
+    def __len__(self) -> int:
+        return len(self.mids)
+
+    @property
+    def depth(self) -> int:
+        return self.tree.depth
+
+    def buckets(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        这些（升序的）桶中的全部条目，返回 (所在桶, MID, 状态)，按 (桶, MID) 排序；只读取这些桶所在的页
+        """
+        starts = np.asarray(self.offsets[indices], dtype=np.int64)
+        lengths = np.asarray(self.offsets[indices + 1], dtype=np.int64) - starts
+        # 每个桶的区间 [start, start + length) 拼接成一个下标数组
+        positions = np.arange(lengths.sum(), dtype=np.int64) + np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.repeat(indices, lengths), np.asarray(self.mids[positions]), np.asarray(self.statuses[positions])
+
+    @classmethod
+    def from_arrays(cls, mids, statuses, depth: int = DEFAULT_DEPTH) -> "Snapshot":
+        """从 MID / 状态数组构建；同一 MID 出现多次时保留最后一条"""
+        if not 1 <= depth <= MAX_DEPTH:
+            raise SnapshotError(f"depth 必须在 1 ~ {MAX_DEPTH} 之间")
+        mids = np.asarray(mids, dtype=np.uint64)
+        statuses = np.asarray(statuses, dtype=np.int64)
+        if mids.shape != statuses.shape or mids.ndim != 1:
+            raise SnapshotError("MID 与状态的数量不一致")
+        buckets = bucket_of(mids, depth)
+        # lexsort 稳定：同一 MID 的多条保持原顺序，取每组最后一条
+        order = np.lexsort((mids, buckets))
+        mids, statuses, buckets = mids[order], statuses[order], buckets[order]
+        keep = np.ones(len(mids), dtype=bool)
+        keep[:-1] = mids[1:] != mids[:-1]
+        if not keep.all():
+            mids, statuses, buckets = mids[keep], statuses[keep], buckets[keep]
+        offsets = np.searchsorted(buckets, np.arange((1 << depth) + 1)).astype(np.int64)
+        return cls(mids, statuses, offsets, _leaves(mids, statuses, offsets))
+
+    def save(self, directory: str, meta: Dict):
+        """写入缓存目录；meta.json 最后写入，作为缓存完整的标记"""
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        if os.path.exists(meta_path):
+            os.unlink(meta_path)
+        for name in ("mids", "statuses", "offsets"):
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+        np.save(os.path.join(directory, "leaves.npy"), self.tree.levels[0])
+        temp_path = meta_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(temp_path, meta_path)
+
+    @classmethod
+    def load(cls, directory: str) -> "Snapshot":
+        """内存映射读取缓存目录，比对时只有访问到的桶会被读入"""
+        arrays = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode="r")
+                  for name in ("mids", "statuses", "offsets")]
+        leaves = np.load(os.path.join(directory, "leaves.npy"))
+        return cls(*arrays, leaves)
+
+def read_csv(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """读取 MID,Status CSV（首行第一列不是整数时视为表头），分块解析"""
+    mid_parts, status_parts = [], []
+    with open(path, "rb") as f:
+        first_line = f.readline()
+        while first_line and not first_line.strip():
+            first_line = f.readline()
+        columns = first_line.count(b",") + 1
+        if first_line and columns < 2:
+            raise SnapshotError(f"{path}: CSV 至少需要 MID,Status 两列")
+        carry = first_line if first_line.split(b",", 1)[0].strip().lstrip(b"-").isdigit() else b""
+        while True:
+            block = f.read(CSV_BLOCK_SIZE)
+            data = carry + block
+            if block:
+                cut = data.rfind(b"\n") + 1
+                data, carry = data[:cut], data[cut:]
+            if data.strip():
+                text = data.replace(b",", b" ").decode("ascii", errors="replace")
+                try:
+                    with warnings.catch_warnings():
+                        warnings.simplefilter("error")
+                        values = np.fromstring(text, dtype=np.int64, sep=" ")
+                except (ValueError, DeprecationWarning):
+                    raise SnapshotError(f"{path}: MID 与状态必须是整数")
+                if len(values) % columns:
+                    raise SnapshotError(f"{path}: 每行必须有 {columns} 列")
+                values = values.reshape(-1, columns)
+                if (values[:, 0] < 0).any():
+                    raise SnapshotError(f"{path}: MID 必须是非负整数")
+                mids = values[:, 0].astype(np.uint64)
+                # 按 int64 解析时 2^63 以上的 MID 及越界的值都被截为 int64 最大值，这些行回到原文重新解析
+                clamped = values[:, :2] == _INT64_MAX
+                if clamped.any():
+                    tokens = text.split()
+                    rows = np.flatnonzero(clamped[:, 0])
+                    try:
+                        mids[rows] = np.array([tokens[row * columns] for row in rows.tolist()], dtype=np.uint64)
+                    except (OverflowError, ValueError):
+                        raise SnapshotError(f"{path}: MID 超出 uint64 范围")
+                    for row in np.flatnonzero(clamped[:, 1]).tolist():
+                        if int(tokens[row * columns + 1]) != _INT64_MAX:
+                            raise SnapshotError(f"{path}: 状态超出 int64 范围")
+                mid_parts.append(mids)
+                status_parts.append(values[:, 1].copy())
+            if not block:
+                break
+    if not mid_parts:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    return np.concatenate(mid_parts), np.concatenate(status_parts)
+
+def read_binary(path: str) -> Tuple[np.ndarray, np.ndarray]:
+    """读取 (uint64 MID, int64 Status) 小端记录"""
+    size = os.path.getsize(path)
+    if size % RECORD_DTYPE.itemsize:
+        raise SnapshotError(f"{path}: 文件大小不是 {RECORD_DTYPE.itemsize} 字节记录的整数倍")
+    if size == 0:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=np.int64)
+    records = np.memmap(path, dtype=RECORD_DTYPE, mode="r")
+    return records["mid"], records["status"]
+
+def write_snapshot(path: str, mids, statuses):
+    """按扩展名写为二进制记录或 CSV 快照"""
+    mids = np.asarray(mids, dtype=np.uint64)
+    statuses = np.asarray(statuses, dtype=np.int64)
+    if path.endswith(BINARY_EXTENSIONS):
+        records = np.empty(len(mids), dtype=RECORD_DTYPE)
+        records["mid"], records["status"] = mids, statuses
+        records.tofile(path)
+        return
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("MID,Status\n")
+        for start in range(0, len(mids), 1 << 20):
+            end = start + (1 << 20)
+            f.writelines(f"{m},{s}\n" for m, s in zip(mids[start:end].tolist(), statuses[start:end].tolist()))
+
+def load_snapshot(path: str, depth: int = DEFAULT_DEPTH, rebuild: bool = False) -> Snapshot:
+    """
+    读取快照文件并构建哈希树；树缓存在 <path>.merkle/，快照大小与修改时间不变时直接内存映射复用
+    """
+    try:
+        stat = os.stat(path)
+    except OSError as e:
+        raise SnapshotError(f"无法读取快照 {path}: {e}")
+    meta = {"version": CACHE_VERSION, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "depth": depth}
+    cache = path + CACHE_SUFFIX
+    if not rebuild:
+        try:
+            with open(os.path.join(cache, "meta.json"), encoding="utf-8") as f:
+                if json.load(f) == meta:
+                    return Snapshot.load(cache)
+        except (OSError, ValueError):
+            pass
+
+    reader = read_binary if path.endswith(BINARY_EXTENSIONS) else read_csv
+    snapshot = Snapshot.from_arrays(*reader(path), depth=depth)
+    try:
+        snapshot.save(cache, meta)
+    except OSError:
+        # 缓存只是加速，目录不可写时下次重新构建
+        pass
+    return snapshot
+
+# ---------------------------------------------------------------------------
+# 本地替身库
+# ---------------------------------------------------------------------------
+
+class LocalStatusStore:
+    """
+    本地替身库（SQLite）：statuses 表按 bucket 建索引，merkle_leaves 表保存每个桶的哈希，
+    写入时在同一事务里增量更新受影响的桶哈希，打开时不需要扫描全表
+    MID 以 int64 位模式保存；create 为 False 时只打开已有的库（路径写错不会建出一个空库）
+    """
+
+    def __init__(self, path: str, depth: int = DEFAULT_DEPTH, create: bool = True):
+        self.path = path
+        if create:
+            self.conn = sqlite3.connect(path)
+        else:
+            if not os.path.isfile(path):
+                raise SnapshotError(f"本地替身库不存在: {path}")
+            try:
+                self.conn = sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=rw", uri=True)
+            except sqlite3.Error as e:
+                raise SnapshotError(f"无法打开本地替身库 {path}: {e}")
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS statuses (
+                mid INTEGER PRIMARY KEY,
+                status INTEGER NOT NULL,
+                bucket INTEGER NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS statuses_bucket ON statuses(bucket);
+            CREATE TABLE IF NOT EXISTS merkle_leaves (bucket INTEGER PRIMARY KEY, hash INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+        """)
+        meta = dict(self.conn.execute("SELECT key, value FROM meta"))
+        if "depth" not in meta:
+            if not 1 <= depth <= MAX_DEPTH:
+                raise SnapshotError(f"depth 必须在 1 ~ {MAX_DEPTH} 之间")
+            with self.conn:
+                self.conn.executemany("INSERT INTO meta (key, value) VALUES (?, ?)", [("depth", depth), ("count", 0)])
+            meta = {"depth": depth, "count": 0}
+        # 已有的库沿用建库时的深度
+        self.depth = int(meta["depth"])
+        self.count = int(meta["count"])
+        self.leaves = np.zeros(1 << self.depth, dtype=np.uint64)
+        rows = self.conn.execute("SELECT bucket, hash FROM merkle_leaves").fetchall()
+        if rows:
+            buckets, hashes = zip(*rows)
+            self.leaves[list(buckets)] = np.array(hashes, dtype=np.int64).view(np.uint64)
+        self._tree = None
+
+    def __len__(self) -> int:
+        return self.count
+
+    def close(self):
+        self.conn.close()
+
+    @property
+    def tree(self) -> MerkleTree:
+        if self._tree is None:
+            self._tree = MerkleTree(self.leaves.copy())
+        return self._tree
+
+    def buckets(self, indices: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """这些桶中的全部条目，返回 (所在桶, MID, 状态)，按 (桶, MID) 排序；按 bucket 索引查询"""
+        rows = []
+        indices = indices.tolist()
+        for start in range(0, len(indices), SQL_BATCH):
+            batch = indices[start:start + SQL_BATCH]
+            rows.extend(self.conn.execute(
+                f"SELECT bucket, mid, status FROM statuses WHERE bucket IN ({','.join('?' * len(batch))})", batch))
+        buckets = np.array([row[0] for row in rows], dtype=np.int64)
+        mids = np.array([row[1] for row in rows], dtype=np.int64).view(np.uint64)
+        statuses = np.array([row[2] for row in rows], dtype=np.int64)
+        order = np.lexsort((mids, buckets))
+        return buckets[order], mids[order], statuses[order]
+
+    def _existing(self, mids: np.ndarray) -> Dict[int, int]:
+        """已有 MID（int64 位模式）-> 状态"""
+        existing = {}
+        if not self.count:
+            return existing
+        keys = mids.view(np.int64).tolist()
+        for start in range(0, len(keys), SQL_BATCH):
+            batch = keys[start:start + SQL_BATCH]
+            existing.update(self.conn.execute(
+                f"SELECT mid, status FROM statuses WHERE mid IN ({','.join('?' * len(batch))})", batch))
+        return existing
+
+    def _apply(self, mids: np.ndarray, statuses: Optional[np.ndarray]):
+        """写入（statuses 为 None 时删除）这些 MID，并增量更新桶哈希"""
+        # 同一批里重复的 MID 保留最后一条
+        reverse_unique = np.unique(mids[::-1], return_index=True)[1]
+        keep = np.sort(len(mids) - 1 - reverse_unique)
+        mids = np.ascontiguousarray(mids[keep])
+        if statuses is not None:
+            statuses = np.ascontiguousarray(statuses[keep])
+        existing = self._existing(mids)
+        keys = mids.view(np.int64)
+        buckets = bucket_of(mids, self.depth)
+
+        old_mask = np.array([key in existing for key in keys.tolist()], dtype=bool)
+        if old_mask.any():
+            old_statuses = np.array([existing[key] for key in keys[old_mask].tolist()], dtype=np.int64)
+            np.subtract.at(self.leaves, buckets[old_mask], entry_hash(mids[old_mask], old_statuses))
+        if statuses is not None:
+            np.add.at(self.leaves, buckets, entry_hash(mids, statuses))
+            count = self.count + int((~old_mask).sum())
+        else:
+            count = self.count - int(old_mask.sum())
+
+        touched = np.unique(buckets)
+        with self.conn:
+            if statuses is not None:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO statuses (mid, status, bucket) VALUES (?, ?, ?)",
+                    zip(keys.tolist(), statuses.tolist(), buckets.tolist()))
+            else:
+                self.conn.executemany("DELETE FROM statuses WHERE mid = ?", ((key,) for key in keys.tolist()))
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO merkle_leaves (bucket, hash) VALUES (?, ?)",
+                zip(touched.tolist(), self.leaves[touched].view(np.int64).tolist()))
+            self.conn.execute("UPDATE meta SET value = ? WHERE key = 'count'", (count,))
+        self.count = count
+        self._tree = None
+
+    def upsert(self, mids, statuses):
+        """写入或更新 MID 的状态"""
+        mids = np.atleast_1d(np.asarray(mids, dtype=np.uint64))
+        statuses = np.atleast_1d(np.asarray(statuses, dtype=np.int64))
+        if mids.shape != statuses.shape:
+            raise SnapshotError("MID 与状态的数量不一致")
+        if len(mids):
+            self._apply(mids, statuses)
+
+    def delete(self, mids):
+        """删除 MID"""
+        mids = np.atleast_1d(np.asarray(mids, dtype=np.uint64))
+        if len(mids):
+            self._apply(mids, None)
+
+    def export(self, path: str):
+        """导出为快照文件"""
+        rows = self.conn.execute("SELECT mid, status FROM statuses ORDER BY mid").fetchall()
+        write_snapshot(path, np.array([row[0] for row in rows], dtype=np.int64).view(np.uint64),
+                       [row[1] for row in rows])
+
+Side = Union[Snapshot, LocalStatusStore]
+
+# ---------------------------------------------------------------------------
+# 比对
+# ---------------------------------------------------------------------------
+
+class ConsistencyReport:
+    """
+    比对结果（均按 MID 升序）：
+    only_dmp / only_local 为只在一侧出现的 MID 及其状态，mismatched 为两侧状态不同的 MID
+    """
+
+    def __init__(self, only_dmp: Tuple[np.ndarray, np.ndarray], only_local: Tuple[np.ndarray, np.ndarray],
+                 mismatched: Tuple[np.ndarray, np.ndarray, np.ndarray], stats: Dict):
+        self.only_dmp = only_dmp
+        self.only_local = only_local
+        self.mismatched = mismatched
+        self.stats = stats
+
+    @property
+    def divergent_count(self) -> int:
+        return len(self.only_dmp[0]) + len(self.only_local[0]) + len(self.mismatched[0])
+
+    @property
+    def consistent(self) -> bool:
+        return self.divergent_count == 0
+
+    def divergent_mids(self) -> np.ndarray:
+        """全部不一致的 MID（升序）"""
+        return np.sort(np.concatenate([self.only_dmp[0], self.only_local[0], self.mismatched[0]]))
+
+    def summary(self) -> Dict:
+        return {
+            "consistent": self.consistent,
+            "divergent": self.divergent_count,
+            "only_dmp": len(self.only_dmp[0]),
+            "only_local": len(self.only_local[0]),
+            "status_mismatch": len(self.mismatched[0]),
+            **self.stats,
+        }
+
+    def rows(self, limit: int = DIFF_ROWS_LIMIT) -> List[Dict]:
+        """前 limit 个不一致的 MID 及两侧状态（状态缺失为 None）"""
+        rows = []
+        for mid, status in zip(self.only_dmp[0][:limit].tolist(), self.only_dmp[1][:limit].tolist()):
+            rows.append({"MID": str(mid), "DMP": status, "Local": None, "problem": "本地缺失"})
+        for mid, status in zip(self.only_local[0][:limit].tolist(), self.only_local[1][:limit].tolist()):
+            rows.append({"MID": str(mid), "DMP": None, "Local": status, "problem": "DMP 缺失"})
+        mids, dmp_statuses, local_statuses = (column[:limit].tolist() for column in self.mismatched)
+        for mid, dmp_status, local_status in zip(mids, dmp_statuses, local_statuses):
+            rows.append({"MID": str(mid), "DMP": dmp_status, "Local": local_status, "problem": "状态不同"})
+        rows.sort(key=lambda row: int(row["MID"]))
+        return rows[:limit]
+
+def _match(dmp_entries: Tuple[np.ndarray, ...], local_entries: Tuple[np.ndarray, ...],
+           buckets: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    两侧都按 (桶, MID) 排好序的条目 -> 共同 MID 在两侧的下标
+    把 (桶序号, MID) 映射为单个单调的整数键后直接二分归并，不用重新排序；键超出 63 位时退回 intersect1d
+    """
+    dmp_buckets, dmp_mids, _ = dmp_entries
+    local_buckets, local_mids, _ = local_entries
+    if not len(dmp_mids) or not len(local_mids):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    low = int(min(dmp_mids.min(), local_mids.min()))
+    span = int(max(dmp_mids.max(), local_mids.max())) - low + 1
+    if len(buckets) * span >= 1 << 63:
+        _, dmp_index, local_index = np.intersect1d(dmp_mids, local_mids, assume_unique=True, return_indices=True)
+        return dmp_index, local_index
+
+    def keys(bucket_column, mids):
+        rank = np.searchsorted(buckets, bucket_column).astype(np.uint64)
+        return rank * np.uint64(span) + (mids - np.uint64(low))
+
+    dmp_keys, local_keys = keys(dmp_buckets, dmp_mids), keys(local_buckets, local_mids)
+    positions = np.minimum(np.searchsorted(local_keys, dmp_keys), len(local_keys) - 1)
+    dmp_index = np.flatnonzero(local_keys[positions] == dmp_keys)
+    return dmp_index, positions[dmp_index]
+
+def compare(dmp: Side, local: Side) -> ConsistencyReport:
+    """先比根，只沿不一致的节点向下，再一次性比较所有不一致桶中的条目"""
+    started = time.perf_counter()
+    buckets, visited = dmp.tree.diff_buckets(local.tree)
+    # 同一个 MID 在两侧落在同一个桶，所以把这些桶拼在一起整体比较即可
+    dmp_entries = dmp.buckets(buckets)
+    local_entries = local.buckets(buckets)
+    dmp_index, local_index = _match(dmp_entries, local_entries, buckets)
+    _, dmp_mids, dmp_statuses = dmp_entries
+    _, local_mids, local_statuses = local_entries
+
+    def only(mids, statuses, matched):
+        mask = np.ones(len(mids), dtype=bool)
+        mask[matched] = False
+        mids, statuses = mids[mask], statuses[mask]
+        order = np.argsort(mids)
+        return mids[order], statuses[order]
+
+    differ = dmp_statuses[dmp_index] != local_statuses[local_index]
+    mismatched = dmp_mids[dmp_index][differ]
+    order = np.argsort(mismatched)
+    stats = {
+        "dmp_count": len(dmp),
+        "local_count": len(local),
+        "depth": dmp.tree.depth,
+        "buckets_compared": len(buckets),
+        "nodes_visited": visited,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 3),
+    }
+    return ConsistencyReport(
+        only(dmp_mids, dmp_statuses, dmp_index),
+        only(local_mids, local_statuses, local_index),
+        (mismatched[order], dmp_statuses[dmp_index][differ][order], local_statuses[local_index][differ][order]),
+        stats)
+
+def open_side(source: str, depth: int = DEFAULT_DEPTH, rebuild: bool = False) -> Side:
+    """store:<路径> 打开已有的本地替身库，其他按快照文件读取"""
+    if source.startswith(STORE_PREFIX):
+        return LocalStatusStore(source[len(STORE_PREFIX):], depth, create=False)
+    return load_snapshot(source, depth, rebuild)
+
+def check(dmp_source: str, local_source: str, depth: int = DEFAULT_DEPTH, rebuild: bool = False) -> ConsistencyReport:
+    """
+    比对两个数据源；其中有本地替身库时快照按库的深度构建
+    """
+    sources = {"dmp": dmp_source, "local": local_source}
+    sides = {}
+    try:
+        for name, source in sorted(sources.items(), key=lambda item: not item[1].startswith(STORE_PREFIX)):
+            sides[name] = open_side(source, depth, rebuild)
+            depth = sides[name].depth
+        return compare(sides["dmp"], sides["local"])
+    finally:
+        for side in sides.values():
+            if isinstance(side, LocalStatusStore):
+                side.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="DMP 与本地用户群快照的哈希树一致性比对")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    diff_parser = subparsers.add_parser("diff", help="比对两个数据源，输出报告 JSON")
+    diff_parser.add_argument("dmp", help="DMP 快照（CSV / .bin / .snap）或 store:<路径>")
+    diff_parser.add_argument("local", help="本地快照或 store:<路径>")
+    diff_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="哈希树深度（桶数为 2^depth）")
+    diff_parser.add_argument("--rebuild", action="store_true", help="忽略缓存重建哈希树")
+    diff_parser.add_argument("--limit", type=int, default=20, help="列出的不一致行数")
+
+    build_parser = subparsers.add_parser("build", help="预先为快照构建并缓存哈希树")
+    build_parser.add_argument("snapshot")
+    build_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH)
+
+    load_parser = subparsers.add_parser("load", help="把快照写入本地替身库（已有的 MID 更新状态）")
+    load_parser.add_argument("store", help="SQLite 文件路径")
+    load_parser.add_argument("snapshot")
+    load_parser.add_argument("--depth", type=int, default=DEFAULT_DEPTH, help="新建库时的哈希树深度")
+
+    export_parser = subparsers.add_parser("export", help="把本地替身库导出为快照")
+    export_parser.add_argument("store")
+    export_parser.add_argument("snapshot")
+
+    args = parser.parse_args()
+    if args.command == "diff":
+        report = check(args.dmp, args.local, args.depth, args.rebuild)
+        print(json.dumps({"summary": report.summary(), "rows": report.rows(args.limit)}, ensure_ascii=False, indent=2))
+    elif args.command == "build":
+        snapshot = load_snapshot(args.snapshot, args.depth, rebuild=True)
+        print(f"{len(snapshot)} 个 MID，根哈希 {snapshot.tree.root:016x}")
+    elif args.command == "load":
+        reader = read_binary if args.snapshot.endswith(BINARY_EXTENSIONS) else read_csv
+        store = LocalStatusStore(args.store, args.depth)
+        try:
+            store.upsert(*reader(args.snapshot))
+            print(f"{len(store)} 个 MID，根哈希 {store.tree.root:016x}")
+        finally:
+            store.close()
+    else:
+        store = LocalStatusStore(args.store, create=False)
+        try:
+            store.export(args.snapshot)
+        finally:
+            store.close()
+
+if __name__ == "__main__":
+    main()
@@ -1,19 +1,28 @@
 # Data Sync MCP - 专门为数据同步工作优化的 MCP 工具
 # 针对用户肖像、用户群数据同步场景
 import os
-import sys
 import json
-import tempfile
-import subprocess
-import base64
+import asyncio
+import time
 import logging
-from typing import Annotated, Dict, Tuple, List, Optional
+from typing import Annotated, Any, Callable, Dict, Tuple, List, Optional, Union
 from datetime import datetime
 from dataclasses import dataclass
 
 from fastmcp import FastMCP
 from fastmcp.utilities.types import Image
-from pydantic import Field
+from pydantic import BaseModel, Field
+
+import ui_daemon
+import ui_launcher
+import ui_protocol
+import confirmation_tickets
+import dmp_verification
+import consistency_tree
+import mid_set
+import mid_bitmap
+import audience_index
+import latency_metrics
 
 # 配置日志
 logging.basicConfig(
@@ -25,6 +34,16 @@ logger = logging.getLogger(__name__)
 # 创建 MCP 服务器
 mcp = FastMCP("Data Sync MCP", log_level="INFO")
 
+# ticket 模式的确认凭据
+tickets = confirmation_tickets.TicketStore()
+
+# 同步调用时等待弹窗的超时（秒）
+UI_TIMEOUT = 300
+
+TICKET_FIELD_DESCRIPTION = "为 true 时立即返回确认凭据，窗口保持打开，之后用 get_confirmation_result(ticket) 获取回答"
+
+AFFECTED_MIDS_FIELD_DESCRIPTION = "受影响的 MID：大批量时传紧凑编码 delta:<base64>（差值 varint）、u64:<base64>（小端 uint64）或 file:<路径>（.delta / .u64 / 文本），也可以是逗号分隔的文本或列表"
+
 @dataclass
 class DataSyncContext:
     """数据同步上下文"""
@@ -33,6 +52,18 @@ class DataSyncContext:
     operation_type: str  # "sync", "verify", "update", "rollback"
     timestamp: str
     user_id: Optional[str] = None
+    items: Optional[List[Dict]] = None  # 批量确认的条目
+    verification: Optional[Dict] = None  # DMP 自动校验的结果（摘要与失败行）
+    mids: Optional[Dict] = None  # 受影响 MID 的摘要与按页读取的 .npy 文件
+    consistency: Optional[Dict] = None  # 哈希树一致性比对的摘要与不一致行
+    fanout: Optional[Dict] = None  # 受影响 MID 同时属于的其他用户群（倒排索引查询结果）
+
+class BatchSyncItem(BaseModel):
+    """批量同步确认中的一个用户群"""
+    audience_id: str = Field(description="用户群ID")
+    task_id: str = Field(description="任务ID")
+    sync_details: str = Field(default="", description="同步详情描述")
+    risk_level: str = Field(default="medium", description="风险等级: low/medium/high")
 
 class DataSyncFeedbackUI:
     """专门为数据同步设计的反馈界面"""
@@ -139,74 +170,172 @@ class DataSyncFeedbackUI:
 请确认您有权限执行此操作：
 """
 
-def launch_data_sync_ui(context: DataSyncContext, predefined_options: List[str] = None) -> Dict[str, str]:
-    """启动数据同步专用的反馈界面"""
+async def launch_data_sync_ui(context: DataSyncContext, predefined_options: List[str] = None, severity: Optional[str] = None,
+                              timeout: float = UI_TIMEOUT, call: Optional[latency_metrics.ToolCall] = None) -> Dict[str, str]:
+    """
+    启动数据同步专用的反馈界面，最多等待 timeout 秒
+    severity（critical/high/medium/low）决定在常驻 UI 进程确认队列中的顺序，未给出时按操作类型推断
+    给出 call 时，UI 回传的各阶段耗时计入该次工具调用
+    """
     
-    # 创建临时文件
-    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
-        output_file = tmp.name
+    # 创建数据同步上下文
+    context_data = {
+        "audience_id": context.audience_id,
+        "task_id": context.task_id,
+        "operation_type": context.operation_type,
+        "timestamp": context.timestamp,
+        "user_id": context.user_id
+    }
+    if context.items:
+        context_data["items"] = context.items
+    if context.verification:
+        context_data["verification"] = context.verification
+    if context.mids:
+        context_data["mids"] = context.mids
+    if context.consistency:
+        context_data["consistency"] = context.consistency
+    if context.fanout:
+        context_data["fanout"] = context.fanout
+    
+    # 优先使用常驻 UI 进程，不可用时回退到启动子进程
+    try:
+        result_data = await ui_daemon.request_prompt_async("data_sync", {
+            "context": context_data,
+            "predefined_options": predefined_options,
+            "severity": severity,
+        }, timeout)
+    except TimeoutError:
+        logger.error("Data sync UI timeout")
+        return {"interactive_feedback": "操作超时，请重试", "images": []}
+    if result_data is not None:
+        return ui_daemon.record_window_timing("warm", result_data, call)
+    # 后台启动常驻进程，下次调用即可热启动
+    await asyncio.to_thread(ui_daemon.start_daemon)
+    
+    # 获取脚本目录
+    feedback_ui_path = ui_launcher.ui_script_path("data_sync_ui.py")
+    
+    # 启动专用 UI（异步等待，结果经子进程 stdout 回传，不落临时文件）
+    args = [
+        "--context", json.dumps(context_data),
+        "--predefined-options", "|||".join(predefined_options) if predefined_options else "",
+        "--launch-ts", str(time.time())
+    ]
     
     try:
-        # 获取脚本目录
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        feedback_ui_path = os.path.join(script_dir, "data_sync_ui.py")
-        
-        # 创建数据同步上下文
-        context_data = {
-            "audience_id": context.audience_id,
-            "task_id": context.task_id,
-            "operation_type": context.operation_type,
-            "timestamp": context.timestamp,
-            "user_id": context.user_id
-        }
-        
-        # 启动专用 UI
-        args = [
-            sys.executable,
-            "-u",
-            feedback_ui_path,
-            "--context", json.dumps(context_data),
-            "--output-file", output_file,
-            "--predefined-options", "|||".join(predefined_options) if predefined_options else ""
-        ]
-        
-        result = subprocess.run(
-            args,
-            check=False,
-            shell=False,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            stdin=subprocess.DEVNULL,
-            close_fds=True,
-            timeout=300  # 5分钟超时
-        )
-        
-        if result.returncode != 0:
-            logger.error(f"Data sync UI failed with return code: {result.returncode}")
-            raise Exception(f"Failed to launch data sync UI: {result.returncode}")
-        
-        # 读取结果
-        with open(output_file, 'r', encoding='utf-8') as f:
-            result_data = json.load(f)
-        
-        os.unlink(output_file)
-        return result_data
-        
-    except subprocess.TimeoutExpired:
+        result_data = await ui_launcher.run_ui_process(feedback_ui_path, args, timeout=timeout)
+    except TimeoutError:
         logger.error("Data sync UI timeout")
         return {"interactive_feedback": "操作超时，请重试", "images": []}
-    except Exception as e:
-        logger.error(f"Error in data sync UI: {e}")
-        if os.path.exists(output_file):
-            os.unlink(output_file)
-        raise e
+    except ui_protocol.UIProtocolError as e:
+        logger.error(f"Data sync UI failed: {e}")
+        raise Exception(f"Failed to launch data sync UI: {e}")
+    
+    return ui_daemon.record_window_timing("cold", result_data, call)
+
+def format_feedback(result_dict: Dict) -> Tuple:
+    """把 UI 结果整理为工具返回值：文本在前，图片在后"""
+    txt = result_dict.get("interactive_feedback", "").strip()
+    img_bytes_list = result_dict.get("images", [])
+    
+    # 处理图片（UI 回传原始字节，无需 Base64 解码）
+    images = [Image(data=img_bytes, format=ui_protocol.image_format(img_bytes)) for img_bytes in img_bytes_list]
+    
+    # 只粘贴了图片、没有输入文字时单独返回图片
+    if txt:
+        return (txt, *images)
+    return tuple(images) if images else ("",)
+
+def split_result(result: Tuple) -> Tuple[str, List]:
+    """把工具返回值拆为 (文本, 图片列表)；只有图片时文本为空"""
+    if result and isinstance(result[0], str):
+        return result[0], list(result[1:])
+    return "", list(result)
+
+async def prepare_affected_mids(affected_mids: Union[str, List[str]], audience_id: str) -> Tuple[Dict, Optional[Dict]]:
+    """
+    解码受影响的 MID 并写为 UI 分页读取的 .npy，同时从倒排索引查询影响扇出（未配置索引时为 None）
+    返回 (mids 载荷, 扇出)；解码可能涉及上千万个 MID，放到线程中避免阻塞事件循环
+    """
+    try:
+        mids = await asyncio.to_thread(mid_set.decode_mids, affected_mids)
+        mids_payload = await asyncio.to_thread(mids.ui_payload)
+    except mid_set.MidDecodeError as e:
+        raise ValueError(f"affected_mids 无法解析: {e}")
+    logger.info(f"Affected MIDs: {len(mids)} ({mids.nbytes / 1e6:.1f} MB)")
+    
+    fanout = None
+    try:
+        index = audience_index.default_index()
+        if index is not None:
+            try:
+                fanout = await asyncio.to_thread(lambda: index.fanout(mids.page(0, len(mids)), audience_id))
+                logger.info(f"Audience fan-out: {fanout['in_other_audiences']} MIDs in {fanout['other_audiences']} other audiences "
+                            f"({fanout['elapsed_ms']} ms)")
+            except (audience_index.AudienceIndexError, OSError) as e:
+                # 索引只是辅助信息，不可用时照常确认
+                logger.warning(f"Audience index lookup failed: {e}")
+    except BaseException:
+        # 还没交给 confirm()，这里失败（包括被取消）时由本函数删除已写出的 .npy
+        remove_file_callback(mids_payload["path"])()
+        raise
+    return mids_payload, fanout
+
+def remove_file_callback(path: str) -> Callable[[], None]:
+    """窗口关闭后删除交给 UI 的临时文件"""
+    def remove():
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    return remove
+
+def with_fanout(format_result: Callable[[Dict], Tuple], fanout: Optional[Dict]) -> Callable[[Dict], Tuple]:
+    """人工确认的结果之后附上影响扇出摘要（前 10 个用户群）"""
+    if not fanout:
+        return format_result
+    summary = {key: fanout[key] for key in ("queried", "in_other_audiences", "other_audiences")}
+    summary["audiences"] = {item["audience_id"]: item["mids"] for item in fanout["audiences"][:10]}
+    
+    def format_with_fanout(result_dict: Dict) -> Tuple:
+        txt, images = split_result(format_result(result_dict))
+        return (f"{txt}\n\n影响扇出: {json.dumps(summary, ensure_ascii=False)}".strip(), *images)
+    return format_with_fanout
+
+async def confirm(tool: str, context: DataSyncContext, predefined_options: Optional[List[str]], format_result: Callable[[Dict], Any],
+                  ticket: bool = False, severity: Optional[str] = None, cleanup: Optional[Callable[[], None]] = None):
+    """
+    弹窗确认并用 format_result 整理结果，各阶段耗时按工具名 tool 记录
+    ticket=True 时立即返回凭据，窗口在后台保持打开（最长为凭据有效期），回答由 get_confirmation_result 获取
+    cleanup 在窗口关闭（或调用取消）后执行，如删除交给 UI 的临时文件
+    """
+    call = latency_metrics.ToolCall(tool)
+    
+    async def run():
+        try:
+            with call.phase("ui_round_trip"):
+                result_dict = await launch_data_sync_ui(context, predefined_options, severity,
+                                                        timeout=tickets.ttl if ticket else UI_TIMEOUT, call=call)
+            with call.phase("decode"):
+                return format_result(result_dict)
+        finally:
+            call.finish()
+            if cleanup is not None:
+                cleanup()
+    
+    if ticket:
+        ticket_id = tickets.issue(run())
+        logger.info(f"Confirmation ticket issued: {ticket_id} ({context.operation_type}, {context.audience_id})")
+        return confirmation_tickets.issued_text(tickets, ticket_id)
+    return await run()
 
 @mcp.tool()
-def audience_sync_confirmation(
+async def audience_sync_confirmation(
     audience_id: str = Field(description="用户群ID"),
     task_id: str = Field(description="任务ID"),
     sync_details: str = Field(description="同步详情描述"),
-    risk_level: str = Field(default="medium", description="风险等级: low/medium/high")
+    risk_level: str = Field(default="medium", description="风险等级: low/medium/high"),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
 ) -> Tuple[str, ...]:
     """
     用户群数据同步确认工具
@@ -244,49 +373,98 @@ def audience_sync_confirmation(
             "❌ 取消操作"
         ]
     
-    result_dict = launch_data_sync_ui(context, predefined_options)
+    return await confirm("audience_sync_confirmation", context, predefined_options, format_feedback, ticket, severity=risk_level)
+
+def batch_decisions(items: List[Dict], result: Dict) -> List[Dict]:
+    """
+    按输入顺序整理每个条目的决定
+    UI 未提交（取消、超时）或缺少某行时，该条目记为 pending
+    """
+    decided = {d.get("index"): d.get("decision", "pending") for d in result.get("decisions") or []}
+    return [
+        {
+            "index": i,
+            "audience_id": item["audience_id"],
+            "task_id": item["task_id"],
+            "risk_level": item["risk_level"],
+            "decision": decided.get(i, "pending"),
+        }
+        for i, item in enumerate(items)
+    ]
+
+@mcp.tool()
+async def batch_sync_confirmation(
+    items: List[BatchSyncItem] = Field(description="待确认的用户群列表，每项包含 audience_id、task_id、sync_details、risk_level"),
+    task_id: str = Field(default="", description="批次任务ID（可选）"),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
+) -> Tuple[str, ...]:
+    """
+    批量用户群同步确认工具
+    在一个窗口的表格中确认多个用户群的同步，每行单独批准/拒绝/推迟，支持一键批准全部低风险条目；
+    返回 JSON：decisions 为按输入顺序的逐条决定（pending / approve / reject / defer），summary 为各决定的计数
+    """
+    logger.info(f"Batch sync confirmation requested: {len(items)} audiences, task: {task_id}")
     
-    txt = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list = result_dict.get("images", [])
+    entries = [{**item.model_dump(), "risk_level": item.risk_level.strip().lower()} for item in items]
+    context = DataSyncContext(
+        audience_id="",
+        task_id=task_id,
+        operation_type="batch_sync",
+        timestamp=datetime.now().isoformat(),
+        items=entries
+    )
     
-    # 处理图片
-    images = []
-    for b64 in img_b64_list:
-        try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
-        except Exception as e:
-            logger.warning(f"Failed to decode image: {e}")
-            txt += f"\n\n[warning] 图片解码失败: {str(e)}"
-    
-    # 返回结果
-    if txt and images:
+    def format_result(result_dict):
+        decisions = batch_decisions(entries, result_dict)
+        summary = {}
+        for decision in decisions:
+            summary[decision["decision"]] = summary.get(decision["decision"], 0) + 1
+        txt = json.dumps({
+            "decisions": decisions,
+            "summary": summary,
+            "feedback": result_dict.get("interactive_feedback", "").strip(),
+        }, ensure_ascii=False)
+        
+        # 处理图片（UI 回传原始字节，无需 Base64 解码）
+        images = [Image(data=img_bytes, format=ui_protocol.image_format(img_bytes)) for img_bytes in result_dict.get("images", [])]
+        
         return (txt, *images)
-    elif txt:
-        return txt
-    elif images:
-        return (images[0],) if len(images) == 1 else tuple(images)
-    else:
-        return ("",)
+    
+    return await confirm("batch_sync_confirmation", context, None, format_result, ticket)
 
 @mcp.tool()
-def dmp_data_verification(
+async def dmp_data_verification(
     audience_id: str = Field(description="用户群ID"),
     task_id: str = Field(description="任务ID"),
     verification_type: str = Field(description="验证类型: status/consistency/completeness"),
-    dmp_response: str = Field(description="DMP 响应数据")
+    dmp_response: str = Field(description="DMP 响应数据：RawDMP=16, Old=1, New=20 形式的键值对，或 [{\"MID\",\"RawDMP\",\"Status\"}] 形式的 JSON 行数组 / 列对象"),
+    allowed_statuses: Optional[List[int]] = Field(default=None, description="允许的 Status 取值，默认取环境变量 DATA_SYNC_DMP_ALLOWED_STATUS 或 1,20"),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
 ) -> Tuple[str, ...]:
     """
     DMP 数据验证工具
-    用于验证 DMP 返回的数据质量和一致性
+    先解析 DMP 响应并自动执行状态 / 一致性 / 完整性校验（verification_type 为 all 时执行全部），
+    校验通过时直接返回报告；发现异常或无法解析时才弹窗，列出失败的行供人工确认
     """
     logger.info(f"DMP verification requested: {audience_id}, type: {verification_type}")
     
+    try:
+        report = await asyncio.to_thread(dmp_verification.parse_and_verify, dmp_response, verification_type, allowed_statuses)
+        verification = {"summary": report.summary(), "rows": report.failing_rows()}
+    except dmp_verification.DMPParseError as e:
+        report = None
+        verification = {"error": str(e), "raw": dmp_response[:2000]}
+    
+    if report is not None and report.passed:
+        logger.info(f"DMP verification passed without confirmation: {len(report.rows)} rows in {report.elapsed * 1000:.1f} ms")
+        return (f"✅ DMP 数据自动验证通过，无需人工确认\n{json.dumps(report.summary(), ensure_ascii=False)}",)
+    
     context = DataSyncContext(
         audience_id=audience_id,
         task_id=task_id,
         operation_type="verify",
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now().isoformat(),
+        verification=verification
     )
     
     predefined_options = [
@@ -297,42 +475,39 @@ def dmp_data_verification(
         "❌ 跳过验证"
     ]
     
-    result_dict = launch_data_sync_ui(context, predefined_options)
+    def format_result(result_dict: Dict) -> Tuple:
+        # 人工确认的结果之后附上自动校验摘要
+        txt, images = split_result(format_feedback(result_dict))
+        summary = verification.get("summary") or {"error": verification.get("error")}
+        return (f"{txt}\n\n自动验证: {json.dumps(summary, ensure_ascii=False)}".strip(), *images)
     
-    txt = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list = result_dict.get("images", [])
-    
-    # 处理图片
-    images = []
-    for b64 in img_b64_list:
-        try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
-        except Exception as e:
-            logger.warning(f"Failed to decode image: {e}")
-            txt += f"\n\n[warning] 图片解码失败: {str(e)}"
-    
-    return (txt, *images) if txt and images else (txt,) if txt else ("",)
+    return await confirm("dmp_data_verification", context, predefined_options, format_result, ticket)
 
 @mcp.tool()
-def status_update_confirmation(
+async def status_update_confirmation(
     audience_id: str = Field(description="用户群ID"),
     task_id: str = Field(description="任务ID"),
     old_status: int = Field(description="当前状态"),
     new_status: int = Field(description="目标状态"),
-    affected_mids: List[str] = Field(description="受影响的 MID 列表")
+    affected_mids: Union[str, List[str]] = Field(description=AFFECTED_MIDS_FIELD_DESCRIPTION),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
 ) -> Tuple[str, ...]:
     """
     状态更新确认工具
-    用于确认用户群状态更新操作
+    用于确认用户群状态更新操作；受影响的 MID 以数组保存，窗口中显示统计摘要并可分页浏览，
+    配置了 DATA_SYNC_AUDIENCE_INDEX 时同时显示这些 MID 还属于哪些用户群
     """
     logger.info(f"Status update confirmation: {audience_id}, {old_status} -> {new_status}")
     
+    mids_payload, fanout = await prepare_affected_mids(affected_mids, audience_id)
+    
     context = DataSyncContext(
         audience_id=audience_id,
         task_id=task_id,
         operation_type="update",
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now().isoformat(),
+        mids=mids_payload,
+        fanout=fanout
     )
     
     predefined_options = [
@@ -343,41 +518,51 @@ def status_update_confirmation(
         "❌ 取消更新"
     ]
     
-    result_dict = launch_data_sync_ui(context, predefined_options)
-    
-    txt = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list = result_dict.get("images", [])
-    
-    # 处理图片
-    images = []
-    for b64 in img_b64_list:
-        try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
-        except Exception as e:
-            logger.warning(f"Failed to decode image: {e}")
-            txt += f"\n\n[warning] 图片解码失败: {str(e)}"
-    
-    return (txt, *images) if txt and images else (txt,) if txt else ("",)
+    return await confirm("status_update_confirmation", context, predefined_options, with_fanout(format_feedback, fanout),
+                         ticket, cleanup=remove_file_callback(mids_payload["path"]))
 
 @mcp.tool()
-def data_consistency_check(
+async def data_consistency_check(
     audience_id: str = Field(description="用户群ID"),
     task_id: str = Field(description="任务ID"),
-    inconsistency_details: str = Field(description="数据不一致详情"),
-    severity: str = Field(description="严重程度: low/medium/high/critical")
+    inconsistency_details: str = Field(description="数据不一致详情（给出两侧快照时可留空，由比对结果展示）"),
+    severity: str = Field(description="严重程度: low/medium/high/critical"),
+    dmp_snapshot: Optional[str] = Field(default=None, description="DMP 侧快照：MID,Status 的 CSV 或 .bin / .snap 二进制记录，也可以是 store:<SQLite 路径>"),
+    local_snapshot: Optional[str] = Field(default=None, description="本地侧快照，格式同 dmp_snapshot；本地替身库用 store:<SQLite 路径>"),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
 ) -> Tuple[str, ...]:
     """
     数据一致性检查工具
-    用于处理数据不一致问题
+    用于处理数据不一致问题；给出两侧快照时先用哈希树比对，只在不一致的桶里逐个比较 MID，
+    两侧一致时直接返回报告，否则在窗口中列出不一致的 MID 及两侧状态
     """
     logger.info(f"Data consistency check: {audience_id}, severity: {severity}")
     
+    consistency = None
+    mids_payload = None
+    if dmp_snapshot or local_snapshot:
+        if not (dmp_snapshot and local_snapshot):
+            raise ValueError("dmp_snapshot 与 local_snapshot 需要同时给出")
+        try:
+            report = await asyncio.to_thread(consistency_tree.check, dmp_snapshot, local_snapshot)
+        except consistency_tree.SnapshotError as e:
+            raise ValueError(f"一致性比对失败: {e}")
+        logger.info(f"Consistency check: {report.divergent_count} divergent MIDs, "
+                    f"{report.stats['buckets_compared']} buckets in {report.stats['elapsed_ms']} ms")
+        if report.consistent:
+            return (f"✅ DMP 与本地数据一致，无需人工确认\n{json.dumps(report.summary(), ensure_ascii=False)}",)
+        consistency = {"summary": report.summary(), "rows": report.rows()}
+        divergent = report.divergent_mids()
+        mids = await asyncio.to_thread(mid_set.MidArray.from_chunks, lambda: iter((divergent,)))
+        mids_payload = await asyncio.to_thread(mids.ui_payload)
+    
     context = DataSyncContext(
         audience_id=audience_id,
         task_id=task_id,
         operation_type="consistency",
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now().isoformat(),
+        mids=mids_payload,
+        consistency=consistency
     )
     
     if severity == "critical":
@@ -402,41 +587,43 @@ def data_consistency_check(
             "✅ 忽略此问题"
         ]
     
-    result_dict = launch_data_sync_ui(context, predefined_options)
+    if consistency is None:
+        return await confirm("data_consistency_check", context, predefined_options, format_feedback, ticket, severity=severity)
     
-    txt = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list = result_dict.get("images", [])
-    
-    # 处理图片
-    images = []
-    for b64 in img_b64_list:
-        try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
-        except Exception as e:
-            logger.warning(f"Failed to decode image: {e}")
-            txt += f"\n\n[warning] 图片解码失败: {str(e)}"
+    def format_result(result_dict: Dict) -> Tuple:
+        # 人工确认的结果之后附上比对摘要
+        txt, images = split_result(format_feedback(result_dict))
+        return (f"{txt}\n\n一致性比对: {json.dumps(consistency['summary'], ensure_ascii=False)}".strip(), *images)
     
-    return (txt, *images) if txt and images else (txt,) if txt else ("",)
+    return await confirm("data_consistency_check", context, predefined_options, format_result, ticket,
+                         severity=severity, cleanup=remove_file_callback(mids_payload["path"]))
 
 @mcp.tool()
-def rollback_confirmation(
+async def rollback_confirmation(
     audience_id: str = Field(description="用户群ID"),
     task_id: str = Field(description="任务ID"),
     rollback_reason: str = Field(description="回滚原因"),
-    rollback_scope: str = Field(description="回滚范围")
+    rollback_scope: str = Field(description="回滚范围"),
+    affected_mids: Optional[Union[str, List[str]]] = Field(default=None, description="回滚涉及的 MID（可选），编码同 status_update_confirmation；给出时窗口中显示这些 MID 还属于哪些用户群"),
+    ticket: bool = Field(default=False, description=TICKET_FIELD_DESCRIPTION)
 ) -> Tuple[str, ...]:
     """
     回滚操作确认工具
-    用于确认数据回滚操作
+    用于确认数据回滚操作；给出 affected_mids 时可分页浏览这些 MID，并显示影响扇出
     """
     logger.info(f"Rollback confirmation: {audience_id}, reason: {rollback_reason}")
     
+    mids_payload, fanout = None, None
+    if affected_mids:
+        mids_payload, fanout = await prepare_affected_mids(affected_mids, audience_id)
+    
     context = DataSyncContext(
         audience_id=audience_id,
         task_id=task_id,
         operation_type="rollback",
-        timestamp=datetime.now().isoformat()
+        timestamp=datetime.now().isoformat(),
+        mids=mids_payload,
+        fanout=fanout
     )
     
     predefined_options = [
@@ -447,23 +634,80 @@ def rollback_confirmation(
         "❌ 取消回滚"
     ]
     
-    result_dict = launch_data_sync_ui(context, predefined_options)
+    cleanup = remove_file_callback(mids_payload["path"]) if mids_payload else None
+    return await confirm("rollback_confirmation", context, predefined_options, with_fanout(format_feedback, fanout),
+                         ticket, cleanup=cleanup)
+
+@mcp.tool()
+async def get_confirmation_result(
+    ticket: str = Field(description="ticket 模式返回的确认凭据"),
+    wait_seconds: float = Field(default=confirmation_tickets.DEFAULT_POLL_SECONDS,
+                                description=f"最多等待回答的秒数（上限 {confirmation_tickets.MAX_POLL_SECONDS}）")
+) -> Tuple[str, ...]:
+    """
+    获取 ticket 模式确认的回答（长轮询）
+    已回答时返回与同步调用相同的结果（有效期内可重复获取）；尚未回答时返回 status=pending，可再次调用；
+    凭据过期或不存在时返回 status=expired
+    """
+    return await tickets.poll(ticket, wait_seconds)
+
+AUDIENCES_FIELD_DESCRIPTION = (
+    "用户群：用户群ID 列表（从 DATA_SYNC_AUDIENCE_DIR/<用户群ID>.rbm 读取），"
+    "或 用户群ID -> MID 来源 的映射（bitmap:<base64>、file:<路径>.rbm，或 delta: / u64: / file: / 逗号分隔文本）"
+)
+
+@mcp.tool()
+async def audience_overlap(
+    audiences: Union[List[str], Dict[str, str]] = Field(description=AUDIENCES_FIELD_DESCRIPTION)
+) -> Tuple[str, ...]:
+    """
+    用户群重叠分析（不弹窗）
+    用压缩位图计算各用户群大小、两两交集与 Jaccard 系数以及并集大小，返回 JSON
+    """
+    if len(audiences) < 2:
+        raise ValueError("至少需要两个用户群")
     
-    txt = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list = result_dict.get("images", [])
+    def analyze():
+        return mid_bitmap.overlap_report(mid_bitmap.load_audiences(audiences))
     
-    # 处理图片
-    images = []
-    for b64 in img_b64_list:
-        try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
-        except Exception as e:
-            logger.warning(f"Failed to decode image: {e}")
-            txt += f"\n\n[warning] 图片解码失败: {str(e)}"
+    try:
+        report = await asyncio.to_thread(analyze)
+    except mid_bitmap.BitmapFormatError as e:
+        raise ValueError(f"用户群无法加载: {e}")
+    logger.info(f"Audience overlap: {len(audiences)} audiences, union {report['union']}")
+    return (json.dumps(report, ensure_ascii=False),)
+
+@mcp.tool()
+async def audience_impact(
+    affected_mids: Union[str, List[str]] = Field(description="受影响的 MID：bitmap:<base64>、file:<路径>.rbm，或与 status_update_confirmation 相同的 delta: / u64: / file: / 文本 / 列表"),
+    audiences: Union[List[str], Dict[str, str]] = Field(description=AUDIENCES_FIELD_DESCRIPTION)
+) -> Tuple[str, ...]:
+    """
+    影响范围分析（不弹窗）
+    计算受影响的 MID 分别落在哪些用户群中：每个用户群的命中数与占比、受影响的用户群数，
+    以及不属于任何给定用户群的 MID 数，返回 JSON
+    """
+    def analyze():
+        affected = mid_bitmap.load_source(affected_mids)
+        return mid_bitmap.impact_report(affected, mid_bitmap.load_audiences(audiences))
     
-    return (txt, *images) if txt and images else (txt,) if txt else ("",)
+    try:
+        report = await asyncio.to_thread(analyze)
+    except mid_bitmap.BitmapFormatError as e:
+        raise ValueError(f"MID 或用户群无法加载: {e}")
+    logger.info(f"Audience impact: {report['affected_mids']} MIDs across {report['impacted_audiences']} audiences")
+    return (json.dumps(report, ensure_ascii=False),)
+
+@mcp.resource("metrics://latency", mime_type="application/json")
+def latency_metrics_summary() -> str:
+    """各工具各阶段的耗时统计：次数、平均与 p50/p95/p99（毫秒）"""
+    return json.dumps(latency_metrics.registry.summary(), ensure_ascii=False, indent=2)
 
 if __name__ == "__main__":
+    # 清理之前崩溃遗留的 UI 进程与临时结果文件；服务退出时终止自己启动的 UI 子进程
+    ui_launcher.sweep_stale_ui()
+    ui_launcher.install_cleanup()
+    # 预热常驻 UI 进程，避免首次确认承担 PySide6 启动开销
+    ui_daemon.start_daemon()
     mcp.run(transport="stdio")
 
@@ -5,23 +5,116 @@ import json
 import argparse
 import base64
 import uuid
+import time
 from datetime import datetime
 from typing import Optional, TypedDict, List, Dict
 
 from PySide6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QPushButton, QCheckBox, QTextEdit, QTextBrowser, QGroupBox,
-    QFrame, QScrollArea, QGridLayout, QProgressBar, QTabWidget
+    QFrame, QScrollArea, QGridLayout, QProgressBar, QTabWidget,
+    QTableWidget, QTableWidgetItem, QHeaderView, QComboBox, QAbstractItemView,
+    QTableView, QSpinBox
 )
-from PySide6.QtCore import Qt, Signal, QObject, QTimer, QSettings, QDateTime, QBuffer, QIODevice
-from PySide6.QtGui import QTextCursor, QIcon, QKeyEvent, QPalette, QColor, QPixmap, QShortcut, QKeySequence, QFont
+from PySide6.QtCore import Qt, Signal, QObject, QTimer, QSettings, QDateTime, QAbstractTableModel, QModelIndex
+from PySide6.QtGui import QTextCursor, QIcon, QKeyEvent, QPalette, QColor, QShortcut, QKeySequence, QFont
+
+import image_pipeline
+import latency_metrics
+import ui_launcher
+import ui_protocol
 
 class DataSyncResult(TypedDict):
     interactive_feedback: str
-    images: List[str]
+    images: List[bytes]  # 图片原始字节
     operation_type: str
     audience_id: str
     task_id: str
+    # 批量确认提交时另有 decisions: List[BatchDecision]，按输入顺序每项一条
+
+class BatchDecision(TypedDict):
+    index: int
+    audience_id: str
+    task_id: str
+    risk_level: str
+    decision: str  # pending / approve / reject / defer
+
+# 批量确认中每一行可选的决定：(结果值, 显示文本)
+BATCH_DECISIONS = [
+    ("pending", "⏳ 待定"),
+    ("approve", "✅ 批准"),
+    ("reject", "❌ 拒绝"),
+    ("defer", "⏰ 推迟"),
+]
+
+# 风险等级从低到高
+RISK_ORDER = ["low", "medium", "high", "critical"]
+
+def normalize_batch_items(items) -> List[Dict]:
+    """整理批量确认条目：补齐字段，风险等级统一为小写，未知等级按 medium 处理"""
+    normalized = []
+    for item in items or []:
+        risk_level = str(item.get("risk_level") or "medium").strip().lower()
+        normalized.append({
+            "audience_id": str(item.get("audience_id", "")),
+            "task_id": str(item.get("task_id", "")),
+            "sync_details": str(item.get("sync_details", "")),
+            "risk_level": risk_level if risk_level in RISK_ORDER else "medium",
+        })
+    return normalized
+
+class MidTableModel(QAbstractTableModel):
+    """
+    受影响 MID 的分页表格：内存映射服务端写出的 .npy（MID = base + offsets[i]），
+    每页 PAGE_SIZE 行，只在视图请求时读取可见的行
+    """
+    PAGE_SIZE = 1000
+    HEADERS = ["序号", "MID"]
+
+    def __init__(self, path: str, base: int, parent=None):
+        super().__init__(parent)
+        # 只有状态更新窗口需要 NumPy，延迟导入以免拖慢其他窗口的启动
+        import numpy as np
+        try:
+            self.offsets = np.load(path, mmap_mode="r")
+        except (OSError, ValueError):
+            self.offsets = np.zeros(0, dtype=np.uint64)
+        self.base = int(base)
+        self.page = 0
+
+    def total(self) -> int:
+        return len(self.offsets)
+
+    def page_count(self) -> int:
+        return max(1, -(-self.total() // self.PAGE_SIZE))
+
+    def set_page(self, page: int):
+        page = min(max(page, 0), self.page_count() - 1)
+        if page != self.page:
+            self.beginResetModel()
+            self.page = page
+            self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()) -> int:
+        if parent.isValid():
+            return 0
+        return max(0, min(self.PAGE_SIZE, self.total() - self.page * self.PAGE_SIZE))
+
+    def columnCount(self, parent=QModelIndex()) -> int:
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        position = self.page * self.PAGE_SIZE + index.row()
+        if index.column() == 0:
+            return str(position + 1)
+        return str(self.base + int(self.offsets[position]))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
 
 def get_data_sync_palette(app: QApplication):
     """数据同步专用的深色主题"""
@@ -45,7 +138,15 @@ class DataSyncTextEdit(QTextEdit):
     
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.image_data = []
+        # 粘贴图片登记表（原始字节，内容相同的图片只保存一份）与占位文本中的文件名
+        self.image_registry = image_pipeline.ImageRegistry()
+        self.image_filenames = {}
+        # 图片压缩参数，与 FeedbackTextEdit 一致
+        self.image_options = image_pipeline.ImageOptions.from_env()
+        # 图片在线程池中编码，粘贴时只插入占位文本
+        self.image_encoder = image_pipeline.ImageEncoder(self.image_options, self)
+        self.image_encoder.encoded.connect(self._on_image_encoded)
+        self.image_encoder.failed.connect(self._on_image_failed)
         
     def keyPressEvent(self, event: QKeyEvent):
         if event.key() == Qt.Key_Return and event.modifiers() == Qt.ControlModifier:
@@ -58,6 +159,19 @@ class DataSyncTextEdit(QTextEdit):
         else:
             super().keyPressEvent(event)
     
+    def _on_image_encoded(self, image_id, encoded, digest, thumb):
+        """后台编码完成，登记图片字节"""
+        self.image_registry.resolve(image_id, encoded.data, digest)
+    
+    def _on_image_failed(self, image_id, error):
+        print(f"处理图片时出错: {error}", file=sys.stderr)
+        self.image_registry.remove(image_id)
+        self.textCursor().insertText(f"[图片处理失败: {self.image_filenames.get(image_id, '')}: {error}]")
+    
+    def wait_for_pending_images(self):
+        """等待仍在后台编码的图片"""
+        self.image_encoder.wait()
+    
     def insertFromMimeData(self, source_data):
         """处理粘贴内容，包括图片"""
         try:
@@ -65,28 +179,21 @@ class DataSyncTextEdit(QTextEdit):
                 image = source_data.imageData()
                 if image:
                     try:
-                        # 转换图片为 Base64
-                        pixmap = QPixmap.fromImage(image)
-                        buffer = QBuffer()
-                        buffer.open(QIODevice.WriteOnly)
-                        pixmap.save(buffer, "PNG")
-                        img_bytes = buffer.data()
-                        base64_string = base64.b64encode(img_bytes).decode('utf-8')
+                        started = time.perf_counter()
                         
-                        # 保存图片数据
+                        # 登记图片数据，字节在后台编码完成后填入（保持原始字节，不做 Base64）
                         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
                         unique_id = str(uuid.uuid4())[:8]
-                        filename = f"data_sync_image_{timestamp}_{unique_id}.png"
+                        filename = f"data_sync_image_{timestamp}_{unique_id}.{image_pipeline.output_extension(self.image_options)}"
                         
-                        image_info = {
-                            'base64': base64_string,
-                            'filename': filename
-                        }
-                        self.image_data.append(image_info)
+                        self.image_registry.add(unique_id)
+                        self.image_filenames[unique_id] = filename
+                        self.image_encoder.submit(unique_id, image)
                         
                         # 插入图片占位符
                         cursor = self.textCursor()
                         cursor.insertText(f"[图片: {filename}]")
+                        image_pipeline.log_paste_stall(started)
                         
                     except Exception as e:
                         print(f"处理图片时出错: {e}")
@@ -98,18 +205,106 @@ class DataSyncTextEdit(QTextEdit):
             print(f"处理粘贴内容时出错: {e}")
             super().insertFromMimeData(source_data)
     
-    def get_image_data(self):
-        """返回图片数据列表"""
-        return self.image_data.copy()
+    def get_image_payload(self):
+        """等待仍在编码的图片，返回去重后的图片字节列表（提交时调用一次）"""
+        self.wait_for_pending_images()
+        return self.image_registry.payload()
 
 class DataSyncUI(QMainWindow):
     """数据同步专用的用户界面"""
     
+    # 窗口关闭时发出，携带反馈结果（常驻 UI 进程据此回传结果）
+    finished = Signal(dict)
+    
+    # 样式表（类级常量，所有窗口共用，不在每次构造时重新拼接）
+    CHECKBOX_STYLE = """
+        QCheckBox {
+            font-size: 14px;
+            padding: 5px;
+        }
+        QCheckBox::indicator {
+            width: 18px;
+            height: 18px;
+        }
+    """
+    
+    FEEDBACK_TEXT_STYLE = """
+        QTextEdit {
+            border: 1px solid #444;
+            border-radius: 5px;
+            padding: 10px;
+            background-color: #2a2a2a;
+            font-size: 13px;
+        }
+    """
+    
+    RISK_LABEL_STYLE = """
+        QLabel {{
+            font-size: 16px;
+            font-weight: bold;
+            color: {color};
+            padding: 10px;
+        }}
+    """
+    
+    BUTTON_STYLES = {
+        "submit": """
+            QPushButton {
+                background-color: #4CAF50;
+                color: white;
+                border: none;
+                padding: 12px 24px;
+                font-size: 14px;
+                font-weight: bold;
+                border-radius: 6px;
+            }
+            QPushButton:hover {
+                background-color: #45a049;
+            }
+            QPushButton:pressed {
+                background-color: #3d8b40;
+            }
+        """,
+        "cancel": """
+            QPushButton {
+                background-color: #f44336;
+                color: white;
+                border: none;
+                padding: 12px 24px;
+                font-size: 14px;
+                font-weight: bold;
+                border-radius: 6px;
+            }
+            QPushButton:hover {
+                background-color: #da190b;
+            }
+            QPushButton:pressed {
+                background-color: #c1170a;
+            }
+        """,
+    }
+    
     def __init__(self, context: Dict, predefined_options: Optional[List[str]] = None):
+        construct_started = time.perf_counter()
         super().__init__()
         self.context = context
         self.predefined_options = predefined_options or []
+        # 批量确认条目（context["items"]），非空时操作确认页显示逐行决定的表格
+        self.batch_items = normalize_batch_items(context.get("items"))
+        # DMP 自动校验的结果（context["verification"]）：摘要与失败行，或解析错误
+        self.verification = context.get("verification") or {}
+        # 受影响的 MID（context["mids"]）：摘要与按页读取的 .npy 文件
+        self.mids = context.get("mids") or {}
+        # 哈希树一致性比对的结果（context["consistency"]）：摘要与不一致行
+        self.consistency = context.get("consistency") or {}
+        # 受影响 MID 同时属于的其他用户群（context["fanout"]）
+        self.fanout = context.get("fanout") or {}
         self.feedback_result = None
+        # 首次显示窗口的时间（time.time()），用于统计冷/热启动到出窗耗时
+        self.first_shown_at = None
+        self._shown_perf = None
+        # 各阶段耗时（毫秒）：construct / think / image_wait，随结果回传
+        self.phase_ms = {}
         
         self.setWindowTitle("数据同步确认 - Data Sync MCP")
         self.setWindowFlags(self.windowFlags() | Qt.WindowStaysOnTopHint)
@@ -120,6 +315,7 @@ class DataSyncUI(QMainWindow):
         
         self._create_ui()
         self._setup_shortcuts()
+        self.phase_ms["construct"] = latency_metrics.elapsed_ms(construct_started)
     
     def center_window(self):
         """窗口居中显示"""
@@ -135,22 +331,29 @@ class DataSyncUI(QMainWindow):
         layout = QVBoxLayout(central_widget)
         layout.setContentsMargins(15, 10, 15, 10)
         
-        # 创建标签页
-        tab_widget = QTabWidget()
+        # 创建标签页：只立即构建回答所需的操作确认页，
+        # 基本信息与风险评估页先放占位页，首次切换到该页或窗口显示后的空闲时间再构建
+        self.tab_widget = QTabWidget()
+        self._pending_tabs = {}
         
         # 基本信息标签页
-        info_tab = self._create_info_tab()
-        tab_widget.addTab(info_tab, "📊 基本信息")
+        self._add_lazy_tab("📊 基本信息", self._create_info_tab)
         
         # 操作确认标签页
         action_tab = self._create_action_tab()
-        tab_widget.addTab(action_tab, "⚡ 操作确认")
+        self.tab_widget.addTab(action_tab, "⚡ 操作确认")
         
         # 风险评估标签页
-        risk_tab = self._create_risk_tab()
-        tab_widget.addTab(risk_tab, "⚠️ 风险评估")
+        self._add_lazy_tab("⚠️ 风险评估", self._create_risk_tab)
+        
+        self.tab_widget.setCurrentWidget(action_tab)
+        self.tab_widget.currentChanged.connect(self._on_tab_changed)
+        layout.addWidget(self.tab_widget)
         
-        layout.addWidget(tab_widget)
+        # 空闲时逐个构建剩余标签页（窗口首次显示后启动）
+        self._tab_build_timer = QTimer(self)
+        self._tab_build_timer.setInterval(0)
+        self._tab_build_timer.timeout.connect(self._build_next_pending_tab)
         
         # 按钮区域
         button_layout = QHBoxLayout()
@@ -169,6 +372,31 @@ class DataSyncUI(QMainWindow):
         
         layout.addLayout(button_layout)
     
+    def _add_lazy_tab(self, title: str, builder):
+        """添加一个占位标签页，内容由 builder 在需要时构建"""
+        page = QWidget()
+        page_layout = QVBoxLayout(page)
+        page_layout.setContentsMargins(0, 0, 0, 0)
+        self._pending_tabs[page] = builder
+        self.tab_widget.addTab(page, title)
+    
+    def _materialize_tab(self, page: QWidget):
+        """构建占位页的内容（已构建的页面忽略）"""
+        builder = self._pending_tabs.pop(page, None)
+        if builder is not None:
+            page.layout().addWidget(builder())
+    
+    def _on_tab_changed(self, index: int):
+        """切换到尚未构建的标签页时立即构建"""
+        self._materialize_tab(self.tab_widget.widget(index))
+    
+    def _build_next_pending_tab(self):
+        """空闲时构建一个尚未构建的标签页，每次只建一个，避免连续阻塞输入"""
+        if self._pending_tabs:
+            self._materialize_tab(next(iter(self._pending_tabs)))
+        if not self._pending_tabs:
+            self._tab_build_timer.stop()
+    
     def _create_info_tab(self) -> QWidget:
         """创建基本信息标签页"""
         widget = QWidget()
@@ -182,7 +410,11 @@ class DataSyncUI(QMainWindow):
         task_layout.addWidget(QLabel(self.context.get("task_id", "N/A")), 0, 1)
         
         task_layout.addWidget(QLabel("用户群ID:"), 1, 0)
-        task_layout.addWidget(QLabel(self.context.get("audience_id", "N/A")), 1, 1)
+        if self.batch_items:
+            audience_text = f"共 {len(self.batch_items)} 个（见操作确认页）"
+        else:
+            audience_text = self.context.get("audience_id", "N/A")
+        task_layout.addWidget(QLabel(audience_text), 1, 1)
         
         task_layout.addWidget(QLabel("操作类型:"), 2, 0)
         task_layout.addWidget(QLabel(self.context.get("operation_type", "N/A")), 2, 1)
@@ -211,6 +443,26 @@ class DataSyncUI(QMainWindow):
         widget = QWidget()
         layout = QVBoxLayout(widget)
         
+        # 批量确认表格
+        if self.batch_items:
+            layout.addWidget(self._create_batch_group(), 1)
+        
+        # DMP 自动校验未通过的行
+        if self.verification:
+            layout.addWidget(self._create_verification_group(), 1)
+        
+        # 一致性比对发现的不一致行
+        if self.consistency:
+            layout.addWidget(self._create_consistency_group(), 1)
+        
+        # 影响扇出
+        if self.fanout:
+            layout.addWidget(self._create_fanout_group(), 1)
+        
+        # 受影响的 MID
+        if self.mids:
+            layout.addWidget(self._create_mids_group(), 1)
+        
         # 预设选项
         if self.predefined_options:
             options_group = QGroupBox("🎯 快速选择")
@@ -219,16 +471,7 @@ class DataSyncUI(QMainWindow):
             self.option_checkboxes = []
             for option in self.predefined_options:
                 checkbox = QCheckBox(option)
-                checkbox.setStyleSheet("""
-                    QCheckBox {
-                        font-size: 14px;
-                        padding: 5px;
-                    }
-                    QCheckBox::indicator {
-                        width: 18px;
-                        height: 18px;
-                    }
-                """)
+                checkbox.setStyleSheet(self.CHECKBOX_STYLE)
                 self.option_checkboxes.append(checkbox)
                 options_layout.addWidget(checkbox)
             
@@ -240,21 +483,265 @@ class DataSyncUI(QMainWindow):
         
         self.feedback_text = DataSyncTextEdit()
         self.feedback_text.setPlaceholderText("在此输入您的反馈或说明 (Ctrl+Enter 提交)")
-        self.feedback_text.setStyleSheet("""
-            QTextEdit {
-                border: 1px solid #444;
-                border-radius: 5px;
-                padding: 10px;
-                background-color: #2a2a2a;
-                font-size: 13px;
-            }
-        """)
+        self.feedback_text.setStyleSheet(self.FEEDBACK_TEXT_STYLE)
         custom_layout.addWidget(self.feedback_text)
         
         layout.addWidget(custom_group)
-        layout.addStretch()
+        if not (self.batch_items or self.verification or self.mids or self.consistency or self.fanout):
+            layout.addStretch()
         return widget
     
+    def _create_mids_group(self) -> QGroupBox:
+        """创建受影响 MID 的统计摘要与分页表格"""
+        summary = self.mids.get("summary", {})
+        group = QGroupBox(f"📋 受影响的 MID（{summary.get('count', 0):,} 个）")
+        group_layout = QVBoxLayout(group)
+        
+        if summary.get("count"):
+            parts = [f"范围 {summary['min']} ~ {summary['max']}"]
+            if summary.get("sorted"):
+                parts.append(f"有序，{summary['ranges']:,} 个连续区间")
+                if summary.get("duplicates"):
+                    parts.append(f"重复 {summary['duplicates']:,} 个")
+                parts.append("前几个区间 " + "，".join(
+                    a if a == b else f"{a}~{b}" for a, b in summary.get("first_ranges", [])))
+            else:
+                parts.append("无序")
+            parts.append("样本 " + "，".join(summary.get("sample", [])))
+            summary_label = QLabel("；".join(parts))
+            summary_label.setWordWrap(True)
+            summary_label.setTextInteractionFlags(Qt.TextSelectableByMouse)
+            group_layout.addWidget(summary_label)
+        
+        self.mids_model = MidTableModel(self.mids.get("path", ""), int(self.mids.get("base", 0)), self)
+        self.mids_view = QTableView()
+        self.mids_view.setModel(self.mids_model)
+        self.mids_view.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.mids_view.verticalHeader().setVisible(False)
+        self.mids_view.horizontalHeader().setStretchLastSection(True)
+        group_layout.addWidget(self.mids_view)
+        
+        # 翻页
+        page_layout = QHBoxLayout()
+        previous_button = QPushButton("◀ 上一页")
+        previous_button.clicked.connect(lambda: self.mids_page_box.setValue(self.mids_page_box.value() - 1))
+        page_layout.addWidget(previous_button)
+        self.mids_page_box = QSpinBox()
+        self.mids_page_box.setRange(1, self.mids_model.page_count())
+        self.mids_page_box.valueChanged.connect(lambda page: self.mids_model.set_page(page - 1))
+        page_layout.addWidget(self.mids_page_box)
+        page_layout.addWidget(QLabel(f"/ {self.mids_model.page_count():,} 页（每页 {MidTableModel.PAGE_SIZE} 个）"))
+        next_button = QPushButton("下一页 ▶")
+        next_button.clicked.connect(lambda: self.mids_page_box.setValue(self.mids_page_box.value() + 1))
+        page_layout.addWidget(next_button)
+        page_layout.addStretch()
+        group_layout.addLayout(page_layout)
+        return group
+    
+    def _create_fanout_group(self) -> QGroupBox:
+        """创建影响扇出：受影响的 MID 还属于哪些用户群，按包含的 MID 数排序"""
+        audiences = self.fanout.get("audiences", [])
+        other_count = self.fanout.get("other_audiences", 0)
+        group = QGroupBox(f"🕸️ 影响扇出（{other_count:,} 个其他用户群）")
+        group_layout = QVBoxLayout(group)
+        
+        summary_text = (f"共 {self.fanout.get('queried', 0):,} 个 MID，其中 {self.fanout.get('in_other_audiences', 0):,} 个"
+                        f"同时属于其他 {other_count:,} 个用户群")
+        if self.fanout.get("current_audience_hits") is not None:
+            summary_text += f"；当前用户群包含其中 {self.fanout['current_audience_hits']:,} 个"
+        summary_text += f"（索引共 {self.fanout.get('indexed_audiences', 0):,} 个用户群，查询 {self.fanout.get('elapsed_ms', 0)} ms）"
+        if len(audiences) < other_count:
+            summary_text += f"，下表列出前 {len(audiences)} 个"
+        summary_label = QLabel(summary_text)
+        summary_label.setWordWrap(True)
+        if other_count:
+            summary_label.setStyleSheet(self.RISK_LABEL_STYLE.format(color=self._get_risk_color("MEDIUM")))
+        group_layout.addWidget(summary_label)
+        if not audiences:
+            return group
+        
+        table = QTableWidget(len(audiences), 3)
+        table.setHorizontalHeaderLabels(["用户群ID", "包含的 MID", "占比"])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.verticalHeader().setVisible(False)
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(2, QHeaderView.Stretch)
+        for row_index, item in enumerate(audiences):
+            table.setItem(row_index, 0, QTableWidgetItem(str(item.get("audience_id", ""))))
+            table.setItem(row_index, 1, QTableWidgetItem(f"{item.get('mids', 0):,}"))
+            table.setItem(row_index, 2, QTableWidgetItem(f"{item.get('ratio', 0) * 100:.2f}%"))
+        group_layout.addWidget(table)
+        return group
+    
+    def _create_consistency_group(self) -> QGroupBox:
+        """创建一致性比对结果：各类不一致的数量与不一致行表格（两侧状态）"""
+        summary = self.consistency.get("summary", {})
+        rows = self.consistency.get("rows", [])
+        group = QGroupBox(f"⚖️ DMP 与本地不一致（{summary.get('divergent', 0):,} 个 MID）")
+        group_layout = QVBoxLayout(group)
+        
+        summary_text = (f"DMP {summary.get('dmp_count', 0):,} 个，本地 {summary.get('local_count', 0):,} 个；"
+                        f"本地缺失 {summary.get('only_dmp', 0):,}，DMP 缺失 {summary.get('only_local', 0):,}，"
+                        f"状态不同 {summary.get('status_mismatch', 0):,}；"
+                        f"比对了 {summary.get('buckets_compared', 0):,} 个桶，耗时 {summary.get('elapsed_ms', 0)} ms")
+        if len(rows) < summary.get("divergent", 0):
+            summary_text += f"（下表列出前 {len(rows)} 个）"
+        summary_label = QLabel(summary_text)
+        summary_label.setWordWrap(True)
+        summary_label.setStyleSheet(self.RISK_LABEL_STYLE.format(color=self._get_risk_color("HIGH")))
+        group_layout.addWidget(summary_label)
+        
+        columns = [("MID", "MID"), ("DMP", "DMP 状态"), ("Local", "本地状态"), ("problem", "问题")]
+        table = QTableWidget(len(rows), len(columns))
+        table.setHorizontalHeaderLabels([title for _, title in columns])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.verticalHeader().setVisible(False)
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(len(columns) - 1, QHeaderView.Stretch)
+        for row_index, row in enumerate(rows):
+            for column, (key, _) in enumerate(columns):
+                value = row.get(key)
+                table.setItem(row_index, column, QTableWidgetItem("—" if value is None else str(value)))
+        group_layout.addWidget(table)
+        return group
+    
+    def _create_verification_group(self) -> QGroupBox:
+        """创建 DMP 自动校验结果：失败规则统计与失败行表格；无法解析时显示错误与原始响应"""
+        group = QGroupBox("🔍 自动验证未通过")
+        group_layout = QVBoxLayout(group)
+        
+        if "error" in self.verification:
+            error_label = QLabel(f"无法自动解析 DMP 响应：{self.verification['error']}")
+            error_label.setWordWrap(True)
+            group_layout.addWidget(error_label)
+            raw_text = QTextBrowser()
+            raw_text.setPlainText(self.verification.get("raw", ""))
+            group_layout.addWidget(raw_text)
+            return group
+        
+        summary = self.verification.get("summary", {})
+        failures = "；".join(f"{item['description']} {item['count']} 行" for item in summary.get("failures", {}).values())
+        rows = self.verification.get("rows", [])
+        summary_text = f"共 {summary.get('rows', 0)} 行，{summary.get('failed_rows', 0)} 行未通过：{failures}"
+        if len(rows) < summary.get("failed_rows", 0):
+            summary_text += f"（下表列出前 {len(rows)} 行）"
+        summary_label = QLabel(summary_text)
+        summary_label.setWordWrap(True)
+        summary_label.setStyleSheet(self.RISK_LABEL_STYLE.format(color=self._get_risk_color("HIGH")))
+        group_layout.addWidget(summary_label)
+        
+        columns = [key for key in ("row", "MID", "RawDMP", "Status", "Old") if any(key in row for row in rows)]
+        headers = {"row": "行号"}
+        table = QTableWidget(len(rows), len(columns) + 1)
+        table.setHorizontalHeaderLabels([headers.get(key, key) for key in columns] + ["问题"])
+        table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        table.verticalHeader().setVisible(False)
+        header = table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(len(columns), QHeaderView.Stretch)
+        for row_index, row in enumerate(rows):
+            for column, key in enumerate(columns):
+                value = row.get(key)
+                table.setItem(row_index, column, QTableWidgetItem("—" if value is None else str(value)))
+            problems = "、".join(row.get("problems", []))
+            problem_cell = QTableWidgetItem(problems)
+            problem_cell.setToolTip(problems)
+            table.setItem(row_index, len(columns), problem_cell)
+        group_layout.addWidget(table)
+        return group
+    
+    def _create_batch_group(self) -> QGroupBox:
+        """创建批量确认表格：每行一个用户群，各自选择决定"""
+        group = QGroupBox(f"📦 批量确认（{len(self.batch_items)} 个用户群）")
+        group_layout = QVBoxLayout(group)
+        
+        headers = ["用户群ID", "任务ID", "同步详情", "风险等级", "决定"]
+        self.batch_table = QTableWidget(len(self.batch_items), len(headers))
+        self.batch_table.setHorizontalHeaderLabels(headers)
+        self.batch_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.batch_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.batch_table.verticalHeader().setVisible(False)
+        header = self.batch_table.horizontalHeader()
+        header.setSectionResizeMode(QHeaderView.ResizeToContents)
+        header.setSectionResizeMode(2, QHeaderView.Stretch)
+        
+        self.batch_decision_boxes = []
+        for row, item in enumerate(self.batch_items):
+            for column, key in enumerate(("audience_id", "task_id", "sync_details")):
+                cell = QTableWidgetItem(item[key])
+                cell.setToolTip(item[key])
+                self.batch_table.setItem(row, column, cell)
+            
+            risk_level = item["risk_level"].upper()
+            risk_cell = QTableWidgetItem(risk_level)
+            risk_cell.setForeground(QColor(self._get_risk_color(risk_level)))
+            self.batch_table.setItem(row, 3, risk_cell)
+            
+            decision_box = QComboBox()
+            for value, label in BATCH_DECISIONS:
+                decision_box.addItem(label, value)
+            decision_box.currentIndexChanged.connect(self._update_batch_summary)
+            self.batch_decision_boxes.append(decision_box)
+            self.batch_table.setCellWidget(row, 4, decision_box)
+        group_layout.addWidget(self.batch_table)
+        
+        # 批量操作
+        bulk_layout = QHBoxLayout()
+        
+        approve_low_button = QPushButton("✅ 批准全部低风险")
+        approve_low_button.clicked.connect(lambda: self._set_batch_decisions(
+            [row for row, item in enumerate(self.batch_items) if item["risk_level"] == "low"], "approve"))
+        bulk_layout.addWidget(approve_low_button)
+        
+        approve_selected_button = QPushButton("✅ 批准选中")
+        approve_selected_button.clicked.connect(lambda: self._set_batch_decisions(self._selected_batch_rows(), "approve"))
+        bulk_layout.addWidget(approve_selected_button)
+        
+        reject_selected_button = QPushButton("❌ 拒绝选中")
+        reject_selected_button.clicked.connect(lambda: self._set_batch_decisions(self._selected_batch_rows(), "reject"))
+        bulk_layout.addWidget(reject_selected_button)
+        
+        bulk_layout.addStretch()
+        self.batch_summary_label = QLabel()
+        bulk_layout.addWidget(self.batch_summary_label)
+        group_layout.addLayout(bulk_layout)
+        
+        self._update_batch_summary()
+        return group
+    
+    def _selected_batch_rows(self) -> List[int]:
+        """批量表格中选中的行号"""
+        return sorted(index.row() for index in self.batch_table.selectionModel().selectedRows())
+    
+    def _set_batch_decisions(self, rows: List[int], decision: str):
+        """把指定行的决定设为 decision"""
+        for row in rows:
+            box = self.batch_decision_boxes[row]
+            box.setCurrentIndex(box.findData(decision))
+    
+    def _update_batch_summary(self, *args):
+        """更新已决定 / 总数的统计"""
+        decided = sum(1 for box in self.batch_decision_boxes if box.currentData() != "pending")
+        self.batch_summary_label.setText(f"已决定 {decided} / {len(self.batch_decision_boxes)}")
+    
+    def get_batch_decisions(self) -> List[BatchDecision]:
+        """按输入顺序返回每个条目的决定"""
+        return [
+            BatchDecision(
+                index=row,
+                audience_id=item["audience_id"],
+                task_id=item["task_id"],
+                risk_level=item["risk_level"],
+                decision=box.currentData(),
+            )
+            for row, (item, box) in enumerate(zip(self.batch_items, self.batch_decision_boxes))
+        ]
+    
     def _create_risk_tab(self) -> QWidget:
         """创建风险评估标签页"""
         widget = QWidget()
@@ -266,14 +753,7 @@ class DataSyncUI(QMainWindow):
         
         risk_level = self._get_risk_level()
         risk_label = QLabel(f"当前风险等级: {risk_level}")
-        risk_label.setStyleSheet(f"""
-            QLabel {{
-                font-size: 16px;
-                font-weight: bold;
-                color: {self._get_risk_color(risk_level)};
-                padding: 10px;
-            }}
-        """)
+        risk_label.setStyleSheet(self.RISK_LABEL_STYLE.format(color=self._get_risk_color(risk_level)))
         risk_layout.addWidget(risk_label)
         
         # 风险说明
@@ -332,6 +812,17 @@ class DataSyncUI(QMainWindow):
                 <li>记录状态变更历史</li>
             </ul>
             """
+        elif operation_type == "batch_sync":
+            counts = {level: 0 for level in RISK_ORDER}
+            for item in self.batch_items:
+                counts[item["risk_level"]] += 1
+            risk_items = "".join(f"<li>{level.upper()}: {count} 个</li>" for level, count in counts.items() if count)
+            return f"""
+            <h3>📦 批量数据同步操作</h3>
+            <p>此操作将同步 {len(self.batch_items)} 个用户群，按风险等级：</p>
+            <ul>{risk_items}</ul>
+            <p>请在操作确认页逐行选择批准、拒绝或推迟</p>
+            """
         elif operation_type == "rollback":
             return """
             <h3>⏪ 回滚操作</h3>
@@ -354,6 +845,9 @@ class DataSyncUI(QMainWindow):
         """获取风险等级"""
         operation_type = self.context.get("operation_type", "unknown")
         
+        if self.batch_items:
+            # 批量确认取各条目中的最高风险
+            return max((item["risk_level"] for item in self.batch_items), key=RISK_ORDER.index).upper()
         if operation_type == "rollback":
             return "HIGH"
         elif operation_type == "sync":
@@ -466,42 +960,7 @@ class DataSyncUI(QMainWindow):
     
     def _get_button_style(self, button_type: str) -> str:
         """获取按钮样式"""
-        if button_type == "submit":
-            return """
-                QPushButton {
-                    background-color: #4CAF50;
-                    color: white;
-                    border: none;
-                    padding: 12px 24px;
-                    font-size: 14px;
-                    font-weight: bold;
-                    border-radius: 6px;
-                }
-                QPushButton:hover {
-                    background-color: #45a049;
-                }
-                QPushButton:pressed {
-                    background-color: #3d8b40;
-                }
-            """
-        else:  # cancel
-            return """
-                QPushButton {
-                    background-color: #f44336;
-                    color: white;
-                    border: none;
-                    padding: 12px 24px;
-                    font-size: 14px;
-                    font-weight: bold;
-                    border-radius: 6px;
-                }
-                QPushButton:hover {
-                    background-color: #da190b;
-                }
-                QPushButton:pressed {
-                    background-color: #c1170a;
-                }
-            """
+        return self.BUTTON_STYLES.get(button_type, self.BUTTON_STYLES["cancel"])
     
     def _setup_shortcuts(self):
         """设置快捷键"""
@@ -524,9 +983,6 @@ class DataSyncUI(QMainWindow):
                 if checkbox.isChecked():
                     selected_options.append(self.predefined_options[i])
         
-        # 获取图片数据
-        image_data = self.feedback_text.get_image_data()
-        
         # 组合反馈内容
         final_feedback_parts = []
         
@@ -537,22 +993,42 @@ class DataSyncUI(QMainWindow):
             final_feedback_parts.append(feedback_text)
         
         final_feedback = "\n\n".join(final_feedback_parts)
-        images_b64 = [img['base64'] for img in image_data]
+        # 获取图片字节（只等待仍在编码的图片）
+        image_started = time.perf_counter()
+        images = self.feedback_text.get_image_payload()
+        self.phase_ms["image_wait"] = latency_metrics.elapsed_ms(image_started)
         
         self.feedback_result = DataSyncResult(
             interactive_feedback=final_feedback,
-            images=images_b64,
+            images=images,
             operation_type=self.context.get("operation_type", ""),
             audience_id=self.context.get("audience_id", ""),
             task_id=self.context.get("task_id", "")
         )
+        if self.batch_items:
+            self.feedback_result["decisions"] = self.get_batch_decisions()
         self.close()
     
-    def run(self) -> DataSyncResult:
-        """运行界面"""
-        self.show()
-        QApplication.instance().exec()
-        
+    def showEvent(self, event):
+        """记录窗口首次显示时间，并开始在空闲时构建其余标签页"""
+        super().showEvent(event)
+        if self.first_shown_at is None:
+            self.first_shown_at = time.time()
+            self._shown_perf = time.perf_counter()
+            # 首次显示后在空闲时间构建其余标签页
+            if self._pending_tabs:
+                self._tab_build_timer.start()
+    
+    def closeEvent(self, event):
+        """关闭窗口时发出结果信号"""
+        # 从窗口显示到提交/关闭：用户阅读与思考的时间
+        if self._shown_perf is not None:
+            self.phase_ms["think"] = latency_metrics.elapsed_ms(self._shown_perf)
+        super().closeEvent(event)
+        self.finished.emit(self.get_result())
+    
+    def get_result(self) -> DataSyncResult:
+        """返回反馈结果，未提交时返回空结果"""
         if not self.feedback_result:
             return DataSyncResult(
                 interactive_feedback="",
@@ -563,12 +1039,19 @@ class DataSyncUI(QMainWindow):
             )
         
         return self.feedback_result
+    
+    def run(self) -> DataSyncResult:
+        """运行界面"""
+        self.show()
+        QApplication.instance().exec()
+        return self.get_result()
 
-def data_sync_ui(context: Dict, predefined_options: Optional[List[str]] = None, output_file: Optional[str] = None) -> Optional[DataSyncResult]:
-    """启动数据同步 UI"""
-    # 启用高 DPI 缩放
-    QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
-    QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
+def prepare_application() -> QApplication:
+    """创建（或复用）QApplication 并应用数据同步主题与全局字体"""
+    if QApplication.instance() is None:
+        # 启用高 DPI 缩放（必须在创建 QApplication 之前设置）
+        QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
+        QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
     
     # 创建应用
     app = QApplication.instance() or QApplication()
@@ -579,32 +1062,58 @@ def data_sync_ui(context: Dict, predefined_options: Optional[List[str]] = None,
     default_font = app.font()
     default_font.setPointSize(13)
     app.setFont(default_font)
+    return app
+
+def data_sync_ui(context: Dict, predefined_options: Optional[List[str]] = None, output_file: Optional[str] = None, launch_ts: Optional[float] = None, output_stream=None) -> Optional[DataSyncResult]:
+    """启动数据同步 UI"""
+    prepare_application()
     
     # 创建 UI
     ui = DataSyncUI(context, predefined_options)
     result = ui.run()
     
+    # 记录从服务端发起启动到窗口首次显示的耗时，以及窗口内各阶段耗时
+    if launch_ts:
+        result["_timing"] = latency_metrics.ui_timing(ui, launch_ts)
+    
+    if output_stream and result:
+        # 按帧回传结果（图片为原始字节）
+        ui_protocol.write_result(output_stream, result)
+        return None
+    
     if output_file and result:
         # 确保目录存在
         os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else ".", exist_ok=True)
-        # 保存结果
+        # 保存结果（JSON 中的图片需要 Base64）
         with open(output_file, "w", encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+            json.dump({**result, "images": [base64.b64encode(img).decode('utf-8') for img in result["images"]]}, f, ensure_ascii=False, indent=2)
         return None
     
     return result
 
 if __name__ == "__main__":
+    # 进程创建到此处：解释器启动与 PySide6 等模块导入
+    latency_metrics.mark_imported()
+
     parser = argparse.ArgumentParser(description="数据同步反馈 UI")
     parser.add_argument("--context", help="上下文数据 JSON")
     parser.add_argument("--predefined-options", default="", help="预设选项 (||| 分隔)")
     parser.add_argument("--output-file", help="输出文件路径")
+    parser.add_argument("--launch-ts", type=float, default=None, help="服务端发起启动的时间戳（用于统计出窗耗时）")
+    parser.add_argument("--output-stdout", action="store_true", help="通过 stdout 以帧协议回传结果")
+    parser.add_argument("--parent-pid", type=int, default=None, help="启动本进程的服务 PID，该进程退出时关闭 UI")
     args = parser.parse_args()
     
+    # 启动本进程的服务退出后，窗口已无人等待
+    ui_launcher.watch_parent(args.parent_pid)
+    
+    # 独占 stdout 作为结果通道，调试输出改写到 stderr
+    output_stream = ui_protocol.claim_stdout() if args.output_stdout else None
+    
     context = json.loads(args.context) if args.context else {}
     predefined_options = [opt for opt in args.predefined_options.split("|||") if opt] if args.predefined_options else None
     
-    result = data_sync_ui(context, predefined_options, args.output_file)
+    result = data_sync_ui(context, predefined_options, args.output_file, args.launch_ts, output_stream)
     if result:
         print(f"\n收到的反馈:\n{result['interactive_feedback']}")
     sys.exit(0)
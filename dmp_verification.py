@@ -0,0 +1,340 @@
+# DMP Verification - DMP 响应解析与向量化校验
+# dmp_response 支持以下形式，解析为 NumPy 列（MID / RawDMP / Status / Old）：
+#   1. 键值对文本："RawDMP=16, Old=1, New=20"，多条记录用换行或分号分隔，可带 MID=...
+#   2. JSON 行数组：[{"MID": "5094814497", "RawDMP": 16, "Status": 20}, ...]
+#   3. JSON 列对象：{"MID": [...], "RawDMP": [...], "Status": [...]}（大响应解析最快）
+# 状态、一致性、完整性规则在整列上向量化执行，只有校验失败时才需要弹窗人工确认
+import os
+import re
+import json
+import time
+import warnings
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+try:
+    import orjson
+except ImportError:  # 可选依赖，大响应解析更快
+    orjson = None
+
+# 缺失的数值字段
+MISSING = -1
+
+# 允许的 Status 取值（逗号分隔），调用时也可以单独指定
+ALLOWED_STATUS_ENV = "DATA_SYNC_DMP_ALLOWED_STATUS"
+DEFAULT_ALLOWED_STATUS = (1, 20)
+
+# 弹窗中最多列出的失败行
+FAILING_ROWS_LIMIT = 500
+
+# 字段别名（小写） -> 列名
+FIELD_ALIASES = {
+    "mid": "mid",
+    "rawdmp": "raw_dmp", "raw_dmp": "raw_dmp", "raw": "raw_dmp",
+    "status": "status", "new": "status", "new_status": "status",
+    "old": "old_status", "old_status": "old_status",
+}
+
+class DMPParseError(ValueError):
+    """dmp_response 无法解析为结构化数据"""
+
+class DMPRows:
+    """
+    列式存储的 DMP 响应
+    mid 全为数字时是 uint64 列，否则是字符串列；mid_missing 标记没有 MID 的行，
+    mid_invalid 标记给出了 MID 但不是 uint64 范围内非负十进制整数的行（如 -5、1.5、0x10）
+    数值列中缺失的值为 MISSING；has_mid / has_old 表示响应中是否给出了该字段
+    """
+
+    def __init__(self, mid: np.ndarray, mid_missing: np.ndarray, mid_invalid: np.ndarray, raw_dmp: np.ndarray,
+                 status: np.ndarray, old_status: np.ndarray, has_mid: bool, has_old: bool):
+        self.mid = mid
+        self.mid_missing = mid_missing
+        self.mid_invalid = mid_invalid
+        self.raw_dmp = raw_dmp
+        self.status = status
+        self.old_status = old_status
+        self.has_mid = has_mid
+        self.has_old = has_old
+
+    def __len__(self) -> int:
+        return len(self.raw_dmp)
+
+    def row(self, index: int) -> Dict:
+        """第 index 行（展示用），缺失的字段为 None"""
+        def value(column: np.ndarray):
+            v = column[index].item()
+            return None if v == MISSING else v
+        row = {"row": int(index)}
+        if self.has_mid:
+            row["MID"] = None if self.mid_missing[index] else str(self.mid[index])
+        row["RawDMP"] = value(self.raw_dmp)
+        row["Status"] = value(self.status)
+        if self.has_old:
+            row["Old"] = value(self.old_status)
+        return row
+
+# ---------------------------------------------------------------------------
+# 解析
+# ---------------------------------------------------------------------------
+
+def _int_column(values: Sequence) -> np.ndarray:
+    """整数列：None / 空字符串 / 布尔值 / 带小数的数值等非整数记为 MISSING"""
+    # np.array 会把 True 转为 1、把 16.7 截断为 16，只有整数与字符串才走快速路径
+    if {type(v) for v in values} <= {int, str}:
+        try:
+            return np.array(values, dtype=np.int64)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    column = np.full(len(values), MISSING, dtype=np.int64)
+    for i, v in enumerate(values):
+        if isinstance(v, bool) or (isinstance(v, float) and not v.is_integer()):
+            continue
+        try:
+            column[i] = int(v)
+        except (TypeError, ValueError, OverflowError):
+            pass
+    return column
+
+_UINT64_MAX = np.iinfo(np.uint64).max
+
+def _valid_mid_text(text: str) -> bool:
+    """uint64 范围内的非负十进制整数"""
+    return text.isascii() and text.isdigit() and int(text) <= _UINT64_MAX
+
+def _mid_column(values: Sequence):
+    """
+    MID 列：全为合法的非负整数（或数字字符串）时转为 uint64，否则保留为字符串；
+    返回 (列, 缺失标记, 非法标记)
+    """
+    count = len(values)
+    if not values:
+        return np.zeros(0, dtype=np.uint64), np.zeros(0, dtype=bool), np.zeros(0, dtype=bool)
+    try:
+        with warnings.catch_warnings():
+            # 旧版 NumPy 遇到无法解析的内容只给出警告并返回部分结果
+            warnings.simplefilter("error")
+            mids = np.fromstring(",".join(map(str, values)), dtype=np.uint64, sep=",")
+        # fromstring 把超出 uint64 的值截为最大值，只有这些位置需要逐个核对原文
+        if len(mids) == count and all(_valid_mid_text(str(values[i]).strip())
+                                      for i in np.flatnonzero(mids == _UINT64_MAX).tolist()):
+            return mids, np.zeros(count, dtype=bool), np.zeros(count, dtype=bool)
+    except (ValueError, DeprecationWarning):
+        pass
+    texts = ["" if v is None else str(v).strip() for v in values]
+    missing = np.array([not t for t in texts], dtype=bool)
+    invalid = np.array([bool(t) and (isinstance(v, bool) or not _valid_mid_text(t)) for v, t in zip(values, texts)],
+                       dtype=bool)
+    if not invalid.any():
+        return np.array([int(t) if t else 0 for t in texts], dtype=np.uint64), missing, invalid
+    return np.array(texts, dtype=str), missing, invalid
+
+def _build_rows(columns: Dict[str, Sequence], count: int) -> DMPRows:
+    """按列名组装 DMPRows，未给出的列全部缺失"""
+    if "mid" in columns:
+        mid, mid_missing, mid_invalid = _mid_column(columns["mid"])
+    else:
+        mid, mid_missing, mid_invalid = np.zeros(count, dtype=np.uint64), np.ones(count, dtype=bool), np.zeros(count, dtype=bool)
+
+    def numeric(name: str) -> np.ndarray:
+        return _int_column(columns[name]) if name in columns else np.full(count, MISSING, dtype=np.int64)
+
+    return DMPRows(mid, mid_missing, mid_invalid, numeric("raw_dmp"), numeric("status"), numeric("old_status"),
+                   has_mid="mid" in columns, has_old="old_status" in columns)
+
+def _field_keys(keys) -> Dict[str, str]:
+    """原始字段名 -> 列名（忽略不认识的字段）"""
+    mapping = {}
+    for key in keys:
+        name = FIELD_ALIASES.get(str(key).strip().lower())
+        if name and name not in mapping.values():
+            mapping[key] = name
+    return mapping
+
+def _parse_json_rows(rows: list) -> DMPRows:
+    if not all(isinstance(row, dict) for row in rows):
+        raise DMPParseError("JSON 数组中的每一项都应为对象")
+    # 字段取所有行字段名的并集（第一行缺少的字段也要校验），每行缺少的字段按缺失处理；
+    # 同一字段在不同行中可能用了不同的别名（MID / mid）
+    aliases: Dict[str, List] = {}
+    first = list(rows[0]) if rows else []
+    for key in first + [key for key in set().union(*rows) if key not in first]:
+        name = FIELD_ALIASES.get(str(key).strip().lower())
+        if name:
+            aliases.setdefault(name, []).append(key)
+    if rows and not aliases:
+        raise DMPParseError("JSON 行中没有 MID / RawDMP / Status 字段")
+
+    def column(keys: List) -> List:
+        if len(keys) == 1:
+            return [row.get(keys[0]) for row in rows]
+        return [next((row[key] for key in keys if key in row), None) for row in rows]
+
+    return _build_rows({name: column(keys) for name, keys in aliases.items()}, len(rows))
+
+def _parse_json_columns(data: dict) -> DMPRows:
+    mapping = _field_keys(data.keys())
+    if not mapping:
+        raise DMPParseError("JSON 对象中没有 MID / RawDMP / Status 字段")
+    columns = {name: data[key] for key, name in mapping.items()}
+    if not all(isinstance(values, list) for values in columns.values()):
+        # 单条记录：{"MID": ..., "RawDMP": ..., "Status": ...}
+        return _parse_json_rows([data])
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) != 1:
+        raise DMPParseError("JSON 列的长度不一致")
+    return _build_rows(columns, lengths.pop())
+
+_PAIR_PATTERN = re.compile(r"([A-Za-z_]+)\s*[=:]\s*([^,;\s]*)")
+
+def _parse_key_values(text: str) -> DMPRows:
+    records = []
+    for line in re.split(r"[;\n]", text):
+        record = {}
+        for key, value in _PAIR_PATTERN.findall(line):
+            name = FIELD_ALIASES.get(key.lower())
+            if name:
+                record[name] = value.strip().strip("'\"")
+        if record:
+            records.append(record)
+    if not records:
+        raise DMPParseError("无法识别的 DMP 响应格式（应为 JSON 或 RawDMP=16, Old=1, New=20 形式的键值对）")
+    names = {name for record in records for name in record}
+    columns = {name: [record.get(name) for record in records] for name in names}
+    return _build_rows(columns, len(records))
+
+def parse_dmp_response(text: str) -> DMPRows:
+    """解析 DMP 响应为列式数据，无法识别时抛出 DMPParseError"""
+    text = (text or "").strip()
+    if not text:
+        raise DMPParseError("DMP 响应为空")
+    if text[0] in "[{":
+        try:
+            data = orjson.loads(text) if orjson is not None else json.loads(text)
+        except ValueError as e:
+            raise DMPParseError(f"JSON 解析失败: {e}")
+        rows = _parse_json_rows(data) if isinstance(data, list) else _parse_json_columns(data)
+    else:
+        rows = _parse_key_values(text)
+    if not len(rows):
+        # 没有任何数据行时规则全部“通过”，不能据此跳过人工确认
+        raise DMPParseError("DMP 响应中没有数据行")
+    return rows
+
+def parse_and_verify(text: str, verification_type: str, allowed: Optional[Sequence[int]] = None) -> "VerificationReport":
+    """解析并校验 DMP 响应（大响应耗时较长，由调用方放到工作线程执行）"""
+    return verify(parse_dmp_response(text), verification_type, allowed)
+
+# ---------------------------------------------------------------------------
+# 校验规则
+# ---------------------------------------------------------------------------
+
+def _duplicate_mask(rows: DMPRows) -> np.ndarray:
+    """MID 出现多次的行（全部标记）"""
+    mask = np.zeros(len(rows), dtype=bool)
+    present = np.flatnonzero(~rows.mid_missing)
+    if len(present) < 2:
+        return mask
+    order = present[np.argsort(rows.mid[present], kind="stable")]
+    sorted_mids = rows.mid[order]
+    same = sorted_mids[1:] == sorted_mids[:-1]
+    mask[order[1:][same]] = True
+    mask[order[:-1][same]] = True
+    return mask
+
+class Rule:
+    """一条向量化校验规则：check(rows, allowed_status) 返回失败行的布尔掩码"""
+
+    def __init__(self, name: str, category: str, description: str, check: Callable[[DMPRows, np.ndarray], np.ndarray]):
+        self.name = name
+        self.category = category
+        self.description = description
+        self.check = check
+
+RULES: List[Rule] = [
+    Rule("missing_mid", "completeness", "缺少 MID",
+         lambda rows, allowed: rows.mid_missing if rows.has_mid else np.zeros(len(rows), dtype=bool)),
+    Rule("invalid_mid", "completeness", "MID 不是非负整数", lambda rows, allowed: rows.mid_invalid),
+    Rule("missing_raw_dmp", "completeness", "缺少 RawDMP", lambda rows, allowed: rows.raw_dmp == MISSING),
+    Rule("missing_status", "completeness", "缺少 Status", lambda rows, allowed: rows.status == MISSING),
+    Rule("zero_raw_dmp", "completeness", "RawDMP 为 0", lambda rows, allowed: rows.raw_dmp == 0),
+    Rule("invalid_status", "status", "Status 不在允许的取值中",
+         lambda rows, allowed: (rows.status != MISSING) & ~np.isin(rows.status, allowed)),
+    Rule("unchanged_status", "status", "新旧状态相同",
+         lambda rows, allowed: (rows.old_status != MISSING) & (rows.old_status == rows.status)),
+    Rule("duplicate_mid", "consistency", "MID 重复", lambda rows, allowed: _duplicate_mask(rows)),
+    Rule("negative_raw_dmp", "consistency", "RawDMP 为负数",
+         lambda rows, allowed: (rows.raw_dmp < 0) & (rows.raw_dmp != MISSING)),
+]
+
+RULE_CATEGORIES = ("status", "consistency", "completeness")
+
+def allowed_statuses(values: Optional[Sequence[int]] = None) -> np.ndarray:
+    """允许的 Status 取值：参数优先，其次环境变量，默认 1 与 20"""
+    if not values:
+        configured = os.environ.get(ALLOWED_STATUS_ENV, "")
+        try:
+            values = [int(v) for v in configured.split(",") if v.strip()]
+        except ValueError:
+            values = None
+    return np.array(values or DEFAULT_ALLOWED_STATUS, dtype=np.int64)
+
+def rules_for(verification_type: str) -> List[Rule]:
+    """
+    verification_type 对应的规则：完整性规则总是执行（缺失的数据无法判断状态与一致性），
+    再加上该类型的规则；all 或未知类型执行全部规则
+    """
+    category = (verification_type or "").strip().lower()
+    if category not in RULE_CATEGORIES:
+        return list(RULES)
+    return [rule for rule in RULES if rule.category in ("completeness", category)]
+
+class VerificationReport:
+    """一次校验的结果：每条规则的失败行掩码"""
+
+    def __init__(self, rows: DMPRows, verification_type: str, failures: Dict[str, np.ndarray], elapsed: float):
+        self.rows = rows
+        self.verification_type = verification_type
+        self.failures = failures
+        self.elapsed = elapsed
+        self.failing_mask = np.zeros(len(rows), dtype=bool)
+        for mask in failures.values():
+            self.failing_mask |= mask
+
+    @property
+    def passed(self) -> bool:
+        return not self.failing_mask.any()
+
+    def counts(self) -> Dict[str, int]:
+        return {name: int(np.count_nonzero(mask)) for name, mask in self.failures.items()}
+
+    def failing_rows(self, limit: int = FAILING_ROWS_LIMIT) -> List[Dict]:
+        """前 limit 个失败行，每行附上失败的规则"""
+        descriptions = {rule.name: rule.description for rule in RULES}
+        result = []
+        for index in np.flatnonzero(self.failing_mask)[:limit]:
+            row = self.rows.row(int(index))
+            row["problems"] = [descriptions[name] for name, mask in self.failures.items() if mask[index]]
+            result.append(row)
+        return result
+
+    def summary(self) -> Dict:
+        descriptions = {rule.name: rule.description for rule in RULES}
+        return {
+            "verification_type": self.verification_type,
+            "rows": len(self.rows),
+            "checks": list(self.failures),
+            "passed": self.passed,
+            "failed_rows": int(np.count_nonzero(self.failing_mask)),
+            "failures": {name: {"count": count, "description": descriptions[name]}
+                         for name, count in self.counts().items() if count},
+            "elapsed_ms": round(self.elapsed * 1000, 1),
+        }
+
+def verify(rows: DMPRows, verification_type: str, allowed: Optional[Sequence[int]] = None) -> VerificationReport:
+    """对整列执行 verification_type 对应的规则"""
+    started = time.perf_counter()
+    allowed_array = allowed_statuses(allowed)
+    failures = {rule.name: rule.check(rows, allowed_array) for rule in rules_for(verification_type)}
+    return VerificationReport(rows, verification_type, failures, time.perf_counter() - started)
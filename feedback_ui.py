@@ -8,8 +8,7 @@ import json
 import argparse
 import base64
 import uuid
-import re  # 将re导入移至顶部
-from datetime import datetime
+import time
 from typing import Optional, TypedDict, List
 
 from PySide6.QtWidgets import (
@@ -17,12 +16,18 @@ from PySide6.QtWidgets import (
     QLabel, QLineEdit, QPushButton, QCheckBox, QTextEdit, QTextBrowser, QGroupBox,
     QFrame, QScrollArea, QGridLayout
 )
-from PySide6.QtCore import Qt, Signal, QObject, QTimer, QSettings, QUrl, QDateTime, QBuffer, QIODevice
-from PySide6.QtGui import QTextCursor, QIcon, QKeyEvent, QPalette, QColor, QTextImageFormat, QTextDocument, QPixmap, QShortcut, QKeySequence, QFont
+from PySide6.QtCore import Qt, Signal, QObject, QTimer, QSettings, QUrl, QDateTime, QEvent
+from PySide6.QtGui import QTextCursor, QIcon, QKeyEvent, QPalette, QColor, QTextImageFormat, QTextDocument, QPixmap, QImage, QShortcut, QKeySequence, QFont
+
+import image_pipeline
+import prompt_render
+import latency_metrics
+import ui_launcher
+import ui_protocol
 
 class FeedbackResult(TypedDict):
     interactive_feedback: str
-    images: List[str]
+    images: List[bytes]  # 图片原始字节
 
 def get_dark_mode_palette(app: QApplication):
     darkPalette = app.palette()
@@ -51,22 +56,31 @@ def get_dark_mode_palette(app: QApplication):
 
 class FeedbackTextEdit(QTextEdit):
     # 图片处理常量
-    DEFAULT_MAX_IMAGE_WIDTH = 1624
-    DEFAULT_MAX_IMAGE_HEIGHT = 1624
-    DEFAULT_IMAGE_FORMAT = "PNG"
+    DEFAULT_MAX_IMAGE_WIDTH = image_pipeline.DEFAULT_MAX_IMAGE_WIDTH
+    DEFAULT_MAX_IMAGE_HEIGHT = image_pipeline.DEFAULT_MAX_IMAGE_HEIGHT
+    DEFAULT_IMAGE_FORMAT = image_pipeline.DEFAULT_IMAGE_FORMAT
+
+    # 预览缩略图的逻辑高度
+    THUMBNAIL_HEIGHT = 80
 
-    # 定义类级别的信号
-    image_pasted = Signal(QPixmap)
+    # 定义类级别的信号：粘贴时立即发出 (图片ID, 占位缩略图)，后台编码完成后发出 (图片ID, 清晰缩略图)
+    image_pasted = Signal(str, QPixmap)
+    image_encoded = Signal(str, QPixmap)
 
     def __init__(self, parent=None):
         super().__init__(parent)
-        self.image_data = []   # 保存图片的Base64数据列表
-        # 获取设备的像素比例
+        # 粘贴图片登记表：保存编码后的原始字节，内容相同的图片只保存一份
+        self.image_registry = image_pipeline.ImageRegistry()
+        # 获取设备的像素比例（窗口所在屏幕变化时由 FeedbackUI 更新）
         self.device_pixel_ratio = QApplication.primaryScreen().devicePixelRatio()
-        # 图片压缩参数
-        self.max_image_width = self.DEFAULT_MAX_IMAGE_WIDTH  # 最大宽度
-        self.max_image_height = self.DEFAULT_MAX_IMAGE_HEIGHT  # 最大高度
-        self.image_format = self.DEFAULT_IMAGE_FORMAT  # 图片格式
+        # 预览缩略图缓存，按内容哈希和设备像素比区分
+        self.thumbnail_cache = image_pipeline.ThumbnailCache(self.THUMBNAIL_HEIGHT)
+        # 图片压缩参数（最大宽高、格式、质量、单张字节预算），可通过环境变量覆盖
+        self.image_options = image_pipeline.ImageOptions.from_env()
+        # 图片在线程池中编码，粘贴不阻塞 GUI 线程
+        self.image_encoder = image_pipeline.ImageEncoder(self.image_options, self)
+        self.image_encoder.encoded.connect(self._on_image_encoded)
+        self.image_encoder.failed.connect(self._on_image_failed)
 
     def keyPressEvent(self, event: QKeyEvent):
         if event.key() == Qt.Key_Return and event.modifiers() == Qt.ControlModifier:
@@ -79,35 +93,44 @@ class FeedbackTextEdit(QTextEdit):
         else:
             super().keyPressEvent(event)
 
-    def _convert_image_to_base64(self, image):
-        """将图片转换为 Base64 编码字符串"""
-        try:
-            # 将图片转换为QPixmap
-            if not isinstance(image, QPixmap):
-                pixmap = QPixmap.fromImage(image)
-            else:
-                pixmap = image
-
-            # 创建字节缓冲区
-            buffer = QBuffer()
-            buffer.open(QIODevice.WriteOnly)
-
-            pixmap.save(buffer, self.image_format)
-            file_extension = self.image_format.lower()  # 使用小写的格式名作为扩展名
-
-            # 获取字节数据并转换为base64
-            byte_array = buffer.data()
-            base64_string = base64.b64encode(byte_array).decode('utf-8')
-            buffer.close()
-
-            # 返回Base64数据和文件扩展名
-            return {
-                'data': base64_string,
-                'extension': file_extension
-            }
-        except Exception as e:
-            print(f"转换图片为Base64时出错: {e}")
+    def _on_image_encoded(self, image_id, encoded, digest, thumb):
+        """后台编码完成：登记字节，用平滑缩放的缩略图替换占位图"""
+        if image_id not in self.image_registry:
+            # 编码完成前预览已被删除
+            return
+        self.image_registry.resolve(image_id, encoded.data, digest)
+        if thumb is not None and thumb.devicePixelRatio() != self.device_pixel_ratio:
+            # 编码期间窗口换到了像素比不同的屏幕
+            thumb = None
+        pixmap = QPixmap.fromImage(thumb) if thumb is not None else self.thumbnail_for(image_id)
+        if pixmap is not None:
+            self.image_encoded.emit(image_id, pixmap)
+
+    def _on_image_failed(self, image_id, error):
+        print(f"编码图片时出错: {error}", file=sys.stderr)
+        if image_id in self.image_registry:
+            self.image_registry.remove(image_id)
+            self.textCursor().insertText(f"[图片处理失败: {error}]")
+
+    def remove_image(self, image_id):
+        """删除一张粘贴的图片"""
+        digest = self.image_registry.digest(image_id)
+        self.image_registry.remove(image_id)
+        if digest is not None and self.image_registry.data(digest) is None:
+            self.thumbnail_cache.discard(digest)
+
+    def thumbnail_for(self, image_id):
+        """当前像素比下的预览缩略图；缓存未命中时从编码后的字节重新生成，仍在编码时返回 None"""
+        digest = self.image_registry.digest(image_id)
+        if digest is None:
             return None
+        data = self.image_registry.data(digest)
+        thumb = self.thumbnail_cache.get_or_create(digest, self.device_pixel_ratio, lambda: QImage.fromData(data))
+        return QPixmap.fromImage(thumb)
+
+    def wait_for_pending_images(self):
+        """等待仍在后台编码的图片"""
+        self.image_encoder.wait()
 
     # Add this method to handle pasting content, including images
     def insertFromMimeData(self, source_data):
@@ -117,33 +140,25 @@ class FeedbackTextEdit(QTextEdit):
         """
         try:
             if source_data.hasImage():
-                # If the mime data contains an image, convert to Base64
+                # If the mime data contains an image, encode it in the background
                 image = source_data.imageData()
                 if image:
                     try:
-                        # 使用原始图片，不进行压缩
-                        # 转换图片为Base64编码
-                        image_result = self._convert_image_to_base64(image)
-
-                        if image_result:
-                            # 生成唯一的文件名用于标识
-                            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                            unique_id = str(uuid.uuid4())[:8]
-                            filename = f"pasted_image_{timestamp}_{unique_id}.{image_result['extension']}"
-
-                            # 保存Base64数据
-                            image_info = {
-                                'base64': image_result['data'],
-                                'filename': filename
-                            }
-                            self.image_data.append(image_info)
-
-                            # 发出信号，通知上层组件有新图片被粘贴
-                            if isinstance(image, QPixmap):
-                                pixmap = image
-                            else:
-                                pixmap = QPixmap.fromImage(image)
-                            self.image_pasted.emit(pixmap)
+                        started = time.perf_counter()
+                        if isinstance(image, QPixmap):
+                            image = image.toImage()
+
+                        # 先登记图片，字节在编码完成后填入
+                        unique_id = str(uuid.uuid4())[:8]
+                        self.image_registry.add(unique_id)
+
+                        # 编码（超出最大尺寸时缩放，超出字节预算时压缩）与清晰缩略图都在线程池中完成
+                        self.image_encoder.submit(unique_id, image, self.thumbnail_cache, self.device_pixel_ratio)
+
+                        # 立即显示快速缩放的占位缩略图
+                        placeholder = image_pipeline.thumbnail(image, self.THUMBNAIL_HEIGHT, self.device_pixel_ratio, smooth=False)
+                        self.image_pasted.emit(unique_id, QPixmap.fromImage(placeholder))
+                        image_pipeline.log_paste_stall(started)
 
                     except Exception as e:
                         print(f"处理图片时出错: {e}")
@@ -170,20 +185,30 @@ class FeedbackTextEdit(QTextEdit):
                 cursor = self.textCursor()
                 cursor.insertText(f"[粘贴内容失败: {str(e)}]")
 
-    def get_image_data(self):
-        """返回图片数据列表（包含Base64编码）"""
-        return self.image_data.copy()
+    def get_image_payload(self):
+        """等待仍在编码的图片，返回去重后的图片字节列表（提交时调用一次）"""
+        self.wait_for_pending_images()
+        return self.image_registry.payload()
 
 class FeedbackUI(QMainWindow):
-    # 缓存Markdown实例
-    _markdown_instance = None
+    # 窗口关闭时发出，携带反馈结果（常驻 UI 进程据此回传结果）
+    finished = Signal(dict)
 
     def __init__(self, prompt: str, predefined_options: Optional[List[str]] = None):
+        construct_started = time.perf_counter()
         super().__init__()
         self.prompt = prompt
         self.predefined_options = predefined_options or []
 
         self.feedback_result = None
+        # 图片ID -> 预览标签，后台编码完成或像素比变化后替换缩略图
+        self.image_labels = {}
+        self._screen_signal_connected = False
+        # 首次显示窗口的时间（time.time()），用于统计冷/热启动到出窗耗时
+        self.first_shown_at = None
+        self._shown_perf = None
+        # 各阶段耗时（毫秒）：construct / render / think / image_wait，随结果回传
+        self.phase_ms = {}
 
         self.setWindowTitle("Cursor 交互式反馈 MCP")
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -218,272 +243,7 @@ class FeedbackUI(QMainWindow):
 
         self._create_ui()
         self._setup_shortcuts()  # 添加快捷键设置
-
-    def _preprocess_text(self, text: str) -> str:
-        """
-        预处理文本，处理转义字符问题
-        特别处理从Cursor编辑器传入时的转义问题
-        """
-        # 记录原始文本（用于调试）
-        print(f"原始文本: {repr(text)}")
-
-        # 处理字面上的转义序列
-        if isinstance(text, str):
-            # 尝试多种解码方式来处理不同来源的转义
-
-            # 方式1: 尝试JSON解码（适用于从JSON参数传入的情况）
-            try:
-                import json
-                # 如果文本看起来像是被JSON编码过的字符串，尝试解码
-                if '\\n' in text or '\\t' in text or '\\r' in text:
-                    # 添加引号使其成为有效JSON字符串，然后解码
-                    decoded_text = json.loads(f'"{text}"')
-                    print(f"JSON解码成功: {repr(decoded_text)}")
-                    text = decoded_text
-                else:
-                    print("不需要JSON解码")
-            except (json.JSONDecodeError, ValueError):
-                print("JSON解码失败，使用字符串替换方法")
-                # 如果JSON解码失败，使用字符串替换方法
-
-                # 先检查是否存在双重转义（如 \\n）
-                if '\\\\n' in text:
-                    # 处理双重转义的换行符
-                    text = text.replace('\\\\n', '\n')
-                    text = text.replace('\\\\t', '\t')
-                    text = text.replace('\\\\r', '\r')
-                    text = text.replace('\\\\\\\\', '\\')  # 四重反斜杠变成单反斜杠
-                else:
-                    # 1. 处理字面上的转义序列
-                    text = text.replace('\\\\', '\\')  # 先处理双反斜杠
-                    text = text.replace('\\n', '\n')
-                    text = text.replace('\\t', '\t')
-                    text = text.replace('\\r', '\r')
-
-            # 2. 规范化换行符
-            text = text.replace('\r\n', '\n')
-            text = text.replace('\r', '\n')
-
-        # 记录处理后的文本（用于调试）
-        print(f"预处理后文本: {repr(text)}")
-        return text
-
-    def _is_markdown(self, text: str) -> bool:
-        """
-        检测文本是否可能是Markdown格式
-        通过检查常见Markdown语法特征来判断
-        """
-        # 如果文本为空，不视为Markdown
-        if not text or text.strip() == "":
-            return False
-
-        # 预处理文本，处理转义字符
-        text = self._preprocess_text(text)
-
-        # 检查常见的Markdown语法特征
-        markdown_patterns = [
-            r'^#{1,6}\s+.+',                  # 标题: # 标题文本
-            r'\*\*.+?\*\*',                   # 粗体: **文本**
-            r'\*.+?\*',                       # 斜体: *文本*
-            r'_.+?_',                         # 斜体: _文本_
-            r'`[^`]+`',                       # 行内代码: `代码`
-            r'^\s*```',                       # 代码块: ```
-            r'^\s*>',                         # 引用: > 文本
-            r'^\s*[-*+]\s+',                  # 无序列表: - 项目 或 * 项目 或 + 项目
-            r'^\s*\d+\.\s+',                  # 有序列表: 1. 项目
-            r'\[.+?\]\(.+?\)',                # 链接: [文本](URL)
-            r'!\[.+?\]\(.+?\)',               # 图片: ![alt](URL)
-            r'\|.+\|.+\|',                    # 表格
-            r'^-{3,}$',                       # 水平线: ---
-            r'^={3,}$',                       # 水平线: ===
-        ]
-
-        # 遍历文本的每一行，检查是否包含Markdown语法特征
-        lines = text.split('\n')
-        markdown_features_count = 0
-
-        for line in lines:
-            for pattern in markdown_patterns:
-                if re.search(pattern, line, re.MULTILINE):
-                    markdown_features_count += 1
-                    # 如果发现明确的Markdown特征，立即返回True
-                    if pattern in [r'^#{1,6}\s+.+', r'^\s*```', r'^\s*>', r'^\s*[-*+]\s+', r'^\s*\d+\.\s+', r'\|.+\|.+\|', r'^-{3,}$', r'^={3,}$']:
-                        return True
-
-        # 如果文本中包含一定数量的Markdown特征，则视为Markdown
-        # 这里根据特征数量和文本长度的比例来判断
-        # 如果特征数量超过2个或特征密度较高，则视为Markdown
-        return markdown_features_count >= 2 or (markdown_features_count > 0 and markdown_features_count / len(lines) > 0.1)
-
-    def _convert_text_to_html(self, text: str) -> str:
-        """
-        将普通文本转换为HTML格式
-        保留换行和空格，并进行基本的HTML转义
-        """
-        # 预处理文本，处理转义字符
-        text = self._preprocess_text(text)
-
-        # HTML转义
-        escaped_text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
-
-        # 保留换行
-        html_text = escaped_text.replace("\n", "<br>")
-
-        # 应用样式，去除多余的缩进，添加emoji字体支持
-        # 减小行高，并使用更具体的字体列表以保证跨平台一致性
-        styled_html = f"""<div style="
-            line-height: {self.line_height};
-            color: #ccc;
-            font-family: 'Segoe UI', 'PingFang SC', 'Hiragino Sans GB', system-ui, -apple-system, sans-serif, 'Apple Color Emoji', 'Segoe UI Emoji', 'Noto Color Emoji';
-            white-space: pre-wrap;
-        ">{html_text}</div>"""
-
-        return styled_html
-
-    def _convert_markdown_to_html(self, markdown_text: str) -> str:
-        """使用markdown库将markdown转换为HTML"""
-        try:
-            # 预处理文本，处理转义字符
-            markdown_text = self._preprocess_text(markdown_text)
-
-            import markdown
-            from markdown.extensions import codehilite, tables, toc
-
-            # 配置markdown扩展，添加emoji支持
-            extensions = ['extra', 'codehilite', 'toc']
-
-            # 尝试添加emoji扩展（如果可用）
-            try:
-                import pymdownx.emoji
-                extensions.append('pymdownx.emoji')
-                extension_configs = {
-                    'pymdownx.emoji': {
-                        'emoji_index': pymdownx.emoji.gemoji,
-                        'emoji_generator': pymdownx.emoji.to_svg,
-                        'alt': 'short',
-                        'options': {
-                            'attributes': {
-                                'align': 'absmiddle',
-                                'height': '20px',
-                                'width': '20px'
-                            },
-                            'image_path': 'https://assets-cdn.github.com/images/icons/emoji/unicode/',
-                            'non_standard_image_path': 'https://assets-cdn.github.com/images/icons/emoji/'
-                        }
-                    }
-                }
-            except ImportError:
-                print("pymdownx.emoji not available, using basic emoji support")
-                extension_configs = {}
-
-            # 使用缓存的Markdown实例或创建新实例
-            if FeedbackUI._markdown_instance is None:
-                FeedbackUI._markdown_instance = markdown.Markdown(
-                    extensions=extensions,
-                    extension_configs=extension_configs
-                )
-
-            # 重置实例以确保状态清空
-            FeedbackUI._markdown_instance.reset()
-
-            # 转换markdown到HTML
-            html = FeedbackUI._markdown_instance.convert(markdown_text)
-
-            # 应用自定义样式，去除多余的缩进，添加emoji支持
-            # 统一设置基础样式，减小行高和段落间距
-            styled_html = f"""
-            <style>
-                /* 基础样式 */
-                .md-content, .md-content p, .md-content li {{
-                    line-height: {self.line_height} !important; /* 统一并强制行高 */
-                    margin-top: 2px !important;
-                    margin-bottom: 2px !important;
-                }}
-                .md-content {{
-                    color: #ccc;
-                    font-family: 'Segoe UI', 'PingFang SC', 'Hiragino Sans GB', system-ui, -apple-system, sans-serif, 'Apple Color Emoji', 'Segoe UI Emoji', 'Noto Color Emoji';
-                    white-space: pre-wrap;
-                }}
-
-                /* 标题样式 */
-                h1 {{ color: #FF9800; margin: 12px 0 8px 0; font-size: 1.3em; }}
-                h2 {{ color: #2196F3; margin: 10px 0 6px 0; font-size: 1.2em; }}
-                h3 {{ color: #4CAF50; margin: 10px 0 6px 0; font-size: 1.1em; }}
-
-                /* 列表样式 */
-                ul, ol {{
-                    margin: 6px 0;
-                    padding-left: 20px;
-                }}
-                li {{
-                    vertical-align: baseline;
-                    display: list-item;
-                    text-align: left;
-                }}
-
-                /* 代码样式 */
-                code {{
-                    background-color: rgba(255,255,255,0.1);
-                    padding: 2px 6px;
-                    border-radius: 4px;
-                    font-family: 'Consolas', 'Monaco', monospace;
-                    font-size: 0.9em;
-                }}
-
-                pre {{
-                    background-color: rgba(255,255,255,0.05);
-                    padding: 12px;
-                    border-radius: 6px;
-                    overflow-x: auto;
-                    border-left: 4px solid #2196F3;
-                }}
-
-                /* 段落样式 - 已在 .md-content p 中处理 */
-                p {{ }}
-
-                /* 强调样式 */
-                strong {{ color: #FFD54F; }}
-                em {{ color: #81C784; }}
-
-                /* Emoji样式优化 */
-                .emoji, img.emoji {{
-                    height: 1.2em;
-                    width: 1.2em;
-                    margin: 0 0.05em 0 0.1em;
-                    vertical-align: -0.1em;
-                    display: inline-block;
-                }}
-
-                /* 表格样式 */
-                table {{
-                    border-collapse: collapse;
-                    width: 100%;
-                    margin: 10px 0;
-                }}
-                th, td {{
-                    border: 1px solid #444;
-                    padding: 8px;
-                    text-align: left;
-                }}
-                th {{
-                    background-color: rgba(255,255,255,0.1);
-                    font-weight: bold;
-                }}
-            </style>
-            <div class="md-content">{html}</div>
-            """
-
-            return styled_html
-
-        except ImportError:
-            # Fallback if markdown library is not installed
-            # Log that markdown library is not found and basic conversion is used.
-            print("Markdown library not found. Using basic HTML escaping for description.")
-            return self._convert_text_to_html(markdown_text)
-        except Exception as e:
-            # Fallback for any other error during markdown conversion
-            print(f"Error during markdown conversion: {e}. Using basic HTML escaping.")
-            return self._convert_text_to_html(markdown_text)
+        self.phase_ms["construct"] = latency_metrics.elapsed_ms(construct_started)
 
     def _create_ui(self):
         central_widget = QWidget()
@@ -493,7 +253,25 @@ class FeedbackUI(QMainWindow):
 
         # Description text area (from self.prompt) - Support multiline, selectable and copyable with markdown support
         self.description_text = QTextBrowser()
+        # 大的提示文本渐进渲染：空闲时逐块追加，滚动到底部时立即追加下一块
+        self._rendered_prompt = None
+        self._rendered_chunks = 0
+        self._render_limit = 0
+        self._prompt_expanded = False
+        self._prompt_render_timer = QTimer(self)
+        self._prompt_render_timer.setInterval(0)
+        self._prompt_render_timer.timeout.connect(self._render_next_prompt_chunk)
+        self.description_text.verticalScrollBar().valueChanged.connect(self._on_description_scrolled)
+        # 超过自动渲染上限时显示，点击后渲染剩余内容
+        self.expand_prompt_button = QPushButton()
+        self.expand_prompt_button.setFlat(True)
+        self.expand_prompt_button.setCursor(Qt.PointingHandCursor)
+        self.expand_prompt_button.setStyleSheet("QPushButton { color: #2196F3; text-align: left; padding: 2px 5px; }")
+        self.expand_prompt_button.setVisible(False)
+        self.expand_prompt_button.clicked.connect(self._expand_prompt)
+        render_started = time.perf_counter()
         self._update_description_text()  # 调用新方法来设置内容
+        self.phase_ms["render"] = latency_metrics.elapsed_ms(render_started)
 
         # QTextBrowser 默认就是只读的，支持选择和复制
         self.description_text.setMaximumHeight(600)  # 设置最大高度，防止按钮溢出屏幕
@@ -517,6 +295,7 @@ class FeedbackUI(QMainWindow):
         )
 
         layout.addWidget(self.description_text)
+        layout.addWidget(self.expand_prompt_button)
 
         # Add predefined options if any
         self.option_checkboxes = []
@@ -551,6 +330,8 @@ class FeedbackUI(QMainWindow):
         self.images_layout.setSpacing(5)  # 减少图片间距
         self.images_layout.setContentsMargins(0, 0, 0, 5)  # 移除内边距
         self.images_layout.setAlignment(Qt.AlignLeft | Qt.AlignVCenter)  # 图片左对齐且垂直居中
+        # 末尾的弹性空间确保所有图片靠左对齐，图片总是插入到它之前
+        self.images_layout.addStretch(1)
         self.images_container.setVisible(False)  # 默认隐藏
 
         # 添加水平滚动支持
@@ -593,6 +374,7 @@ class FeedbackUI(QMainWindow):
         self.feedback_text = FeedbackTextEdit()
         # 连接图片粘贴信号
         self.feedback_text.image_pasted.connect(self._on_image_pasted)
+        self.feedback_text.image_encoded.connect(self._on_image_encoded)
         # Increase font size and apply modern border to text edit
         font = self.feedback_text.font()
         font.setPointSize(font.pointSize() )
@@ -728,26 +510,23 @@ class FeedbackUI(QMainWindow):
         toggle_line_height_shortcut.activated.connect(self._toggle_line_height)
 
     def _update_description_text(self):
-        """根据当前设置更新描述文本区域的内容和样式"""
-        # 如果是从命令行参数传入的文本，可能需要特殊处理
-        prompt = self.prompt
-        if isinstance(prompt, str) and prompt.startswith('"') and prompt.endswith('"'):
-            # 去除引号
-            prompt = prompt[1:-1]
-
+        """根据当前设置更新描述文本区域的内容和样式（转换结果按提示文本缓存，切换行高时只重新套用样式）"""
+        self._prompt_render_timer.stop()
         try:
-            # 尝试检测并处理Markdown
-            is_markdown = self._is_markdown(prompt)
-
-            # 记录日志，帮助调试
-            print(f"检测到文本类型: {'Markdown' if is_markdown else '普通文本'}")
-
-            if is_markdown:
-                html_content = self._convert_markdown_to_html(prompt)
-            else:
-                html_content = self._convert_text_to_html(prompt)
-
-            self.description_text.setHtml(html_content)
+            rendered = self._rendered_prompt = prompt_render.render(self.prompt)
+            if not rendered.progressive:
+                self.description_text.setHtml(prompt_render.styled_html(rendered, self.line_height))
+                return
+
+            # 先只渲染第一屏，其余块由 _render_next_prompt_chunk 追加
+            self.description_text.document().setDefaultStyleSheet(
+                prompt_render.document_style(rendered.is_markdown, self.line_height))
+            self.description_text.setHtml(prompt_render.chunk_html(rendered, 0, self.line_height))
+            self._rendered_chunks = 1
+            self._render_limit = len(rendered) if self._prompt_expanded else rendered.cap_index(prompt_render.render_cap())
+            self._update_expand_button()
+            if self._rendered_chunks < self._render_limit:
+                self._prompt_render_timer.start()
 
         except Exception as e:
             # 如果出现任何错误，回退到最基本的文本显示
@@ -755,14 +534,51 @@ class FeedbackUI(QMainWindow):
 
             # 尝试直接将转义字符转换为实际字符后设置为纯文本
             try:
-                processed_text = self._preprocess_text(prompt)
+                processed_text = prompt_render.preprocess(prompt_render.strip_quotes(self.prompt))
                 self.description_text.setPlainText(processed_text)
                 print("使用纯文本显示（预处理后）")
             except:
                 # 最后的回退方案
-                self.description_text.setPlainText(prompt)
+                self.description_text.setPlainText(self.prompt)
                 print("使用纯文本显示（原始文本）")
 
+    def _render_next_prompt_chunk(self):
+        """追加下一块提示文本（空闲时由零间隔定时器触发）"""
+        rendered = self._rendered_prompt
+        if rendered is None or self._rendered_chunks >= self._render_limit:
+            self._prompt_render_timer.stop()
+            return
+        # 用独立的光标在文档末尾插入，不影响用户当前的选择和滚动位置
+        cursor = QTextCursor(self.description_text.document())
+        cursor.movePosition(QTextCursor.End)
+        cursor.insertBlock()
+        cursor.insertHtml(prompt_render.chunk_html(rendered, self._rendered_chunks, self.line_height))
+        self._rendered_chunks += 1
+        if self._rendered_chunks >= self._render_limit:
+            self._prompt_render_timer.stop()
+
+    def _on_description_scrolled(self, value):
+        """滚动到底部附近时立即渲染下一块，不等空闲回调"""
+        if self._prompt_render_timer.isActive():
+            scroll_bar = self.description_text.verticalScrollBar()
+            if value >= scroll_bar.maximum() - scroll_bar.pageStep():
+                self._render_next_prompt_chunk()
+
+    def _update_expand_button(self):
+        rendered = self._rendered_prompt
+        remaining = sum(rendered.chunk_sizes[self._render_limit:]) if rendered is not None else 0
+        self.expand_prompt_button.setText(f"展开剩余内容（{remaining / 1024:.0f} KB）")
+        self.expand_prompt_button.setVisible(remaining > 0)
+
+    def _expand_prompt(self):
+        """渲染超出自动渲染上限的剩余内容"""
+        if self._rendered_prompt is None:
+            return
+        self._prompt_expanded = True
+        self._render_limit = len(self._rendered_prompt)
+        self._update_expand_button()
+        self._prompt_render_timer.start()
+
     def _toggle_line_height(self):
         """循环切换行高并更新UI"""
         line_heights = [1.0, 1.1, 1.2, 1.3, 1.4]
@@ -852,12 +668,35 @@ class FeedbackUI(QMainWindow):
     def showEvent(self, event):
         """窗口显示时加载保存的字体大小"""
         super().showEvent(event)
+        if self.first_shown_at is None:
+            self.first_shown_at = time.time()
+            self._shown_perf = time.perf_counter()
         app = QApplication.instance()
         saved_size = self._load_font_size()
         current_font = app.font()
         current_font.setPointSize(saved_size)
         app.setFont(current_font)
         self._update_all_fonts()
+        self._on_device_pixel_ratio_changed()
+        if not self._screen_signal_connected and self.windowHandle():
+            self.windowHandle().screenChanged.connect(lambda screen: self._on_device_pixel_ratio_changed())
+            self._screen_signal_connected = True
+
+    def event(self, event):
+        if event.type() == QEvent.DevicePixelRatioChange:
+            self._on_device_pixel_ratio_changed()
+        return super().event(event)
+
+    def _on_device_pixel_ratio_changed(self):
+        """窗口所在屏幕的像素比变化时，按新像素比重新生成预览缩略图（只在变化时生成，结果缓存）"""
+        device_pixel_ratio = self.devicePixelRatioF()
+        if device_pixel_ratio == self.feedback_text.device_pixel_ratio:
+            return
+        self.feedback_text.device_pixel_ratio = device_pixel_ratio
+        for image_id, image_label in self.image_labels.items():
+            pixmap = self.feedback_text.thumbnail_for(image_id)
+            if pixmap is not None:
+                image_label.setPixmap(pixmap)
 
     def _submit_feedback(self):
         feedback_text = self.feedback_text.toPlainText().strip()
@@ -869,8 +708,6 @@ class FeedbackUI(QMainWindow):
                 if checkbox.isChecked():
                     selected_options.append(self.predefined_options[i])
 
-        # Get Base64 image data
-        image_data = self.feedback_text.get_image_data()
 
         # Combine selected options and feedback text
         final_feedback_parts = []
@@ -885,11 +722,14 @@ class FeedbackUI(QMainWindow):
 
         # Join with a newline if both parts exist
         final_feedback = "\n\n".join(final_feedback_parts)
-        images_b64 = [img['base64'] for img in image_data]
+        # Get raw image bytes（只等待仍在编码的图片）
+        image_started = time.perf_counter()
+        images = self.feedback_text.get_image_payload()
+        self.phase_ms["image_wait"] = latency_metrics.elapsed_ms(image_started)
 
         self.feedback_result = FeedbackResult(
             interactive_feedback=final_feedback,
-            images=images_b64
+            images=images
         )
         self.close()
 
@@ -900,36 +740,34 @@ class FeedbackUI(QMainWindow):
         self.settings.setValue("windowState", self.saveState())
         self.settings.endGroup()
 
+        # 从窗口显示到提交/关闭：用户阅读与思考的时间
+        if self._shown_perf is not None:
+            self.phase_ms["think"] = latency_metrics.elapsed_ms(self._shown_perf)
         super().closeEvent(event)
+        self.finished.emit(self.get_result())
+
+    def get_result(self) -> FeedbackResult:
+        """返回反馈结果，未提交时返回空结果"""
+        if not self.feedback_result:
+            return FeedbackResult(interactive_feedback="", images=[])
+        return self.feedback_result
 
     def run(self) -> FeedbackResult:
         self.show()
         QApplication.instance().exec()
-
-        if not self.feedback_result:
-            return FeedbackResult(interactive_feedback="")
-
-        return self.feedback_result
+        return self.get_result()
 
     # 添加处理图片粘贴的方法
-    def _on_image_pasted(self, pixmap):
-        """处理粘贴的图片，显示在图片预览区域"""
+    def _on_image_pasted(self, image_id, pixmap):
+        """处理粘贴的图片，显示在图片预览区域（pixmap 是已按设备像素比缩放好的缩略图）"""
         # 确保图片容器可见
         if not self.images_container.isVisible():
             self.images_container.setVisible(True)
             self.scroll_area.setVisible(True)  # 同时显示滚动区域
-            # 只有第一次显示容器时添加一个弹性空间，确保所有图片靠左对齐
-            self.images_layout.addStretch(1)
-
-        # 获取原始图片尺寸
-        original_width = pixmap.width()
-        original_height = pixmap.height()
-
-        # 固定高度，稍微降低高度确保完整显示
-        target_height = 80  # 进一步降低图片高度至40
 
-        # 计算保持宽高比的缩放尺寸
-        scaled_width = int(original_width * (target_height / original_height))
+        # 固定高度，缩略图宽度按其逻辑尺寸计算
+        target_height = self.feedback_text.THUMBNAIL_HEIGHT
+        scaled_width = max(int(pixmap.deviceIndependentSize().width()), 1)
 
         # 创建一个容器帧用于放置图片和删除按钮
         image_frame = QFrame()
@@ -958,33 +796,9 @@ class FeedbackUI(QMainWindow):
         image_label.setMinimumSize(scaled_width, target_height)
         image_label.setMaximumSize(scaled_width, target_height)
 
-        # 缩放图片，保持宽高比，确保完整显示（contain模式）
-        scaled_pixmap = pixmap.scaled(
-            scaled_width,
-            target_height,
-            Qt.KeepAspectRatio,
-            Qt.SmoothTransformation
-        )
-
-        # 支持视网膜屏幕
-        device_pixel_ratio = QApplication.primaryScreen().devicePixelRatio()
-        if device_pixel_ratio > 1.0:
-            # 对于高DPI屏幕，创建更高分辨率的pixmap
-            hires_scaled_width = int(scaled_width * device_pixel_ratio)
-            hires_target_height = int(target_height * device_pixel_ratio)
-
-            hires_pixmap = pixmap.scaled(
-                hires_scaled_width,
-                hires_target_height,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
-
-            # 设置设备像素比
-            hires_pixmap.setDevicePixelRatio(device_pixel_ratio)
-            image_label.setPixmap(hires_pixmap)
-        else:
-            image_label.setPixmap(scaled_pixmap)
+        # 先显示占位缩略图，后台编码完成后替换为平滑缩放的版本（见 _on_image_encoded）
+        image_label.setPixmap(pixmap)
+        self.image_labels[image_id] = image_label
 
         # 删除按钮，悬浮在右上角
         delete_button = QPushButton("×")
@@ -1007,31 +821,16 @@ class FeedbackUI(QMainWindow):
 
         # 删除图片的功能
         def delete_image():
-            # 获取图片索引
-            index = self.images_layout.indexOf(image_frame)
-            if index >= 0:
-                # 从布局中移除
-                widget = self.images_layout.itemAt(index).widget()
-                if widget:
-                    widget.setParent(None)
-                    widget.deleteLater()
-
-                    # 从图片数据列表中删除
-                    if index < len(self.feedback_text.image_data):
-                        del self.feedback_text.image_data[index]
-
-                    # 检查是否还有图片
-                    has_images = False
-                    for i in range(self.images_layout.count()):
-                        item = self.images_layout.itemAt(i)
-                        if item and not item.spacerItem() and item.widget():
-                            has_images = True
-                            break
-
-                    # 如果没有图片了，隐藏容器和滚动区域
-                    if not has_images:
-                        self.images_container.setVisible(False)
-                        self.scroll_area.setVisible(False)
+            # 从布局中移除预览，从登记表中删除图片（按图片ID，不依赖布局索引）
+            image_frame.setParent(None)
+            image_frame.deleteLater()
+            self.image_labels.pop(image_id, None)
+            self.feedback_text.remove_image(image_id)
+
+            # 如果没有图片了，隐藏容器和滚动区域
+            if not self.image_labels:
+                self.images_container.setVisible(False)
+                self.scroll_area.setVisible(False)
 
         delete_button.clicked.connect(delete_image)
 
@@ -1039,29 +838,21 @@ class FeedbackUI(QMainWindow):
         frame_layout.addWidget(image_label, 0, 0)
         frame_layout.addWidget(delete_button, 0, 0, Qt.AlignTop | Qt.AlignRight)
 
-        # 添加到图片布局，确保在弹性空间之前插入
-        if self.images_layout.count() > 0:
-            # 找到弹性空间的索引
-            stretch_index = -1
-            for i in range(self.images_layout.count()):
-                if self.images_layout.itemAt(i).spacerItem():
-                    stretch_index = i
-                    break
-
-            if stretch_index >= 0:
-                # 在弹性空间之前插入图片
-                self.images_layout.insertWidget(stretch_index, image_frame)
-            else:
-                # 如果没有找到弹性空间，直接添加到末尾
-                self.images_layout.addWidget(image_frame)
-        else:
-            # 如果布局为空，直接添加图片
-            self.images_layout.addWidget(image_frame)
+        # 弹性空间始终是布局的最后一项，直接插入到它之前
+        self.images_layout.insertWidget(self.images_layout.count() - 1, image_frame)
 
-def feedback_ui(prompt: str, predefined_options: Optional[List[str]] = None, output_file: Optional[str] = None) -> Optional[FeedbackResult]:
-    # ----- 开启高 DPI 缩放 -----
-    QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
-    QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
+    def _on_image_encoded(self, image_id, pixmap):
+        """后台编码完成，替换预览中的占位缩略图"""
+        image_label = self.image_labels.get(image_id)
+        if image_label is not None:
+            image_label.setPixmap(pixmap)
+
+def prepare_application() -> QApplication:
+    """创建（或复用）QApplication 并应用深色主题与全局字体"""
+    if QApplication.instance() is None:
+        # ----- 开启高 DPI 缩放（必须在创建 QApplication 之前设置） -----
+        QApplication.setAttribute(Qt.AA_EnableHighDpiScaling)
+        QApplication.setAttribute(Qt.AA_UseHighDpiPixmaps)
 
     # 创建 QApplication 或获取已有实例
     app = QApplication.instance() or QApplication()
@@ -1072,30 +863,55 @@ def feedback_ui(prompt: str, predefined_options: Optional[List[str]] = None, out
     default_font = app.font()           # 拿到当前系统/风格默认的 QFont
     default_font.setPointSize(15)       # 设定全局字号为 11pt，按需修改
     app.setFont(default_font)
+    return app
+
+def feedback_ui(prompt: str, predefined_options: Optional[List[str]] = None, output_file: Optional[str] = None, launch_ts: Optional[float] = None, output_stream=None) -> Optional[FeedbackResult]:
+    prepare_application()
 
     ui = FeedbackUI(prompt, predefined_options)
     result = ui.run()
 
+    # 记录从服务端发起启动到窗口首次显示的耗时，以及窗口内各阶段耗时
+    if launch_ts:
+        result["_timing"] = latency_metrics.ui_timing(ui, launch_ts)
+
+    if output_stream and result:
+        # Stream the result back to the server as frames (images as raw bytes)
+        ui_protocol.write_result(output_stream, result)
+        return None
+
     if output_file and result:
         # Ensure the directory exists
         os.makedirs(os.path.dirname(output_file) if os.path.dirname(output_file) else ".", exist_ok=True)
-        # Save the result to the output file
+        # Save the result to the output file (JSON needs Base64 for images)
         with open(output_file, "w") as f:
-            json.dump(result, f)
+            json.dump({**result, "images": [base64.b64encode(img).decode('utf-8') for img in result["images"]]}, f)
         return None
 
     return result
 
 if __name__ == "__main__":
+    # 进程创建到此处：解释器启动与 PySide6 等模块导入
+    latency_metrics.mark_imported()
+
     parser = argparse.ArgumentParser(description="运行反馈 UI")
     parser.add_argument("--prompt", default="我已经根据您的请求完成了修改。", help="要向用户显示的提示信息")
     parser.add_argument("--predefined-options", default="", help="竖线分隔的预设选项列表 (|||)")
     parser.add_argument("--output-file", help="保存反馈结果的 JSON 文件路径")
+    parser.add_argument("--launch-ts", type=float, default=None, help="服务端发起启动的时间戳（用于统计出窗耗时）")
+    parser.add_argument("--output-stdout", action="store_true", help="通过 stdout 以帧协议回传结果")
+    parser.add_argument("--parent-pid", type=int, default=None, help="启动本进程的服务 PID，该进程退出时关闭 UI")
     args = parser.parse_args()
 
+    # 启动本进程的服务退出后，窗口已无人等待
+    ui_launcher.watch_parent(args.parent_pid)
+
+    # 独占 stdout 作为结果通道，调试输出改写到 stderr
+    output_stream = ui_protocol.claim_stdout() if args.output_stdout else None
+
     predefined_options = [opt for opt in args.predefined_options.split("|||") if opt] if args.predefined_options else None
 
-    result = feedback_ui(args.prompt, predefined_options, args.output_file)
+    result = feedback_ui(args.prompt, predefined_options, args.output_file, args.launch_ts, output_stream)
     if result:
         print(f"\n收到的反馈:\n{result['interactive_feedback']}")
     sys.exit(0)
\ No newline at end of file
@@ -0,0 +1,32 @@
+# File Lock - 跨进程建议锁
+# 规则日志与用户群倒排索引都用它让写入互斥（POSIX 上为 flock，Windows 上为 msvcrt.locking）
+import os
+import sys
+from contextlib import contextmanager
+
+@contextmanager
+def file_lock(path: str, shared: bool = False):
+    """
+    对锁文件 path 加锁（不存在时创建）
+    shared=True 为读锁，可与其他读锁共存（Windows 上退化为互斥锁）
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        if sys.platform == "win32":
+            import msvcrt
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+            try:
+                yield
+            finally:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(fd, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+    finally:
+        os.close(fd)
@@ -0,0 +1,381 @@
+# Image Pipeline - 粘贴图片的缩放与编码
+# FeedbackTextEdit 与 DataSyncTextEdit 共用：超出最大尺寸时高质量缩放，按配置编码为 PNG/JPEG/WebP，
+# 并保证单张图片不超过字节预算（先降低有损格式的质量，仍超出时继续缩小尺寸）
+# 编码在 ImageEncoder 的线程池中完成，GUI 线程只负责生成占位缩略图
+import os
+import sys
+import time
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from PySide6.QtCore import Qt, QBuffer, QIODevice, QObject, QRunnable, QThreadPool, Signal
+from PySide6.QtGui import QImage, QImageWriter, QPainter, QPixmap
+
+DEFAULT_MAX_IMAGE_WIDTH = 1624
+DEFAULT_MAX_IMAGE_HEIGHT = 1624
+DEFAULT_IMAGE_FORMAT = "PNG"
+DEFAULT_IMAGE_QUALITY = 85
+DEFAULT_MAX_IMAGE_BYTES = 2 * 1024 * 1024
+
+IMAGE_FORMAT_ENV = "INTERACTIVE_FEEDBACK_IMAGE_FORMAT"
+IMAGE_QUALITY_ENV = "INTERACTIVE_FEEDBACK_IMAGE_QUALITY"
+IMAGE_MAX_BYTES_ENV = "INTERACTIVE_FEEDBACK_IMAGE_MAX_BYTES"
+IMAGE_MAX_SIZE_ENV = "INTERACTIVE_FEEDBACK_IMAGE_MAX_SIZE"
+
+SUPPORTED_FORMATS = ("PNG", "JPEG", "WEBP")
+LOSSY_FORMATS = ("JPEG", "WEBP")
+
+# 超出字节预算时依次尝试的质量，全部失败后再缩小尺寸
+BUDGET_QUALITY_STEPS = (70, 55, 40)
+# 为满足字节预算而缩小尺寸时的下限（长边像素）
+MIN_BUDGET_EDGE = 320
+
+@dataclass
+class ImageOptions:
+    """图片编码参数"""
+    max_width: int = DEFAULT_MAX_IMAGE_WIDTH
+    max_height: int = DEFAULT_MAX_IMAGE_HEIGHT
+    format: str = DEFAULT_IMAGE_FORMAT
+    quality: int = DEFAULT_IMAGE_QUALITY
+    max_bytes: int = DEFAULT_MAX_IMAGE_BYTES
+
+    @classmethod
+    def from_env(cls) -> "ImageOptions":
+        """读取环境变量覆盖默认参数，无效的值忽略"""
+        options = cls()
+        image_format = os.environ.get(IMAGE_FORMAT_ENV, "").strip().upper()
+        if image_format == "JPG":
+            image_format = "JPEG"
+        if image_format in SUPPORTED_FORMATS:
+            options.format = image_format
+        try:
+            options.quality = min(max(int(os.environ[IMAGE_QUALITY_ENV]), 1), 100)
+        except (KeyError, ValueError):
+            pass
+        try:
+            options.max_bytes = int(os.environ[IMAGE_MAX_BYTES_ENV])
+        except (KeyError, ValueError):
+            pass
+        try:
+            options.max_width = options.max_height = int(os.environ[IMAGE_MAX_SIZE_ENV])
+        except (KeyError, ValueError):
+            pass
+        return options
+
+@dataclass
+class EncodedImage:
+    """编码结果"""
+    data: bytes
+    format: str        # PNG / JPEG / WEBP
+    extension: str     # png / jpg / webp
+    width: int
+    height: int
+    original_width: int
+    original_height: int
+
+def _writer_format(image_format: str) -> str:
+    """当前 Qt 不支持 WebP 写入时退回 JPEG"""
+    if image_format == "WEBP" and b"webp" not in [bytes(f) for f in QImageWriter.supportedImageFormats()]:
+        return "JPEG"
+    return image_format
+
+def _flatten_alpha(image: QImage) -> QImage:
+    """JPEG 不支持透明通道：把透明区域铺在白色背景上"""
+    if not image.hasAlphaChannel():
+        return image.convertToFormat(QImage.Format_RGB32)
+    flat = QImage(image.size(), QImage.Format_RGB32)
+    flat.fill(Qt.white)
+    painter = QPainter(flat)
+    painter.drawImage(0, 0, image)
+    painter.end()
+    return flat
+
+def _save(image: QImage, image_format: str, quality: int) -> bytes:
+    buffer = QBuffer()
+    buffer.open(QIODevice.WriteOnly)
+    # PNG 的 quality 只影响压缩级别，传 -1 使用默认值
+    image.save(buffer, image_format, quality if image_format in LOSSY_FORMATS else -1)
+    data = buffer.data().data()
+    buffer.close()
+    return data
+
+def output_extension(options: ImageOptions) -> str:
+    """按 options 编码后的文件扩展名（编码完成前即可确定）"""
+    image_format = _writer_format(options.format)
+    return "jpg" if image_format == "JPEG" else image_format.lower()
+
+def _fit(image: QImage, max_width: int, max_height: int) -> QImage:
+    if image.width() <= max_width and image.height() <= max_height:
+        return image
+    return image.scaled(max_width, max_height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+
+def encode_image(image: Union[QImage, QPixmap], options: Optional[ImageOptions] = None) -> EncodedImage:
+    """
+    缩放并编码一张图片
+    1. 超出 max_width/max_height 时按比例平滑缩放
+    2. 按 options.format 编码（JPEG 会先去掉透明通道）
+    3. 超出 max_bytes 时：有损格式先逐步降低质量，仍超出（或为 PNG）则按比例缩小尺寸重试
+    """
+    options = options or ImageOptions()
+    if isinstance(image, QPixmap):
+        image = image.toImage()
+    original_width, original_height = image.width(), image.height()
+    image_format = _writer_format(options.format)
+
+    image = _fit(image, options.max_width, options.max_height)
+    if image_format == "JPEG":
+        image = _flatten_alpha(image)
+
+    quality = options.quality
+    data = _save(image, image_format, quality)
+
+    if options.max_bytes > 0 and len(data) > options.max_bytes and image_format in LOSSY_FORMATS:
+        for step in BUDGET_QUALITY_STEPS:
+            if step >= quality:
+                continue
+            quality = step
+            data = _save(image, image_format, quality)
+            if len(data) <= options.max_bytes:
+                break
+
+    while options.max_bytes > 0 and len(data) > options.max_bytes and max(image.width(), image.height()) > MIN_BUDGET_EDGE:
+        # 编码后大小约与像素数成正比，按面积比例估算缩放系数并留一点余量
+        factor = max(min((options.max_bytes / len(data)) ** 0.5 * 0.9, 0.9), 0.25)
+        width = max(int(image.width() * factor), 1)
+        height = max(int(image.height() * factor), 1)
+        image = image.scaled(width, height, Qt.KeepAspectRatio, Qt.SmoothTransformation)
+        data = _save(image, image_format, quality)
+
+    return EncodedImage(
+        data=data,
+        format=image_format,
+        extension=output_extension(options),
+        width=image.width(),
+        height=image.height(),
+        original_width=original_width,
+        original_height=original_height,
+    )
+
+def thumbnail(image: QImage, height: int, device_pixel_ratio: float = 1.0, smooth: bool = True) -> QImage:
+    """按固定逻辑高度生成缩略图（物理像素 = 逻辑高度 × 设备像素比）"""
+    scaled = image.scaledToHeight(
+        max(int(height * device_pixel_ratio), 1),
+        Qt.SmoothTransformation if smooth else Qt.FastTransformation,
+    )
+    scaled.setDevicePixelRatio(device_pixel_ratio)
+    return scaled
+
+def log_encoded(image: QImage, encoded: EncodedImage, elapsed: Optional[float] = None):
+    """输出缩放/编码前后的尺寸与大小（UI 进程的 stdout 被结果通道占用，写到 stderr）"""
+    raw_size = image.sizeInBytes() if isinstance(image, QImage) else image.width() * image.height() * 4
+    timing = f" ({elapsed * 1000:.0f} ms)" if elapsed is not None else ""
+    print(
+        f"图片编码: {encoded.original_width}x{encoded.original_height} ({raw_size / 1024 / 1024:.1f} MB 像素数据)"
+        f" -> {encoded.width}x{encoded.height} {encoded.format} {len(encoded.data) / 1024:.0f} KB{timing}",
+        file=sys.stderr,
+    )
+
+def log_paste_stall(started: float):
+    """输出一次粘贴在 GUI 线程上的耗时（从 insertFromMimeData 开始计时）"""
+    print(f"粘贴图片: GUI 线程耗时 {(time.perf_counter() - started) * 1000:.1f} ms", file=sys.stderr)
+
+def content_hash(data: bytes) -> str:
+    """编码后字节的内容哈希（同一张图片重复粘贴时编码结果完全相同）"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+class ImageRegistry:
+    """
+    粘贴图片登记表：图片ID -> 内容哈希，哈希 -> 编码后的原始字节（带引用计数）
+    重复粘贴同一张图片只保存一份字节，提交时也只发送一次；删除预览时按ID移除，
+    最后一个引用移除后释放字节
+    """
+
+    def __init__(self):
+        # 按粘贴顺序记录；编码完成前哈希为 None
+        self._digests: Dict[str, Optional[str]] = {}
+        self._blobs: Dict[str, bytes] = {}
+        self._refs: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self._digests)
+
+    def __contains__(self, image_id: str) -> bool:
+        return image_id in self._digests
+
+    def add(self, image_id: str):
+        """登记一张正在编码的图片"""
+        self._digests[image_id] = None
+
+    def resolve(self, image_id: str, data: bytes, digest: Optional[str] = None) -> bool:
+        """
+        填入编码结果，返回内容是否与已登记的图片重复
+        图片已被移除时忽略（返回 False）
+        """
+        if image_id not in self._digests or self._digests[image_id] is not None:
+            return False
+        digest = digest or content_hash(data)
+        self._digests[image_id] = digest
+        duplicate = digest in self._blobs
+        if not duplicate:
+            self._blobs[digest] = data
+        self._refs[digest] = self._refs.get(digest, 0) + 1
+        return duplicate
+
+    def remove(self, image_id: str):
+        """移除一张图片（编码中的图片移除后，其编码结果会被忽略）"""
+        digest = self._digests.pop(image_id, None)
+        if digest is None:
+            return
+        self._refs[digest] -= 1
+        if not self._refs[digest]:
+            del self._refs[digest]
+            del self._blobs[digest]
+
+    def payload(self) -> List[bytes]:
+        """按首次粘贴顺序返回去重后的图片字节（提交时调用一次）"""
+        images = []
+        seen = set()
+        for digest in self._digests.values():
+            if digest is not None and digest not in seen:
+                seen.add(digest)
+                images.append(self._blobs[digest])
+        return images
+
+    def digest(self, image_id: str) -> Optional[str]:
+        """图片的内容哈希（编码中或已移除时为 None）"""
+        return self._digests.get(image_id)
+
+    def data(self, digest: str) -> Optional[bytes]:
+        """内容哈希对应的图片字节（已没有图片引用时为 None）"""
+        return self._blobs.get(digest)
+
+    def nbytes(self) -> int:
+        """已保存的图片字节总数"""
+        return sum(len(data) for data in self._blobs.values())
+
+class ThumbnailCache:
+    """
+    预览缩略图缓存：(内容哈希, 设备像素比) -> 按固定逻辑高度平滑缩放的 QImage
+    每张图片在每种设备像素比下只缩放一次；重复粘贴的图片直接复用。
+    存放 QImage 而不是 QPixmap，工作线程也可以查询和写入
+    """
+
+    def __init__(self, height: int):
+        self.height = height
+        self._images: Dict[Tuple[str, float], QImage] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(digest: str, device_pixel_ratio: float) -> Tuple[str, float]:
+        return digest, round(device_pixel_ratio, 2)
+
+    def get(self, digest: str, device_pixel_ratio: float) -> Optional[QImage]:
+        with self._lock:
+            return self._images.get(self._key(digest, device_pixel_ratio))
+
+    def get_or_create(self, digest: str, device_pixel_ratio: float, source: Callable[[], QImage]) -> QImage:
+        """命中缓存时直接返回，否则从 source() 缩放生成（缩放在锁外进行）"""
+        cached = self.get(digest, device_pixel_ratio)
+        if cached is not None:
+            return cached
+        image = thumbnail(source(), self.height, device_pixel_ratio)
+        with self._lock:
+            return self._images.setdefault(self._key(digest, device_pixel_ratio), image)
+
+    def discard(self, digest: str):
+        """图片已没有引用时移除它的所有缩略图"""
+        with self._lock:
+            for key in [key for key in self._images if key[0] == digest]:
+                del self._images[key]
+
+class _EncodeTask(QRunnable):
+    """线程池任务：编码图片并生成平滑缩放的缩略图（只读访问 QImage，可在工作线程中进行）"""
+
+    def __init__(self, encoder: "ImageEncoder", key: Any, image: QImage, options: ImageOptions,
+                 thumbnails: Optional[ThumbnailCache], device_pixel_ratio: float):
+        super().__init__()
+        self.encoder = encoder
+        self.key = key
+        self.image = image
+        self.options = options
+        self.thumbnails = thumbnails
+        self.device_pixel_ratio = device_pixel_ratio
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            encoded = encode_image(self.image, self.options)
+            log_encoded(self.image, encoded, time.perf_counter() - started)
+            # 哈希也在工作线程中计算，GUI 线程登记时直接使用；相同内容的缩略图只生成一次
+            digest = content_hash(encoded.data)
+            thumb = None
+            if self.thumbnails is not None:
+                thumb = self.thumbnails.get_or_create(digest, self.device_pixel_ratio, lambda: self.image)
+            result = (encoded, digest, thumb, None)
+        except Exception as e:
+            result = (None, None, None, e)
+        # 原图只在编码期间保留
+        self.image = None
+        self.encoder._complete(self.key, result)
+
+class ImageEncoder(QObject):
+    """
+    后台图片编码器
+    submit() 立即返回，编码完成后在 GUI 线程发出 encoded(key, EncodedImage, 内容哈希, 缩略图 QImage) 或 failed(key, 错误信息)；
+    wait() 阻塞到所有已提交的任务完成，并在返回前同步发出这些信号
+    """
+
+    encoded = Signal(object, object, str, object)
+    failed = Signal(object, str)
+    # 工作线程完成后通知 GUI 线程取结果（跨线程信号自动排队）
+    _ready = Signal()
+
+    def __init__(self, options: ImageOptions, parent: Optional[QObject] = None):
+        super().__init__(parent)
+        self.options = options
+        self._pool = QThreadPool(self)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._results: Dict[Any, Tuple[Optional[EncodedImage], Optional[str], Optional[QImage], Optional[Exception]]] = {}
+        self._ready.connect(self._deliver)
+
+    def submit(self, key: Any, image: Union[QImage, QPixmap], thumbnails: Optional[ThumbnailCache] = None,
+               device_pixel_ratio: float = 1.0):
+        """提交一张图片（传入 thumbnails 时同时生成预览缩略图）；QPixmap 只能在 GUI 线程使用，先转换为 QImage"""
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        with self._lock:
+            self._pending += 1
+        self._pool.start(_EncodeTask(self, key, image, self.options, thumbnails, device_pixel_ratio))
+
+    def pending_count(self) -> int:
+        """尚未交付结果的任务数"""
+        with self._lock:
+            return self._pending
+
+    def _complete(self, key: Any, result):
+        with self._lock:
+            self._results[key] = result
+        try:
+            self._ready.emit()
+        except RuntimeError:
+            # 窗口已关闭，编码器已被销毁
+            pass
+
+    def _deliver(self):
+        with self._lock:
+            results, self._results = self._results, {}
+            self._pending -= len(results)
+        for key, (encoded, digest, thumb, error) in results.items():
+            if error is None:
+                self.encoded.emit(key, encoded, digest, thumb)
+            else:
+                self.failed.emit(key, str(error))
+
+    def wait(self):
+        """等待仍在编码的图片（没有待处理任务时立即返回）"""
+        if self.pending_count():
+            self._pool.waitForDone()
+            self._deliver()
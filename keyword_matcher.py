@@ -0,0 +1,177 @@
+# Keyword Matcher - 多关键词匹配
+# 字面量模式（默认）：所有关键词建成一棵前缀树，再转换为一个正则（每个位置只沿前缀树尝试一次），
+#   一次扫描找出文本中出现的全部关键词，关键词中的正则元字符按普通字符处理。
+#   与 Aho-Corasick 效果相同，但扫描在正则引擎（C）中完成，比纯 Python 的自动机快得多
+# 正则模式（需显式开启）：逐个关键词做正则匹配，编译时拒绝嵌套量词等易灾难性回溯的写法，
+#   匹配过程受总时间预算约束，超时抛出 KeywordMatchTimeout
+import re
+import time
+import signal
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Set
+
+try:
+    from re import _parser as sre_parse
+except ImportError:  # Python < 3.11
+    import sre_parse
+
+# 正则模式的默认匹配时间预算（秒）
+DEFAULT_REGEX_BUDGET = 0.5
+
+class KeywordPatternError(ValueError):
+    """正则关键词无法编译或存在灾难性回溯风险"""
+
+class KeywordMatchTimeout(TimeoutError):
+    """正则匹配超出时间预算"""
+
+def _trie_pattern(keywords: Iterable[str]) -> str:
+    """把关键词集合转换为前缀树形状的正则：共享前缀只匹配一次，分支按字符区分"""
+    trie: Dict = {}
+    for keyword in keywords:
+        node = trie
+        for ch in keyword:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        branches = [re.escape(ch) + build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        # 该节点本身是一个关键词的结尾：后续部分可选（贪婪，优先匹配更长的关键词）
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """
+    字面量多关键词匹配器，输入文本应已做 casefold 规范化（与 rules_index.normalize 一致）
+    匹配结果是关键词在构造参数中的下标集合，同一规范化文本的重复关键词都会返回
+    """
+
+    def __init__(self, keywords: Iterable[str]):
+        self.keywords: List[str] = list(keywords)
+        self._indices: Dict[str, List[int]] = {}
+        for i, keyword in enumerate(self.keywords):
+            norm = keyword.casefold()
+            if norm:
+                self._indices.setdefault(norm, []).append(i)
+
+        # 同一位置只能得到最长的匹配；其余在该位置出现的关键词必然是它的前缀，预先算好
+        norms = list(self._indices)
+        self._prefixes: Dict[str, List[str]] = {
+            norm: [other for other in norms if norm.startswith(other)] for norm in norms
+        }
+        self._pattern = re.compile(_trie_pattern(norms)) if norms else None
+
+    def find_all(self, text: str) -> Set[int]:
+        """返回出现在 text 中的关键词下标集合"""
+        found: Set[int] = set()
+        if self._pattern is None:
+            return found
+        seen: Set[str] = set()
+        search = self._pattern.search
+        pos = 0
+        while True:
+            # 每次从上一个匹配的下一个字符继续，重叠的关键词也不会漏掉；
+            # 不用零宽先行断言，正则引擎可以按首字符快速跳过不可能匹配的位置
+            match = search(text, pos)
+            if match is None:
+                break
+            pos = match.start() + 1
+            norm = match.group()
+            if norm in seen:
+                continue
+            for prefix in self._prefixes[norm]:
+                if prefix not in seen:
+                    seen.add(prefix)
+                    found.update(self._indices[prefix])
+            if len(seen) == len(self._indices):
+                break
+        return found
+
+_REPEAT_OPS = (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT)
+
+def _has_nested_repeat(parsed, inside_repeat: bool = False) -> bool:
+    """检查解析后的正则中是否有 (a+)+ 这类嵌套的无界量词"""
+    for op, av in parsed:
+        if op in _REPEAT_OPS:
+            low, high, sub = av
+            unbounded = high > 1
+            if unbounded and inside_repeat:
+                return True
+            if _has_nested_repeat(sub, inside_repeat or unbounded):
+                return True
+        elif op == sre_parse.SUBPATTERN:
+            if _has_nested_repeat(av[-1], inside_repeat):
+                return True
+        elif op == sre_parse.BRANCH:
+            if any(_has_nested_repeat(branch, inside_repeat) for branch in av[1]):
+                return True
+        elif op in (sre_parse.ASSERT, sre_parse.ASSERT_NOT):
+            if _has_nested_repeat(av[1], inside_repeat):
+                return True
+    return False
+
+def compile_regex_keyword(keyword: str) -> re.Pattern:
+    """编译正则关键词（忽略大小写），拒绝无法编译或含嵌套无界量词的模式"""
+    try:
+        parsed = sre_parse.parse(keyword, re.IGNORECASE)
+        if _has_nested_repeat(parsed):
+            raise KeywordPatternError(f"regex keyword has nested repetition: {keyword!r}")
+        return re.compile(keyword, re.IGNORECASE)
+    except re.error as e:
+        raise KeywordPatternError(f"invalid regex keyword {keyword!r}: {e}")
+
+class RegexMatcher:
+    """
+    正则多关键词匹配器（原始文本，忽略大小写）
+    预算从进入 guard() 或第一次匹配开始计时。每次匹配前检查是否超时；在主线程且支持
+    setitimer 的平台上，guard() 还会设置 SIGALRM 定时器，单次匹配陷入回溯时也能被中断
+    """
+
+    def __init__(self, keywords: Iterable[str], budget: Optional[float] = None):
+        self.keywords: List[str] = list(keywords)
+        self.patterns = [compile_regex_keyword(keyword) for keyword in self.keywords]
+        self.budget = DEFAULT_REGEX_BUDGET if budget is None else budget
+        self._deadline: Optional[float] = None
+
+    def _timeout(self) -> KeywordMatchTimeout:
+        return KeywordMatchTimeout(f"regex keyword matching exceeded {self.budget}s budget")
+
+    def check_budget(self):
+        now = time.monotonic()
+        if self._deadline is None:
+            self._deadline = now + self.budget
+        elif now > self._deadline:
+            raise self._timeout()
+
+    @contextmanager
+    def guard(self):
+        """在预算内执行一组匹配，超时抛出 KeywordMatchTimeout"""
+        self.check_budget()
+        use_alarm = hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+        if not use_alarm:
+            yield
+            return
+
+        def on_alarm(signum, frame):
+            raise self._timeout()
+
+        previous_handler = signal.signal(signal.SIGALRM, on_alarm)
+        signal.setitimer(signal.ITIMER_REAL, max(self._deadline - time.monotonic(), 0.001))
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous_handler)
+
+    def matches(self, index: int, text: str) -> bool:
+        """第 index 个关键词是否匹配 text"""
+        self.check_budget()
+        return self.patterns[index].search(text) is not None
+
+    def find_all(self, text: str) -> Set[int]:
+        """返回匹配 text 的关键词下标集合"""
+        return {i for i in range(len(self.patterns)) if self.matches(i, text)}
@@ -0,0 +1,189 @@
+# Latency Metrics - 工具调用的分阶段耗时
+# 每次工具调用记录各阶段的耗时（进程启动、PySide6 导入、窗口构造、提示渲染、排队、人工思考、
+# 图片等待、结果回传、结果解码……），按 工具名 × 阶段 汇总为直方图：
+# MCP 资源给出最近样本的 p50/p95/p99，设置 INTERACTIVE_FEEDBACK_METRICS_FILE 时另写 Prometheus 文本文件
+import os
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional, Tuple
+
+# Prometheus 文本文件路径（如 node_exporter textfile collector 目录下的 *.prom），未设置时不写
+METRICS_FILE_ENV = "INTERACTIVE_FEEDBACK_METRICS_FILE"
+
+METRIC_NAME = "interactive_feedback_phase_latency_seconds"
+
+# 直方图桶上界（秒），覆盖毫秒级的解码到几分钟的人工思考
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+
+# 分位数基于每个 工具 × 阶段 最近的样本计算
+RECENT_SAMPLES = 1024
+
+class Histogram:
+    """累积桶计数（写 Prometheus）+ 最近样本（算分位数）"""
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最后一个是 +Inf
+        self.count = 0
+        self.total = 0.0
+        self.recent: Deque[float] = deque(maxlen=RECENT_SAMPLES)
+
+    def observe(self, seconds: float):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.recent.append(seconds)
+
+    def quantiles(self, qs=(0.5, 0.95, 0.99)) -> List[float]:
+        """最近样本的分位数（最近邻取整），没有样本时返回空列表"""
+        samples = sorted(self.recent)
+        if not samples:
+            return []
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in qs]
+
+class LatencyRegistry:
+    """按 (工具名, 阶段) 保存直方图，线程安全"""
+
+    def __init__(self):
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, tool: str, phase: str, seconds: float):
+        if seconds < 0:
+            return
+        with self._lock:
+            histogram = self._histograms.get((tool, phase))
+            if histogram is None:
+                histogram = self._histograms[(tool, phase)] = Histogram()
+            histogram.observe(seconds)
+
+    def summary(self) -> Dict[str, Dict[str, Dict[str, float]]]:
+        """{工具: {阶段: {count, mean_ms, p50_ms, p95_ms, p99_ms}}}"""
+        result: Dict[str, Dict[str, Dict[str, float]]] = {}
+        with self._lock:
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                p50, p95, p99 = histogram.quantiles()
+                result.setdefault(tool, {})[phase] = {
+                    "count": histogram.count,
+                    "mean_ms": round(histogram.total / histogram.count * 1000, 1),
+                    "p50_ms": round(p50 * 1000, 1),
+                    "p95_ms": round(p95 * 1000, 1),
+                    "p99_ms": round(p99 * 1000, 1),
+                }
+        return result
+
+    def prometheus_text(self) -> str:
+        """Prometheus 文本格式（histogram 类型，标签 tool / phase）"""
+        lines = [
+            f"# HELP {METRIC_NAME} Latency of each phase of an interactive feedback tool call.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        with self._lock:
+            for (tool, phase), histogram in sorted(self._histograms.items()):
+                labels = f'tool="{_escape_label(tool)}",phase="{_escape_label(phase)}"'
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{METRIC_NAME}_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"{METRIC_NAME}_sum{{{labels}}} {histogram.total:.6f}")
+                lines.append(f"{METRIC_NAME}_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: Optional[str] = None):
+        """写 Prometheus 文本文件（先写临时文件再替换，采集方不会读到半个文件）"""
+        path = path or os.environ.get(METRICS_FILE_ENV)
+        if not path:
+            return
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(self.prometheus_text())
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+def _escape_label(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+# 本进程的全局注册表
+registry = LatencyRegistry()
+
+class ToolCall:
+    """
+    一次工具调用的阶段计时（服务端），结束时写入 registry
+    阶段耗时可以用 phase() 计时，也可以直接 record()（如 UI 进程回传的毫秒数）
+    """
+
+    def __init__(self, tool: str, metrics: Optional[LatencyRegistry] = None):
+        self.tool = tool
+        self.metrics = metrics or registry
+        self.started = time.monotonic()
+        self.phases: Dict[str, float] = {}
+
+    def record(self, phase: str, seconds: float):
+        """记录一个阶段（同名阶段累加）"""
+        self.phases[phase] = self.phases.get(phase, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.record(name, time.monotonic() - started)
+
+    def record_ui_timing(self, timing: Dict):
+        """
+        记录 UI 回传的 _timing：*_ms 字段作为阶段耗时；
+        finished_at（UI 结束时的时间戳）换算为结果回传耗时
+        """
+        for key, value in timing.items():
+            if key.endswith("_ms") and isinstance(value, (int, float)):
+                self.record(key[:-3], value / 1000)
+        finished_at = timing.get("finished_at")
+        if isinstance(finished_at, (int, float)):
+            self.record("result_transfer", max(0.0, time.time() - finished_at))
+
+    def finish(self):
+        """记录总耗时并写入注册表（以及 Prometheus 文件）"""
+        self.record("total", time.monotonic() - self.started)
+        for phase, seconds in self.phases.items():
+            self.metrics.observe(self.tool, phase, seconds)
+        self.metrics.write_prometheus()
+
+# ---------------------------------------------------------------------------
+# UI 进程侧
+# ---------------------------------------------------------------------------
+
+# UI 脚本进入 __main__ 时记录的进程启动耗时（解释器启动 + PySide6 与界面模块导入）
+_import_ms: Optional[float] = None
+
+def mark_imported():
+    """在 UI 脚本 __main__ 开头调用，记录从进程创建到模块导入完成的耗时"""
+    global _import_ms
+    try:
+        import psutil
+        _import_ms = round((time.time() - psutil.Process().create_time()) * 1000, 1)
+    except Exception:
+        _import_ms = None
+
+def ui_timing(window, launch_ts: Optional[float] = None, **extra) -> Dict:
+    """
+    UI 回传给服务端的 _timing：窗口记录的各阶段毫秒数、出窗耗时与结束时间戳
+    window 需要有 phase_ms（阶段 -> 毫秒）与 first_shown_at（time.time()）
+    """
+    timing = {f"{phase}_ms": ms for phase, ms in window.phase_ms.items()}
+    if _import_ms is not None:
+        timing["import_ms"] = _import_ms
+    if launch_ts and window.first_shown_at:
+        timing["time_to_window_ms"] = round((window.first_shown_at - launch_ts) * 1000, 1)
+    timing.update(extra)
+    timing["finished_at"] = time.time()
+    return timing
+
+def elapsed_ms(started: float) -> float:
+    """从 time.perf_counter() 的 started 到现在的毫秒数"""
+    return round((time.perf_counter() - started) * 1000, 1)
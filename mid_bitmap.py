@@ -0,0 +1,437 @@
+# MID Bitmap - 用户群成员的压缩位图（roaring 风格）
+# 影响范围分析需要对用户群求交、并、差，用 Python 字符串集合保存上千万个 MID 要数 GB 内存。
+# 这里按 MID 的高 48 位分为容器，容器内只保存低 16 位：
+#   - 数组容器：元素不超过 4096 个时为有序 uint16 数组（每个 MID 2 字节）
+#   - 位图容器：超过 4096 个时为 1024 个 uint64 字（固定 8 KB，每个 MID 不到 1 位）
+# 并、交、差、基数都逐容器用 NumPy 计算，只有两侧共同的容器需要真正运算；容器不可变，运算结果可与输入共享容器
+# 序列化格式（小端）：b"MBMP" + 版本(u32) + 容器数 n(u32) + 容器键 u64[n] + 基数 u32[n] + 各容器数据
+#   （基数不超过 4096 为 uint16 数组，否则为 1024 个 uint64 字）
+# 用户群位图可放在 DATA_SYNC_AUDIENCE_DIR 目录下的 <用户群ID>.rbm 文件中，按用户群 ID 引用
+import os
+import base64
+import struct
+import argparse
+from typing import Dict, List, Sequence, Tuple, Union
+
+import numpy as np
+
+import mid_set
+
+# 数组容器的最大元素数，超过时转为位图容器
+ARRAY_MAX = 4096
+BITMAP_WORDS = 1024
+
+MAGIC = b"MBMP"
+VERSION = 1
+FILE_SUFFIX = ".rbm"
+SOURCE_PREFIX = "bitmap:"
+AUDIENCE_DIR_ENV = "DATA_SYNC_AUDIENCE_DIR"
+
+_HEADER = struct.Struct("<4sII")
+_LOW_MASK = np.uint64(0xFFFF)
+_EMPTY_ARRAY = np.zeros(0, dtype=np.uint16)
+
+class BitmapFormatError(ValueError):
+    """位图数据或用户群来源无法解析"""
+
+# ---------------------------------------------------------------------------
+# 容器运算
+# ---------------------------------------------------------------------------
+
+if hasattr(np, "bitwise_count"):
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.bitwise_count(words).sum())
+else:
+    # NumPy 2.0 之前没有 bitwise_count
+    def _popcount(words: np.ndarray) -> int:
+        return int(np.unpackbits(words.view(np.uint8)).sum())
+
+def _is_bitmap(container: np.ndarray) -> bool:
+    return container.dtype == np.uint64
+
+def _to_bitmap(values: np.ndarray) -> np.ndarray:
+    bits = np.zeros(1 << 16, dtype=bool)
+    bits[values] = True
+    return np.packbits(bits, bitorder="little").view("<u8")
+
+def _to_array(words: np.ndarray) -> np.ndarray:
+    return np.flatnonzero(np.unpackbits(words.view(np.uint8), bitorder="little")).astype(np.uint16)
+
+def _test(words: np.ndarray, values: np.ndarray) -> np.ndarray:
+    """values 中每个值在位图容器中是否存在"""
+    shifts = (values & 63).astype(np.uint64)
+    return ((words[values >> 6] >> shifts) & np.uint64(1)).astype(bool)
+
+def _cardinality(container: np.ndarray) -> int:
+    return _popcount(container) if _is_bitmap(container) else len(container)
+
+def _shrink(words: np.ndarray) -> np.ndarray:
+    """运算得到的位图容器元素不多时转回数组容器"""
+    return _to_array(words) if _popcount(words) <= ARRAY_MAX else words
+
+def _or(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    if not _is_bitmap(x) and not _is_bitmap(y):
+        merged = np.union1d(x, y)
+        return merged if len(merged) <= ARRAY_MAX else _to_bitmap(merged)
+    if not _is_bitmap(x):
+        x, y = y, x
+    return x | (y if _is_bitmap(y) else _to_bitmap(y))
+
+def _and(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    if _is_bitmap(x) and _is_bitmap(y):
+        return _shrink(x & y)
+    if _is_bitmap(x):
+        x, y = y, x
+    if _is_bitmap(y):
+        return x[_test(y, x)]
+    return np.intersect1d(x, y, assume_unique=True)
+
+def _and_cardinality(x: np.ndarray, y: np.ndarray) -> int:
+    if _is_bitmap(x) and _is_bitmap(y):
+        return _popcount(x & y)
+    if _is_bitmap(x):
+        x, y = y, x
+    if _is_bitmap(y):
+        return int(_test(y, x).sum())
+    return len(np.intersect1d(x, y, assume_unique=True))
+
+def _andnot(x: np.ndarray, y: np.ndarray) -> np.ndarray:
+    if not _is_bitmap(x):
+        if _is_bitmap(y):
+            return x[~_test(y, x)]
+        return np.setdiff1d(x, y, assume_unique=True)
+    return _shrink(x & ~(y if _is_bitmap(y) else _to_bitmap(y)))
+
+# ---------------------------------------------------------------------------
+# 位图
+# ---------------------------------------------------------------------------
+
+class MidBitmap:
+    """
+    MID 集合：keys 为升序的容器键（MID >> 16），containers[i] 保存该键下 MID 的低 16 位
+    """
+
+    def __init__(self, keys: np.ndarray, containers: List[np.ndarray]):
+        self.keys = np.asarray(keys, dtype=np.uint64)
+        self.containers = containers
+        self.cardinalities = np.array([_cardinality(c) for c in containers], dtype=np.int64)
+
+    @classmethod
+    def from_mids(cls, mids) -> "MidBitmap":
+        """从任意顺序、可重复的 MID 构建"""
+        mids = np.asarray(mids, dtype=np.uint64)
+        if len(mids) > 1 and not (mids[1:] > mids[:-1]).all():
+            mids = np.unique(mids)
+        if not len(mids):
+            return cls(np.zeros(0, dtype=np.uint64), [])
+        high = mids >> np.uint64(16)
+        lows = (mids & _LOW_MASK).astype(np.uint16)
+        starts = np.concatenate(([0], np.flatnonzero(high[1:] != high[:-1]) + 1))
+        ends = np.append(starts[1:], len(mids))
+        containers = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            low = lows[start:end]
+            containers.append(low.copy() if end - start <= ARRAY_MAX else _to_bitmap(low))
+        return cls(high[starts], containers)
+
+    def __len__(self) -> int:
+        return int(self.cardinalities.sum())
+
+    @property
+    def nbytes(self) -> int:
+        return self.keys.nbytes + sum(c.nbytes for c in self.containers)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, MidBitmap):
+            return NotImplemented
+        return (np.array_equal(self.keys, other.keys)
+                and all(_is_bitmap(a) == _is_bitmap(b) and np.array_equal(a, b)
+                        for a, b in zip(self.containers, other.containers)))
+
+    def __repr__(self) -> str:
+        return f"MidBitmap({len(self)} MIDs, {len(self.keys)} containers, {self.nbytes} bytes)"
+
+    def to_array(self) -> np.ndarray:
+        """全部 MID（uint64，升序）"""
+        parts = []
+        for key, container in zip(self.keys.tolist(), self.containers):
+            low = _to_array(container) if _is_bitmap(container) else container
+            parts.append(low.astype(np.uint64) + np.uint64(key << 16))
+        return np.concatenate(parts) if parts else np.zeros(0, dtype=np.uint64)
+
+    def contains(self, mids) -> np.ndarray:
+        """每个 MID 是否在集合中（布尔数组）"""
+        mids = np.atleast_1d(np.asarray(mids, dtype=np.uint64))
+        result = np.zeros(len(mids), dtype=bool)
+        if not len(self.keys):
+            return result
+        high = mids >> np.uint64(16)
+        slots = np.minimum(np.searchsorted(self.keys, high), len(self.keys) - 1)
+        present = np.flatnonzero(self.keys[slots] == high)
+        lows = (mids[present] & _LOW_MASK).astype(np.uint16)
+        for slot in np.unique(slots[present]).tolist():
+            group = slots[present] == slot
+            container = self.containers[slot]
+            if _is_bitmap(container):
+                result[present[group]] = _test(container, lows[group])
+            else:
+                result[present[group]] = np.isin(lows[group], container, assume_unique=False)
+        return result
+
+    def __contains__(self, mid) -> bool:
+        return bool(self.contains([int(mid)])[0])
+
+    def _pairs(self, other: "MidBitmap") -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """两侧共同的容器键及其下标"""
+        return np.intersect1d(self.keys, other.keys, assume_unique=True, return_indices=True)
+
+    def __and__(self, other: "MidBitmap") -> "MidBitmap":
+        keys, containers = [], []
+        common, mine, theirs = self._pairs(other)
+        for key, i, j in zip(common.tolist(), mine.tolist(), theirs.tolist()):
+            container = _and(self.containers[i], other.containers[j])
+            if len(container):
+                keys.append(key)
+                containers.append(container)
+        return MidBitmap(np.array(keys, dtype=np.uint64), containers)
+
+    def __or__(self, other: "MidBitmap") -> "MidBitmap":
+        merged = dict(zip(self.keys.tolist(), self.containers))
+        for key, container in zip(other.keys.tolist(), other.containers):
+            merged[key] = _or(merged[key], container) if key in merged else container
+        keys = sorted(merged)
+        return MidBitmap(np.array(keys, dtype=np.uint64), [merged[key] for key in keys])
+
+    def __sub__(self, other: "MidBitmap") -> "MidBitmap":
+        theirs = dict(zip(other.keys.tolist(), other.containers))
+        keys, containers = [], []
+        for key, container in zip(self.keys.tolist(), self.containers):
+            if key in theirs:
+                container = _andnot(container, theirs[key])
+            if len(container):
+                keys.append(key)
+                containers.append(container)
+        return MidBitmap(np.array(keys, dtype=np.uint64), containers)
+
+    def intersection_cardinality(self, other: "MidBitmap") -> int:
+        """交集大小，不生成结果位图"""
+        _, mine, theirs = self._pairs(other)
+        return sum(_and_cardinality(self.containers[i], other.containers[j])
+                   for i, j in zip(mine.tolist(), theirs.tolist()))
+
+    def union_cardinality(self, other: "MidBitmap") -> int:
+        return len(self) + len(other) - self.intersection_cardinality(other)
+
+    def difference_cardinality(self, other: "MidBitmap") -> int:
+        return len(self) - self.intersection_cardinality(other)
+
+    @classmethod
+    def union_all(cls, bitmaps: Sequence["MidBitmap"]) -> "MidBitmap":
+        result = cls(np.zeros(0, dtype=np.uint64), [])
+        for bitmap in bitmaps:
+            result = result | bitmap
+        return result
+
+    # -----------------------------------------------------------------------
+    # 序列化
+    # -----------------------------------------------------------------------
+
+    def to_bytes(self) -> bytes:
+        parts = [_HEADER.pack(MAGIC, VERSION, len(self.keys)),
+                 self.keys.astype("<u8").tobytes(),
+                 self.cardinalities.astype("<u4").tobytes()]
+        for container in self.containers:
+            parts.append(container.astype("<u8" if _is_bitmap(container) else "<u2").tobytes())
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "MidBitmap":
+        if len(data) < _HEADER.size:
+            raise BitmapFormatError("位图数据过短")
+        magic, version, count = _HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise BitmapFormatError("不是 MBMP v1 位图数据")
+        offset = _HEADER.size
+        try:
+            keys = np.frombuffer(data, dtype="<u8", count=count, offset=offset)
+            offset += keys.nbytes
+            cardinalities = np.frombuffer(data, dtype="<u4", count=count, offset=offset)
+            offset += cardinalities.nbytes
+            containers = []
+            for cardinality in cardinalities.tolist():
+                if cardinality > ARRAY_MAX:
+                    container = np.frombuffer(data, dtype="<u8", count=BITMAP_WORDS, offset=offset)
+                else:
+                    container = np.frombuffer(data, dtype="<u2", count=cardinality, offset=offset)
+                offset += container.nbytes
+                containers.append(container.astype(container.dtype.newbyteorder("=")))
+        except ValueError:
+            raise BitmapFormatError("位图数据被截断")
+        # 数据来自工具参数，运算假设容器有序去重（intersect1d assume_unique），这里逐个校验
+        for cardinality, container in zip(cardinalities.tolist(), containers):
+            if _is_bitmap(container):
+                if _popcount(container) != cardinality:
+                    raise BitmapFormatError("位图容器的置位数与记录的基数不一致")
+            elif not cardinality or not (container[1:] > container[:-1]).all():
+                raise BitmapFormatError("数组容器必须非空且严格升序")
+        if offset != len(data):
+            raise BitmapFormatError("位图数据长度不正确")
+        if count > 1 and not (keys[1:] > keys[:-1]).all():
+            raise BitmapFormatError("容器键必须严格升序")
+        return cls(keys.astype(np.uint64), containers)
+
+    def save(self, path: str):
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(self.to_bytes())
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "MidBitmap":
+        with open(path, "rb") as f:
+            return cls.from_bytes(f.read())
+
+    def encode(self) -> str:
+        """bitmap:<base64> 参数形式"""
+        return SOURCE_PREFIX + base64.b64encode(self.to_bytes()).decode("ascii")
+
+    def summary(self) -> Dict:
+        bitmap_containers = sum(1 for c in self.containers if _is_bitmap(c))
+        return {
+            "count": len(self),
+            "containers": len(self.keys),
+            "bitmap_containers": bitmap_containers,
+            "array_containers": len(self.keys) - bitmap_containers,
+            "bytes": self.nbytes,
+        }
+
+# ---------------------------------------------------------------------------
+# 用户群来源
+# ---------------------------------------------------------------------------
+
+def audience_dir() -> str:
+    return os.environ.get(AUDIENCE_DIR_ENV, "").strip()
+
+def audience_path(audience_id: str) -> str:
+    """用户群位图在 DATA_SYNC_AUDIENCE_DIR 下的路径"""
+    directory = audience_dir()
+    if not directory:
+        raise BitmapFormatError(f"未设置 {AUDIENCE_DIR_ENV}，无法按用户群ID {audience_id} 查找位图")
+    if os.path.basename(audience_id) != audience_id or audience_id in ("", ".", ".."):
+        raise BitmapFormatError(f"用户群ID 不合法: {audience_id}")
+    return os.path.join(directory, audience_id + FILE_SUFFIX)
+
+def load_source(source: Union[str, Sequence]) -> MidBitmap:
+    """
+    解析一个 MID 集合来源：
+    bitmap:<base64>、.rbm 位图文件（file:<路径>.rbm），或 mid_set 支持的 delta: / u64: / file: / 文本 / 列表
+    """
+    if isinstance(source, str):
+        stripped = source.strip()
+        try:
+            if stripped.startswith(SOURCE_PREFIX):
+                return MidBitmap.from_bytes(base64.b64decode(stripped[len(SOURCE_PREFIX):], validate=True))
+            if stripped.startswith("file:") and stripped.endswith(FILE_SUFFIX):
+                return MidBitmap.load(stripped[len("file:"):])
+        except (OSError, ValueError) as e:
+            raise BitmapFormatError(str(e))
+    try:
+        mids = mid_set.decode_mids(source)
+    except mid_set.MidDecodeError as e:
+        raise BitmapFormatError(str(e))
+    return MidBitmap.from_mids(mids.page(0, len(mids)))
+
+def load_audiences(audiences: Union[List[str], Dict[str, str]]) -> Dict[str, MidBitmap]:
+    """用户群ID 列表（从 DATA_SYNC_AUDIENCE_DIR 读取）或 用户群ID -> 来源 的映射"""
+    if isinstance(audiences, dict):
+        return {audience_id: load_source(source) for audience_id, source in audiences.items()}
+    loaded = {}
+    for audience_id in audiences:
+        path = audience_path(audience_id)
+        try:
+            loaded[audience_id] = MidBitmap.load(path)
+        except OSError as e:
+            raise BitmapFormatError(f"无法读取用户群 {audience_id} 的位图 {path}: {e}")
+    return loaded
+
+# ---------------------------------------------------------------------------
+# 分析
+# ---------------------------------------------------------------------------
+
+def overlap_report(audiences: Dict[str, MidBitmap]) -> Dict:
+    """各用户群大小、两两交集与 Jaccard 系数、并集大小"""
+    ids = list(audiences)
+    pairs = []
+    for index, first in enumerate(ids):
+        for second in ids[index + 1:]:
+            shared = audiences[first].intersection_cardinality(audiences[second])
+            union = len(audiences[first]) + len(audiences[second]) - shared
+            pairs.append({
+                "audiences": [first, second],
+                "intersection": shared,
+                "only_first": len(audiences[first]) - shared,
+                "only_second": len(audiences[second]) - shared,
+                "jaccard": round(shared / union, 6) if union else 0.0,
+            })
+    return {
+        "sizes": {audience_id: len(bitmap) for audience_id, bitmap in audiences.items()},
+        "union": len(MidBitmap.union_all(list(audiences.values()))),
+        "pairs": pairs,
+    }
+
+def impact_report(affected: MidBitmap, audiences: Dict[str, MidBitmap]) -> Dict:
+    """受影响的 MID 分别落在哪些用户群中：每个用户群命中数与占比，以及不属于任何给定用户群的数量"""
+    impacted = []
+    for audience_id, bitmap in audiences.items():
+        hits = affected.intersection_cardinality(bitmap)
+        impacted.append({
+            "audience_id": audience_id,
+            "affected": hits,
+            "audience_size": len(bitmap),
+            "ratio": round(hits / len(bitmap), 6) if len(bitmap) else 0.0,
+        })
+    impacted.sort(key=lambda item: item["affected"], reverse=True)
+    covered = MidBitmap.union_all(list(audiences.values()))
+    return {
+        "affected_mids": len(affected),
+        "impacted_audiences": sum(1 for item in impacted if item["affected"]),
+        "outside_audiences": affected.difference_cardinality(covered),
+        "audiences": impacted,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="用户群 MID 位图")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build_parser = subparsers.add_parser("build", help="从 MID 来源（delta: / u64: / file: / 文本）构建位图")
+    build_parser.add_argument("source")
+    target = build_parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--output", help="输出 .rbm 文件")
+    target.add_argument("--audience-id", help=f"写入 {AUDIENCE_DIR_ENV}/<用户群ID>{FILE_SUFFIX}")
+
+    info_parser = subparsers.add_parser("info", help="查看位图摘要")
+    info_parser.add_argument("source")
+
+    op_parser = subparsers.add_parser("op", help="集合运算")
+    op_parser.add_argument("operation", choices=["and", "or", "andnot"])
+    op_parser.add_argument("first")
+    op_parser.add_argument("second")
+    op_parser.add_argument("--output", help="输出 .rbm 文件，不给出时只打印摘要")
+
+    args = parser.parse_args()
+    if args.command == "build":
+        bitmap = load_source(args.source)
+        path = args.output or audience_path(args.audience_id)
+        bitmap.save(path)
+        print(f"{path}: {bitmap!r}")
+    elif args.command == "info":
+        print(load_source(args.source).summary())
+    else:
+        first, second = load_source(args.first), load_source(args.second)
+        result = {"and": first.__and__, "or": first.__or__, "andnot": first.__sub__}[args.operation](second)
+        if args.output:
+            result.save(args.output)
+        print(result.summary())
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,339 @@
+# MID Set - 大批量 MID 的紧凑编码与数组存储
+# status_update_confirmation 的 affected_mids 可能有上千万个，逐个作为 Python 字符串校验和保存会占用数 GB 内存。
+# 这里接受以下紧凑编码，解码后按 min 偏移存为最窄的无符号整数数组（MID 跨度小于 2^32 时每个 4 字节）：
+#   - "delta:<base64>"：按输入顺序的差值 zigzag 编码后的 varint 序列（有序 MID 每个约 1~2 字节，推荐）
+#   - "u64:<base64>"：小端 uint64 数组
+#   - "file:<路径>"：.u64 / .bin 为小端 uint64，.delta / .varint 为差值 varint，其他按文本（逗号或空白分隔）
+#   - 逗号分隔的文本，或旧的字符串列表
+# 解码分块进行，峰值内存约为最终数组大小加一个块；UI 通过 .npy 文件按页内存映射读取，不需要整表传输
+import os
+import base64
+import tempfile
+import warnings
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Union
+
+import numpy as np
+
+import ui_launcher
+
+# 每次解码 / 统计处理的元素（或字节）数
+CHUNK_SIZE = 1 << 18
+
+# 摘要中的样本数与列出的连续区间数
+SAMPLE_SIZE = 10
+RANGE_LIMIT = 5
+
+# 交给 UI 的 .npy 文件前缀（服务崩溃后遗留的由 ui_launcher.sweep_stale_ui 清理）
+TEMP_PREFIX = ui_launcher.UI_TEMP_PREFIX + "mids_"
+
+_UINT64_MAX = np.iinfo(np.uint64).max
+
+class MidDecodeError(ValueError):
+    """affected_mids 的编码无法解析"""
+
+class MidArray:
+    """
+    MID 数组：MID = base + offsets[i]，保持输入顺序
+    offsets 为能容纳 max - min 的最窄无符号整数类型
+    """
+
+    def __init__(self, base: int, offsets: np.ndarray):
+        self.base = int(base)
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets)
+
+    @property
+    def nbytes(self) -> int:
+        return self.offsets.nbytes
+
+    def page(self, start: int, count: int) -> np.ndarray:
+        """第 start 个起的 count 个 MID（uint64）"""
+        return self.offsets[start:start + count].astype(np.uint64) + np.uint64(self.base)
+
+    def _chunks(self) -> Iterator[np.ndarray]:
+        for start in range(0, len(self), CHUNK_SIZE):
+            yield self.offsets[start:start + CHUNK_SIZE]
+
+    def summary(self) -> Dict:
+        """
+        摘要：数量、最小 / 最大值、是否有序；有序时另给出重复数与连续区间（前 RANGE_LIMIT 个），
+        以及均匀抽取的样本。全部分块计算，不生成整表大小的临时数组
+        """
+        count = len(self)
+        if count == 0:
+            return {"count": 0}
+        sorted_ = True
+        duplicates = 0
+        range_count = 0
+        ranges: List[List[int]] = []
+        previous = None
+        range_start = None
+        for chunk in self._chunks():
+            # 偏移可能达到 2^64 - 1，全程用 uint64 并显式比较大小，不转为 int64
+            values = chunk.astype(np.uint64)
+            if previous is not None:
+                values = np.concatenate((np.array([previous], dtype=np.uint64), values))
+            if sorted_ and (values[1:] < values[:-1]).any():
+                sorted_ = False
+            if sorted_:
+                # 有序时相邻差值非负，uint64 减法不会回绕
+                diffs = values[1:] - values[:-1]
+                duplicates += int(np.count_nonzero(diffs == 0))
+                # 差值大于 1 的位置是区间的分界
+                breaks = np.flatnonzero(diffs > 1)
+                if range_start is None:
+                    range_start = int(values[0])
+                for index in breaks[:max(0, RANGE_LIMIT - len(ranges))]:
+                    ranges.append([range_start, int(values[index])])
+                    range_start = int(values[index + 1])
+                if len(breaks):
+                    range_start = int(values[breaks[-1] + 1])
+                range_count += len(breaks)
+            previous = int(values[-1])
+
+        summary = {
+            "count": count,
+            "min": str(self.base),
+            "max": str(self.base + int(self.offsets.max())),
+            "sorted": sorted_,
+            "bytes": self.nbytes,
+        }
+        if sorted_:
+            if len(ranges) < RANGE_LIMIT:
+                ranges.append([range_start, previous])
+            summary["duplicates"] = duplicates
+            summary["ranges"] = range_count + 1
+            summary["first_ranges"] = [[str(self.base + a), str(self.base + b)] for a, b in ranges]
+        positions = np.unique(np.linspace(0, count - 1, min(SAMPLE_SIZE, count)).astype(np.int64))
+        summary["sample"] = [str(mid) for mid in (self.offsets[positions].astype(np.uint64) + np.uint64(self.base)).tolist()]
+        return summary
+
+    def save(self, path: Optional[str] = None) -> str:
+        """把 offsets 写为 .npy（UI 按页内存映射读取），返回路径"""
+        if path is None:
+            fd, path = tempfile.mkstemp(prefix=TEMP_PREFIX, suffix=".npy")
+            os.close(fd)
+        np.save(path, self.offsets)
+        return path
+
+    def ui_payload(self) -> Dict:
+        """交给 UI 的内容：摘要与 .npy 文件（窗口关闭后由调用方删除）"""
+        return {"summary": self.summary(), "base": str(self.base), "path": self.save()}
+
+    @classmethod
+    def from_chunks(cls, chunks: Callable[[], Iterator[np.ndarray]]) -> "MidArray":
+        """
+        从分块产生 uint64 的数据源构建：第一遍求数量与最小 / 最大值，第二遍按最窄类型填充
+        chunks 每次调用返回一个新的迭代器
+        """
+        count, low, high = 0, None, None
+        for chunk in chunks():
+            if len(chunk):
+                count += len(chunk)
+                chunk_low, chunk_high = int(chunk.min()), int(chunk.max())
+                low = chunk_low if low is None else min(low, chunk_low)
+                high = chunk_high if high is None else max(high, chunk_high)
+        if count == 0:
+            return cls(0, np.zeros(0, dtype=np.uint8))
+        span = high - low
+        dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if span <= np.iinfo(t).max)
+        offsets = np.empty(count, dtype=dtype)
+        position = 0
+        for chunk in chunks():
+            offsets[position:position + len(chunk)] = chunk - np.uint64(low)
+            position += len(chunk)
+        return cls(low, offsets)
+
+# ---------------------------------------------------------------------------
+# 解码
+# ---------------------------------------------------------------------------
+
+def _parse_text(text: Union[str, bytes]) -> np.ndarray:
+    """逗号或空白分隔的十进制 MID"""
+    if isinstance(text, bytes):
+        text = text.decode("ascii", errors="replace")
+    text = text.replace(",", " ").strip()
+    if not text:
+        return np.zeros(0, dtype=np.uint64)
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("error")
+            values = np.fromstring(text, dtype=np.uint64, sep=" ")
+    except (ValueError, DeprecationWarning):
+        raise MidDecodeError("MID 必须是非负整数")
+    # fromstring 把超出 uint64 的值截为最大值，只有出现最大值时才需要核对原文
+    clamped = np.flatnonzero(values == _UINT64_MAX)
+    if len(clamped):
+        tokens = text.split()
+        for index in clamped.tolist():
+            if int(tokens[index]) > _UINT64_MAX:
+                raise MidDecodeError(f"MID 超出 uint64 范围: {tokens[index]}")
+    return values
+
+def _list_chunks(mids: Sequence) -> Callable[[], Iterator[np.ndarray]]:
+    def chunks():
+        for start in range(0, len(mids), CHUNK_SIZE):
+            yield _parse_text(",".join(map(str, mids[start:start + CHUNK_SIZE])))
+    return chunks
+
+def _packed_chunks(data: np.ndarray) -> Callable[[], Iterator[np.ndarray]]:
+    def chunks():
+        for start in range(0, len(data), CHUNK_SIZE):
+            yield np.asarray(data[start:start + CHUNK_SIZE], dtype=np.uint64)
+    return chunks
+
+def _decode_varints(data: np.ndarray) -> np.ndarray:
+    """解码一段完整的 varint 序列（最后一个字节必须是结束字节）"""
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts + 1
+    if lengths.max() > 10:
+        raise MidDecodeError("varint 过长")
+    shifts = (np.arange(len(data)) - np.repeat(starts, lengths)).astype(np.uint64) * np.uint64(7)
+    return np.add.reduceat((data & 0x7F).astype(np.uint64) << shifts, starts)
+
+def _delta_chunks(data: np.ndarray) -> Callable[[], Iterator[np.ndarray]]:
+    """差值 varint：每块截到最后一个结束字节，块间携带上一个值"""
+    if len(data) and data[-1] >= 0x80:
+        raise MidDecodeError("delta 编码不完整")
+
+    def chunks():
+        position, previous = 0, 0
+        while position < len(data):
+            window = data[position:position + CHUNK_SIZE]
+            cut = int(np.flatnonzero(window < 0x80)[-1]) + 1 if (window < 0x80).any() else 0
+            if cut == 0:
+                raise MidDecodeError("varint 过长")
+            zigzag = _decode_varints(window[:cut])
+            deltas = (zigzag >> np.uint64(1)) ^ (np.uint64(0) - (zigzag & np.uint64(1)))
+            # 差值按模 2^64 累加（与 encode_delta 对应），任意 uint64 MID 都能还原
+            values = np.cumsum(deltas, dtype=np.uint64) + np.uint64(previous)
+            previous = int(values[-1])
+            position += cut
+            yield values
+    return chunks
+
+def _text_file_chunks(path: str) -> Callable[[], Iterator[np.ndarray]]:
+    def chunks():
+        with open(path, "rb") as f:
+            rest = b""
+            while True:
+                block = f.read(CHUNK_SIZE * 8)
+                if not block:
+                    break
+                block = rest + block
+                cut = max(block.rfind(b"\n"), block.rfind(b","), block.rfind(b" "))
+                if cut < 0:
+                    rest = block
+                    continue
+                rest = block[cut + 1:]
+                yield _parse_text(block[:cut + 1])
+            if rest.strip():
+                yield _parse_text(rest)
+    return chunks
+
+def _base64(text: str) -> bytes:
+    try:
+        return base64.b64decode(text, validate=True)
+    except ValueError as e:
+        raise MidDecodeError(f"base64 解码失败: {e}")
+
+def decode_mids(value: Union[str, Sequence]) -> MidArray:
+    """把 affected_mids（编码字符串、文本或列表）解码为 MidArray，格式错误时抛出 MidDecodeError"""
+    if not isinstance(value, str):
+        return MidArray.from_chunks(_list_chunks(list(value)))
+    text = value.strip()
+    if text.startswith("delta:"):
+        return MidArray.from_chunks(_delta_chunks(np.frombuffer(_base64(text[6:]), dtype=np.uint8)))
+    if text.startswith("u64:"):
+        raw = _base64(text[4:])
+        if len(raw) % 8:
+            raise MidDecodeError("u64 编码的长度必须是 8 的倍数")
+        return MidArray.from_chunks(_packed_chunks(np.frombuffer(raw, dtype="<u8")))
+    if text.startswith("file:"):
+        path = os.path.expanduser(text[5:].strip())
+        if not os.path.isfile(path):
+            raise MidDecodeError(f"文件不存在: {path}")
+        extension = os.path.splitext(path)[1].lower()
+        if extension in (".u64", ".bin"):
+            if os.path.getsize(path) % 8:
+                raise MidDecodeError("uint64 文件的长度必须是 8 的倍数")
+            if os.path.getsize(path) == 0:
+                return MidArray.from_chunks(_packed_chunks(np.zeros(0, dtype=np.uint64)))
+            return MidArray.from_chunks(_packed_chunks(np.memmap(path, dtype="<u8", mode="r")))
+        if extension in (".delta", ".varint"):
+            if os.path.getsize(path) == 0:
+                return MidArray.from_chunks(_packed_chunks(np.zeros(0, dtype=np.uint64)))
+            return MidArray.from_chunks(_delta_chunks(np.memmap(path, dtype=np.uint8, mode="r")))
+        return MidArray.from_chunks(_text_file_chunks(path))
+    return MidArray.from_chunks(lambda: iter([_parse_text(text)]))
+
+# ---------------------------------------------------------------------------
+# 编码（调用方生成紧凑参数时使用）
+# ---------------------------------------------------------------------------
+
+def _encode_varints(values: np.ndarray) -> bytes:
+    values = values.astype(np.uint64)
+    lengths = np.ones(len(values), dtype=np.int64)
+    for k in range(1, 10):
+        lengths += values >= (np.uint64(1) << np.uint64(7 * k))
+    out = np.empty(int(lengths.sum()), dtype=np.uint8)
+    starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+    for k in range(10):
+        present = lengths > k
+        if not present.any():
+            break
+        byte = ((values[present] >> np.uint64(7 * k)) & np.uint64(0x7F)).astype(np.uint8)
+        byte |= np.where(lengths[present] > k + 1, 0x80, 0).astype(np.uint8)
+        out[starts[present] + k] = byte
+    return out.tobytes()
+
+def encode_delta(mids: Sequence[int]) -> bytes:
+    """
+    按顺序的差值 zigzag varint 编码（有序时最紧凑）
+    差值按模 2^64 计算后视为 int64 再 zigzag，相邻 MID 相差 2^63 以上时也能无损还原
+    """
+    mids = np.asarray(mids, dtype=np.uint64)
+    parts = []
+    previous = 0
+    for start in range(0, len(mids), CHUNK_SIZE):
+        values = mids[start:start + CHUNK_SIZE]
+        deltas = np.diff(values, prepend=np.uint64(previous)).view(np.int64)
+        previous = int(values[-1])
+        parts.append(_encode_varints(((deltas << 1) ^ (deltas >> 63)).view(np.uint64)))
+    return b"".join(parts)
+
+def encode_mids(mids: Sequence[int], encoding: str = "delta") -> str:
+    """生成 affected_mids 参数：delta:<base64> 或 u64:<base64>"""
+    if encoding == "u64":
+        return "u64:" + base64.b64encode(np.asarray(mids, dtype="<u8").tobytes()).decode("ascii")
+    return "delta:" + base64.b64encode(encode_delta(mids)).decode("ascii")
+
+if __name__ == "__main__":
+    import sys
+    import argparse
+
+    parser = argparse.ArgumentParser(description="MID 列表的紧凑编码")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    p = subparsers.add_parser("encode", help="把文本 MID 文件编码为 affected_mids 参数或二进制文件")
+    p.add_argument("input", help="MID 文件（逗号或空白分隔）")
+    p.add_argument("--encoding", choices=["delta", "u64"], default="delta")
+    p.add_argument("--output", help="写为二进制文件（.delta / .u64），之后以 file:<路径> 传入")
+    p = subparsers.add_parser("summary", help="解码 affected_mids 参数并打印摘要")
+    p.add_argument("value", help="delta:... / u64:... / file:... 或逗号分隔的 MID")
+    args = parser.parse_args()
+
+    if args.command == "encode":
+        mids = decode_mids("file:" + args.input)
+        values = mids.page(0, len(mids))
+        if args.output:
+            with open(args.output, "wb") as f:
+                f.write(encode_delta(values) if args.encoding == "delta" else values.astype("<u8").tobytes())
+            print(f"file:{os.path.abspath(args.output)}")
+        else:
+            sys.stdout.write(encode_mids(values, args.encoding) + "\n")
+    else:
+        import json
+        print(json.dumps(decode_mids(args.value).summary(), ensure_ascii=False, indent=2))
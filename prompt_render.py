@@ -0,0 +1,449 @@
+# Prompt Render - 反馈窗口描述区域的渲染
+# 提示文本只预处理一次，Markdown 检测用一个预编译的组合正则（找到明确特征即停止）；
+# 转换后的 HTML 正文按提示文本的哈希缓存，切换行高等样式时只重新套用样式，不再重新转换；
+# 很大的提示文本切分为块，由界面先渲染第一屏，其余块渐进追加
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+# 描述区域使用的字体列表（含 emoji 字体）
+FONT_FAMILY = "'Segoe UI', 'PingFang SC', 'Hiragino Sans GB', system-ui, -apple-system, sans-serif, 'Apple Color Emoji', 'Segoe UI Emoji', 'Noto Color Emoji'"
+
+# 出现任意一个即判定为 Markdown 的特征，合并为一个正则。
+# 行首特征以换行符开头（在 "\n" + 文本 上搜索），每个分支都以固定字符开头，
+# 正则引擎可以按首字符快速跳过，而不是在每个位置尝试全部分支；[^\S\n] 表示不跨行的空白
+STRONG_MARKDOWN_RE = re.compile(
+    r'\n(?:'
+    r'[^\S\n]*(?:'
+    r'```'                               # 代码块: ```
+    r'|>'                                # 引用: > 文本
+    r'|[-*+][^\S\n]'                     # 无序列表: - 项目 或 * 项目 或 + 项目
+    r'|\d+\.[^\S\n]'                     # 有序列表: 1. 项目
+    r')'
+    r'|#{1,6}[^\S\n]+[^\n]'                # 标题: # 标题文本
+    r'|(?:-{3,}|={3,})(?=\n|\Z)'          # 水平线: --- 或 ===
+    r')'
+    r'|\|.+\|.+\|'                        # 表格
+    # 粗体同时也满足斜体规则、图片同时也满足链接规则，同一行两个特征，原规则下总是判定为 Markdown
+    r'|\*\*.+?\*\*'                       # 粗体: **文本**
+    r'|!\[.+?\]\(.+?\)'                   # 图片: ![alt](URL)
+)
+
+# 需要累计的弱特征（同一行同一种特征只计一次），各分支的首字符不同，可以据此区分特征
+WEAK_MARKDOWN_RE = re.compile(
+    r'\*.+?\*'                             # 斜体: *文本*
+    r'|_.+?_'                              # 斜体: _文本_
+    r'|`[^`\n]+`'                          # 行内代码: `代码`
+    r'|\[.+?\]\(.+?\)'                     # 链接: [文本](URL)
+)
+
+logger = logging.getLogger(__name__)
+
+# 转换结果缓存的条目数
+RENDER_CACHE_SIZE = 8
+
+def preprocess(text: str) -> str:
+    """
+    预处理文本，处理转义字符问题
+    特别处理从Cursor编辑器传入时的转义问题
+    """
+    if not isinstance(text, str):
+        return text
+
+    # 尝试多种解码方式来处理不同来源的转义
+
+    # 方式1: 尝试JSON解码（适用于从JSON参数传入的情况）
+    try:
+        # 如果文本看起来像是被JSON编码过的字符串，尝试解码
+        if '\\n' in text or '\\t' in text or '\\r' in text:
+            # 添加引号使其成为有效JSON字符串，然后解码
+            text = json.loads(f'"{text}"')
+            logger.debug("JSON解码成功")
+    except (json.JSONDecodeError, ValueError):
+        logger.debug("JSON解码失败，使用字符串替换方法")
+        # 如果JSON解码失败，使用字符串替换方法
+
+        # 先检查是否存在双重转义（如 \\n）
+        if '\\\\n' in text:
+            # 处理双重转义的换行符
+            text = text.replace('\\\\n', '\n')
+            text = text.replace('\\\\t', '\t')
+            text = text.replace('\\\\r', '\r')
+            text = text.replace('\\\\\\\\', '\\')  # 四重反斜杠变成单反斜杠
+        else:
+            # 1. 处理字面上的转义序列
+            text = text.replace('\\\\', '\\')  # 先处理双反斜杠
+            text = text.replace('\\n', '\n')
+            text = text.replace('\\t', '\t')
+            text = text.replace('\\r', '\r')
+
+    # 2. 规范化换行符
+    text = text.replace('\r\n', '\n')
+    text = text.replace('\r', '\n')
+    return text
+
+def is_markdown(text: str) -> bool:
+    """
+    检测（已预处理的）文本是否可能是Markdown格式
+    出现任意明确特征立即返回 True；否则累计弱特征（每行每种特征计一次），
+    数量达到 2 个或密度超过 10% 时视为 Markdown
+    """
+    # 如果文本为空，不视为Markdown
+    if not text or text.strip() == "":
+        return False
+
+    if STRONG_MARKDOWN_RE.search("\n" + text):
+        return True
+
+    line_count = text.count('\n') + 1
+    seen = set()
+    for match in WEAK_MARKDOWN_RE.finditer(text):
+        start = match.start()
+        seen.add((text.rfind('\n', 0, start), text[start]))
+        if len(seen) >= 2:
+            return True
+    return len(seen) > 0 and len(seen) / line_count > 0.1
+
+def text_to_html(text: str) -> str:
+    """将普通文本转换为HTML正文：HTML转义并保留换行"""
+    escaped_text = text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+    return escaped_text.replace("\n", "<br>")
+
+_markdown_instance = None
+_markdown_lock = threading.Lock()
+
+def _get_markdown():
+    """创建（或复用）markdown 转换实例"""
+    global _markdown_instance
+    if _markdown_instance is None:
+        import markdown
+
+        # 配置markdown扩展，添加emoji支持
+        extensions = ['extra', 'codehilite', 'toc']
+
+        # 尝试添加emoji扩展（如果可用）
+        try:
+            import pymdownx.emoji
+            extensions.append('pymdownx.emoji')
+            extension_configs = {
+                'pymdownx.emoji': {
+                    'emoji_index': pymdownx.emoji.gemoji,
+                    'emoji_generator': pymdownx.emoji.to_svg,
+                    'alt': 'short',
+                    'options': {
+                        'attributes': {
+                            'align': 'absmiddle',
+                            'height': '20px',
+                            'width': '20px'
+                        },
+                        'image_path': 'https://assets-cdn.github.com/images/icons/emoji/unicode/',
+                        'non_standard_image_path': 'https://assets-cdn.github.com/images/icons/emoji/'
+                    }
+                }
+            }
+        except ImportError:
+            logger.debug("pymdownx.emoji not available, using basic emoji support")
+            extension_configs = {}
+
+        _markdown_instance = markdown.Markdown(
+            extensions=extensions,
+            extension_configs=extension_configs
+        )
+    return _markdown_instance
+
+def markdown_to_html(text: str) -> str:
+    """使用markdown库将markdown转换为HTML正文"""
+    with _markdown_lock:
+        md = _get_markdown()
+        # 重置实例以确保状态清空
+        md.reset()
+        return md.convert(text)
+
+# 超过该大小（字节）的提示文本按块渐进渲染：先显示第一屏，其余块在空闲时或滚动到底部时追加
+PROGRESSIVE_THRESHOLD = 64 * 1024
+# 第一块（第一屏）的大小
+FIRST_CHUNK_BYTES = 4 * 1024
+# 之后每块的大小：Markdown 转换较慢，块要小一些，保证每次空闲回调都很短
+MARKDOWN_CHUNK_BYTES = 4 * 1024
+TEXT_CHUNK_BYTES = 64 * 1024
+# 自动渲染的上限（字节），超出部分需要点击“展开剩余内容”
+RENDER_CAP_ENV = "INTERACTIVE_FEEDBACK_PROMPT_RENDER_CAP"
+DEFAULT_RENDER_CAP = 512 * 1024
+
+FENCE_RE = re.compile(r'^[^\S\n]*(```|~~~)')
+
+def render_cap() -> int:
+    """自动渲染的上限（字节），<= 0 表示不限制"""
+    try:
+        return int(os.environ.get(RENDER_CAP_ENV, DEFAULT_RENDER_CAP))
+    except ValueError:
+        return DEFAULT_RENDER_CAP
+
+def _utf8_len(text: str) -> int:
+    return len(text.encode("utf-8", "surrogatepass"))
+
+def split_markdown_blocks(text: str) -> List[str]:
+    """按空行把 Markdown 切分为块，代码块（``` / ~~~）内部的空行不切分"""
+    blocks, current = [], []
+    fence = None
+    for line in text.split("\n"):
+        match = FENCE_RE.match(line)
+        if fence is None:
+            if match:
+                fence = match.group(1)
+            elif not line.strip():
+                if current:
+                    blocks.append("\n".join(current))
+                    current = []
+                continue
+        elif match and match.group(1) == fence:
+            fence = None
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+def _split_oversized(block: str, limit: int, markdown: bool) -> List[str]:
+    """按行切开超过 limit 的块；被切开的代码块每一段都补上开闭围栏"""
+    lines = block.split("\n")
+    opener = closer = None
+    if markdown and FENCE_RE.match(lines[0]):
+        opener = lines.pop(0)
+        closer = FENCE_RE.match(opener).group(1)
+        if lines and FENCE_RE.match(lines[-1]):
+            lines.pop()
+    pieces, current, size = [], [], 0
+    for line in lines:
+        current.append(line)
+        size += _utf8_len(line) + 1
+        if size >= limit:
+            pieces.append(current)
+            current, size = [], 0
+    if current:
+        pieces.append(current)
+    if opener is not None:
+        return ["\n".join([opener, *piece, closer]) for piece in pieces]
+    return ["\n".join(piece) for piece in pieces]
+
+def split_chunks(text: str, markdown: bool) -> List[str]:
+    """把提示文本切分为渐进渲染的块：第一块约一屏，之后按固定大小分组"""
+    if markdown:
+        blocks, separator, chunk_bytes = split_markdown_blocks(text), "\n\n", MARKDOWN_CHUNK_BYTES
+    else:
+        blocks, separator, chunk_bytes = text.split("\n"), "\n", TEXT_CHUNK_BYTES
+
+    chunks, current, size = [], [], 0
+    limit = FIRST_CHUNK_BYTES
+    for block in blocks:
+        pieces = [block]
+        if _utf8_len(block) + len(separator) > limit:
+            # 超大的块（长代码块、没有空行的日志）单独按行切开
+            if current:
+                chunks.append(separator.join(current))
+                current, size = [], 0
+                limit = chunk_bytes
+            pieces = _split_oversized(block, limit, markdown)
+        for piece in pieces:
+            current.append(piece)
+            size += _utf8_len(piece) + len(separator)
+            if size >= limit:
+                chunks.append(separator.join(current))
+                current, size = [], 0
+                limit = chunk_bytes
+    if current:
+        chunks.append(separator.join(current))
+    return chunks
+
+class RenderedPrompt:
+    """
+    预处理并检测过的提示文本（不含样式）
+    小的提示文本只有一块；大的提示文本切分为多块，每块在第一次用到时转换为 HTML 并缓存
+    """
+
+    def __init__(self, is_markdown: bool, chunks: List[str]):
+        self.is_markdown = is_markdown
+        self.chunks = chunks
+        self.chunk_sizes = [_utf8_len(chunk) for chunk in chunks]
+        self._bodies: List[Optional[str]] = [None] * len(chunks)
+
+    def __len__(self) -> int:
+        return len(self.chunks)
+
+    @property
+    def progressive(self) -> bool:
+        return len(self.chunks) > 1
+
+    def chunk_body(self, index: int) -> str:
+        """第 index 块的 HTML 正文"""
+        body = self._bodies[index]
+        if body is None:
+            chunk = self.chunks[index]
+            body = self._bodies[index] = markdown_to_html(chunk) if self.is_markdown else text_to_html(chunk)
+        return body
+
+    @property
+    def body(self) -> str:
+        """全部正文（会转换所有块）"""
+        return "".join(self.chunk_body(i) for i in range(len(self.chunks)))
+
+    def cap_index(self, cap: int) -> int:
+        """在 cap 字节以内自动渲染的块数（至少一块）"""
+        if cap <= 0:
+            return len(self.chunks)
+        total = 0
+        for i, size in enumerate(self.chunk_sizes):
+            total += size
+            if total > cap:
+                return max(i, 1)
+        return len(self.chunks)
+
+_render_cache: "OrderedDict[str, RenderedPrompt]" = OrderedDict()
+_render_cache_lock = threading.Lock()
+
+def prompt_key(prompt: str) -> str:
+    """提示文本的缓存键"""
+    return hashlib.blake2b(prompt.encode("utf-8", "surrogatepass"), digest_size=16).hexdigest()
+
+def strip_quotes(prompt: str) -> str:
+    """从命令行参数传入的文本可能带有首尾引号"""
+    if isinstance(prompt, str) and prompt.startswith('"') and prompt.endswith('"'):
+        return prompt[1:-1]
+    return prompt
+
+def render(prompt: str) -> RenderedPrompt:
+    """预处理、检测并切分提示文本（结果按提示文本的哈希缓存，各块的 HTML 在用到时转换）"""
+    key = prompt_key(prompt)
+    with _render_cache_lock:
+        cached = _render_cache.get(key)
+        if cached is not None:
+            _render_cache.move_to_end(key)
+            return cached
+
+    text = preprocess(strip_quotes(prompt))
+    markdown_detected = is_markdown(text)
+    logger.debug(f"检测到文本类型: {'Markdown' if markdown_detected else '普通文本'}（{len(text)} 字符）")
+    chunks = split_chunks(text, markdown_detected) if _utf8_len(text) > PROGRESSIVE_THRESHOLD else [text]
+    rendered = RenderedPrompt(markdown_detected, chunks)
+
+    with _render_cache_lock:
+        _render_cache[key] = rendered
+        while len(_render_cache) > RENDER_CACHE_SIZE:
+            _render_cache.popitem(last=False)
+    return rendered
+
+def text_style(line_height: float) -> str:
+    """普通文本外层 div 的样式"""
+    return f"""
+            line-height: {line_height};
+            color: #ccc;
+            font-family: {FONT_FAMILY};
+            white-space: pre-wrap;
+        """
+
+def markdown_style(line_height: float) -> str:
+    """Markdown 正文的样式表"""
+    return f"""
+                /* 基础样式 */
+                .md-content, .md-content p, .md-content li {{
+                    line-height: {line_height} !important; /* 统一并强制行高 */
+                    margin-top: 2px !important;
+                    margin-bottom: 2px !important;
+                }}
+                .md-content {{
+                    color: #ccc;
+                    font-family: {FONT_FAMILY};
+                    white-space: pre-wrap;
+                }}
+
+                /* 标题样式 */
+                h1 {{ color: #FF9800; margin: 12px 0 8px 0; font-size: 1.3em; }}
+                h2 {{ color: #2196F3; margin: 10px 0 6px 0; font-size: 1.2em; }}
+                h3 {{ color: #4CAF50; margin: 10px 0 6px 0; font-size: 1.1em; }}
+
+                /* 列表样式 */
+                ul, ol {{
+                    margin: 6px 0;
+                    padding-left: 20px;
+                }}
+                li {{
+                    vertical-align: baseline;
+                    display: list-item;
+                    text-align: left;
+                }}
+
+                /* 代码样式 */
+                code {{
+                    background-color: rgba(255,255,255,0.1);
+                    padding: 2px 6px;
+                    border-radius: 4px;
+                    font-family: 'Consolas', 'Monaco', monospace;
+                    font-size: 0.9em;
+                }}
+
+                pre {{
+                    background-color: rgba(255,255,255,0.05);
+                    padding: 12px;
+                    border-radius: 6px;
+                    overflow-x: auto;
+                    border-left: 4px solid #2196F3;
+                }}
+
+                /* 强调样式 */
+                strong {{ color: #FFD54F; }}
+                em {{ color: #81C784; }}
+
+                /* Emoji样式优化 */
+                .emoji, img.emoji {{
+                    height: 1.2em;
+                    width: 1.2em;
+                    margin: 0 0.05em 0 0.1em;
+                    vertical-align: -0.1em;
+                    display: inline-block;
+                }}
+
+                /* 表格样式 */
+                table {{
+                    border-collapse: collapse;
+                    width: 100%;
+                    margin: 10px 0;
+                }}
+                th, td {{
+                    border: 1px solid #444;
+                    padding: 8px;
+                    text-align: left;
+                }}
+                th {{
+                    background-color: rgba(255,255,255,0.1);
+                    font-weight: bold;
+                }}
+            """
+
+def wrap_body(body: str, is_markdown: bool, line_height: float) -> str:
+    """正文外层的容器（Markdown 的样式表由 document_style 提供）"""
+    if is_markdown:
+        return f"<div class=\"md-content\">{body}</div>"
+    return f"<div style=\"{text_style(line_height)}\">{body}</div>"
+
+def document_style(is_markdown: bool, line_height: float) -> str:
+    """渐进渲染时设置为文档的默认样式表，之后追加的块也会套用"""
+    return markdown_style(line_height) if is_markdown else ""
+
+def styled_html(rendered: RenderedPrompt, line_height: float) -> str:
+    """给转换后的正文套用样式，得到描述区域的完整 HTML"""
+    if rendered.is_markdown:
+        return f"<style>{markdown_style(line_height)}</style><div class=\"md-content\">{rendered.body}</div>"
+    return f"<div style=\"{text_style(line_height)}\">{rendered.body}</div>"
+
+def chunk_html(rendered: RenderedPrompt, index: int, line_height: float) -> str:
+    """渐进渲染时第 index 块的 HTML"""
+    return wrap_body(rendered.chunk_body(index), rendered.is_markdown, line_height)
+
+def render_html(prompt: str, line_height: float) -> Tuple[RenderedPrompt, str]:
+    """渲染提示文本并套用样式"""
+    rendered = render(prompt)
+    return rendered, styled_html(rendered, line_height)
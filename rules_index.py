@@ -0,0 +1,339 @@
+# Rules Index - 规则文件（user_rules.md）的内存索引
+# 将规则文件解析为 章节 -> 问答条目，并建立 规范化词元 -> 条目 的倒排索引；
+# 仅当文件的 mtime 或大小变化时才重新解析。追加日志（rules_journal）中的条目
+# 增量读入，排在规则文件条目之后
+import os
+import re
+import bisect
+import threading
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Set, Tuple
+
+import rules_journal
+from keyword_matcher import KeywordMatcher, RegexMatcher
+
+# 词元：连续的 ASCII 字母数字（整词），或单个非 ASCII 文字字符（中文按字索引）
+TOKEN_RE = re.compile(r"[0-9a-z_]+|[^\W\x00-\x7f]")
+
+SECTION_RE = re.compile(r"^## (?!#)(.*)$")
+ENTRY_RE = re.compile(r"^### (.*)$")
+QUESTION_RE = re.compile(r"\*\*问题[：:]\*\*[ \t]*")
+ANSWER_RE = re.compile(r"\*\*用户回答[：:]\*\*[ \t]*")
+# 分隔线（---）结束当前块，本身不属于任何条目
+RULE_LINE_RE = re.compile(r"^\s*-{3,}\s*$")
+
+def normalize(text: str) -> str:
+    """规范化文本：统一大小写"""
+    return text.casefold()
+
+def tokenize(text: str) -> Set[str]:
+    """把文本切分为规范化词元集合"""
+    return set(TOKEN_RE.findall(normalize(text)))
+
+@dataclass
+class RulesEntry:
+    """规则文件中的一个条目（一个问答，或章节中的一段普通文本）"""
+    entry_id: int
+    section: str
+    heading: str          # 所在 ### 标题（通常是保存时间），可能为空
+    text: str             # 条目原文
+    question: Optional[str] = None
+    answer: Optional[str] = None
+    norm_text: str = field(default="", repr=False)
+
+def _make_entry(entries: List[RulesEntry], section: str, heading: str, lines: List[str], id_base: int = 0):
+    text = "\n".join(lines).strip()
+    if not text:
+        return
+    question = None
+    answer = None
+    answer_match = ANSWER_RE.search(text)
+    if answer_match:
+        # 回答可以是多行，取到条目末尾
+        answer = text[answer_match.end():].strip() or None
+    question_match = QUESTION_RE.match(text)
+    if question_match:
+        question_end = answer_match.start() if answer_match else len(text)
+        question = text[question_match.end():question_end].strip() or None
+    entries.append(RulesEntry(
+        entry_id=id_base + len(entries),
+        section=section,
+        heading=heading,
+        text=text,
+        question=question,
+        answer=answer,
+        norm_text=normalize(text),
+    ))
+
+def parse_rules(content: str, section: str = "", id_base: int = 0) -> List[RulesEntry]:
+    """
+    把规则文件内容解析为条目列表（按文件顺序），条目 ID 从 id_base 开始
+    ## 开始新章节，### 开始新块，--- 结束当前块，块内每个 **问题：** 开始一个新的问答条目
+    """
+    entries: List[RulesEntry] = []
+    heading = ""
+    lines: List[str] = []
+
+    for line in content.split("\n"):
+        # 先用首字符过滤，绝大多数行无需做正则匹配
+        first = line[:1]
+        if first == "#":
+            section_match = SECTION_RE.match(line)
+            entry_match = ENTRY_RE.match(line) if not section_match else None
+            if section_match or entry_match:
+                _make_entry(entries, section, heading, lines, id_base)
+                lines = []
+                if section_match:
+                    section = section_match.group(1).strip()
+                    heading = ""
+                else:
+                    heading = entry_match.group(1).strip()
+                continue
+        elif first in ("-", " ", "\t") and RULE_LINE_RE.match(line):
+            _make_entry(entries, section, heading, lines, id_base)
+            lines = []
+            continue
+        elif first == "*" and lines and QUESTION_RE.match(line) and any(l.strip() for l in lines):
+            _make_entry(entries, section, heading, lines, id_base)
+            lines = []
+        lines.append(line)
+    _make_entry(entries, section, heading, lines, id_base)
+    return entries
+
+def _index_entries(entries: List[RulesEntry], postings: Dict[str, List[int]], new_entries: List[RulesEntry]):
+    """
+    追加条目并更新倒排表（条目 ID 连续递增，倒排表保持升序）
+    先扩展条目列表再写倒排表，保证并发查询取到的 ID 总是有效
+    """
+    entries.extend(new_entries)
+    findall = TOKEN_RE.findall
+    for entry in new_entries:
+        entry_id = entry.entry_id
+        for token in set(findall(entry.norm_text)):
+            posting = postings.get(token)
+            if posting is None:
+                postings[token] = [entry_id]
+            else:
+                posting.append(entry_id)
+
+class _Vocabulary:
+    """
+    倒排表中 ASCII 词元的子串查找：关键词里的英文词可能只是条目中某个词的一部分（sync 之于 audience_sync），
+    把全部 ASCII 词元拼成一个字符串后用 str.find 定位包含它的词元，结果按关键词词元缓存
+    """
+
+    def __init__(self, postings: Dict[str, List[int]], generation: int):
+        self.postings = postings
+        self.generation = generation
+        # list() 一次性取出键，不受并发的增量写入影响
+        self.keys = [key for key in list(postings) if key.isascii()]
+        self.starts: List[int] = []
+        position = 1
+        for key in self.keys:
+            self.starts.append(position)
+            position += len(key) + 1
+        self.text = "\n" + "\n".join(self.keys) + "\n"
+        self.expansions: Dict[str, List[int]] = {}
+
+    def postings_containing(self, token: str) -> List[int]:
+        """包含 token 的所有词元的倒排表的并集（升序）"""
+        posting = self.expansions.get(token)
+        if posting is not None:
+            return posting
+        keys = []
+        position = self.text.find(token)
+        while position != -1:
+            slot = bisect.bisect_right(self.starts, position) - 1
+            keys.append(self.keys[slot])
+            # 同一个词元只记一次，从下一个词元开始继续查找
+            next_start = self.starts[slot + 1] if slot + 1 < len(self.starts) else len(self.text)
+            position = self.text.find(token, next_start)
+        if len(keys) == 1:
+            posting = self.postings[keys[0]]
+        else:
+            posting = sorted(set().union(*(self.postings[key] for key in keys)))
+        self.expansions[token] = posting
+        return posting
+
+class RulesIndex:
+    """单个规则文件的倒排索引，文件 mtime/大小变化时自动重建"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.entries: List[RulesEntry] = []
+        self.postings: Dict[str, List[int]] = {}
+        self._signature: Optional[Tuple[int, int]] = None
+        self._journal_offset = 0
+        self._vocabulary: Optional[_Vocabulary] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def _file_signature(self) -> Tuple[int, int]:
+        stat = os.stat(self.file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def _journal_size(self) -> int:
+        try:
+            return os.stat(rules_journal.journal_path(self.file_path)).st_size
+        except FileNotFoundError:
+            return 0
+
+    def refresh(self) -> bool:
+        """
+        规则文件变化（或日志被压缩截断）时重建索引；仅日志增长时只读入新增记录
+        返回是否发生了变化
+        """
+        if self._file_signature() == self._signature and self._journal_size() == self._journal_offset:
+            return False
+        with self._lock:
+            # 持有读锁读取规则文件与日志：压缩先替换规则文件再截断日志，两者之间读到的记录会被重复索引
+            with rules_journal.rules_lock(self.file_path, shared=True):
+                signature = self._file_signature()
+                journal_size = self._journal_size()
+                if signature == self._signature and journal_size == self._journal_offset:
+                    return False
+                rebuild = signature != self._signature or journal_size < self._journal_offset
+                content = None
+                if rebuild:
+                    with open(self.file_path, 'r', encoding='utf-8') as f:
+                        content = f.read()
+                records, offset = rules_journal.read_records(self.file_path, 0 if rebuild else self._journal_offset)
+            if rebuild:
+                # 全量重建：先在局部构建，完成后整体替换，避免并发查询看到半成品
+                entries: List[RulesEntry] = []
+                postings: Dict[str, List[int]] = {}
+                _index_entries(entries, postings, parse_rules(content))
+            else:
+                entries, postings = self.entries, self.postings
+            for section, block in records:
+                _index_entries(entries, postings, parse_rules(block, section, len(entries)))
+            self.entries, self.postings = entries, postings
+            # 增量读入日志时倒排表原地更新，用代数让旧的子串缓存失效
+            self._generation += 1
+            self._signature = signature
+            self._journal_offset = offset
+            return True
+
+    def _candidates(self, tokens: Set[str]) -> Optional[List[int]]:
+        """
+        返回候选条目 ID（升序）：取关键词各词元中最短的倒排表，
+        短语校验已隐含其余词元，无需再求交集；词元为空时返回 None 表示需要全量扫描
+        ASCII 词元按子串匹配（可能是条目中更长的词的一部分），取包含它的全部词元的倒排表
+        """
+        if not tokens:
+            return None
+        vocabulary = self._vocabulary
+        generation = self._generation
+        if vocabulary is None or vocabulary.generation != generation:
+            vocabulary = self._vocabulary = _Vocabulary(self.postings, generation)
+        shortest: List[int] = []
+        for token in tokens:
+            posting = vocabulary.postings_containing(token) if token.isascii() else self.postings.get(token)
+            if not posting:
+                return []
+            if not shortest or len(posting) < len(shortest):
+                shortest = posting
+        return shortest
+
+    def lookup(self, keyword: str, regex: bool = False, budget: Optional[float] = None) -> List[RulesEntry]:
+        """查找匹配单个关键词的条目（按文件顺序）"""
+        return self.search([keyword], regex, budget).get(keyword, [])
+
+    def _iter_matches_reversed(self, keyword: str):
+        """从新到旧惰性产出匹配条目，供只需要最新回答的场景提前结束"""
+        entries = self.entries
+        phrase = normalize(keyword)
+        if not phrase:
+            return iter(())
+        candidate_ids = self._candidates(tokenize(keyword))
+        if candidate_ids is None:
+            return (entry for entry in reversed(entries) if phrase in entry.norm_text)
+        return (entries[i] for i in reversed(candidate_ids) if phrase in entries[i].norm_text)
+
+    def latest_answer(self, keywords: List[str], regex: bool = False, budget: Optional[float] = None) -> Optional[str]:
+        """
+        按关键词顺序查找，返回第一个有回答的关键词下最新的用户回答
+        regex=True 时关键词按正则匹配（受时间预算约束，超时抛出 KeywordMatchTimeout）
+        """
+        self.refresh()
+        if regex:
+            entries = self.entries
+            matcher = RegexMatcher(keywords, budget)
+            with matcher.guard():
+                for i in range(len(keywords)):
+                    for entry in reversed(entries):
+                        if entry.answer and matcher.matches(i, entry.text):
+                            return entry.answer
+            return None
+
+        for keyword in keywords:
+            for entry in self._iter_matches_reversed(keyword):
+                if entry.answer:
+                    return entry.answer
+        return None
+
+    def search(self, keywords: List[str], regex: bool = False, budget: Optional[float] = None) -> Dict[str, List[RulesEntry]]:
+        """
+        按关键词查找，返回 关键词 -> 匹配条目 列表（按文件顺序，无匹配的关键词不出现）
+        字面量模式（默认）：合并各关键词在倒排表中的候选条目，再对每个候选条目
+        用多关键词匹配器扫描一次，得到其中出现的全部关键词；
+        正则模式：对每个条目逐个关键词做正则匹配，受时间预算约束
+        """
+        self.refresh()
+        entries = self.entries
+        if regex:
+            matcher = RegexMatcher(keywords, budget)
+            candidate_ids = range(len(entries))
+            text_of = lambda entry: entry.text
+        else:
+            matcher = KeywordMatcher(keywords)
+            candidate_ids = self._union_candidates(keywords, len(entries))
+            text_of = lambda entry: entry.norm_text
+
+        matched: Dict[int, List[RulesEntry]] = {}
+        with matcher.guard() if regex else nullcontext():
+            for entry_id in candidate_ids:
+                entry = entries[entry_id]
+                for i in matcher.find_all(text_of(entry)):
+                    matched.setdefault(i, []).append(entry)
+
+        results = {}
+        for i, keyword in enumerate(keywords):
+            if i in matched and keyword not in results:
+                results[keyword] = matched[i]
+        return results
+
+    def _union_candidates(self, keywords: List[str], entry_count: int):
+        """各关键词候选条目的并集（升序）；任何关键词无法用倒排表定位时返回全部条目"""
+        union: Set[int] = set()
+        for keyword in keywords:
+            if not normalize(keyword):
+                continue
+            candidate_ids = self._candidates(tokenize(keyword))
+            if candidate_ids is None:
+                return range(entry_count)
+            union.update(candidate_ids)
+        return sorted(union)
+
+_indexes: Dict[str, RulesIndex] = {}
+_indexes_lock = threading.Lock()
+
+def get_index(file_path: str) -> RulesIndex:
+    """获取（或创建）规则文件对应的进程内索引"""
+    key = os.path.abspath(file_path)
+    with _indexes_lock:
+        index = _indexes.get(key)
+        if index is None:
+            index = _indexes[key] = RulesIndex(key)
+    return index
+
+def find_answer(search_results: Dict[str, List[RulesEntry]]) -> Optional[str]:
+    """按关键词顺序，从匹配条目中取最新（文件中最靠后）的用户回答"""
+    for keyword, entries in search_results.items():
+        if not isinstance(entries, list):
+            continue
+        for entry in reversed(entries):
+            if entry.answer:
+                return entry.answer
+    return None
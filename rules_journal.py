@@ -0,0 +1,189 @@
+# Rules Journal - 规则文件的追加日志
+# 新的问答条目以单次 O_APPEND 写入 <规则文件>.journal，不再每次重写整个规则文件；
+# 压缩（compact）时再把日志按章节合并回规则文件。读取方通过 rules_index 同时看到规则文件与日志
+import os
+import re
+import argparse
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from file_lock import file_lock
+
+# 每条日志记录的头部：章节名 + 正文字节数，正文不完整（写入中）的记录会被读取方跳过
+RECORD_HEADER_RE = re.compile(rb"<!-- rules-journal section: (.*?) length: (\d+) -->\n")
+
+# 日志超过该大小时，追加后在后台自动压缩
+COMPACT_THRESHOLD_ENV = "INTERACTIVE_FEEDBACK_RULES_COMPACT_BYTES"
+DEFAULT_COMPACT_THRESHOLD = 256 * 1024
+
+def journal_path(rules_path: str) -> str:
+    """规则文件对应的日志路径"""
+    return rules_path + ".journal"
+
+def lock_path(rules_path: str) -> str:
+    """规则文件对应的锁文件路径"""
+    return rules_path + ".lock"
+
+def rules_lock(rules_path: str, shared: bool = False):
+    """
+    规则文件的跨进程建议锁（追加、压缩、整体重写互斥）
+    shared=True 为读锁：同时读取规则文件与日志时使用，避免读到压缩进行到一半的状态（Windows 上退化为互斥锁）
+    """
+    return file_lock(lock_path(rules_path), shared)
+
+def format_block(content: str, timestamp: Optional[str] = None) -> str:
+    """生成追加到章节中的条目块"""
+    if timestamp is None:
+        timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    return f"\n### {timestamp}\n{content}\n"
+
+def encode_record(section: str, block: str) -> bytes:
+    """编码一条日志记录"""
+    section = section.replace("\n", " ").replace("-->", "")
+    body = block.encode("utf-8")
+    header = f"<!-- rules-journal section: {section} length: {len(body)} -->\n".encode("utf-8")
+    return header + body
+
+def append_entry(rules_path: str, section: str, content: str) -> int:
+    """以单次 O_APPEND 写入追加一条记录，返回写入后的日志大小"""
+    record = encode_record(section, format_block(content))
+    with rules_lock(rules_path):
+        fd = os.open(journal_path(rules_path), os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, record)
+            return os.fstat(fd).st_size
+        finally:
+            os.close(fd)
+
+def read_records(rules_path: str, offset: int = 0) -> Tuple[List[Tuple[str, str]], int]:
+    """
+    从 offset 开始读取完整的日志记录
+    返回 ([(章节, 条目块), ...], 下一次读取的 offset)
+    """
+    try:
+        with open(journal_path(rules_path), 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+    except FileNotFoundError:
+        return [], 0
+
+    records = []
+    pos = 0
+    while pos < len(data):
+        match = RECORD_HEADER_RE.match(data, pos)
+        if not match:
+            break
+        body_start = match.end()
+        body_end = body_start + int(match.group(2))
+        if body_end > len(data):
+            # 记录尚未写完
+            break
+        records.append((match.group(1).decode("utf-8"), data[body_start:body_end].decode("utf-8")))
+        pos = body_end
+    return records, offset + pos
+
+def splice_blocks(content: str, section: str, blocks: str) -> str:
+    """把条目块插入到规则文件内容中指定章节的末尾（下一个 ## 之前），章节不存在时新建"""
+    section_marker = f"## {section}"
+
+    # 如果指定部分不存在，添加它
+    if section_marker not in content:
+        content += f"\n{section_marker}\n"
+
+    section_index = content.rfind(section_marker)
+    # 找到该部分结束的位置（下一个##或文件结尾）
+    next_section = content.find("\n## ", section_index + len(section_marker))
+    if next_section == -1:
+        # 没有下一个部分，追加到文件末尾
+        return content + blocks
+    # 插入到下一个部分之前
+    return content[:next_section] + blocks + content[next_section:]
+
+def fold_records(content: str, records: List[Tuple[str, str]]) -> str:
+    """把日志记录按章节合并进规则文件内容（每个章节只拼接一次）"""
+    grouped: Dict[str, List[str]] = {}
+    for section, block in records:
+        grouped.setdefault(section, []).append(block)
+    for section, blocks in grouped.items():
+        content = splice_blocks(content, section, "".join(blocks))
+    return content
+
+def read_merged(rules_path: str, lock: bool = True) -> str:
+    """
+    读取规则文件并合并尚未压缩的日志，得到与压缩后一致的内容
+    压缩先替换规则文件再截断日志，所以默认持有读锁读取，否则可能把同一批记录合并两次；
+    调用方已持有锁时传 lock=False
+    """
+    with rules_lock(rules_path, shared=True) if lock else nullcontext():
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+        records, _ = read_records(rules_path)
+    return fold_records(content, records) if records else content
+
+def compact(rules_path: str) -> int:
+    """把日志合并回规则文件并清空日志，返回合并的记录数"""
+    with rules_lock(rules_path):
+        records, end = read_records(rules_path)
+        if not records:
+            return 0
+
+        with open(rules_path, 'r', encoding='utf-8') as f:
+            content = f.read()
+
+        content = fold_records(content, records)
+
+        tmp_path = f"{rules_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, rules_path)
+
+        # 持有锁期间不会有新的追加，可以安全截断（保留未写完的尾部）
+        with open(journal_path(rules_path), 'r+b') as f:
+            f.seek(end)
+            tail = f.read()
+            f.seek(0)
+            f.write(tail)
+            f.truncate()
+        return len(records)
+
+_compacting = set()
+_compacting_lock = threading.Lock()
+
+def compact_threshold() -> int:
+    """自动压缩阈值（字节）"""
+    try:
+        return int(os.environ.get(COMPACT_THRESHOLD_ENV, DEFAULT_COMPACT_THRESHOLD))
+    except ValueError:
+        return DEFAULT_COMPACT_THRESHOLD
+
+def compact_in_background(rules_path: str):
+    """在后台线程中压缩（同一文件同时只运行一个）"""
+    with _compacting_lock:
+        if rules_path in _compacting:
+            return
+        _compacting.add(rules_path)
+
+    def run():
+        try:
+            compact(rules_path)
+        except Exception:
+            pass
+        finally:
+            with _compacting_lock:
+                _compacting.discard(rules_path)
+
+    threading.Thread(target=run, daemon=True).start()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="规则文件日志工具")
+    parser.add_argument("command", choices=["compact", "status"], help="compact: 合并日志到规则文件；status: 查看日志状态")
+    parser.add_argument("rules_file", help="规则文件路径")
+    args = parser.parse_args()
+
+    if args.command == "compact":
+        print(f"已合并 {compact(args.rules_file)} 条记录")
+    else:
+        records, end = read_records(args.rules_file)
+        print(f"日志记录: {len(records)} 条, {end} 字节")
@@ -0,0 +1,239 @@
+# Rules Similarity - 已保存问题的本地相似度索引
+# 问题文本切分为字符 n-gram（中文）与整词 + 词内三元组（英文/数字），按 TF-IDF 加权后用余弦相似度比较；
+# 纯 NumPy 实现，不依赖网络模型。新条目只追加到特征数组末尾，在下一次查询时计算权重
+import os
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+import rules_index
+
+SIMILARITY_THRESHOLD_ENV = "INTERACTIVE_FEEDBACK_SIMILARITY_THRESHOLD"
+# 默认阈值较高：只复用几乎是同一个问题的换一种说法（含数字的 ID 另外要求完全一致）
+DEFAULT_SIMILARITY_THRESHOLD = 0.8
+
+@dataclass
+class SimilarMatch:
+    """相似问题的匹配结果"""
+    score: float
+    question: str
+    answer: str
+
+def similarity_threshold(value: Optional[float] = None) -> Optional[float]:
+    """
+    解析相似度阈值：显式传入的值优先，其次是环境变量，最后是默认值
+    阈值 <= 0 或 > 1（例如环境变量设为 off）表示关闭相似度复用，返回 None
+    """
+    if value is None:
+        raw = os.environ.get(SIMILARITY_THRESHOLD_ENV, "").strip().lower()
+        if raw in ("off", "none", "false"):
+            return None
+        try:
+            value = float(raw) if raw else DEFAULT_SIMILARITY_THRESHOLD
+        except ValueError:
+            value = DEFAULT_SIMILARITY_THRESHOLD
+    if value <= 0 or value > 1:
+        return None
+    return value
+
+def features(text: str) -> Counter:
+    """
+    文本特征：连续中文按单字 + 相邻二元组，英文/数字按整词 + 词内三元组
+    （三元组让 deploy/deployment、config/configs 这类变形也能部分匹配）
+    """
+    counts: Counter = Counter()
+    previous_char = None
+    for token in rules_index.TOKEN_RE.findall(rules_index.normalize(text)):
+        if len(token) == 1 and not token.isascii():
+            counts[token] += 1
+            if previous_char is not None:
+                counts[previous_char + token] += 1
+            previous_char = token
+            continue
+        previous_char = None
+        counts["w:" + token] += 1
+        padded = f"#{token}#"
+        for i in range(len(padded) - 2):
+            counts["g:" + padded[i:i + 3]] += 1
+    return counts
+
+def identifiers(text: str) -> frozenset:
+    """含数字的词元（ID、版本号等），这些必须完全一致才算同一个问题"""
+    return frozenset(token for token in rules_index.TOKEN_RE.findall(rules_index.normalize(text))
+                     if token.isascii() and any(ch.isdigit() for ch in token))
+
+# 在得分最高的若干个候选中挑选 ID 一致的条目
+CANDIDATE_COUNT = 8
+
+# 文档数增长超过该比例时全量重算 IDF
+REFIT_RATIO = 1.1
+
+class SimilarityIndex:
+    """
+    TF-IDF 余弦相似度索引
+    文档以 CSR 形式存放：所有文档的特征 ID / 词频首尾相接，_starts 记录每个文档的起点
+    """
+
+    def __init__(self):
+        self.vocab: Dict[str, int] = {}
+        self.payloads: List[SimilarMatch] = []
+        self._df: List[int] = []
+        self._pending_features: List[int] = []
+        self._pending_tf: List[float] = []
+        self._pending_lengths: List[int] = []
+        self._features = np.zeros(0, dtype=np.int32)
+        self._tf = np.zeros(0, dtype=np.float32)
+        self._lengths = np.zeros(0, dtype=np.int64)
+        self._weights: Optional[np.ndarray] = None
+        self._starts: Optional[np.ndarray] = None
+        self._idf: Optional[np.ndarray] = None
+        self._fitted_count = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.payloads)
+
+    def add(self, question: str, answer: str):
+        """加入一个已保存的问答（没有可用特征的问题忽略）"""
+        counts = features(question)
+        if not counts:
+            return
+        with self._lock:
+            for feature, tf in counts.items():
+                feature_id = self.vocab.get(feature)
+                if feature_id is None:
+                    feature_id = self.vocab[feature] = len(self.vocab)
+                    self._df.append(0)
+                self._df[feature_id] += 1
+                self._pending_features.append(feature_id)
+                # 次线性词频，避免重复词主导
+                self._pending_tf.append(1.0 + math.log(tf))
+            self._pending_lengths.append(len(counts))
+            self.payloads.append(SimilarMatch(score=0.0, question=question, answer=answer))
+
+    def _idf_for(self, df: np.ndarray, doc_count: int) -> np.ndarray:
+        return np.log((1.0 + doc_count) / (1.0 + df)) + 1.0
+
+    def _finalize(self):
+        """
+        合并新增文档并计算其归一化权重
+        文档数比上次全量计算增长超过 REFIT_RATIO 时重算全部 IDF；否则沿用旧 IDF，
+        只给新文档（及新特征）计算权重，避免每次保存回答后都做一次全量计算
+        """
+        new_features = np.asarray(self._pending_features, dtype=np.int32)
+        new_tf = np.asarray(self._pending_tf, dtype=np.float32)
+        new_lengths = np.asarray(self._pending_lengths, dtype=np.int64)
+        self._pending_features, self._pending_tf, self._pending_lengths = [], [], []
+
+        self._features = np.concatenate([self._features, new_features])
+        self._tf = np.concatenate([self._tf, new_tf])
+        self._lengths = np.concatenate([self._lengths, new_lengths])
+        doc_count = len(self._lengths)
+        df = np.asarray(self._df, dtype=np.float32)
+
+        if self._weights is None or doc_count > self._fitted_count * REFIT_RATIO:
+            self._idf = self._idf_for(df, doc_count)
+            self._fitted_count = doc_count
+            features, tf, lengths = self._features, self._tf, self._lengths
+        else:
+            # 新出现的特征补上 IDF，已有特征的 IDF 保持不变
+            if len(df) > len(self._idf):
+                self._idf = np.concatenate([self._idf, self._idf_for(df[len(self._idf):], doc_count)])
+            features, tf, lengths = new_features, new_tf, new_lengths
+
+        weights = tf * self._idf[features]
+        starts = np.zeros(len(lengths), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=starts[1:])
+        norms = np.sqrt(np.add.reduceat(weights * weights, starts))
+        weights /= np.repeat(norms, lengths)
+
+        if features is self._features:
+            self._weights, self._starts = weights, starts
+        else:
+            self._starts = np.concatenate([self._starts, starts + len(self._weights)])
+            self._weights = np.concatenate([self._weights, weights])
+
+    def query(self, text: str) -> Optional[SimilarMatch]:
+        """
+        返回与 text 余弦相似度最高、且含数字的词元完全一致的已保存问答（同分取最新）
+        索引为空或没有符合条件的条目时返回 None
+        """
+        counts = features(text)
+        if not counts:
+            return None
+        with self._lock:
+            if not self.payloads:
+                return None
+            if self._pending_lengths:
+                self._finalize()
+
+            # 查询向量：未出现过的特征同样参与归一化（df=0 时的 IDF）
+            unseen_idf = math.log(1.0 + self._fitted_count) + 1.0
+            query = np.zeros(len(self.vocab), dtype=np.float32)
+            norm = 0.0
+            for feature, tf in counts.items():
+                feature_id = self.vocab.get(feature)
+                weight = (1.0 + math.log(tf)) * (self._idf[feature_id] if feature_id is not None else unseen_idf)
+                if feature_id is not None:
+                    query[feature_id] = weight
+                norm += weight * weight
+            if not query.any():
+                return None
+            query /= math.sqrt(norm)
+
+            scores = np.add.reduceat(query[self._features] * self._weights, self._starts)
+            count = min(CANDIDATE_COUNT, len(scores))
+            candidates = np.argpartition(-scores, count - 1)[:count]
+            # 按得分从高到低、同分时从新到旧
+            candidates = sorted(candidates.tolist(), key=lambda i: (-scores[i], -i))
+            wanted = identifiers(text)
+            for i in candidates:
+                if scores[i] <= 0:
+                    break
+                payload = self.payloads[i]
+                if identifiers(payload.question) == wanted:
+                    return SimilarMatch(score=float(scores[i]), question=payload.question, answer=payload.answer)
+            return None
+
+class EntrySimilarity:
+    """跟随一个 RulesIndex：每次查询前把新增的问答条目加入相似度索引，规则文件重建时整体重建"""
+
+    def __init__(self, index: rules_index.RulesIndex):
+        self.index = index
+        self.similarity = SimilarityIndex()
+        self._entries = None
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def sync(self):
+        self.index.refresh()
+        with self._lock:
+            entries = self.index.entries
+            if entries is not self._entries:
+                # 规则文件被重建（或压缩），条目 ID 已变化
+                self.similarity = SimilarityIndex()
+                self._entries = entries
+                self._count = 0
+            for entry in entries[self._count:]:
+                if entry.question and entry.answer:
+                    self.similarity.add(entry.question, entry.answer)
+            self._count = len(entries)
+
+    def query(self, text: str) -> Optional[SimilarMatch]:
+        self.sync()
+        return self.similarity.query(text)
+
+_entry_similarities: Dict[str, EntrySimilarity] = {}
+_entry_similarities_lock = threading.Lock()
+
+def for_index(index: rules_index.RulesIndex) -> EntrySimilarity:
+    """获取（或创建）规则索引对应的相似度索引"""
+    with _entry_similarities_lock:
+        similarity = _entry_similarities.get(index.file_path)
+        if similarity is None or similarity.index is not index:
+            similarity = _entry_similarities[index.file_path] = EntrySimilarity(index)
+    return similarity
@@ -0,0 +1,330 @@
+# Rules Store - 可插拔的规则/回答存储
+# markdown：user_rules.md + 追加日志 + 进程内索引（默认）
+# sqlite：SQLite 数据库，按章节存放问答条目，FTS5 索引问题与回答文本，关键词查询按相关度排序
+# 通过 INTERACTIVE_FEEDBACK_RULES_STORE=sqlite 切换后端
+import os
+import sqlite3
+import argparse
+import threading
+from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional
+
+import rules_index
+import rules_journal
+import rules_similarity
+from keyword_matcher import RegexMatcher
+from rules_index import RulesEntry
+from rules_similarity import SimilarMatch
+
+RULES_STORE_ENV = "INTERACTIVE_FEEDBACK_RULES_STORE"
+RULES_DB_ENV = "INTERACTIVE_FEEDBACK_RULES_DB"
+
+# 设置为 "0" 时关闭追加日志，每次保存都重写整个规则文件
+RULES_JOURNAL_ENV = "INTERACTIVE_FEEDBACK_RULES_JOURNAL"
+
+def backend_name() -> str:
+    """当前选择的存储后端（markdown / sqlite）"""
+    return os.environ.get(RULES_STORE_ENV, "markdown").strip().lower() or "markdown"
+
+class RulesStore(ABC):
+    """规则存储接口（缺少任一方法的后端在创建时就会报错）"""
+
+    @abstractmethod
+    def latest_answer(self, keywords: List[str], regex: bool = False) -> Optional[str]:
+        """
+        返回与关键词最相关的用户回答，没有时返回 None
+        关键词默认按字面量匹配；regex=True 时按正则匹配，超出时间预算抛出 KeywordMatchTimeout
+        """
+
+    @abstractmethod
+    def search(self, keywords: List[str], regex: bool = False) -> Dict[str, List[RulesEntry]]:
+        """按关键词查找，返回 关键词 -> 匹配条目 列表（无匹配的关键词不出现）"""
+
+    @abstractmethod
+    def append(self, content: str, section: str = "确认信息"):
+        """追加一个条目到指定章节"""
+
+    @abstractmethod
+    def similar_answer(self, message: str) -> Optional[SimilarMatch]:
+        """返回与 message 最相似的已保存问题及其回答（附余弦相似度），没有时返回 None"""
+
+# ---------------------------------------------------------------------------
+# Markdown 后端
+# ---------------------------------------------------------------------------
+
+class MarkdownRulesStore(RulesStore):
+    """user_rules.md 后端：写入走追加日志，查找走进程内索引"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def latest_answer(self, keywords: List[str], regex: bool = False) -> Optional[str]:
+        return rules_index.get_index(self.file_path).latest_answer(keywords, regex)
+
+    def search(self, keywords: List[str], regex: bool = False) -> Dict[str, List[RulesEntry]]:
+        return rules_index.get_index(self.file_path).search(keywords, regex)
+
+    def similar_answer(self, message: str) -> Optional[SimilarMatch]:
+        return rules_similarity.for_index(rules_index.get_index(self.file_path)).query(message)
+
+    def append(self, content: str, section: str = "确认信息"):
+        """
+        默认写入追加日志（单次 O_APPEND 写入，加建议锁），日志过大时在后台合并回规则文件；
+        设置 INTERACTIVE_FEEDBACK_RULES_JOURNAL=0 时直接重写规则文件
+        """
+        if os.environ.get(RULES_JOURNAL_ENV, "1") != "0":
+            journal_size = rules_journal.append_entry(self.file_path, section, content)
+            if journal_size > rules_journal.compact_threshold():
+                rules_journal.compact_in_background(self.file_path)
+            return
+
+        # 整体重写模式：在锁内读取、拼接、写回，避免并发写入互相覆盖
+        with rules_journal.rules_lock(self.file_path):
+            current_content = rules_journal.read_merged(self.file_path, lock=False)
+            current_content = rules_journal.splice_blocks(current_content, section, rules_journal.format_block(content))
+
+            # 写回文件
+            with open(self.file_path, 'w', encoding='utf-8') as f:
+                f.write(current_content)
+
+# ---------------------------------------------------------------------------
+# SQLite FTS5 后端
+# ---------------------------------------------------------------------------
+
+# FTS5 列存放预先切分好的词元（ASCII 整词 + 单个中文字符，以空格分隔），
+# 与 rules_index 的切分规则一致；关键词转换为短语查询，保证中文按连续字符匹配
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    section TEXT NOT NULL,
+    heading TEXT NOT NULL DEFAULT '',
+    text TEXT NOT NULL,
+    question TEXT,
+    answer TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_section ON entries(section, id);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    question_terms, answer_terms, tokenize='unicode61 remove_diacritics 0'
+);
+"""
+
+# 问题命中比回答命中更相关
+QUESTION_WEIGHT = 2.0
+ANSWER_WEIGHT = 1.0
+
+# 只在最新的若干个命中中排序：FTS5 按 rowid 倒序扫描可以提前结束；
+# bm25 需要扫描整条倒排链统计 IDF，高频关键词下会退化到毫秒级，因此不在 SQL 中使用
+RANK_WINDOW = 256
+
+def _terms(text: Optional[str]) -> str:
+    return " ".join(rules_index.TOKEN_RE.findall(rules_index.normalize(text or "")))
+
+def _phrases(keywords: Iterable[str]) -> List[str]:
+    """关键词切分为词元短语（去掉没有可用词元的关键词）"""
+    return [terms for terms in (_terms(keyword) for keyword in keywords) if terms]
+
+def _match_expression(phrases: List[str]) -> str:
+    """FTS5 查询：每个关键词一个短语，多个关键词取 OR"""
+    return " OR ".join(f'"{phrase}"' for phrase in phrases)
+
+def _score(phrases: List[str], question_terms: str, answer_terms: str) -> float:
+    """相关度：每个命中问题的关键词计 QUESTION_WEIGHT，命中回答的计 ANSWER_WEIGHT"""
+    question_terms = f" {question_terms} "
+    answer_terms = f" {answer_terms} "
+    score = 0.0
+    for phrase in phrases:
+        phrase = f" {phrase} "
+        if phrase in question_terms:
+            score += QUESTION_WEIGHT
+        if phrase in answer_terms:
+            score += ANSWER_WEIGHT
+    return score
+
+class SqliteRulesStore(RulesStore):
+    """SQLite 后端：条目按章节存放，问题/回答建立 FTS5 全文索引"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        # 同一连接在事件循环线程和后台线程之间共享，用锁串行化
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        # 相似度索引随查询增量读入 id 更大的新问答
+        self._similarity = rules_similarity.SimilarityIndex()
+        self._similarity_last_id = 0
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript(SCHEMA)
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def _insert(self, entries: Iterable[RulesEntry]) -> int:
+        count = 0
+        with self._lock, self._conn:
+            for entry in entries:
+                cursor = self._conn.execute(
+                    "INSERT INTO entries (section, heading, text, question, answer) VALUES (?, ?, ?, ?, ?)",
+                    (entry.section, entry.heading, entry.text, entry.question, entry.answer),
+                )
+                # 普通文本条目（没有问答标记）整体作为问题文本索引
+                question = entry.question if entry.question is not None or entry.answer is not None else entry.text
+                self._conn.execute(
+                    "INSERT INTO entries_fts (rowid, question_terms, answer_terms) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, _terms(question), _terms(entry.answer)),
+                )
+                count += 1
+        return count
+
+    def append(self, content: str, section: str = "确认信息"):
+        self._insert(rules_index.parse_rules(rules_journal.format_block(content), section))
+
+    def latest_answer(self, keywords: List[str], regex: bool = False) -> Optional[str]:
+        """
+        所有关键词合成一个 FTS5 查询，在最新的 RANK_WINDOW 个有回答的命中中
+        按命中的关键词数量与位置（问题优先于回答）排序，同分取最新
+        正则模式无法使用全文索引，从新到旧扫描有回答的条目，返回第一个匹配的
+        """
+        if regex:
+            return self._latest_answer_regex(keywords)
+        phrases = _phrases(keywords)
+        if not phrases:
+            return None
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT rowid, question_terms, answer_terms FROM entries_fts "
+                "WHERE entries_fts MATCH ? AND answer_terms != '' ORDER BY rowid DESC LIMIT ?",
+                (_match_expression(phrases), RANK_WINDOW),
+            ).fetchall()
+            if not rows:
+                return None
+            # rows 按从新到旧排列，max 在同分时保留第一个（最新的）
+            best = max(rows, key=lambda row: _score(phrases, row[1], row[2]))
+            row = self._conn.execute("SELECT answer FROM entries WHERE id = ?", (best[0],)).fetchone()
+        return row[0] if row else None
+
+    def similar_answer(self, message: str) -> Optional[SimilarMatch]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT id, question, answer FROM entries "
+                "WHERE id > ? AND question IS NOT NULL AND answer IS NOT NULL ORDER BY id",
+                (self._similarity_last_id,),
+            ).fetchall()
+            for entry_id, question, answer in rows:
+                self._similarity.add(question, answer)
+                self._similarity_last_id = entry_id
+        return self._similarity.query(message)
+
+    def _latest_answer_regex(self, keywords: List[str]) -> Optional[str]:
+        matcher = RegexMatcher(keywords)
+        with self._lock, matcher.guard():
+            cursor = self._conn.execute("SELECT text, answer FROM entries WHERE answer IS NOT NULL ORDER BY id DESC")
+            for text, answer in cursor:
+                if matcher.find_all(text):
+                    return answer
+        return None
+
+    def search(self, keywords: List[str], regex: bool = False) -> Dict[str, List[RulesEntry]]:
+        if regex:
+            return self._search_regex(keywords)
+        results = {}
+        for keyword in keywords:
+            phrases = _phrases([keyword])
+            if not phrases:
+                continue
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT e.id, e.section, e.heading, e.text, e.question, e.answer "
+                    "FROM entries_fts JOIN entries e ON e.id = entries_fts.rowid "
+                    "WHERE entries_fts MATCH ? ORDER BY e.id",
+                    (_match_expression(phrases),),
+                ).fetchall()
+            if rows:
+                results[keyword] = [
+                    RulesEntry(entry_id=row[0], section=row[1], heading=row[2], text=row[3],
+                               question=row[4], answer=row[5], norm_text=rules_index.normalize(row[3]))
+                    for row in rows
+                ]
+        return results
+
+    def _search_regex(self, keywords: List[str]) -> Dict[str, List[RulesEntry]]:
+        matcher = RegexMatcher(keywords)
+        results: Dict[str, List[RulesEntry]] = {}
+        with self._lock, matcher.guard():
+            cursor = self._conn.execute("SELECT id, section, heading, text, question, answer FROM entries ORDER BY id")
+            for row in cursor:
+                for i in matcher.find_all(row[3]):
+                    results.setdefault(keywords[i], []).append(
+                        RulesEntry(entry_id=row[0], section=row[1], heading=row[2], text=row[3],
+                                   question=row[4], answer=row[5], norm_text=rules_index.normalize(row[3])))
+        return results
+
+    def import_markdown(self, markdown_path: str) -> int:
+        """从 user_rules.md 格式（含未合并的追加日志）导入条目，返回导入条数"""
+        return self._insert(rules_index.parse_rules(rules_journal.read_merged(markdown_path)))
+
+    def export_markdown(self) -> str:
+        """导出为 user_rules.md 格式：章节按首次出现顺序，条目按写入顺序"""
+        with self._lock:
+            rows = self._conn.execute("SELECT section, heading, text FROM entries ORDER BY id").fetchall()
+        sections: Dict[str, List[str]] = {}
+        for section, heading, text in rows:
+            block = f"### {heading}\n{text}\n" if heading else f"{text}\n"
+            sections.setdefault(section, []).append(block)
+
+        parts = []
+        for section, blocks in sections.items():
+            if section:
+                parts.append(f"## {section}\n")
+            parts.append("\n".join(blocks))
+        return "\n".join(parts)
+
+_sqlite_stores: Dict[str, SqliteRulesStore] = {}
+_sqlite_stores_lock = threading.Lock()
+
+def get_sqlite_store(db_path: str, seed_markdown: Optional[str] = None) -> SqliteRulesStore:
+    """
+    获取（或打开）数据库对应的进程内存储
+    数据库为空且提供了 seed_markdown 时，先从该规则文件导入
+    """
+    key = os.path.abspath(db_path)
+    with _sqlite_stores_lock:
+        store = _sqlite_stores.get(key)
+        if store is None:
+            store = _sqlite_stores[key] = SqliteRulesStore(key)
+            if seed_markdown and os.path.exists(seed_markdown) and store.count() == 0:
+                store.import_markdown(seed_markdown)
+    return store
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="规则存储工具")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p = subparsers.add_parser("import", help="从 user_rules.md 导入到 SQLite")
+    p.add_argument("markdown", help="规则文件路径")
+    p.add_argument("db", help="数据库路径")
+
+    p = subparsers.add_parser("export", help="把 SQLite 导出为 user_rules.md 格式")
+    p.add_argument("db", help="数据库路径")
+    p.add_argument("markdown", help="输出文件路径")
+
+    p = subparsers.add_parser("search", help="在 SQLite 中查找最佳回答")
+    p.add_argument("db", help="数据库路径")
+    p.add_argument("keywords", nargs="+", help="关键词")
+
+    args = parser.parse_args()
+    store = SqliteRulesStore(args.db)
+    if args.command == "import":
+        print(f"已导入 {store.import_markdown(args.markdown)} 条记录")
+    elif args.command == "export":
+        with open(args.markdown, 'w', encoding='utf-8') as f:
+            f.write(store.export_markdown())
+        print(f"已导出 {store.count()} 条记录")
+    else:
+        print(store.latest_answer(args.keywords))
+    store.close()
@@ -3,24 +3,37 @@
 # Inspired by/related to dotcursorrules.com (https://dotcursorrules.com/)
 # Enhanced by Pau Oliva (https://x.com/pof) with ideas from https://github.com/ttommyth/interactive-mcp
 import os
-import sys
 import json
-import tempfile
-import subprocess
-import base64
-import re
+import asyncio
+import time
 from datetime import datetime
 from typing import Annotated, Dict, Tuple, List, Optional
 
 from fastmcp import FastMCP, Image
 from pydantic import Field
 
+import rules_index
+import rules_journal
+import rules_similarity
+import rules_store
+import ui_daemon
+import ui_launcher
+import ui_protocol
+import confirmation_tickets
+import latency_metrics
+
 # The log_level is necessary for Cline to work: https://github.com/jlowin/fastmcp/issues/81
 mcp = FastMCP("Interactive Feedback MCP", log_level="ERROR")
 
+# Confirmation tickets issued in ticket mode (answers are fetched with get_confirmation_result)
+tickets = confirmation_tickets.TicketStore()
+
 # 默认规则文件路径
 DEFAULT_RULES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_rules.md")
 
+# SQLite 后端（INTERACTIVE_FEEDBACK_RULES_STORE=sqlite）的默认数据库路径
+DEFAULT_RULES_DB = os.path.join(os.path.dirname(os.path.abspath(__file__)), "user_rules.db")
+
 def ensure_rules_file(file_path: str = None) -> str:
     """确保规则文件存在，如果不存在则创建"""
     if file_path is None:
@@ -45,146 +58,100 @@ def ensure_rules_file(file_path: str = None) -> str:
     return file_path
 
 def read_rules_file(file_path: str = None) -> str:
-    """读取规则文件内容"""
+    """读取规则文件内容（包含尚未压缩进文件的追加日志）"""
     file_path = ensure_rules_file(file_path)
-    with open(file_path, 'r', encoding='utf-8') as f:
-        return f.read()
+    return rules_journal.read_merged(file_path)
 
-def search_in_rules(keywords: List[str], file_path: str = None) -> dict:
+def search_in_rules(keywords: List[str], file_path: str = None, regex: bool = False) -> dict:
     """
     在规则文件中搜索相关信息
-    返回包含匹配内容的字典，如果没有找到返回空字典
+    返回 关键词 -> 匹配条目列表 的字典，如果没有找到返回空字典
+    使用进程内索引，仅在规则文件 mtime/大小变化时重新解析；
+    关键词默认按字面量一次扫描匹配，regex=True 时按正则匹配（有时间预算）
     """
     try:
-        content = read_rules_file(file_path)
-        results = {}
-        
-        for keyword in keywords:
-            # 简单的关键词搜索
-            pattern = re.compile(keyword, re.IGNORECASE)
-            matches = pattern.findall(content)
-            if matches:
-                # 找到包含该关键词的章节或段落
-                lines = content.split('\n')
-                context_lines = []
-                for i, line in enumerate(lines):
-                    if pattern.search(line):
-                        # 收集上下文（前后各3行）
-                        start = max(0, i - 3)
-                        end = min(len(lines), i + 4)
-                        context_lines.extend(lines[start:end])
-                
-                if context_lines:
-                    results[keyword] = '\n'.join(context_lines)
-        
-        return results
+        file_path = ensure_rules_file(file_path)
+        return rules_index.get_index(file_path).search(keywords, regex)
     except Exception as e:
         return {"error": str(e)}
 
 def extract_answer_from_rules(search_results: dict) -> Optional[str]:
     """
     从搜索结果中提取用户回答
-    尝试从规则文件中找到类似"**用户回答：**"的模式
+    直接使用解析好的条目中的"**用户回答：**"，同一关键词取最新的回答
     """
-    for keyword, context in search_results.items():
-        # 查找用户回答模式
-        answer_pattern = re.compile(r'\*\*用户回答[：:]\*\*\s*(.+)', re.IGNORECASE | re.MULTILINE)
-        match = answer_pattern.search(context)
-        if match:
-            answer = match.group(1).strip()
-            if answer:
-                return answer
-    return None
+    return rules_index.find_answer(search_results)
+
+def lookup_answer_in_rules(keywords: List[str], file_path: str = None, regex: bool = False) -> Optional[str]:
+    """
+    直接在索引中查找关键词对应的最新用户回答
+    等价于 extract_answer_from_rules(search_in_rules(keywords))，但找到后立即返回，不收集全部匹配
+    """
+    try:
+        file_path = ensure_rules_file(file_path)
+        return rules_index.get_index(file_path).latest_answer(keywords, regex)
+    except Exception:
+        return None
 
 def append_to_rules_file(content: str, section: str = "确认信息", file_path: str = None) -> str:
-    """追加内容到规则文件的指定部分"""
+    """
+    追加内容到规则文件的指定部分
+    默认写入追加日志（单次 O_APPEND 写入，加建议锁），日志过大时在后台合并回规则文件；
+    设置 INTERACTIVE_FEEDBACK_RULES_JOURNAL=0 时直接重写规则文件
+    """
     file_path = ensure_rules_file(file_path)
-    
-    # 读取现有内容
-    current_content = read_rules_file(file_path)
-    
-    # 生成追加的内容
-    timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-    new_content = f"\n### {timestamp}\n{content}\n"
-    
-    # 如果指定部分不存在，添加它
-    if f"## {section}" not in current_content:
-        current_content += f"\n## {section}\n"
-    
-    # 追加到指定部分
-    if f"## {section}" in current_content:
-        # 在指定部分后面追加
-        section_marker = f"## {section}"
-        section_index = current_content.rfind(section_marker)
-        if section_index != -1:
-            # 找到该部分结束的位置（下一个##或文件结尾）
-            next_section = current_content.find("\n## ", section_index + len(section_marker))
-            if next_section == -1:
-                # 没有下一个部分，追加到文件末尾
-                current_content += new_content
-            else:
-                # 插入到下一个部分之前
-                current_content = current_content[:next_section] + new_content + current_content[next_section:]
-        else:
-            current_content += f"\n## {section}{new_content}"
-    else:
-        current_content += f"\n## {section}{new_content}"
-    
-    # 写回文件
-    with open(file_path, 'w', encoding='utf-8') as f:
-        f.write(current_content)
-    
+    rules_store.MarkdownRulesStore(file_path).append(content, section)
     return file_path
 
-def launch_feedback_ui(summary: str, predefinedOptions: list[str] | None = None) -> dict[str, str]:
-    # Create a temporary file for the feedback result
-    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as tmp:
-        output_file = tmp.name
+def get_rules_store() -> rules_store.RulesStore:
+    """
+    按 INTERACTIVE_FEEDBACK_RULES_STORE 选择规则存储后端
+    sqlite 后端首次创建数据库时自动导入现有的 user_rules.md
+    """
+    if rules_store.backend_name() == "sqlite":
+        db_path = os.environ.get(rules_store.RULES_DB_ENV) or DEFAULT_RULES_DB
+        return rules_store.get_sqlite_store(db_path, seed_markdown=DEFAULT_RULES_FILE)
+    return rules_store.MarkdownRulesStore(ensure_rules_file())
+
+async def launch_feedback_ui(summary: str, predefinedOptions: list[str] | None = None, timeout: Optional[float] = None,
+                             call: Optional[latency_metrics.ToolCall] = None) -> dict[str, str]:
+    # Prefer the pre-warmed UI daemon; fall back to spawning a fresh process.
+    # timeout=None waits for the user indefinitely; otherwise TimeoutError is raised
+    # Phase timings reported by the UI are added to call when given
+    result = await ui_daemon.request_prompt_async("feedback", {
+        "prompt": summary,
+        "predefined_options": predefinedOptions,
+    }, timeout)
+    if result is not None:
+        return ui_daemon.record_window_timing("warm", result, call)
+    # Start the daemon in the background so the next call is warm
+    await asyncio.to_thread(ui_daemon.start_daemon)
+
+    # Get the path to feedback_ui.py relative to this script
+    feedback_ui_path = ui_launcher.ui_script_path("feedback_ui.py")
 
+    # Run feedback_ui.py as a separate process without blocking the event loop;
+    # the result is streamed back over its stdout, so there is no temp file to clean up
+    args = [
+        "--prompt", summary,
+        "--predefined-options", "|||".join(predefinedOptions) if predefinedOptions else "",
+        "--launch-ts", str(time.time())
+    ]
     try:
-        # Get the path to feedback_ui.py relative to this script
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        feedback_ui_path = os.path.join(script_dir, "feedback_ui.py")
-
-        # Run feedback_ui.py as a separate process
-        # NOTE: There appears to be a bug in uv, so we need
-        # to pass a bunch of special flags to make this work
-        args = [
-            sys.executable,
-            "-u",
-            feedback_ui_path,
-            "--prompt", summary,
-            "--output-file", output_file,
-            "--predefined-options", "|||".join(predefinedOptions) if predefinedOptions else ""
-        ]
-        result = subprocess.run(
-            args,
-            check=False,
-            shell=False,
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            stdin=subprocess.DEVNULL,
-            close_fds=True
-        )
-        if result.returncode != 0:
-            raise Exception(f"Failed to launch feedback UI: {result.returncode}")
-
-        # Read the result from the temporary file
-        with open(output_file, 'r') as f:
-            result = json.load(f)
-        os.unlink(output_file)
-        return result
-    except Exception as e:
-        if os.path.exists(output_file):
-            os.unlink(output_file)
-        raise e
+        result = await ui_launcher.run_ui_process(feedback_ui_path, args, timeout)
+    except ui_protocol.UIProtocolError as e:
+        raise Exception(f"Failed to launch feedback UI: {e}")
+    return ui_daemon.record_window_timing("cold", result, call)
 
 @mcp.tool()
-def interactive_feedback(
+async def interactive_feedback(
     message: str = Field(description="The specific question for the user"),
     predefined_options: list = Field(default=None, description="Predefined options for the user to choose from (optional)"),
     search_keywords: Optional[List[str]] = Field(default=None, description="Optional keywords to search in rules file. If found, skip popup and return directly."),
+    search_regex: bool = Field(default=False, description="Treat search_keywords as regular expressions (bounded by a match-time budget) instead of literal text"),
     section: str = Field(default="确认信息", description="Section name in rules file to save the feedback (default: 确认信息)"),
+    similarity_threshold: Optional[float] = Field(default=None, description="Cosine similarity (0-1] above which a stored answer to a similar question is returned without popup. Defaults to INTERACTIVE_FEEDBACK_SIMILARITY_THRESHOLD or 0.8; 0 disables."),
+    ticket: bool = Field(default=False, description="Return a confirmation ticket immediately instead of waiting for the popup; fetch the answer with get_confirmation_result(ticket)"),
 ) -> Tuple[str | Image, ...]:
     """
     Request interactive feedback from the user.
@@ -192,56 +159,119 @@ def interactive_feedback(
     Enhanced version with smart rules file lookup:
     1. If search_keywords provided, first search in rules file
     2. If found, return directly without popup
-    3. If not found or no search_keywords, show popup UI
-    4. After popup, automatically save to rules file
+    3. Otherwise, if a stored question is similar enough to message, return its answer with the score
+    4. If nothing matches, show popup UI
+    5. After popup, automatically save to rules file
+
+    With ticket=true the popup stays open in the background and a ticket is returned at once.
     """
-    # 如果提供了搜索关键词，先搜索规则文件
-    if search_keywords and len(search_keywords) > 0:
-        search_results = search_in_rules(search_keywords)
-        if search_results and "error" not in search_results:
-            # 找到了相关信息，尝试提取用户回答
-            answer = extract_answer_from_rules(search_results)
-            if answer:
-                # 直接返回，跳过弹窗
-                return answer
-    
+    call = latency_metrics.ToolCall("interactive_feedback")
+    with call.phase("rules_lookup"):
+        # 索引重建、SQLite 首次导入、TF-IDF 重新拟合都可能较慢，放到线程中避免阻塞其他调用
+        answer = await asyncio.to_thread(lookup_saved_answer, message, search_keywords, search_regex, similarity_threshold)
+    if answer:
+        # 直接返回，跳过弹窗
+        call.finish()
+        return answer
+
     # 没找到或没提供搜索关键词，使用弹窗收集信息
     predefined_options_list = predefined_options if isinstance(predefined_options, list) else None
-    result_dict = launch_feedback_ui(message, predefined_options_list)
-
-    txt: str = result_dict.get("interactive_feedback", "").strip()
-    img_b64_list: List[str] = result_dict.get("images", [])
+    if ticket:
+        # The window stays open for up to the ticket TTL; the answer is kept until the ticket expires
+        ticket_id = tickets.issue(collect_feedback(message, predefined_options_list, search_keywords, section, tickets.ttl, call))
+        return confirmation_tickets.issued_text(tickets, ticket_id)
+    return await collect_feedback(message, predefined_options_list, search_keywords, section, call=call)
 
-    # 如果收集到了文本反馈，自动保存到规则文件
-    if txt and search_keywords:
+def lookup_saved_answer(message: str, search_keywords: Optional[List[str]], search_regex: bool,
+                        similarity_threshold: Optional[float]) -> Optional[str]:
+    """Look up a stored answer by keywords, then by question similarity; None means the popup is needed"""
+    # 如果提供了搜索关键词，先搜索规则文件
+    if search_keywords and len(search_keywords) > 0:
+        # 在规则存储中查找最相关的用户回答
         try:
-            # 保存到规则文件
-            save_content = f"""**问题：** {message}
-**用户回答：** {txt}"""
-            append_to_rules_file(save_content, section)
-        except Exception as e:
-            # 保存失败不影响返回结果，只在日志中记录
-            pass
-
-    # 把 base64 变成 Image 对象
-    images: List[Image] = []
-    for b64 in img_b64_list:
+            answer = get_rules_store().latest_answer(search_keywords, search_regex)
+        except Exception:
+            answer = None
+        if answer:
+            return answer
+
+    # 关键词没有命中时，按问题文本的相似度查找已保存的回答
+    threshold = rules_similarity.similarity_threshold(similarity_threshold)
+    if threshold is not None:
         try:
-            img_bytes = base64.b64decode(b64)
-            images.append(Image(data=img_bytes, format="png"))
+            match = get_rules_store().similar_answer(message)
         except Exception:
-            # 若解码失败，忽略该图片并在文字中提示
-            txt += f"\n\n[warning] 有一张图片解码失败。"
-
-    # 根据返回的实际内容组装 tuple
-    if txt and images:
-        return (txt, *images)
-    elif txt:
-        return txt
-    elif images:
-        return (images[0],) if len(images) == 1 else tuple(images)
-    else:
-        return ("",)
+            match = None
+        if match and match.score >= threshold:
+            return f"{match.answer}\n\n[复用相似问题的已保存回答，相似度 {match.score:.2f}：{match.question}]"
+    return None
+
+async def collect_feedback(message: str, predefined_options_list: Optional[List[str]], search_keywords: Optional[List[str]],
+                           section: str, timeout: Optional[float] = None,
+                           call: Optional[latency_metrics.ToolCall] = None) -> Tuple[str | Image, ...]:
+    """Show the popup, save the answer to the rules file and assemble the tool result"""
+    call = call or latency_metrics.ToolCall("interactive_feedback")
+    try:
+        with call.phase("ui_round_trip"):
+            result_dict = await launch_feedback_ui(message, predefined_options_list, timeout, call)
+
+        txt: str = result_dict.get("interactive_feedback", "").strip()
+        img_bytes_list: List[bytes] = result_dict.get("images", [])
+
+        # 如果收集到了文本反馈，自动保存到规则文件
+        if txt and search_keywords:
+            with call.phase("rules_save"):
+                try:
+                    # 保存到规则文件
+                    save_content = f"""**问题：** {message}
+**用户回答：** {txt}"""
+                    await asyncio.to_thread(lambda: get_rules_store().append(save_content, section))
+                except Exception:
+                    # 保存失败不影响返回结果，只在日志中记录
+                    pass
+
+        with call.phase("decode"):
+            # 图片以原始字节回传，直接构造 Image 对象
+            images: List[Image] = [Image(data=img_bytes, format=ui_protocol.image_format(img_bytes)) for img_bytes in img_bytes_list]
+
+        # 根据返回的实际内容组装 tuple
+        if txt and images:
+            return (txt, *images)
+        elif txt:
+            return txt
+        elif images:
+            return (images[0],) if len(images) == 1 else tuple(images)
+        else:
+            return ("",)
+    finally:
+        call.finish()
+
+@mcp.tool()
+async def get_confirmation_result(
+    ticket: str = Field(description="Ticket returned by a tool called with ticket=true"),
+    wait_seconds: float = Field(default=confirmation_tickets.DEFAULT_POLL_SECONDS, description=f"Seconds to wait for the answer (at most {confirmation_tickets.MAX_POLL_SECONDS})"),
+) -> Tuple[str | Image, ...]:
+    """
+    Long-poll the answer of a ticket-mode confirmation.
+
+    Returns the same result as a blocking call once the user has answered (repeatable until the ticket expires),
+    a status=pending JSON while the window is still open, or status=expired for unknown/expired tickets.
+    """
+    return await tickets.poll(ticket, wait_seconds)
+
+@mcp.resource("metrics://latency", mime_type="application/json")
+def latency_metrics_summary() -> str:
+    """Per-tool, per-phase latency of recent tool calls: count, mean and p50/p95/p99 in milliseconds"""
+    return json.dumps(latency_metrics.registry.summary(), ensure_ascii=False, indent=2)
 
 if __name__ == "__main__":
+    # Reap UI processes and temp result files left behind by earlier crashes,
+    # and kill our own UI children when this server exits
+    ui_launcher.sweep_stale_ui()
+    ui_launcher.install_cleanup()
+    # Pre-warm the UI host so the first confirmation doesn't pay the PySide6 startup
+    ui_daemon.start_daemon()
+    # Fold any journal left over from a previous run back into the rules file
+    if rules_store.backend_name() == "markdown" and os.path.exists(rules_journal.journal_path(DEFAULT_RULES_FILE)):
+        rules_journal.compact_in_background(DEFAULT_RULES_FILE)
     mcp.run(transport="stdio")
@@ -138,6 +138,9 @@ echo "- dmp_data_verification: DMP 数据验证"
 echo "- status_update_confirmation: 状态更新确认"
 echo "- data_consistency_check: 数据一致性检查"
 echo "- rollback_confirmation: 回滚操作确认"
+echo "- batch_sync_confirmation: 批量用户群同步确认"
+echo "- audience_overlap / audience_impact: 用户群重叠与影响范围分析"
+echo "- get_confirmation_result: 获取 ticket 模式确认的回答"
 echo ""
 echo "📚 更多信息请查看:"
 echo "- data_sync_rules.md: 详细使用规则"
@@ -0,0 +1,80 @@
+import json
+import os
+
+import numpy as np
+import pytest
+
+import audience_index
+from audience_index import AudienceIndex, AudienceIndexError
+
+EDGES = [0, 2 ** 63, 2 ** 64 - 1]
+
+@pytest.fixture
+def index(tmp_path):
+    return AudienceIndex(str(tmp_path / "index"))
+
+def test_empty_index(index):
+    assert index.audiences_of([1, 2]) == {}
+    fanout = index.fanout([1, 2])
+    assert fanout["queried"] == 2 and fanout["indexed"] == 0 and fanout["audiences"] == []
+
+def test_ingest_and_lookup_edge_values(index):
+    index.ingest("a", EDGES + [5])
+    index.ingest("b", [5, 2 ** 64 - 1])
+    index.ingest("empty", [])
+    assert index.audiences_of(EDGES + [5, 6]) == {
+        0: ["a"], 2 ** 63: ["a"], 2 ** 64 - 1: ["a", "b"], 5: ["a", "b"]}
+
+def test_reingest_replaces_and_remove_hides(index):
+    index.ingest("a", [1, 2, 3])
+    index.ingest("a", [3, 4])
+    assert index.audiences_of([1, 2, 3, 4]) == {3: ["a"], 4: ["a"]}
+    assert index.remove("a") and not index.remove("a")
+    assert index.audiences_of([3, 4]) == {}
+
+def test_compaction_keeps_live_entries(index):
+    rng = np.random.default_rng(0)
+    expected = {}
+    for number in range(audience_index.COMPACT_SEGMENTS * 3):
+        audience_id = f"audience_{number % 5}"
+        mids = rng.integers(0, 1000, size=200).astype(np.uint64)
+        index.ingest(audience_id, mids)
+        expected[audience_id] = {int(mid) for mid in mids.tolist()}
+    assert index.stats()["segments"] <= audience_index.COMPACT_SEGMENTS
+    index.compact()
+    assert index.stats()["segments"] == 1
+    got = index.audiences_of(np.arange(1000, dtype=np.uint64))
+    for audience_id, mids in expected.items():
+        assert {mid for mid, audiences in got.items() if audience_id in audiences} == mids
+
+def test_fanout_separates_current_audience(index):
+    index.ingest("current", [1, 2, 3, 4])
+    index.ingest("other", [3, 4, 5])
+    fanout = index.fanout([1, 2, 3, 4, 9], "current")
+    assert fanout["current_audience_hits"] == 4
+    assert fanout["in_other_audiences"] == 2 and fanout["indexed"] == 4
+    assert fanout["audiences"] == [{"audience_id": "other", "mids": 2, "ratio": 0.4}]
+
+def test_orphan_segment_from_interrupted_write_is_replaced(index):
+    index.ingest("a", [1])
+    # 上次写入段后、写 manifest 前中断，留下了同名目录
+    os.makedirs(os.path.join(index.directory, "seg_000002"))
+    index.ingest("b", [1])
+    assert index.audiences_of([1]) == {1: ["a", "b"]}
+
+def test_manifest_missing_keys(index):
+    index.ingest("a", [1])
+    with open(index.manifest_path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    del manifest["segments"]
+    with open(index.manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    with pytest.raises(AudienceIndexError):
+        AudienceIndex(index.directory).fanout([1])
+
+def test_corrupt_segment(index):
+    index.ingest("a", [1])
+    with open(os.path.join(index.directory, "seg_000001", "mids.npy"), "wb") as f:
+        f.write(b"not an array")
+    with pytest.raises(AudienceIndexError):
+        AudienceIndex(index.directory).fanout([1])
@@ -0,0 +1,50 @@
+import asyncio
+import inspect
+import time
+
+import pytest
+
+server = pytest.importorskip("server", exc_type=ImportError)
+
+UI_SECONDS = 0.3
+LOOKUP_SECONDS = 0.2
+CALLS = 5
+
+@pytest.fixture
+def slow_ui(monkeypatch, tmp_path):
+    """
+    每次弹窗耗时 UI_SECONDS，规则查找阻塞 LOOKUP_SECONDS；
+    规则文件放在临时目录，不在仓库中生成 user_rules.md
+    """
+    async def launch_feedback_ui(summary, *args, **kwargs):
+        await asyncio.sleep(UI_SECONDS)
+        return {"interactive_feedback": summary, "images": []}
+
+    def lookup_saved_answer(*args):
+        time.sleep(LOOKUP_SECONDS)
+        return None
+
+    monkeypatch.setattr(server, "launch_feedback_ui", launch_feedback_ui)
+    monkeypatch.setattr(server, "lookup_saved_answer", lookup_saved_answer)
+    monkeypatch.setattr(server, "DEFAULT_RULES_FILE", str(tmp_path / "user_rules.md"))
+
+def call_tool(tool, **kwargs):
+    """按工具签名补齐默认值（参数默认值是 pydantic Field）后调用"""
+    fn = getattr(tool, "fn", tool)
+    for name, parameter in inspect.signature(fn).parameters.items():
+        if name not in kwargs:
+            kwargs[name] = getattr(parameter.default, "default", parameter.default)
+    return fn(**kwargs)
+
+def test_concurrent_prompts_do_not_serialize(slow_ui):
+    async def run_all():
+        return await asyncio.gather(*(call_tool(server.interactive_feedback, message=f"q{i}") for i in range(CALLS)))
+
+    start = time.perf_counter()
+    results = asyncio.run(run_all())
+    wall = time.perf_counter() - start
+
+    assert results == [f"q{i}" for i in range(CALLS)]
+    # 并发执行时总耗时接近单次耗时（max），任何一步串行都会让总耗时接近各次之和（sum）
+    single = UI_SECONDS + LOOKUP_SECONDS
+    assert wall < single * 2, f"{CALLS} 个调用耗时 {wall:.2f} s，单次 {single:.2f} s"
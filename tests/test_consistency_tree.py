@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+
+import consistency_tree
+from consistency_tree import LocalStatusStore, SnapshotError, check, read_csv, write_snapshot
+
+EDGES = [0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 2, 2 ** 64 - 1]
+
+def sample(seed, count=2000):
+    rng = np.random.default_rng(seed)
+    mids = np.concatenate([rng.integers(0, 2 ** 64 - 1, size=count, dtype=np.uint64, endpoint=True),
+                           np.array(EDGES, dtype=np.uint64)])
+    statuses = rng.integers(-3, 4, size=len(mids), dtype=np.int64)
+    statuses[-1] = np.iinfo(np.int64).max
+    return mids, statuses
+
+def as_dict(mids, statuses):
+    return dict(zip(np.asarray(mids).tolist(), np.asarray(statuses).tolist()))
+
+@pytest.mark.parametrize("name", ["snap.csv", "snap.bin"])
+def test_snapshot_round_trip_with_large_mids(tmp_path, name):
+    mids, statuses = sample(0)
+    path = str(tmp_path / name)
+    write_snapshot(path, mids, statuses)
+    reader = consistency_tree.read_binary if name.endswith(".bin") else read_csv
+    read_mids, read_statuses = reader(path)
+    assert read_mids.dtype == np.uint64
+    assert read_mids.tolist() == mids.tolist() and read_statuses.tolist() == statuses.tolist()
+
+def test_csv_round_trip_across_blocks(tmp_path, monkeypatch):
+    monkeypatch.setattr(consistency_tree, "CSV_BLOCK_SIZE", 64)
+    mids, statuses = sample(1, 300)
+    path = str(tmp_path / "snap.csv")
+    write_snapshot(path, mids, statuses)
+    read_mids, read_statuses = read_csv(path)
+    assert read_mids.tolist() == mids.tolist() and read_statuses.tolist() == statuses.tolist()
+
+def test_csv_without_header(tmp_path):
+    path = tmp_path / "snap.csv"
+    path.write_text("18446744073709551615,1\n5,-2\n")
+    mids, statuses = read_csv(str(path))
+    assert mids.tolist() == [2 ** 64 - 1, 5] and statuses.tolist() == [1, -2]
+
+@pytest.mark.parametrize("body", [
+    "-1,1\n",
+    "18446744073709551616,1\n",
+    "5,1\n99999999999999999999999,1\n",
+    "5,9223372036854775808\n",
+    "5,-99999999999999999999\n",
+    "5,x\n",
+    "5,1\n6\n",
+])
+def test_csv_rejects_invalid_values(tmp_path, body):
+    path = tmp_path / "snap.csv"
+    path.write_text("MID,Status\n" + body)
+    with pytest.raises(SnapshotError):
+        read_csv(str(path))
+
+def test_empty_snapshots(tmp_path):
+    for name, content in (("empty.csv", "MID,Status\n"), ("blank.csv", ""), ("empty.bin", "")):
+        (tmp_path / name).write_text(content)
+    assert check(str(tmp_path / "empty.csv"), str(tmp_path / "blank.csv")).consistent
+    report = check(str(tmp_path / "empty.bin"), str(tmp_path / "empty.csv"))
+    assert report.consistent and report.summary()["dmp_count"] == 0
+
+def test_check_finds_each_kind_of_difference(tmp_path):
+    mids, statuses = sample(2)
+    dmp, local = str(tmp_path / "dmp.csv"), str(tmp_path / "local.bin")
+    write_snapshot(dmp, mids, statuses)
+    local_statuses = statuses.copy()
+    local_statuses[5] += 1
+    local_statuses[-3] += 1  # 2^63
+    keep = np.ones(len(mids), dtype=bool)
+    keep[[7, -1]] = False  # 只在 DMP：其中一个是 2^64 - 1
+    extra = np.array([2 ** 64 - 3], dtype=np.uint64)
+    write_snapshot(local, np.concatenate([mids[keep], extra]), np.concatenate([local_statuses[keep], [9]]))
+
+    report = check(dmp, local, depth=8)
+    assert report.only_dmp[0].tolist() == sorted([int(mids[7]), 2 ** 64 - 1])
+    assert report.only_local[0].tolist() == [2 ** 64 - 3]
+    assert report.mismatched[0].tolist() == sorted([int(mids[5]), 2 ** 63])
+    assert report.divergent_count == 5 and not report.consistent
+    assert [row["MID"] for row in report.rows()] == [str(mid) for mid in report.divergent_mids().tolist()]
+    assert check(dmp, dmp, depth=8).consistent
+
+def test_store_round_trip_and_check(tmp_path):
+    mids, statuses = sample(3, 500)
+    store_path = str(tmp_path / "local.db")
+    store = LocalStatusStore(store_path, depth=6)
+    store.upsert(mids, statuses)
+    store.delete(mids[:1])
+    store.upsert(mids[1:2], statuses[1:2] + 1)
+    store.export(str(tmp_path / "export.csv"))
+    store.close()
+
+    expected = as_dict(mids, statuses)
+    del expected[int(mids[0])]
+    expected[int(mids[1])] += 1
+    assert as_dict(*read_csv(str(tmp_path / "export.csv"))) == expected
+
+    dmp = str(tmp_path / "dmp.csv")
+    write_snapshot(dmp, mids, statuses)
+    report = check(dmp, "store:" + store_path)
+    assert report.only_dmp[0].tolist() == [int(mids[0])]
+    assert report.mismatched[0].tolist() == [int(mids[1])]
+    assert report.summary()["depth"] == 6
+    assert check(str(tmp_path / "export.csv"), "store:" + store_path).consistent
+
+def test_missing_store_is_not_created(tmp_path):
+    path = tmp_path / "missing.db"
+    (tmp_path / "dmp.csv").write_text("MID,Status\n1,1\n")
+    with pytest.raises(SnapshotError):
+        check(str(tmp_path / "dmp.csv"), f"store:{path}")
+    assert not path.exists()
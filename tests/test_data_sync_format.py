@@ -0,0 +1,24 @@
+import pytest
+
+try:
+    import data_sync_mcp
+except (ImportError, TypeError) as e:
+    # 安装的 fastmcp 与服务端代码不兼容时跳过
+    pytest.skip(f"could not import data_sync_mcp: {e}", allow_module_level=True)
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(16)
+
+def test_text_then_images():
+    result = data_sync_mcp.format_feedback({"interactive_feedback": " ok ", "images": [PNG]})
+    assert result[0] == "ok" and len(result) == 2
+
+def test_images_without_text_are_kept():
+    result = data_sync_mcp.format_feedback({"interactive_feedback": "", "images": [PNG, PNG]})
+    assert len(result) == 2 and not any(isinstance(part, str) for part in result)
+    assert data_sync_mcp.format_feedback({"interactive_feedback": "", "images": []}) == ("",)
+
+def test_summary_appended_to_images_only_result():
+    fanout = {"queried": 1, "in_other_audiences": 0, "other_audiences": 0, "audiences": []}
+    format_result = data_sync_mcp.with_fanout(data_sync_mcp.format_feedback, fanout)
+    text, *images = format_result({"interactive_feedback": "", "images": [PNG]})
+    assert text.startswith("影响扇出") and len(images) == 1
@@ -0,0 +1,61 @@
+import json
+
+import numpy as np
+import pytest
+
+import dmp_verification
+from dmp_verification import DMPParseError, MISSING, parse_and_verify, parse_dmp_response
+
+def failures(text, verification_type="all"):
+    report = parse_and_verify(text, verification_type)
+    return {name: count for name, count in report.counts().items() if count}
+
+def test_key_values_pass():
+    report = parse_and_verify("RawDMP=16, Old=1, New=20", "status")
+    assert report.passed
+    assert report.rows.row(0) == {"row": 0, "RawDMP": 16, "Status": 20, "Old": 1}
+
+def test_json_rows_and_columns_agree():
+    rows = [{"MID": str(mid), "RawDMP": 16, "Status": 20} for mid in (1, 2, 3)]
+    columns = {"MID": ["1", "2", "3"], "RawDMP": [16, 16, 16], "Status": [20, 20, 20]}
+    for text in (json.dumps(rows), json.dumps(columns)):
+        parsed = parse_dmp_response(text)
+        assert parsed.mid.tolist() == [1, 2, 3]
+        assert parse_and_verify(text, "all").passed
+
+@pytest.mark.parametrize("text", ["", "[]", '{"MID": [], "RawDMP": [], "Status": []}', "no pairs here"])
+def test_empty_or_unparseable_is_an_error(text):
+    with pytest.raises(DMPParseError):
+        parse_dmp_response(text)
+
+def test_bools_and_fractions_are_missing():
+    rows = parse_dmp_response('{"RawDMP": [true, 16.7, 16.0, "16", null], "Status": [20, 20, 20, 20, 20]}')
+    assert rows.raw_dmp.tolist() == [MISSING, MISSING, 16, 16, MISSING]
+
+def test_fields_missing_from_first_row_are_checked():
+    text = json.dumps([{"RawDMP": 16, "Status": 20}, {"MID": "3", "RawDMP": 16, "Status": 20, "Old": 20}])
+    assert failures(text) == {"missing_mid": 1, "unchanged_status": 1}
+
+def test_field_aliases_may_differ_between_rows():
+    text = json.dumps([{"MID": "1", "RawDMP": 16, "Status": 20}, {"mid": "2", "raw": 16, "new": 20}])
+    rows = parse_dmp_response(text)
+    assert rows.mid.tolist() == [1, 2]
+    assert rows.raw_dmp.tolist() == [16, 16]
+
+@pytest.mark.parametrize("mid", ["-5", "1.5", "abc", "0x10", "18446744073709551616", True])
+def test_invalid_mids_fail(mid):
+    text = json.dumps([{"MID": "7", "RawDMP": 16, "Status": 20}, {"MID": mid, "RawDMP": 16, "Status": 20}])
+    assert failures(text) == {"invalid_mid": 1}
+
+def test_mid_edge_values():
+    mids = ["0", str(2 ** 63), str(2 ** 64 - 1)]
+    rows = parse_dmp_response(json.dumps({"MID": mids, "RawDMP": [1, 1, 1], "Status": [20, 20, 20]}))
+    assert rows.mid.dtype == np.uint64
+    assert [str(mid) for mid in rows.mid.tolist()] == mids
+    assert parse_and_verify(json.dumps({"MID": mids + [mids[-1]], "RawDMP": [1] * 4, "Status": [20] * 4}),
+                            "consistency").counts()["duplicate_mid"] == 2
+
+def test_rules_for_type_keep_completeness():
+    names = {rule.name for rule in dmp_verification.rules_for("status")}
+    assert {"missing_mid", "invalid_mid", "invalid_status"} <= names
+    assert "duplicate_mid" not in names
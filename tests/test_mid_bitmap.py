@@ -0,0 +1,90 @@
+import base64
+
+import numpy as np
+import pytest
+
+import mid_bitmap
+from mid_bitmap import BitmapFormatError, MidBitmap
+
+EDGES = [0, 1, 2 ** 16 - 1, 2 ** 16, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 2, 2 ** 64 - 1]
+
+def random_mids(seed, count, dense_start=10 ** 9):
+    rng = np.random.default_rng(seed)
+    sparse = rng.integers(0, 2 ** 64 - 1, size=count, dtype=np.uint64, endpoint=True)
+    # 一段足够密集的 MID，使对应容器转为位图容器
+    dense = np.uint64(dense_start) + rng.choice(1 << 16, size=6000, replace=False).astype(np.uint64)
+    return np.concatenate([sparse, dense, np.array(EDGES, dtype=np.uint64)])
+
+def as_set(values):
+    return {int(v) for v in np.asarray(values).tolist()}
+
+def test_from_mids_sorts_and_deduplicates():
+    bitmap = MidBitmap.from_mids([5, 3, 5, 2 ** 64 - 1, 0, 3])
+    assert bitmap.to_array().tolist() == [0, 3, 5, 2 ** 64 - 1]
+    assert len(bitmap) == 4
+    assert 2 ** 64 - 1 in bitmap and 4 not in bitmap
+
+def test_empty():
+    empty = MidBitmap.from_mids([])
+    other = MidBitmap.from_mids([1, 2])
+    assert len(empty) == 0 and empty.to_array().tolist() == []
+    assert (empty & other) == empty and (empty | other) == other and (other - empty) == other
+    assert MidBitmap.from_bytes(empty.to_bytes()) == empty
+
+def test_set_operations_match_python_sets():
+    first, second = random_mids(1, 3000), random_mids(2, 3000)
+    a, b = MidBitmap.from_mids(first), MidBitmap.from_mids(second)
+    expected_a, expected_b = as_set(first), as_set(second)
+    assert as_set((a & b).to_array()) == expected_a & expected_b
+    assert as_set((a | b).to_array()) == expected_a | expected_b
+    assert as_set((a - b).to_array()) == expected_a - expected_b
+    assert a.intersection_cardinality(b) == len(expected_a & expected_b)
+    assert a.union_cardinality(b) == len(expected_a | expected_b)
+    assert a.difference_cardinality(b) == len(expected_a - expected_b)
+
+def test_bytes_round_trip_with_both_container_kinds():
+    bitmap = MidBitmap.from_mids(random_mids(3, 2000))
+    summary = bitmap.summary()
+    assert summary["bitmap_containers"] and summary["array_containers"]
+    assert MidBitmap.from_bytes(bitmap.to_bytes()) == bitmap
+    assert mid_bitmap.load_source(bitmap.encode()) == bitmap
+
+def _corrupt_first_container(bitmap, values, dtype="<u2"):
+    data = bytearray(bitmap.to_bytes())
+    offset = mid_bitmap._HEADER.size + 12 * len(bitmap.keys)
+    raw = np.asarray(values, dtype=dtype).tobytes()
+    data[offset:offset + len(raw)] = raw
+    return bytes(data)
+
+@pytest.mark.parametrize("values", [[3, 1, 2, 2, 1], [1, 2, 2, 3, 4], [5, 4, 3, 2, 1]])
+def test_unsorted_or_duplicate_array_container_is_rejected(values):
+    bitmap = MidBitmap.from_mids([1, 2, 3, 4, 5])
+    with pytest.raises(BitmapFormatError):
+        MidBitmap.from_bytes(_corrupt_first_container(bitmap, values))
+
+def test_bitmap_popcount_must_match_cardinality():
+    bitmap = MidBitmap.from_mids(np.arange(5000, dtype=np.uint64))
+    words = bitmap.containers[0].copy()
+    words[-1] |= np.uint64(1) << np.uint64(63)
+    with pytest.raises(BitmapFormatError):
+        MidBitmap.from_bytes(_corrupt_first_container(bitmap, words, "<u8"))
+
+@pytest.mark.parametrize("data", [b"", b"XXXX" + bytes(8), MidBitmap.from_mids([1, 2]).to_bytes()[:-1]])
+def test_malformed_bytes(data):
+    with pytest.raises(BitmapFormatError):
+        MidBitmap.from_bytes(data)
+
+def test_bitmap_argument_with_bad_containers_is_rejected():
+    bitmap = MidBitmap.from_mids([1, 2, 3, 4, 5])
+    source = mid_bitmap.SOURCE_PREFIX + base64.b64encode(_corrupt_first_container(bitmap, [3, 1, 2, 2, 1])).decode()
+    with pytest.raises(BitmapFormatError):
+        mid_bitmap.load_source(source)
+
+def test_overlap_and_impact_reports():
+    audiences = {"a": MidBitmap.from_mids([1, 2, 3, 2 ** 64 - 1]), "b": MidBitmap.from_mids([3, 4, 2 ** 64 - 1])}
+    overlap = mid_bitmap.overlap_report(audiences)
+    assert overlap["sizes"] == {"a": 4, "b": 3} and overlap["union"] == 5
+    assert overlap["pairs"][0]["intersection"] == 2 and overlap["pairs"][0]["jaccard"] == 0.4
+    impact = mid_bitmap.impact_report(MidBitmap.from_mids([2, 3, 9]), audiences)
+    assert impact["outside_audiences"] == 1
+    assert [(item["audience_id"], item["affected"]) for item in impact["audiences"]] == [("a", 2), ("b", 1)]
@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+import mid_set
+from mid_set import MidDecodeError, decode_mids, encode_mids
+
+EDGES = [0, 1, 2 ** 63 - 1, 2 ** 63, 2 ** 64 - 2, 2 ** 64 - 1]
+
+def values(mids):
+    return [int(v) for v in mids.page(0, len(mids)).tolist()]
+
+@pytest.mark.parametrize("encoding", ["delta", "u64"])
+def test_encode_round_trip_keeps_order(encoding):
+    rng = np.random.default_rng(0)
+    mids = EDGES[::-1] + rng.integers(0, 2 ** 64 - 1, size=5000, dtype=np.uint64, endpoint=True).tolist() + EDGES
+    assert values(decode_mids(encode_mids(mids, encoding))) == mids
+
+def test_delta_round_trip_across_chunks(monkeypatch):
+    monkeypatch.setattr(mid_set, "CHUNK_SIZE", 16)
+    mids = [2 ** 64 - 1, 0, 2 ** 63, 5, 5, 4] * 5
+    assert values(decode_mids(encode_mids(mids, "delta"))) == mids
+
+def test_text_and_list_inputs():
+    assert values(decode_mids("3, 1 2\n18446744073709551615")) == [3, 1, 2, 2 ** 64 - 1]
+    assert values(decode_mids([0, 2 ** 63, "7"])) == [0, 2 ** 63, 7]
+
+@pytest.mark.parametrize("value", ["", "  ", [], "delta:", "u64:"])
+def test_empty_input(value):
+    mids = decode_mids(value)
+    assert len(mids) == 0 and mids.summary() == {"count": 0}
+
+def test_summary_with_span_over_int64():
+    summary = decode_mids(["18446744073709551615", "0"]).summary()
+    assert summary["count"] == 2 and summary["sorted"] is False
+    assert summary["min"] == "0" and summary["max"] == str(2 ** 64 - 1)
+
+def test_summary_ranges_and_duplicates():
+    summary = decode_mids([2 ** 63, 2 ** 63 + 1, 2 ** 63 + 1, 2 ** 63 + 2, 2 ** 64 - 1]).summary()
+    assert summary["sorted"] is True and summary["duplicates"] == 1
+
+@pytest.mark.parametrize("value", [
+    "18446744073709551616",
+    "1, 18446744073709551615, 99999999999999999999999",
+    [2 ** 64],
+])
+def test_out_of_range_text_is_rejected(value):
+    with pytest.raises(MidDecodeError):
+        decode_mids(value)
+
+@pytest.mark.parametrize("value", ["-1", "1 abc", "1.5", "u64:AAAA", "delta:gA==", "delta:!!"])
+def test_malformed_input_is_rejected(value):
+    with pytest.raises(MidDecodeError):
+        decode_mids(value)
+
+def test_file_sources(tmp_path):
+    mids = [2 ** 64 - 1, 0, 2 ** 63, 42]
+    (tmp_path / "mids.txt").write_text("\n".join(map(str, mids)) + "\n")
+    (tmp_path / "mids.u64").write_bytes(np.asarray(mids, dtype="<u8").tobytes())
+    (tmp_path / "mids.delta").write_bytes(mid_set.encode_delta(mids))
+    for name in ("mids.txt", "mids.u64", "mids.delta"):
+        assert values(decode_mids(f"file:{tmp_path / name}")) == mids
+    (tmp_path / "empty.u64").write_bytes(b"")
+    assert len(decode_mids(f"file:{tmp_path / 'empty.u64'}")) == 0
+
+def test_file_source_errors(tmp_path):
+    with pytest.raises(MidDecodeError):
+        decode_mids(f"file:{tmp_path / 'missing.txt'}")
+    (tmp_path / "short.u64").write_bytes(b"\0" * 7)
+    with pytest.raises(MidDecodeError):
+        decode_mids(f"file:{tmp_path / 'short.u64'}")
+    (tmp_path / "big.txt").write_text("1\n18446744073709551616\n")
+    with pytest.raises(MidDecodeError):
+        values(decode_mids(f"file:{tmp_path / 'big.txt'}"))
@@ -0,0 +1,37 @@
+import rules_index
+import rules_journal
+
+RULES = """## 工作流程规则
+
+### 2025-01-01 10:00:00
+**问题：** run audience_sync job?
+**用户回答：** yes
+
+---
+### 2025-01-02 10:00:00
+**问题：** 数据同步是否继续
+**用户回答：** 继续
+"""
+
+def make_index(tmp_path):
+    path = tmp_path / "user_rules.md"
+    path.write_text(RULES, encoding="utf-8")
+    return rules_index.RulesIndex(str(path))
+
+def test_whole_word_keyword(tmp_path):
+    index = make_index(tmp_path)
+    assert index.latest_answer(["audience_sync"]) == "yes"
+
+def test_partial_word_keywords(tmp_path):
+    # 与原先的子串匹配一致：关键词可以只是条目中某个词的一部分
+    index = make_index(tmp_path)
+    for keyword in ["sync", "udience", "SYNC JOB", "nc jo", "同步"]:
+        assert keyword in index.search([keyword]), keyword
+    assert index.latest_answer(["sync"]) == "yes"
+    assert index.search(["synced"]) == {}
+
+def test_partial_word_after_journal_append(tmp_path):
+    index = make_index(tmp_path)
+    assert index.search(["rollback"]) == {}
+    rules_journal.append_entry(index.file_path, "工作流程规则", "**问题：** confirm dmp_rollback?\n**用户回答：** no")
+    assert index.latest_answer(["rollback"]) == "no"
@@ -0,0 +1,404 @@
+# UI Daemon - 常驻预热的 PySide6 界面宿主进程
+# 让 server.py / data_sync_mcp.py 复用同一个已加载 QApplication 的进程弹窗，
+# 避免每次确认都重新启动 Python、导入 PySide6、创建 QApplication；
+# 并发的弹窗请求进入确认队列（confirmation_broker），按严重程度排序、同一时间只显示一个窗口
+import os
+import sys
+import json
+import time
+import asyncio
+import getpass
+import logging
+import secrets
+import tempfile
+import argparse
+import threading
+import subprocess
+from multiprocessing.connection import Listener, Client
+from typing import Dict, Optional
+
+import latency_metrics
+import ui_protocol
+
+logger = logging.getLogger(__name__)
+
+# 设置为 "0" 可禁用常驻 UI 进程，始终使用逐次启动的子进程
+DAEMON_ENV = "INTERACTIVE_FEEDBACK_UI_DAEMON"
+# 常驻进程空闲多久（秒）后自动退出
+IDLE_TIMEOUT_ENV = "INTERACTIVE_FEEDBACK_UI_IDLE_TIMEOUT"
+DEFAULT_IDLE_TIMEOUT = 1800
+
+# 连接常驻进程的超时时间（秒）
+CONNECT_TIMEOUT = 2.0
+
+# 等待弹窗结果期间，检查调用是否取消 / 客户端连接是否关闭的间隔（秒）
+CANCEL_CHECK_INTERVAL = 0.5
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def daemon_enabled() -> bool:
+    """是否启用常驻 UI 进程"""
+    return os.environ.get(DAEMON_ENV, "1") != "0"
+
+def state_file_path() -> str:
+    """常驻进程状态文件（地址、认证密钥、PID）的路径"""
+    try:
+        user = getpass.getuser()
+    except Exception:
+        user = "default"
+    return os.path.join(tempfile.gettempdir(), f"interactive_feedback_ui_{user}.json")
+
+def read_state() -> Optional[Dict]:
+    """读取常驻进程状态，不存在或损坏时返回 None"""
+    try:
+        with open(state_file_path(), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def _write_state(state: Dict):
+    """以仅当前用户可读的权限写入状态文件"""
+    path = state_file_path()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def _remove_state(pid: int):
+    """仅当状态文件仍属于指定进程时删除"""
+    state = read_state()
+    if state and state.get("pid") == pid:
+        try:
+            os.unlink(state_file_path())
+        except OSError:
+            pass
+
+def _connect(state: Dict):
+    """连接常驻进程，失败时抛出异常"""
+    address = state["address"]
+    if isinstance(address, list):
+        address = tuple(address)
+    return Client(address, authkey=bytes.fromhex(state["authkey"]))
+
+# ---------------------------------------------------------------------------
+# 客户端（MCP 服务端进程中使用）
+# ---------------------------------------------------------------------------
+
+# 客户端侧统计：冷启动（子进程）与热启动（常驻进程）的出窗耗时，以及在确认队列中的等待时间
+_window_timings = {"cold": [], "warm": [], "queue_wait": []}
+_timings_lock = threading.Lock()
+
+def _record_sample(mode: str, ms: float):
+    with _timings_lock:
+        samples = _window_timings[mode]
+        samples.append(ms)
+        del samples[:-100]  # 只保留最近 100 次
+
+def record_window_timing(mode: str, result: Dict, call: Optional["latency_metrics.ToolCall"] = None):
+    """
+    从 UI 结果中取出出窗耗时（及排队时间）并记录，返回去掉内部字段后的结果
+    传入 call 时，UI 回传的各阶段耗时一并计入该次工具调用
+    """
+    timing = result.pop("_timing", None) if isinstance(result, dict) else None
+    if timing and call is not None:
+        call.record_ui_timing(timing)
+    if timing and "time_to_window_ms" in timing:
+        ms = timing["time_to_window_ms"]
+        _record_sample(mode, ms)
+        logger.info(f"UI time-to-window ({mode}): {ms:.1f} ms")
+    if timing and "queue_wait_ms" in timing:
+        _record_sample("queue_wait", timing["queue_wait_ms"])
+        logger.info(f"UI confirmation queue wait: {timing['queue_wait_ms']:.1f} ms")
+    return result
+
+def window_timing_summary() -> Dict[str, Dict[str, float]]:
+    """返回冷/热启动出窗耗时与排队时间的汇总（次数、平均、最近一次）"""
+    summary = {}
+    with _timings_lock:
+        for mode, samples in _window_timings.items():
+            if samples:
+                summary[mode] = {
+                    "count": len(samples),
+                    "avg_ms": round(sum(samples) / len(samples), 1),
+                    "last_ms": samples[-1],
+                }
+    return summary
+
+def ping() -> Optional[Dict]:
+    """探测常驻进程是否存活，存活时返回其信息"""
+    state = read_state()
+    if not state:
+        return None
+    try:
+        conn = _connect(state)
+    except Exception:
+        return None
+    try:
+        conn.send({"op": "ping"})
+        if conn.poll(CONNECT_TIMEOUT):
+            return conn.recv()
+    except Exception:
+        pass
+    finally:
+        conn.close()
+    return None
+
+def queue_status() -> Optional[Dict]:
+    """常驻进程中确认队列的深度与每个请求的等待时间；常驻进程不可用时返回 None"""
+    info = ping()
+    return info.get("queue") if info else None
+
+def request_prompt(kind: str, payload: Dict, timeout: Optional[float] = None,
+                   cancel_event: Optional[threading.Event] = None) -> Optional[Dict]:
+    """
+    请求常驻进程显示一个弹窗并等待结果
+    kind: "feedback" 或 "data_sync"；payload 可带 severity（critical/high/medium/low）决定排队顺序
+    常驻进程不存在或中途崩溃时返回 None，调用方应回退到子进程方式；
+    等待超时抛出 TimeoutError；cancel_event 被设置时返回 None。
+    超时或取消时关闭连接，常驻进程随之关闭对应的窗口
+    """
+    if not daemon_enabled():
+        return None
+    state = read_state()
+    if not state:
+        return None
+    try:
+        conn = _connect(state)
+    except Exception as e:
+        logger.info(f"UI daemon unavailable, falling back to spawn: {e}")
+        return None
+
+    try:
+        conn.send({"op": "show", "kind": kind, "payload": payload, "sent_at": time.time()})
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while not conn.poll(CANCEL_CHECK_INTERVAL if deadline is None else
+                            max(0.0, min(CANCEL_CHECK_INTERVAL, deadline - time.monotonic()))):
+            if cancel_event is not None and cancel_event.is_set():
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                raise TimeoutError("UI daemon prompt timed out")
+        # 结果按帧回传，图片为原始字节
+        return ui_protocol.recv_result(conn)
+    except TimeoutError:
+        raise
+    except ui_protocol.UIProtocolError as e:
+        logger.warning(f"UI daemon failed to show prompt: {e}")
+        return None
+    except Exception as e:
+        # 常驻进程崩溃或连接中断
+        logger.warning(f"UI daemon connection lost, falling back to spawn: {e}")
+        return None
+    finally:
+        conn.close()
+
+async def request_prompt_async(kind: str, payload: Dict, timeout: Optional[float] = None) -> Optional[Dict]:
+    """在线程中执行 request_prompt，不阻塞事件循环；调用被取消时通知常驻进程关闭对应的窗口"""
+    cancel_event = threading.Event()
+    try:
+        return await asyncio.to_thread(request_prompt, kind, payload, timeout, cancel_event)
+    except asyncio.CancelledError:
+        cancel_event.set()
+        raise
+
+def start_daemon():
+    """在后台启动常驻 UI 进程（不等待其就绪）"""
+    if not daemon_enabled() or ping():
+        return
+    args = [sys.executable, "-u", os.path.join(SCRIPT_DIR, "ui_daemon.py"), "serve"]
+    kwargs = dict(
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        stdin=subprocess.DEVNULL,
+        close_fds=True,
+    )
+    if sys.platform == "win32":
+        kwargs["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        kwargs["start_new_session"] = True
+    try:
+        subprocess.Popen(args, **kwargs)
+    except Exception as e:
+        logger.warning(f"Failed to start UI daemon: {e}")
+
+# ---------------------------------------------------------------------------
+# 服务端（常驻 UI 进程中使用）
+# ---------------------------------------------------------------------------
+
+def serve(idle_timeout: float):
+    """运行常驻 UI 进程：预加载 PySide6 与两种界面，等待弹窗请求"""
+    pid = os.getpid()
+    # 已有存活的常驻进程时直接退出
+    existing = ping()
+    if existing and existing.get("pid") != pid:
+        return
+
+    from PySide6.QtCore import Qt, QObject, QTimer, Signal
+    import feedback_ui
+    import data_sync_ui
+    import confirmation_broker
+
+    app = feedback_ui.prepare_application()
+    app.setQuitOnLastWindowClosed(False)
+
+    authkey = secrets.token_bytes(32)
+    listener = Listener(authkey=authkey)
+    address = listener.address
+    _write_state({
+        "pid": pid,
+        "address": list(address) if isinstance(address, tuple) else address,
+        "authkey": authkey.hex(),
+        "started_at": time.time(),
+    })
+
+    class Bridge(QObject):
+        """把监听线程收到的请求（及取消）转交给 GUI 线程"""
+        show_requested = Signal(object, object, object)
+        cancel_requested = Signal(object)
+
+    bridge = Bridge()
+    broker = confirmation_broker.ConfirmationBroker()
+    open_windows = set()
+    last_activity = [time.monotonic()]
+    started_at = time.time()
+
+    # 每个弹窗请求一个 session：{"done": 结果已发送或窗口已撤下, "window": 窗口, "cancelled": 客户端已离开}
+    # 连接由监听线程在 done 之后关闭，GUI 线程只负责发送结果
+    def show_prompt(conn, request, session):
+        kind = request.get("kind")
+        payload = request.get("payload", {})
+        try:
+            if kind == "feedback":
+                feedback_ui.prepare_application()
+                window = feedback_ui.FeedbackUI(payload.get("prompt", ""), payload.get("predefined_options"))
+            elif kind == "data_sync":
+                data_sync_ui.prepare_application()
+                window = data_sync_ui.DataSyncUI(payload.get("context", {}), payload.get("predefined_options"))
+            else:
+                raise ValueError(f"unknown prompt kind: {kind}")
+        except Exception as e:
+            try:
+                ui_protocol.send_frames(conn, ui_protocol.error_frames(str(e)))
+            except Exception:
+                pass
+            session["done"].set()
+            return
+
+        sent_at = request.get("sent_at")
+
+        def on_finished(pending, result):
+            open_windows.discard(window)
+            last_activity[0] = time.monotonic()
+            result = dict(result)
+            result["_timing"] = latency_metrics.ui_timing(window, sent_at, queue_wait_ms=round(pending.wait_seconds() * 1000, 1))
+            try:
+                if not session.get("cancelled"):
+                    ui_protocol.send_result(conn, result)
+            except Exception:
+                pass
+            finally:
+                session["done"].set()
+            window.deleteLater()
+
+        open_windows.add(window)
+        # 由确认队列决定何时显示；两种界面的主题不同，显示前重新应用对应的主题
+        prepare = feedback_ui.prepare_application if kind == "feedback" else data_sync_ui.prepare_application
+        session["window"] = window
+        broker.add(kind, payload, window, on_finished, prepare)
+
+    def cancel_prompt(session):
+        """客户端取消调用、超时或退出：关闭仍在等待（或排队）的窗口，不回传结果"""
+        window = session.get("window")
+        if window is not None and window in open_windows:
+            session["cancelled"] = True
+            window.close()
+
+    bridge.show_requested.connect(show_prompt, Qt.QueuedConnection)
+    bridge.cancel_requested.connect(cancel_prompt, Qt.QueuedConnection)
+
+    def handle_connection(conn):
+        try:
+            request = conn.recv()
+        except Exception:
+            conn.close()
+            return
+        op = request.get("op")
+        if op == "ping":
+            conn.send({"pid": pid, "started_at": started_at, "open_windows": len(open_windows), "queue": broker.status()})
+            conn.close()
+        elif op == "show":
+            last_activity[0] = time.monotonic()
+            session = {"done": threading.Event(), "window": None}
+            bridge.show_requested.emit(conn, request, session)
+            # 等待期间监视连接：客户端只发送一次请求，之后连接可读即表示对端已关闭
+            while not session["done"].wait(CANCEL_CHECK_INTERVAL):
+                try:
+                    closed = conn.poll(0)
+                except (OSError, EOFError):
+                    closed = True
+                if closed:
+                    bridge.cancel_requested.emit(session)
+                    session["done"].wait()
+                    break
+            conn.close()
+        else:
+            conn.send({"error": f"unknown op: {op}"})
+            conn.close()
+
+    def accept_loop():
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception:
+                # 认证失败等单个连接错误不影响监听
+                if listener_closed.is_set():
+                    return
+                continue
+            threading.Thread(target=handle_connection, args=(conn,), daemon=True).start()
+
+    listener_closed = threading.Event()
+    threading.Thread(target=accept_loop, daemon=True).start()
+
+    def check_idle():
+        state = read_state()
+        # 状态文件已被其他常驻进程接管时退出
+        if not state or state.get("pid") != pid:
+            app.quit()
+            return
+        if not open_windows and time.monotonic() - last_activity[0] > idle_timeout:
+            app.quit()
+
+    idle_timer = QTimer()
+    idle_timer.timeout.connect(check_idle)
+    idle_timer.start(10_000)
+
+    try:
+        app.exec()
+    finally:
+        listener_closed.set()
+        _remove_state(pid)
+        listener.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="常驻 UI 进程")
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="运行常驻 UI 进程")
+    serve_parser.add_argument("--idle-timeout", type=float,
+                              default=float(os.environ.get(IDLE_TIMEOUT_ENV, DEFAULT_IDLE_TIMEOUT)),
+                              help="空闲多少秒后退出")
+    subparsers.add_parser("ping", help="检查常驻 UI 进程是否存活")
+    subparsers.add_parser("queue", help="查看确认队列的深度与每个请求的等待时间")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.idle_timeout)
+    elif args.command == "ping":
+        info = ping()
+        print(json.dumps(info) if info else "UI daemon is not running")
+        sys.exit(0 if info else 1)
+    elif args.command == "queue":
+        status = queue_status()
+        print(json.dumps(status, ensure_ascii=False, indent=2) if status else "UI daemon is not running")
+        sys.exit(0 if status else 1)
+    else:
+        parser.print_help()
@@ -0,0 +1,244 @@
+# UI Launcher - 以异步方式启动 UI 子进程
+# server.py 与 data_sync_mcp.py 共用，等待弹窗期间不阻塞 MCP 服务的事件循环
+# 启动的子进程登记在注册表中：调用被取消、服务退出时终止；子进程自己也监视父进程，父进程消失即退出；
+# 服务启动时清理之前崩溃遗留的 UI 进程与临时结果文件
+import os
+import sys
+import time
+import atexit
+import signal
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Dict, List, Optional
+
+import psutil
+
+import ui_protocol
+
+logger = logging.getLogger(__name__)
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# 读取子进程 stdout 的缓冲上限；默认 64KB 会让大图片在读取时频繁暂停/恢复管道
+STDOUT_BUFFER_LIMIT = 4 * 1024 * 1024
+
+# 由本模块启动的 UI 脚本
+UI_SCRIPTS = ("feedback_ui.py", "data_sync_ui.py")
+
+# 子进程检查父进程是否存活的间隔（秒）
+PARENT_CHECK_INTERVAL = 2.0
+
+# 子进程发现父进程已退出时的退出码
+EXIT_ORPHANED = 3
+
+# 早于该时间（秒）的旧版临时结果文件（tmp*.json）视为崩溃遗留
+STALE_RESULT_AGE = 3600
+
+# 交给 UI 进程的临时数据文件（如大批量 MID）的前缀，服务崩溃后遗留的在启动时清理
+UI_TEMP_PREFIX = "ifmcp_ui_"
+
+# 正在运行的 UI 子进程：pid -> 进程
+_children: Dict[int, asyncio.subprocess.Process] = {}
+_children_lock = threading.Lock()
+
+def ui_script_path(script_name: str) -> str:
+    """返回与本模块同目录的 UI 脚本路径"""
+    return os.path.join(SCRIPT_DIR, script_name)
+
+async def run_ui_process(script_path: str, args: List[str], timeout: Optional[float] = None) -> Dict:
+    """
+    异步运行 UI 脚本，通过其 stdout 的帧协议读取结果
+    超时时终止子进程并抛出 TimeoutError；调用被取消时同样终止子进程；
+    子进程异常退出或结果不完整时抛出 UIProtocolError
+    不落临时文件，子进程崩溃时无需清理
+    """
+    # NOTE: There appears to be a bug in uv, so we need
+    # to pass a bunch of special flags to make this work
+    process = await asyncio.create_subprocess_exec(
+        sys.executable,
+        "-u",
+        script_path,
+        *args,
+        "--output-stdout",
+        "--parent-pid", str(os.getpid()),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.DEVNULL,
+        stdin=asyncio.subprocess.DEVNULL,
+        close_fds=True,
+        limit=STDOUT_BUFFER_LIMIT
+    )
+
+    async def read_and_wait():
+        result = await ui_protocol.read_result_async(process.stdout)
+        returncode = await process.wait()
+        if returncode != 0:
+            raise ui_protocol.UIProtocolError(f"UI process exited with code {returncode}")
+        return result
+
+    with _children_lock:
+        _children[process.pid] = process
+    try:
+        return await asyncio.wait_for(read_and_wait(), timeout)
+    except asyncio.TimeoutError:
+        logger.error(f"UI process timed out after {timeout}s: {os.path.basename(script_path)}")
+        await _kill(process)
+        raise TimeoutError(f"UI process timed out after {timeout}s")
+    except BaseException:
+        # 包括调用被取消（CancelledError）：窗口已无人等待，直接终止
+        await _kill(process)
+        raise
+    finally:
+        with _children_lock:
+            _children.pop(process.pid, None)
+
+async def _kill(process: asyncio.subprocess.Process):
+    """终止子进程并回收"""
+    if process.returncode is None:
+        try:
+            process.kill()
+        except ProcessLookupError:
+            pass
+        await process.wait()
+
+def running_children() -> List[int]:
+    """正在运行的 UI 子进程 PID"""
+    with _children_lock:
+        return list(_children)
+
+def kill_children():
+    """同步终止所有登记的 UI 子进程（服务退出时调用，此时事件循环可能已关闭）"""
+    with _children_lock:
+        pids = list(_children)
+        _children.clear()
+    for pid in pids:
+        try:
+            psutil.Process(pid).kill()
+        except psutil.Error:
+            pass
+
+def install_cleanup():
+    """服务退出（正常结束、SIGTERM、SIGHUP）时终止所有 UI 子进程"""
+    atexit.register(kill_children)
+    for name in ("SIGTERM", "SIGHUP"):
+        signum = getattr(signal, name, None)
+        if signum is None:
+            continue
+        previous = signal.getsignal(signum)
+
+        def handler(signum, frame, previous=previous):
+            kill_children()
+            if callable(previous):
+                previous(signum, frame)
+            else:
+                raise SystemExit(128 + signum)
+
+        signal.signal(signum, handler)
+
+# ---------------------------------------------------------------------------
+# 子进程侧：父进程消失时退出
+# ---------------------------------------------------------------------------
+
+def parent_alive(parent_pid: int) -> bool:
+    """父进程是否仍在运行（POSIX 上父进程退出后子进程会被重新挂到其他进程下）"""
+    if sys.platform != "win32":
+        return os.getppid() == parent_pid
+    return psutil.pid_exists(parent_pid)
+
+def watch_parent(parent_pid: Optional[int]):
+    """在后台线程中监视父进程，父进程退出（崩溃、被杀）时立即结束本进程，不留下无人等待的窗口"""
+    if not parent_pid:
+        return
+
+    def watch():
+        while parent_alive(parent_pid):
+            time.sleep(PARENT_CHECK_INTERVAL)
+        print(f"父进程 {parent_pid} 已退出，关闭 UI", file=sys.stderr)
+        os._exit(EXIT_ORPHANED)
+
+    threading.Thread(target=watch, daemon=True, name="parent-watch").start()
+
+# ---------------------------------------------------------------------------
+# 启动时清理
+# ---------------------------------------------------------------------------
+
+def _cmdline_parent_pid(cmdline: List[str]) -> Optional[int]:
+    try:
+        return int(cmdline[cmdline.index("--parent-pid") + 1])
+    except (ValueError, IndexError):
+        return None
+
+def _is_stale_ui_process(proc: psutil.Process, cmdline: List[str]) -> bool:
+    """本仓库 UI 脚本启动的进程，且启动它的服务已不存在"""
+    scripts = {os.path.join(SCRIPT_DIR, name) for name in UI_SCRIPTS}
+    if not any(os.path.abspath(arg) in scripts for arg in cmdline[1:3]):
+        return False
+    # 只处理由服务端启动（结果回传给服务端）的进程，手动运行的 UI 不动
+    if "--output-stdout" not in cmdline and "--output-file" not in cmdline:
+        return False
+    parent_pid = _cmdline_parent_pid(cmdline)
+    if parent_pid is not None:
+        return not psutil.pid_exists(parent_pid) or proc.ppid() != parent_pid
+    # 旧版本启动的进程没有 --parent-pid：父进程已不存在（被重新挂到 init）即视为遗留
+    return proc.ppid() <= 1 or not psutil.pid_exists(proc.ppid())
+
+def _is_stale_result_file(path: str, now: float) -> bool:
+    """旧版本 UI 写入的临时结果文件（tmp*.json，内容以 interactive_feedback 字段开头）"""
+    try:
+        if now - os.path.getmtime(path) < STALE_RESULT_AGE:
+            return False
+        with open(path, "rb") as f:
+            head = f.read(64)
+    except OSError:
+        return False
+    return b"".join(head.split()).startswith(b'{"interactive_feedback"')
+
+def _is_stale_temp_file(path: str, now: float) -> bool:
+    """交给 UI 的临时数据文件超过有效期仍未删除（写入它的服务已崩溃）"""
+    try:
+        return now - os.path.getmtime(path) >= STALE_RESULT_AGE
+    except OSError:
+        return False
+
+def sweep_stale_ui() -> Dict[str, int]:
+    """
+    服务启动时调用：终止之前崩溃遗留的 UI 进程，删除遗留的临时结果文件
+    返回清理的进程数与文件数
+    """
+    killed = 0
+    try:
+        user = psutil.Process().username()
+    except psutil.Error:
+        user = None
+    for proc in psutil.process_iter(["pid", "username", "cmdline"]):
+        try:
+            cmdline = proc.info["cmdline"] or []
+            if proc.pid == os.getpid() or (user and proc.info["username"] != user):
+                continue
+            if _is_stale_ui_process(proc, cmdline):
+                proc.kill()
+                killed += 1
+        except psutil.Error:
+            continue
+
+    removed = 0
+    now = time.time()
+    temp_dir = tempfile.gettempdir()
+    try:
+        names = os.listdir(temp_dir)
+    except OSError:
+        names = []
+    for name in names:
+        path = os.path.join(temp_dir, name)
+        if (name.startswith("tmp") and name.endswith(".json") and _is_stale_result_file(path, now)) \
+                or (name.startswith(UI_TEMP_PREFIX) and _is_stale_temp_file(path, now)):
+            try:
+                os.unlink(path)
+                removed += 1
+            except OSError:
+                pass
+
+    if killed or removed:
+        logger.info(f"Swept {killed} stale UI processes and {removed} stale result files")
+    return {"processes": killed, "result_files": removed}
@@ -0,0 +1,152 @@
+# UI Protocol - UI 进程向 MCP 服务端回传结果的帧协议
+# 每帧 = 1 字节类型 + 4 字节大端长度 + 负载：
+#   J  文本元数据（UTF-8 JSON，不含图片）
+#   I  一张图片的原始字节（不经过 JSON/Base64）
+#   X  错误信息（UTF-8 JSON: {"error": ...}）
+#   E  结束帧（长度为 0）
+# 子进程通过 stdout 写出，常驻 UI 进程通过 multiprocessing 连接写出
+import os
+import sys
+import json
+import struct
+from typing import BinaryIO, Callable, Dict, Iterator, List, Tuple
+
+FRAME_HEADER = struct.Struct(">cI")
+
+FRAME_META = b"J"
+FRAME_IMAGE = b"I"
+FRAME_ERROR = b"X"
+FRAME_END = b"E"
+
+# 单帧上限，防止损坏的数据导致巨量内存分配
+MAX_FRAME_SIZE = 256 * 1024 * 1024
+
+class UIProtocolError(Exception):
+    """结果流不完整或格式错误"""
+
+def iter_frames(result: Dict) -> Iterator[Tuple[bytes, bytes]]:
+    """把 UI 结果拆成 (类型, 负载) 帧序列：元数据一帧，每张图片一帧"""
+    images: List[bytes] = result.get("images") or []
+    meta = {key: value for key, value in result.items() if key != "images"}
+    meta["image_count"] = len(images)
+    yield FRAME_META, json.dumps(meta, ensure_ascii=False).encode("utf-8")
+    for img in images:
+        yield FRAME_IMAGE, bytes(img)
+    yield FRAME_END, b""
+
+def error_frames(message: str) -> Iterator[Tuple[bytes, bytes]]:
+    """错误结果的帧序列"""
+    yield FRAME_ERROR, json.dumps({"error": message}, ensure_ascii=False).encode("utf-8")
+    yield FRAME_END, b""
+
+def image_format(data: bytes) -> str:
+    """根据文件头判断图片格式（png / jpeg / webp），无法识别时按 png 处理"""
+    if data[:3] == b"\xff\xd8\xff":
+        return "jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+def _check_header(kind: bytes, length: int):
+    if kind not in (FRAME_META, FRAME_IMAGE, FRAME_ERROR, FRAME_END):
+        raise UIProtocolError(f"unknown frame type: {kind!r}")
+    if length > MAX_FRAME_SIZE:
+        raise UIProtocolError(f"frame too large: {length} bytes")
+
+def decode_frames(frames: Iterator[Tuple[bytes, bytes]]) -> Dict:
+    """把帧序列还原为结果字典，images 为原始字节列表"""
+    meta = None
+    images: List[bytes] = []
+    for kind, payload in frames:
+        if kind == FRAME_META:
+            meta = json.loads(payload.decode("utf-8"))
+        elif kind == FRAME_IMAGE:
+            images.append(payload)
+        elif kind == FRAME_ERROR:
+            raise UIProtocolError(json.loads(payload.decode("utf-8")).get("error", "unknown error"))
+        elif kind == FRAME_END:
+            if meta is None:
+                raise UIProtocolError("result stream ended without metadata")
+            if meta.pop("image_count", len(images)) != len(images):
+                raise UIProtocolError("result stream is missing image frames")
+            meta["images"] = images
+            return meta
+    raise UIProtocolError("result stream ended before end frame")
+
+# ---------------------------------------------------------------------------
+# 字节流（子进程 stdout）
+# ---------------------------------------------------------------------------
+
+def write_result(stream: BinaryIO, result: Dict):
+    """把结果按帧写入二进制流"""
+    for kind, payload in iter_frames(result):
+        stream.write(FRAME_HEADER.pack(kind, len(payload)))
+        stream.write(payload)
+    stream.flush()
+
+def _stream_frames(read_exactly: Callable[[int], bytes]) -> Iterator[Tuple[bytes, bytes]]:
+    while True:
+        kind, length = FRAME_HEADER.unpack(read_exactly(FRAME_HEADER.size))
+        _check_header(kind, length)
+        yield kind, read_exactly(length) if length else b""
+
+def read_result(stream: BinaryIO) -> Dict:
+    """从二进制流读取一个完整结果"""
+    def read_exactly(n: int) -> bytes:
+        data = stream.read(n)
+        if len(data) != n:
+            raise UIProtocolError("result stream closed unexpectedly")
+        return data
+    return decode_frames(_stream_frames(read_exactly))
+
+async def read_result_async(reader) -> Dict:
+    """从 asyncio.StreamReader 读取一个完整结果"""
+    import asyncio
+
+    frames = []
+    try:
+        while True:
+            kind, length = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+            _check_header(kind, length)
+            frames.append((kind, await reader.readexactly(length) if length else b""))
+            if kind == FRAME_END:
+                break
+    except asyncio.IncompleteReadError:
+        raise UIProtocolError("result stream closed unexpectedly")
+    return decode_frames(iter(frames))
+
+def claim_stdout() -> BinaryIO:
+    """
+    独占进程的 stdout 作为结果通道
+    原 stdout 被复制为私有二进制流返回，之后 print 及 C 层输出全部改写到 stderr，
+    避免调试输出混入结果帧
+    """
+    sys.stdout.flush()
+    result_fd = os.dup(1)
+    os.dup2(2, 1)
+    sys.stdout = sys.stderr
+    return os.fdopen(result_fd, "wb")
+
+# ---------------------------------------------------------------------------
+# multiprocessing 连接（常驻 UI 进程）
+# ---------------------------------------------------------------------------
+
+def send_frames(conn, frames: Iterator[Tuple[bytes, bytes]]):
+    """通过 multiprocessing 连接发送帧，头部与负载分开发送避免拼接大图片"""
+    for kind, payload in frames:
+        conn.send_bytes(FRAME_HEADER.pack(kind, len(payload)))
+        if payload:
+            conn.send_bytes(payload)
+
+def send_result(conn, result: Dict):
+    """通过 multiprocessing 连接发送结果"""
+    send_frames(conn, iter_frames(result))
+
+def recv_result(conn) -> Dict:
+    """从 multiprocessing 连接接收一个完整结果"""
+    def frames():
+        while True:
+            kind, length = FRAME_HEADER.unpack(conn.recv_bytes())
+            _check_header(kind, length)
+            yield kind, conn.recv_bytes() if length else b""
+    return decode_frames(frames())